@@ -0,0 +1,152 @@
+import numpy as np
+from taskinit import casalog, tbtool
+
+'''
+A set of helper functions to read calibration tables with bulk column reads
+instead of one getcell call per row. Used by plotbandpass, and usable by
+other tools which plot or inspect calibration tables.
+
+    getcellcolumn   : read an array column as a list of per-row arrays
+    CalTableData    : read the main table of a cal table, indexed by
+                      (antenna, spw, time)
+'''
+
+def getcellcolumn(mytb, colname, spwcolname=None):
+    '''Read an array column of an open table as a list with one numpy array
+       per row, the same arrays that getcell would return for each row.
+       mytb        --> table tool with the table already open
+       colname     --> name of the column to read
+       spwcolname  --> name of the column with the spw of each row
+                       (e.g. SPECTRAL_WINDOW_ID), used to read the column
+                       in chunks of rows of the same shape if the cell shapes
+                       vary from row to row
+
+       The column is read with a single getcol call when all the cells have
+       the same shape. Otherwise it is read with one getcol per spw, or with
+       getvarcol if spwcolname is not given.'''
+
+    nrows = mytb.nrows()
+    if nrows == 0:
+        return []
+
+    try:
+        # getcol returns the rows in the last axis
+        return rowarrays(mytb.getcol(colname))
+    except Exception:
+        pass
+
+    if spwcolname is not None and spwcolname in mytb.colnames():
+        try:
+            return _getcellcolumnperspw(mytb, colname, spwcolname, nrows)
+        except Exception, instance:
+            casalog.post('Cannot read column %s by %s: %s' % (colname,spwcolname,instance),
+                         'DEBUG')
+
+    # getvarcol returns a dictionary with the rows as 'r1', 'r2', ...
+    cells = mytb.getvarcol(colname)
+    return [cells['r%d' % (row+1)][...,0] for row in xrange(nrows)]
+
+def _getcellcolumnperspw(mytb, colname, spwcolname, nrows):
+    '''Read a column with one getcol call per spw'''
+
+    rows = [None] * nrows
+    for spw in np.unique(mytb.getcol(spwcolname)):
+        subtb = mytb.query('%s==%d' % (spwcolname,spw))
+        try:
+            rownumbers = subtb.rownumbers()
+            for (row, cell) in zip(rownumbers, rowarrays(subtb.getcol(colname))):
+                rows[row] = cell
+        finally:
+            subtb.close()
+
+    return rows
+
+def rowarrays(column):
+    '''Split a column read with getcol into a list with one array per row.
+       The arrays are views of a single copy of the column in row-major
+       order, so that each row is contiguous in memory.'''
+
+    column = np.asarray(column)
+    if column.ndim < 2:
+        return list(column)
+    return list(np.ascontiguousarray(np.rollaxis(column, -1)))
+
+
+class CalTableData:
+    '''Read the main table of a calibration table with bulk column reads,
+       and give access to the cells by (antenna, spw, time).
+
+       caltable  --> name of the calibration table
+       columns   --> array columns to read (e.g. ['CPARAM','FLAG'])
+
+       The scalar columns ANTENNA1, TIME, FIELD_ID and the spw of each row
+       (SPECTRAL_WINDOW_ID, or CAL_DESC_ID for the casa 3.3 format) are
+       available as the numpy arrays antenna, time, field and spw, and the
+       array columns as lists of per-row arrays in data[column].
+
+       Example:
+           caldata = CalTableData('ngc5921.bcal', ['CPARAM','FLAG'])
+           for time in caldata.gettimes(antenna=1, spw=0):
+               gain = caldata.getcell('CPARAM', 1, 0, time)
+    '''
+
+    def __init__(self, caltable, columns=['FLAG']):
+        self.caltable = caltable
+        self.data = {}
+        mytb = tbtool()
+        mytb.open(caltable)
+        try:
+            colnames = mytb.colnames()
+            if 'SPECTRAL_WINDOW_ID' in colnames:
+                self.spwcolname = 'SPECTRAL_WINDOW_ID'
+            else:
+                self.spwcolname = 'CAL_DESC_ID'
+            self.nrows = mytb.nrows()
+            self.antenna = mytb.getcol('ANTENNA1')
+            self.time = mytb.getcol('TIME')
+            self.spw = mytb.getcol(self.spwcolname)
+            if 'FIELD_ID' in colnames:
+                self.field = mytb.getcol('FIELD_ID')
+            else:
+                self.field = np.zeros(self.nrows, dtype=int)
+            for col in columns:
+                self.data[col] = getcellcolumn(mytb, col, self.spwcolname)
+        finally:
+            mytb.close()
+
+        # Row number of each (antenna, spw, time)
+        self.index = {}
+        for row in xrange(self.nrows):
+            self.index[(self.antenna[row],self.spw[row],self.time[row])] = row
+
+    def getrow(self, antenna, spw, time):
+        '''Return the row number of a solution, or None if it does not exist'''
+        return self.index.get((antenna,spw,time))
+
+    def getcell(self, colname, antenna, spw, time):
+        '''Return the cell of a column for a solution, or None if it does not exist'''
+        row = self.getrow(antenna, spw, time)
+        if row is None:
+            return None
+        return self.data[colname][row]
+
+    def getrows(self, antenna=None, spw=None):
+        '''Return the row numbers of an antenna and/or spw, sorted by time'''
+        mask = np.ones(self.nrows, dtype=bool)
+        if antenna is not None:
+            mask &= (self.antenna == antenna)
+        if spw is not None:
+            mask &= (self.spw == spw)
+        rows = np.where(mask)[0]
+        return rows[np.argsort(self.time[rows], kind='mergesort')]
+
+    def gettimes(self, antenna=None, spw=None):
+        '''Return the solution times of an antenna and/or spw, sorted'''
+        return self.time[self.getrows(antenna, spw)]
+
+    def getcolumn(self, colname, antenna=None, spw=None):
+        '''Return the cells of a column for an antenna and/or spw as a single
+           array with the time (sorted) in the first axis. The cells must have
+           the same shape, which is the case for a single spw.'''
+        rows = self.getrows(antenna, spw)
+        return np.array([self.data[colname][row] for row in rows])
@@ -1,73 +1,66 @@
 import sys
 import string
-import inspect
+
+# NOTE: The stack is walked with sys._getframe instead of inspect.stack, which
+#       reads from disk the source context of every frame and made each lookup
+#       very expensive (taskinit alone does ~50 of them at import time)
+
+def __is_stack_top_frame(filename) :
+    return filename.startswith("<ipython-input-") or \
+           string.find(filename, 'ipython console') > 0 or \
+           string.find(filename,"/casapy.py") > 0 or \
+           string.find(filename,"/casa.py") > 0 or \
+           string.find(filename,"mpi4casapy.py") > 0
+
+def __is_root_top_frame(filename) :
+    return string.find(filename,"start_casa.py") > 0
+
+__top_frame_matchers = { 'stack' : __is_stack_top_frame,
+                         'root' : __is_root_top_frame }
+
+# Cache of the result of matching each code filename against each stack level
+__top_frame_filename_cache = { 'stack' : {}, 'root' : {} }
+
+def __top_frame_globals(level) :
+    if not __top_frame_matchers.has_key(level):
+        raise RuntimeError("unknown stack level %s" % level)
+
+    is_top_frame = __top_frame_matchers[level]
+    filename_cache = __top_frame_filename_cache[level]
+
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename_cache.has_key(filename):
+            filename_cache[filename] = is_top_frame(filename)
+        # jagonzal: Take the first level that matches the requirement
+        if filename_cache[filename]:
+            return frame.f_globals
+        frame = frame.f_back
+
+    # Nothing matched: Same as stack level 0 with inspect.stack
+    return globals()
 
 def stack_find(symbol, level='stack') :
     label="_casa_top_frame_"
-    a=inspect.stack()
-    stacklevel=0
-    if level == "stack":
-        for k in range(len(a)):
-            if a[k][1].startswith("<ipython-input-") or \
-               string.find(a[k][1], 'ipython console') > 0 or \
-               string.find(a[k][1],"/casapy.py") > 0 or \
-               string.find(a[k][1],"/casa.py") > 0 or \
-               string.find(a[k][1],"mpi4casapy.py") > 0:
-                stacklevel=k
-                # jagonzal: Take the first level that matches the requirement
-                break
-
-        myf=sys._getframe(stacklevel).f_globals
+    myf=__top_frame_globals(level)
 
+    if level == "stack":
         if myf.has_key(symbol) and myf.has_key(label) :
             return myf[symbol]
-
         else:
             return None
 
-    elif level == "root":
-        for k in range(len(a)):
-            if string.find(a[k][1],"start_casa.py") > 0:
-                stacklevel=k
-                # jagonzal: Take the first level that matches the requirement
-                break
-
-        myf=sys._getframe(stacklevel).f_globals
-
+    else:
         if myf.has_key(symbol) :
             return myf[symbol]
-
         else:
             return None
 
-    else:
-        raise RuntimeError("unknown stack level %s" % level)
-
 
 def stack_frame_find(level='stack') :
     label="_casa_top_frame_"
-    a=inspect.stack()
-    stacklevel=0
-    if level == "stack":
-        for k in range(len(a)):
-            if a[k][1].startswith("<ipython-input-") or \
-               string.find(a[k][1], 'ipython console') > 0 or \
-               string.find(a[k][1],"/casapy.py") > 0 or \
-               string.find(a[k][1],"/casa.py") > 0 or \
-               string.find(a[k][1],"mpi4casapy.py") > 0:
-                stacklevel=k
-                # jagonzal: Take the first level that matches the requirement
-                break
-    elif level == "root":
-        for k in range(len(a)):
-            if string.find(a[k][1],"start_casa.py") > 0:
-                stacklevel=k
-                # jagonzal: Take the first level that matches the requirement
-                break
-    else:
-        raise RuntimeError("unknown stack level %s" % level)
-
-    myf=sys._getframe(stacklevel).f_globals
+    myf=__top_frame_globals(level)
 
     if myf.has_key(label) :
         return myf
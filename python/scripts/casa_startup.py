@@ -0,0 +1,182 @@
+import re
+import sys
+import imp
+import time
+import __builtin__
+
+####
+#### Support for profiling and speeding up the CASA start up:
+####
+####      --startup-profile  =>  report the time spent in each start up stage and import
+####      --lazy-init        =>  bind placeholders for tasks, pylab and the testing
+####                             environment, which are imported on first use
+####
+
+def startup_flag( flag ):
+    """ Check for a start up flag before the command line is parsed """
+    return flag in sys.argv
+
+
+class StartupProfiler:
+    """ Accumulate the time spent in each start up stage and each imported module """
+
+    def __init__( self ):
+        self.__enabled = False
+        self.__start_time = time.time( )
+        self.__stage = None
+        self.__stage_start_time = None
+        self.__stage_list = [ ]
+        self.__import_dict = { }
+        self.__import_stack = [ ]
+        self.__builtin_import = None
+
+    def enabled( self ):
+        return self.__enabled
+
+    def enable( self ):
+        if self.__enabled:
+            return
+        self.__enabled = True
+        self.__builtin_import = __builtin__.__import__
+        __builtin__.__import__ = self.__profiled_import
+
+    def disable( self ):
+        if not self.__enabled:
+            return
+        __builtin__.__import__ = self.__builtin_import
+        self.__enabled = False
+
+    def __profiled_import( self, name, globals=None, locals=None, fromlist=None, level=-1 ):
+        # Already imported modules are not timed
+        if sys.modules.has_key(name):
+            return self.__builtin_import(name,globals,locals,fromlist,level)
+
+        self.__import_stack.append(0.0)
+        start = time.time( )
+        try:
+            return self.__builtin_import(name,globals,locals,fromlist,level)
+        finally:
+            elapsed = time.time( ) - start
+            nested = self.__import_stack.pop( )
+            if len(self.__import_stack) > 0:
+                self.__import_stack[-1] += elapsed
+            # Inclusive time and time excluding nested imports
+            if self.__import_dict.has_key(name):
+                self.__import_dict[name][0] += elapsed
+                self.__import_dict[name][1] += elapsed - nested
+            else:
+                self.__import_dict[name] = [elapsed, elapsed - nested, self.__stage]
+
+    def stage( self, name ):
+        """ Start a new start up stage, finishing the current one """
+        now = time.time( )
+        if self.__stage is not None:
+            self.__stage_list.append((self.__stage, now - self.__stage_start_time))
+        self.__stage = name
+        self.__stage_start_time = now
+
+    def report( self, nimports=25 ):
+        """ Finish the current stage and print the start up timing report """
+        self.stage(None)
+        if not self.__enabled:
+            return
+
+        print "-" * 90
+        print "CASA start up profile: %.3f s total" % (time.time( ) - self.__start_time)
+        print "-" * 90
+        for (stage, elapsed) in self.__stage_list:
+            print "%8.3f s  %s" % (elapsed, stage)
+        print "-" * 90
+        print "%10s %10s  %-40s %s" % ("total","self","import","stage")
+        import_list = sorted(self.__import_dict.items( ), key=lambda item: item[1][0], reverse=True)
+        for (name, (elapsed, selfelapsed, stage)) in import_list[:nimports]:
+            print "%8.3f s %8.3f s  %-40s %s" % (elapsed, selfelapsed, name, stage)
+        print "-" * 90
+
+        # Imports are not profiled after the start up
+        self.disable( )
+
+startup_profiler = StartupProfiler( )
+
+
+class LazyObject(object):
+    """ Placeholder bound in a namespace instead of an object which is expensive to import
+
+    The object is loaded on first use, and the placeholder then replaces itself in the
+    namespace with the actual object, so that further accesses have no overhead.
+    """
+
+    def __init__( self, namespace, name, loader ):
+        self.__namespace = namespace
+        self.__name = name
+        self.__loader = loader
+        self.__object = None
+
+    def __resolve( self ):
+        if self.__object is None:
+            self.__object = self.__loader( )
+            if self.__namespace.get(self.__name) is self:
+                self.__namespace[self.__name] = self.__object
+        return self.__object
+
+    def __getattr__( self, attr ):
+        # Avoid infinite recursion for a partially constructed placeholder (e.g. copy)
+        if attr.startswith('_LazyObject__'):
+            raise AttributeError(attr)
+        return getattr(self.__resolve( ), attr)
+
+    def __call__( self, *args, **kwargs ):
+        return self.__resolve( )(*args, **kwargs)
+
+    def __dir__( self ):
+        return dir(self.__resolve( ))
+
+    def __repr__( self ):
+        if self.__object is None:
+            return "<%s (not loaded yet)>" % self.__name
+        return repr(self.__object)
+
+def __module_loader( module, attribute=None ):
+    def load( ):
+        if attribute is None:
+            __import__(module)
+            return sys.modules[module]
+        else:
+            return getattr(__import__(module,{},{},[attribute]),attribute)
+    return load
+
+def lazy_import_module( namespace, name, module=None, loader=None ):
+    """ Bind name in namespace to a module (or the result of loader) imported on first use """
+    if loader is None:
+        loader = __module_loader(module or name)
+    namespace[name] = LazyObject(namespace,name,loader)
+
+__task_import = re.compile(r'^from\s+(\S+)\s+import\s+(\S+)\s+as\s+(\S+)\s*$')
+
+def lazy_import_tasks( namespace ):
+    """ Lazy equivalent of 'from tasks import *'
+
+    Each 'from <task>_cli import <task>_cli as <task>' line of the generated tasks.py
+    binds a placeholder, other statements are executed as they are.
+    """
+    try:
+        (fd, path, description) = imp.find_module('tasks')
+        if fd is not None:
+            fd.close( )
+    except ImportError:
+        path = None
+
+    if path is None or not path.endswith('.py'):
+        exec "from tasks import *" in namespace
+        return
+
+    for line in open(path):
+        line = line.strip( )
+        if len(line) == 0 or line.startswith('#'):
+            continue
+        match = __task_import.match(line)
+        if match is None:
+            exec line in namespace
+        else:
+            (module, attribute, name) = match.groups( )
+            namespace[name] = LazyObject(namespace,name,__module_loader(module,attribute))
@@ -7,6 +7,13 @@ import signal
 import filecmp
 import traceback # To pretty-print tracebacks
 from subprocess import Popen, PIPE, STDOUT
+from casa_startup import startup_flag, startup_profiler, lazy_import_module, lazy_import_tasks
+
+##
+## start up profiling has to be enabled before the command line is parsed
+##
+if startup_flag('--startup-profile'):
+    startup_profiler.enable( )
 
 ##
 ## toplevel frame marker
@@ -112,18 +119,21 @@ if os.fork( ) == 0 :
 ## no one likes a bloated watchdog...
 ## ...do this after setting up the watchdog
 ##
+startup_profiler.stage("casac")
 try:
     import casac 
 except ImportError, e:
     print "failed to load casa:\n", e
     sys.exit(1)
 
+startup_profiler.stage("matplotlib")
 try:
     import matplotlib
 except ImportError, e:
     print "failed to load matplotlib:\n", e
     print "sys.path =", "\n\t".join(sys.path)
     
+startup_profiler.stage("casa settings")
 from asap_init import *
 
 
@@ -367,6 +377,8 @@ if casa['flags'].has_key('--help') :
 	print "   --nogui"
         print "   --colors=[NoColor|Linux|LightBG]"
         print "   --pipeline"
+        print "   --startup-profile, print the time spent in each start up stage and import"
+        print "   --lazy-init, import tasks, pylab and the testing environment on first use"
 	print "   -c filename-or-expression"
 	print "   --help, print this text and exit"
 	print
@@ -480,8 +492,10 @@ if casa['flags'].has_key('--pipeline'):
 #
 # We put in all the task declarations here...
 #
+startup_profiler.stage("taskinit")
 from taskinit import *
 
+startup_profiler.stage("casa functions")
 logpid=[]
 
 def casalogger(logfile=''):
@@ -1311,23 +1325,31 @@ def pybot_setup( ):
         print "ERROR:  ", err
 ####################
 
-    
-import pylab as pl
 
-#
-# 
-import platform
-##
-## CAS-951: matplotlib unresponsive on some 64bit systems
-##
+startup_profiler.stage("pylab")
+def __load_pylab( ):
+    import pylab as pl
 
-if (platform.architecture()[0]=='64bit'):
-    if os.environ.has_key('DISPLAY') and os.environ['DISPLAY']!="" and not casa['flags'].has_key('--nogui'):
-        pl.ioff( )
-        pl.clf( )
-        pl.ion( )
-##
-##
+    #
+    # 
+    import platform
+    ##
+    ## CAS-951: matplotlib unresponsive on some 64bit systems
+    ##
+
+    if (platform.architecture()[0]=='64bit'):
+        if os.environ.has_key('DISPLAY') and os.environ['DISPLAY']!="" and not casa['flags'].has_key('--nogui'):
+            pl.ioff( )
+            pl.clf( )
+            pl.ion( )
+    ##
+    ##
+    return pl
+
+if casa['flags'].has_key('--lazy-init'):
+    lazy_import_module(globals(),'pl',loader=__load_pylab)
+else:
+    pl = __load_pylab( )
 
 # Provide flexibility for boolean representation in the CASA shell
 true  = True
@@ -1336,6 +1358,7 @@ false = False
 F     = False
 
 # Case where casapy is run non-interactively
+startup_profiler.stage("IPython")
 try:
    import IPython
 except ImportError, e:
@@ -1345,19 +1368,29 @@ except ImportError, e:
 
 # setup available tasks
 #
+startup_profiler.stage("tasks")
 from math import *
-from tasks import *
+if casa['flags'].has_key('--lazy-init'):
+    lazy_import_tasks(globals())
+else:
+    from tasks import *
 from parameter_dictionary import *
 from task_help import *
 
 #
 # import testing environment
 #
-import publish_summary
-import runUnitTest
+startup_profiler.stage("testing environment")
+if casa['flags'].has_key('--lazy-init'):
+    lazy_import_module(globals(),'publish_summary')
+    lazy_import_module(globals(),'runUnitTest')
+else:
+    import publish_summary
+    import runUnitTest
 #
 home=os.environ['HOME']
 
+startup_profiler.stage("pipeline and init.py")
 #
 # If the pipeline is there and the user requested it, load the pipeline tasks
 #
@@ -1417,6 +1450,7 @@ fullpath=casa['dirs']['python'] + '/assignmentFilter.py'
 if os.environ.has_key('__CASAPY_PYTHONDIR'):
     fullpath=os.environ['__CASAPY_PYTHONDIR'] + '/assignmentFilter.py'
 
+startup_profiler.stage("IPython shell")
 ipythonlog = 'ipython-'+time.strftime("%Y%m%d-%H%M%S", time.gmtime())+'.log'
 #if os.path.exists('ipython.log') and not os.access('ipython.log', os.W_OK):
 #    print
@@ -1505,6 +1539,7 @@ casalog.version()
 
 
 ### Try loading ASAP
+startup_profiler.stage("asap")
 try:
     asap_init()
 except ImportError, e:
@@ -1518,6 +1553,7 @@ if cu.hostinfo( )['memory']['available'] < 524288:
     casalog.post( 'available memory less than 512MB (with casarc settings)\n...some things will not run correctly', 'SEVERE' )
     
 # jagonzal: MPIClient initialization after watchdog fork
+startup_profiler.stage("casa services")
 if MPIEnvironment.is_mpi_enabled:
     # Instantiate MPICommunicator singleton in order not to block the clients
     from mpi4casa.MPICommunicator import MPICommunicator
@@ -1572,6 +1608,8 @@ except Exception as e:
     print "***\n*** Crash reporter initialization failed.\n***"
     print "*** exception={0}\n***".format (e)
 
+startup_profiler.report( )
+
 ipshell.mainloop( )
 if(os.uname()[0] == 'Darwin') and type(casa) == "<type 'dict'>" and casa['flags'].has_key('--maclogger') :
     os.system("osascript -e 'tell application \"Console\" to quit'")
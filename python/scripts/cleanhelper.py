@@ -3184,27 +3184,78 @@ class cleanhelper:
         chan          -- channel plane index
         imagermode    -- imagermode  
         """
+        self.putCubePlanes(cubeimageroot,
+                           {chan:self.getChanPlanes(chanimageroot,imagermode)},
+                           imagermode)
+
+    def getChanPlanes(self,chanimageroot,imagermode):
+        """
+        Read the channel images of chaniter=T mode into memory, so that
+        they can be put in the CubeImages later on, possibly by another
+        process (see putCubePlanes)
+
+        Keyword arguments:
+        chanimageroot -- root name for channel image
+        imagermode    -- imagermode
+
+        returns: dictionary of (pixels, pixelmask) per image extension
+        """
         imagext = ['.image','.model','.flux','.residual','.psf','.mask']
         if imagermode=='mosaic':
             imagext.append('.flux.pbcoverage')
         lerange=range(self.nimages)
         for n in lerange:
-            cubeimagerootname=cubeimageroot[n]
             chanimagerootname=chanimageroot[n]
+        chanplanes={}
         for ext in imagext:
-            nomaskim=False
-            cubeimage=cubeimagerootname+ext
             chanimage=chanimagerootname+ext
+            if os.path.exists(chanimage):
+                ia.open(chanimage)
+                chanplanes[ext]=(ia.getchunk(),ia.getchunk(getmask=True))
+                ia.close()
+        return chanplanes
+
+    def putCubePlanes(self,cubeimageroot,chanplanes,imagermode):
+        """
+        Put channel planes read by getChanPlanes back into CubeImages
+        for chaniter=T mode. Each cube is opened once for all the channels.
+
+        Keyword arguments:
+        cubeimageroot -- root name for output cube image
+        chanplanes    -- dictionary of channel plane index -> 
+                         getChanPlanes output
+        imagermode    -- imagermode
+        """
+        imagext = ['.image','.model','.flux','.residual','.psf','.mask']
+        if imagermode=='mosaic':
+            imagext.append('.flux.pbcoverage')
+        lerange=range(self.nimages)
+        for n in lerange:
+            cubeimagerootname=cubeimageroot[n]
+        chans=sorted(chanplanes.keys())
+        for ext in imagext:
+            cubeimage=cubeimagerootname+ext
+            chans_ext=[chan for chan in chans if chanplanes[chan].has_key(ext)]
+            if len(chans_ext)==0:
+                # unless mask image is given or in interactive mode
+                # there is no mask image
+                continue
             if not os.path.exists(cubeimage):
-                if os.path.exists(chanimage):
-                    outim=ia.newimagefromimage(cubeimagerootname+'.model',cubeimage)
-                    outim.done(verbose=False)
-                elif ext=='.mask':
-                    # unless mask image is given or in interactive mode
-                    # there is no mask image
-                    nomaskim=True
-            if not nomaskim: 
-                self.putchanimage(cubeimage, chanimage,chan)
+                outim=ia.newimagefromimage(cubeimagerootname+'.model',cubeimage)
+                outim.done(verbose=False)
+            ia.open(cubeimage)
+            cubeshape=ia.shape()
+            for chan in chans_ext:
+                (imdata,immask)=chanplanes[chan][ext]
+                inimshape=list(imdata.shape)
+                if not (cubeshape[3] > (chan+inimshape[3]-1)):
+                    continue
+                if inimshape[0:3]!=list(cubeshape[0:3]):
+                    continue
+                blc=[0,0,inimshape[2]-1,chan]
+                trc=[inimshape[0]-1,inimshape[1]-1,inimshape[2]-1,chan]
+                ia.putregion(pixels=imdata,pixelmask=immask,region=rg.box(blc=blc,trc=trc))
+            ia.close()
 
     def cleanupTempFiles(self, tmppath):
         """
@@ -30,6 +30,9 @@ scaling={'GHz':1.0e-9,
          'kHz':1.0e-3,
          'Hz':1.0}
 
+# maximum number of Tsys values (rows x channels) processed at a time
+maxchunk = 4194304
+
 #
 # fillTsys( filename, specif, tsysif, mode )
 # 
@@ -88,11 +91,12 @@ def fillTsys( filename, specif, tsysif=None, mode='linear', extrap=False, skipav
 def interpolateInFrequency( a, b, x, mode='linear' ):
     """
     Interpolate 1d array 'b', which is based on axis 'a',
-    to 'x'.
+    to 'x'. If 'b' is a 2d array, each row is interpolated.
 
     Inputs:
        a -- base axis (1-d array)
-       b -- base array (1-d array)
+       b -- base array (1-d array, or 2-d array whose
+            last axis is based on 'a')
        x -- transfer axis (1-d array)
        mode -- interpolation mode
                default: 'linear'
@@ -100,18 +104,18 @@ def interpolateInFrequency( a, b, x, mode='linear' ):
                         'slinear','quadratic','cubic'
 
     Returns:
-       interpolated 1d array
+       interpolated 1d array (2d array if 'b' is 2d)
     """
     flipped = False
     if a[1] < a[0]:
         flipped = True
         a = a[::-1]
-        b = b[::-1]
+        b = b[...,::-1]
         x = x[::-1]
     f = interp1d( a, b, kind=mode )
     y = f( x )
     if flipped:
-        y = y[::-1]
+        y = y[...,::-1]
     return y
 
 def interpolateInTime( t1, y1, t2, y2, t ):
@@ -138,6 +142,41 @@ def interpolateInTime( t1, y1, t2, y2, t ):
         y = ( y2 * dt1 + y1 * dt2 ) / ( dt1 + dt2 )
         return y
 
+def interpolateTsysInTime( caltime, atsys, t ):
+    """
+    Linearly interpolate scan averaged Tsys, 'atsys', which
+    is defined at 'caltime', to each time stamp of 't'.
+    The first (last) Tsys is used for the time stamps
+    before (after) 'caltime'.
+
+    Inputs:
+       caltime -- time stamps of Tsys in ascending order
+                  (1-d array of nscan)
+       atsys -- Tsys (2-d array of nscan x nchan)
+       t -- transfer time stamps (1-d array of nrow)
+
+    Returns:
+       interpolated Tsys (2-d array of nrow x nchan)
+    """
+    nscan = len(caltime)
+    tsys = numpy.empty( (len(t),atsys.shape[1]), dtype=atsys.dtype )
+    before = t < caltime[0]
+    after = t > caltime[nscan-1]
+    # minimum index that satisfies caltime[index] >= t
+    idx = numpy.minimum( numpy.searchsorted( caltime, t ), nscan-1 )
+    exact = numpy.logical_and( caltime[idx] == t,
+                               numpy.logical_not( before | after ) )
+    between = numpy.logical_not( before | after | exact )
+    tsys[before] = atsys[0]
+    tsys[after] = atsys[nscan-1]
+    tsys[exact] = atsys[idx[exact]]
+    if between.any():
+        i = idx[between]
+        dt1 = ( t[between] - caltime[i-1] )[:,numpy.newaxis]
+        dt2 = ( caltime[i] - t[between] )[:,numpy.newaxis]
+        tsys[between] = ( atsys[i] * dt1 + atsys[i-1] * dt2 ) / ( dt1 + dt2 )
+    return tsys
+
 #
 # base class for TsysFiller
 #
@@ -237,31 +276,53 @@ class TsysFillerBase( object ):
                 ret.append( None )
         return ret
 
-    def _search( self, tcol, t, startpos=0 ):
+    def _fillTsys( self, stab, tptab, caltime, atsys ):
         """
-        Simple search
-        
-        Return minimum index that satisfies tcol[index] > t.
-        If such index couldn't be found, return -1.
+        Fill TSYS field of stab with Tsys interpolated in time,
+        and TSYS field of tptab (channel averaged data) with its
+        median unless skip_channelaveraged is True.
 
-        tcol -- array
-        t -- target value
-        startpos -- optional start position (default 0)
-        """
-        n = len(tcol)
-        idx = min( n-1, max( 0, startpos ) )
-        if tcol[idx] > t:
-            idx = 0
-        while ( idx < n and tcol[idx] < t ):
-            #print '%s: tcol[%s] = %s, t = %s'%(idx,idx,tcol[idx],t)
-            idx += 1
-        if idx == n:
-            idx = -1
-            #print 'Index not found, return -1'
-        #else:
-            #print 'found index %s: time[%s] = %s, target = %s'%(idx,idx,tcol[idx],t)
+        Rows are processed in chunks: TIME is read and TSYS is
+        written for all rows of a chunk at once.
 
-        return idx
+        stab -- table of spectral data
+        tptab -- table of channel averaged data
+        caltime -- scan averaged time for Tsys
+        atsys -- scan averaged Tsys (nscan x nchan)
+        """
+        caltime = numpy.array( caltime, dtype=float )
+        atsys = numpy.array( atsys )
+        nrow = stab.nrows()
+        fill_channelaveraged = self.skip_channelaveraged is False and tptab.nrows() > 0
+        nchunk = max( 1, maxchunk / atsys.shape[1] )
+        for startrow in xrange(0,nrow,nchunk):
+            n = min( nchunk, nrow-startrow )
+            t = stab.getcol( 'TIME', startrow, n )
+            tsys = interpolateTsysInTime( caltime, atsys, t )
+            self._putTsys( stab, tsys.transpose(), startrow )
+            if fill_channelaveraged:
+                self._putTsys( tptab, numpy.median( tsys, axis=1 ).reshape(1,n), startrow )
+
+    def _putTsys( self, tab, tsys, startrow ):
+        """
+        Put TSYS for tsys.shape[1] rows from startrow.
+        Rows whose TSYS shape differ from tsys.shape[0]
+        are reshaped.
+
+        tab -- table
+        tsys -- Tsys (nchan x nrow)
+        startrow -- first row
+        """
+        nrow = tsys.shape[1]
+        shape = '[%s]'%(tsys.shape[0])
+        shapes = tab.getcolshapestring( 'TSYS', startrow, nrow )
+        if all( [ s == shape for s in shapes ] ):
+            tab.putcol( 'TSYS', tsys, startrow, nrow )
+        else:
+            cells = {}
+            for i in xrange(nrow):
+                cells['r%s'%(i+1)] = tsys[:,i]
+            tab.putvarcol( 'TSYS', cells, startrow, nrow )
 
 
 #
@@ -331,31 +392,7 @@ class SimpleTsysFiller( TsysFillerBase ):
             print 'WARN: There is only one ATM cal session. No temporal interpolation will be done.'
 
         # process all rows
-        nrow = stab.nrows()
-        cleat = 0
-        for irow in xrange(nrow):
-            #print 'process row %s'%(irow)
-            t = stab.getcell( 'TIME', irow )
-            if t < caltime[0]:
-                #print 'No Tsys available before this scan, use first Tsys'
-                tsys = atsys[0]
-            elif t > caltime[nscan-1]:
-                #print 'No Tsys available after this scan, use last Tsys'
-                tsys = atsys[nscan-1]
-            else:
-                idx = self._search( caltime, t, cleat )
-                cleat = max( 0, idx-1 )
-                if caltime[idx] == t:
-                    tsys = atsys[idx]
-                else:
-                    t0 = caltime[idx-1]
-                    t1 = caltime[idx]
-                    tsys0 = atsys[idx-1]
-                    tsys1 = atsys[idx]
-                    tsys = interpolateInTime( t0, tsys0, t1, tsys1, t )
-            stab.putcell( 'TSYS', irow, tsys )
-            if self.skip_channelaveraged is False and tptab.nrows() > 0:
-                tptab.putcell( 'TSYS', irow, numpy.median(tsys) )
+        self._fillTsys( stab, tptab, caltime, atsys )
         stab.close()
         ttab.close()
         tptab.close()
@@ -557,40 +594,19 @@ class TsysFiller( TsysFillerBase ):
         else:
             abctsys = self.abctsys
 
+        # interpolate in frequency
+        # since interpolation is linear with respect to Tsys,
+        # scan averaged Tsys is interpolated in frequency once
+        # instead of interpolating Tsys of each row
+        atsys = numpy.array( atsys )
+        if atsys.shape[1] == len(abctsys):
+            atsys = interpolateInFrequency( abctsys,
+                                            atsys,
+                                            self.abcsp,
+                                            mode )
+
         # process all rows
-        nrow = stab.nrows()
-        cleat = 0
-        for irow in xrange(nrow):
-            #print 'process row %s'%(irow)
-            t = stab.getcell( 'TIME', irow )
-            if t < caltime[0]:
-                #print 'No Tsys available before this scan, use first Tsys'
-                tsys = atsys[0]
-            elif t > caltime[nscan-1]:
-                #print 'No Tsys available after this scan, use last Tsys'
-                tsys = atsys[nscan-1]
-            else:
-                idx = self._search( caltime, t, cleat )
-                cleat = max( 0, idx-1 )
-                if caltime[idx] == t:
-                    tsys = atsys[idx]
-                else:
-                    t0 = caltime[idx-1]
-                    t1 = caltime[idx]
-                    tsys0 = atsys[idx-1]
-                    tsys1 = atsys[idx]
-                    tsys = interpolateInTime( t0, tsys0, t1, tsys1, t )
-            if len(tsys) == len(abctsys):
-                newtsys = interpolateInFrequency( abctsys,
-                                                  tsys,
-                                                  self.abcsp,
-                                                  mode )
-            else:
-                newtsys = tsys
-            stab.putcell( 'TSYS', irow, newtsys )
-            if self.skip_channelaveraged is False and tptab.nrows() > 0:
-                #tptab.putcell( 'TSYS', irow, newtsys.mean() )
-                tptab.putcell( 'TSYS', irow, numpy.median(newtsys) )
+        self._fillTsys( stab, tptab, caltime, atsys )
 
         stab.close()
         ttab.close()
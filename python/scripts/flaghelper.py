@@ -1,7 +1,13 @@
 import os
+import re
 import time
 import ast
+import gc
 import copy
+import datetime
+import hashlib
+import cPickle
+import numpy as np
 from taskinit import casalog, tbtool, qa, tb, ms, aftool
 from parallel.parallel_task_helper import ParallelTaskHelper
 from collections import deque,defaultdict
@@ -18,6 +24,8 @@ I/O functions:
     readFile
     readFiles
     readAndParse
+    readAndParseFile
+    parseCommand
     parseDictionary
     parseXML
     readAntennaList
@@ -46,6 +54,19 @@ Others
 ###some helper tools
 tblocal = tbtool()
 
+# Time strings in the form written by qa.time(form='ymd',prec=9), used in online flags
+_ymdTimePattern = re.compile(r'^\s*(\d+)/(\d+)/(\d+)/(\d+):(\d+):(\d+(?:\.\d*)?)\s*$')
+_mjdOrdinal = datetime.date(1858,11,17).toordinal()
+
+# On-disk cache of parsed flag command files, keyed by the file contents.
+# Set parsedFileCacheDir to '' to disable it. Small files are not cached, and
+# only the parsedFileCacheMaxFiles most recently used files are kept.
+parsedFileCacheDir = os.path.join(os.getenv('HOME', ''), '.casa', 'flagcmdcache')
+parsedFileCacheMinLines = 1000
+parsedFileCacheMaxFiles = 20
+# Change the version whenever parseCommand() returns something different
+_parsedFileCacheVersion = '1'
+
 
 debug = False
 
@@ -61,6 +82,23 @@ def dump_args(func):
    
     return echo_func
 
+# Decorator function to disable the garbage collector while a function runs
+def pause_gc(func):
+    "This decorator disables the garbage collector while a function creates many objects"
+
+    def nogc_func(*args,**kwargs):
+        gcenabled = gc.isenabled()
+        gc.disable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if gcenabled:
+                gc.enable()
+
+    nogc_func.__name__ = func.__name__
+    nogc_func.__doc__ = func.__doc__
+    return nogc_func
+
 class Parser():
     ''' Parser for input files.
         primarydivider --> first split the string by this character
@@ -121,6 +159,32 @@ class Parser():
         return nstring.split(self.prime)
 
 
+def parseCommand(cmd):
+    '''Parse a flag command string into an ordered dictionary of typed values
+    cmd --> flag command, e.g. "mode='manual' spw='0' autocorr=True"
+
+    Single pass equivalent of Parser(' ','=').parseNoEval() followed by
+    evaluateParameters(). The command is split by whitespace and every entry
+    without a '=' is part of the value of the previous parameter.
+    '''
+    cmddict = OrderedDict()
+    key = None
+    for entry in cmd.strip().split(' '):
+        if '=' in entry:
+            if key is not None:
+                cmddict[key] = _evaluateValue(val)
+            (key, val) = entry.split('=', 1)
+        elif key is None:
+            raise ValueError, 'Invalid flag command: %s' % cmd
+        else:
+            val += ' ' + entry
+
+    if key is not None:
+        cmddict[key] = _evaluateValue(val)
+
+    return cmddict
+
+
 #######################################################
 #
 #     Reading functions
@@ -166,8 +230,8 @@ def addAbsolutePath(input_file):
     of the input_file + '.tmp'
     '''        
     
-    # Get a list of the flag commands from the file          
-    cmdlist = readFile(input_file)
+    # Get a list of the parsed flag commands from the file          
+    cmdlist = readAndParseFile(input_file)
     
     # Make a dictionary of the flag commands
     flagdict = parseDictionary(cmdlist, 'any', False)
@@ -258,14 +322,112 @@ def readFiles(inputfiles):
         cmdlist = cmdlist + cmd
                      
     return cmdlist
+
+@pause_gc
+def readAndParseFile(inputfile):
+    '''Read in a file with flag commands and parse each command
+    inputfile -->  file in disk with a list of flag commands per line
+
+    Returns a list of dictionaries, as parseCommand() returns them for
+    each line given by readFile().
+
+    Files with at least parsedFileCacheMinLines commands are saved parsed
+    to the cache directory parsedFileCacheDir, using the SHA1 of the file
+    contents as the name. Reading again an unchanged file loads the cache
+    instead of parsing it. The least recently used files are removed from
+    the cache when it holds more than parsedFileCacheMaxFiles files.
+    '''
+
+    cachefile = None
+    if parsedFileCacheDir != '' and os.path.isfile(inputfile):
+        try:
+            cachefile = os.path.join(parsedFileCacheDir, _fileDigest(inputfile) + '.pkl')
+            if os.path.isfile(cachefile):
+                cf = open(cachefile, 'rb')
+                try:
+                    cachedrows = cPickle.load(cf)
+                finally:
+                    cf.close()
+                # Mark the cache file as recently used
+                os.utime(cachefile, None)
+                casalog.post('Loaded parsed commands of %s from cache %s'%(inputfile,cachefile), 'DEBUG')
+                return [OrderedDict(zip(keys, values)) for (keys, values) in cachedrows]
+        except Exception, instance:
+            casalog.post('Cannot use the cache of parsed flag commands: %s'%instance, 'DEBUG')
+
+    cmdlist = readFile(inputfile)
+    parsedlist = [parseCommand(cmd) for cmd in cmdlist]
+
+    if cachefile is not None and len(parsedlist) >= parsedFileCacheMinLines:
+        _saveParsedFile(cachefile, parsedlist)
+
+    return parsedlist
+
+def _fileDigest(inputfile):
+    '''Return the SHA1 of the contents of a file, together with the cache version'''
+    digest = hashlib.sha1(_parsedFileCacheVersion)
+    ff = open(inputfile, 'rb')
+    try:
+        for block in iter(lambda: ff.read(1 << 20), ''):
+            digest.update(block)
+    finally:
+        ff.close()
+
+    return digest.hexdigest()
+
+def _saveParsedFile(cachefile, parsedlist):
+    '''Save a list of parsed flag commands to the cache. The commands are
+       saved as (keys, values) pairs, sharing the tuple of keys between the
+       commands that have the same parameters, which is faster to load than
+       the ordered dictionaries themselves.
+    '''
+    keysets = {}
+    cachedrows = []
+    for cmddict in parsedlist:
+        keys = tuple(cmddict.keys())
+        keys = keysets.setdefault(keys, keys)
+        cachedrows.append((keys, tuple(cmddict.values())))
+
+    try:
+        if not os.path.isdir(parsedFileCacheDir):
+            os.makedirs(parsedFileCacheDir)
+        # Write to a temporary file first, so that concurrent
+        # readers never load an incomplete cache
+        tmpfile = '%s.%d.tmp' % (cachefile, os.getpid())
+        cf = open(tmpfile, 'wb')
+        try:
+            cPickle.dump(cachedrows, cf, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            cf.close()
+        os.rename(tmpfile, cachefile)
+        _evictParsedFiles()
+    except Exception, instance:
+        casalog.post('Cannot save the parsed flag commands to the cache: %s'%instance, 'DEBUG')
+
+def _evictParsedFiles():
+    '''Remove the least recently used files of the cache of parsed flag
+       commands, keeping at most parsedFileCacheMaxFiles files.
+    '''
+    cachefiles = [os.path.join(parsedFileCacheDir, name) for name in os.listdir(parsedFileCacheDir)
+                  if name.endswith('.pkl')]
+    if len(cachefiles) <= parsedFileCacheMaxFiles:
+        return
+    cachefiles.sort(key=lambda name: os.path.getmtime(name), reverse=True)
+    for cachefile in cachefiles[parsedFileCacheMaxFiles:]:
+        try:
+            os.remove(cachefile)
+        except OSError:
+            # Removed concurrently by another process
+            pass
     
 def readAndParse(inputlist, tbuff=None):
     '''Read in a list of flag commands and parse them into a dictionary.
        The flag commands can be from a list of files or from a list of flag commands.
        If tbuff is given, it will be applied to the timerange parameters.
        
-       Note: when tbuff is None, it is best to use the individual functions
-       readFile(s) and parseDictionary to avoid parsing the file twice!
+       The files are parsed with readAndParseFile(), which caches the parsed
+       commands of large files. The returned list can be given directly to
+       parseDictionary, which will not parse the commands again.
     
     inputlist -->  list of files in disk containing the flag commands or
                    a list of Python strings with flag commands.
@@ -314,24 +476,12 @@ def readAndParse(inputlist, tbuff=None):
     # List of dictionaries to return    
     listofdict = []
 
-    # Initialize the parser
-    myParser = Parser(' ', '=')
-    
     # Read files 
     if isFile:
         for flagfile in inputlist:        
-            cmdlist = readFile(flagfile)
-            nlines = len(cmdlist)
+            parsedlist = readAndParseFile(flagfile)
+            nlines = len(parsedlist)
             casalog.post('Read %s command(s) from file: %s'%(nlines, flagfile))  
- 
-            parsedlist = []
-            for cmd in cmdlist:
-                #Get a dictionary without type evaluation
-                preparsing = myParser.parseNoEval(cmd)   
-                
-                # Evaluate the types          
-                parsed = evaluateParameters(preparsing)                                    
-                parsedlist.append(parsed)
                 
             # Apply time buffer to file
             if doPadding:
@@ -349,14 +499,7 @@ def readAndParse(inputlist, tbuff=None):
         nlines = len(cmdlist)
         casalog.post('Read %s command(s) from a Python list of strings'%nlines)  
         
-        parsedlist = []
-        for cmd in cmdlist:
-            #Get a dictionary without type evaluation
-            preparsing = myParser.parseNoEval(cmd)   
-            
-            # Evaluate the types          
-            parsed = evaluateParameters(preparsing)
-            parsedlist.append(parsed)
+        parsedlist = [parseCommand(cmd) for cmd in cmdlist]
                    
         # Apply time buffer to list
         if doPadding:
@@ -424,9 +567,6 @@ def readParseTbuff(inputlist, tbuff=None):
     # List of dictionaries to return    
     listofdict = []
 
-    # Initialize the parser
-    myParser = Parser(' ', '=')
-    
     # Read files 
     if isFile:
         for flagfile in inputlist:        
@@ -439,11 +579,8 @@ def readParseTbuff(inputlist, tbuff=None):
  
             parsedlist = []
             for cmd in cmdlist:
-                #Get a dictionary without type evaluation
-                preparsing = myParser.parseNoEval(cmd)   
-                
-                # Evaluate the types          
-                parsed = evaluateParameters(preparsing)     
+                # Get a dictionary with the evaluated types
+                parsed = parseCommand(cmd)
                                                
                 # Apply time buffer to single command
                 if doPadding: 
@@ -469,11 +606,8 @@ def readParseTbuff(inputlist, tbuff=None):
         
         parsedlist = []
         for cmd in cmdlist:
-            #Get a dictionary without type evaluation
-            preparsing = myParser.parseNoEval(cmd)   
-            
-            # Evaluate the types          
-            parsed = evaluateParameters(preparsing)
+            # Get a dictionary with the evaluated types
+            parsed = parseCommand(cmd)
             
             # Apply time buffer to single command
             if doPadding: 
@@ -494,10 +628,9 @@ def applyTimeBuffer(cmddict, tbuff):
          
         * it assumes that timerange has syntax t0~t1
         * split timerange in '~' to get t0 and t1
-        * convert value to time in days using qa.totime
-        * convert days to seconds
+        * convert value to time in seconds using timeToSeconds
         * subtract tbuff from t0 and add tbuff to t1
-        * convert back to time string with the form 'ymd' using qa.time
+        * convert back to time string with the form 'ymd' using secondsToTime
         * write new values back to input dictionary
         
     '''
@@ -510,15 +643,9 @@ def applyTimeBuffer(cmddict, tbuff):
         if timerange.find('~') != -1:
             t0,t1 = timerange.split('~',1)
             # start time
-            startTime = qa.totime(t0)['value']
-            startTimeSec = (startTime * 24 * 3600) - tbuff
-            startTimeSec = qa.quantity(startTimeSec, 's')
-            paddedT0 = qa.time(startTimeSec,form='ymd',prec=9)[0]
+            paddedT0 = secondsToTime(timeToSeconds(t0) - tbuff)
             # end time
-            endTime = qa.totime(t1)['value']
-            endTimeSec = (endTime * 24 * 3600) + tbuff
-            endTimeSec = qa.quantity(endTimeSec, 's')
-            paddedT1 = qa.time(endTimeSec,form='ymd',prec=9)[0]
+            paddedT1 = secondsToTime(timeToSeconds(t1) + tbuff)
             
             # update the original dictionary
             cmddict['timerange'] = paddedT0+'~'+paddedT1                
@@ -540,10 +667,9 @@ def applyTimeBufferList(alist, tbuff=None):
         
         * it assumes that timerange has syntax t0~t1
         * split timerange in '~' to get t0 and t1
-        * convert value to time in days using qa.totime
-        * convert days to seconds
+        * convert all the values to arrays of times in seconds using timeToSeconds
         * subtract tbuff0 from t0 and add tbuff1 to t1
-        * convert back to time string with the form 'ymd' using qa.time
+        * convert back to time strings with the form 'ymd' using secondsToTime
         * write new values back to dictionary
         
     '''
@@ -565,28 +691,58 @@ def applyTimeBufferList(alist, tbuff=None):
          casalog.post('Time buffer (tbuff) is not of type float or list', 'WARN')
          return
     
+    # Collect the start and end times of all the timeranges
+    cmdlist = []
+    startTimes = []
+    endTimes = []
     for cmddict in alist:
         if cmddict.has_key('timerange'):
             timerange = cmddict['timerange']
             if timerange.find('~') != -1:
                 t0,t1 = timerange.split('~',1)
-                # start time
-                startTime = qa.totime(t0)['value']
-                startTimeSec = (startTime * 24 * 3600) - tbuff0
-                startTimeSec = qa.quantity(startTimeSec, 's')
-                paddedT0 = qa.time(startTimeSec,form='ymd',prec=9)[0]
-                # end time
-                endTime = qa.totime(t1)['value']
-                endTimeSec = (endTime * 24 * 3600) + tbuff1
-                endTimeSec = qa.quantity(endTimeSec, 's')
-                paddedT1 = qa.time(endTimeSec,form='ymd',prec=9)[0]
-                
-                # update the original dictionary
-                cmddict['timerange'] = paddedT0+'~'+paddedT1
+                cmdlist.append(cmddict)
+                startTimes.append(timeToSeconds(t0))
+                endTimes.append(timeToSeconds(t1))
+
+    # Apply the time buffer to all of them at once
+    startTimes = np.array(startTimes, dtype=float) - tbuff0
+    endTimes = np.array(endTimes, dtype=float) + tbuff1
+
+    # update the original dictionaries
+    for (cmddict, startTime, endTime) in zip(cmdlist, startTimes, endTimes):
+        cmddict['timerange'] = secondsToTime(startTime)+'~'+secondsToTime(endTime)
                 
     return
 
+
+def timeToSeconds(timestr):
+    ''' Convert a time string to seconds (MJD seconds for dates). Strings in
+        the form YYYY/MM/DD/hh:mm:ss.sss used by the online flags are converted
+        directly, any other form is converted using qa.totime.
+    '''
+    match = _ymdTimePattern.match(timestr)
+    if match is None:
+        return qa.totime(timestr)['value'] * 24 * 3600
+
+    (year, month, day, hour, minute) = map(int, match.groups()[:5])
+    mjd = datetime.date(year, month, day).toordinal() - _mjdOrdinal
+    return (mjd * 24 + hour) * 3600.0 + minute * 60.0 + float(match.group(6))
+
+
+def secondsToTime(seconds):
+    ''' Convert MJD seconds to a time string in the form YYYY/MM/DD/hh:mm:ss.sss,
+        as qa.time(qa.quantity(seconds,'s'),form='ymd',prec=9)[0] would return it.
+    '''
+    (days, msec) = divmod(int(round(seconds * 1000.0)), 24 * 3600 * 1000)
+    date = datetime.date.fromordinal(_mjdOrdinal + days)
+    (hour, msec) = divmod(msec, 3600 * 1000)
+    (minute, msec) = divmod(msec, 60 * 1000)
+    (second, msec) = divmod(msec, 1000)
+    return '%04d/%02d/%02d/%02d:%02d:%02d.%03d' % (date.year, date.month, date.day,
+                                                   hour, minute, second, msec)
+
 #@dump_args
+@pause_gc
 def parseDictionary(cmdlist, reason='any', shadow=True):
     '''Create a dictionary after parsing a list of flag commands.
        If reason is different than 'any', only the selected
@@ -619,9 +775,6 @@ def parseDictionary(cmdlist, reason='any', shadow=True):
                      'ERROR')
         return
  
-    # Separate per ' ', then per '='
-    myParser = Parser(' ', '=')
- 
     flagdict = {}
     row = 0
     for cmd in cmdlist:
@@ -638,11 +791,8 @@ def parseDictionary(cmdlist, reason='any', shadow=True):
             uppercmd = cmd.replace('true','True')
             cmd = uppercmd.replace('false','False')      
         
-            # Get a dictionary without type evaluation
-            preparsing = myParser.parseNoEval(cmd)
-            
-            # Evaluate the types            
-            parsed = evaluateParameters(preparsing)
+            # Get a dictionary with the evaluated types
+            parsed = parseCommand(cmd)
             
         # List of dictionaries: [{'key1':'value1', 'key2':'value2'}]
         elif isinstance(cmd, dict):
@@ -887,14 +1037,54 @@ def parseUnion(vis, flagdict):
          
     return dictpars
 
+def _merge_intervals(intervals):
+    ''' merge overlapping or adjacent time intervals
+
+        intervals -> list of (t0, t1, start, end) tuples, with the time strings
+                     t0, t1 and their values start, end in seconds
+
+        returns the minimal list of 't0~t1' timerange strings covering the
+        intervals, sorted by start time. The time strings of the input are
+        reused, so that an interval that is not merged is left as it is.
+    '''
+    if len(intervals) == 1:
+        return [intervals[0][0] + '~' + intervals[0][1]]
+
+    start = np.array([x[2] for x in intervals])
+    end = np.array([x[3] for x in intervals])
+    order = np.argsort(start, kind='mergesort')
+    start = start[order]
+    end = end[order]
+
+    # running maximum of the end times and index of the interval reaching it
+    maxend = np.maximum.accumulate(end)
+    maxidx = np.maximum.accumulate(np.where(end >= maxend, np.arange(len(end)), 0))
+
+    # a new interval begins when the start is after all the previous ends
+    first = np.flatnonzero(np.concatenate(([True], start[1:] > maxend[:-1])))
+    last = np.concatenate((first[1:] - 1, [len(end) - 1]))
+
+    return [intervals[order[i]][0] + '~' + intervals[order[maxidx[j]]][1]
+            for (i, j) in zip(first, last)]
+
 def _merge_timerange(commands):
     ''' merge manual commands that only differ in timerange and agentname
-        this speeds up manual flagging using large lists
+        this speeds up manual flagging using large lists. The time intervals
+        of the merged commands are merged too when they overlap or are adjacent
 
         cmd -> list of flagging commands
 
         returns list of commands with unique key
     '''
+    def merged_commands(merged):
+        lmerged = []
+        for (cmd, intervals, timeranges) in merged.values():
+            if len(intervals) > 0:
+                timeranges = _merge_intervals(intervals) + timeranges
+            cmd['timerange'] = ','.join(timeranges)
+            lmerged.append(cmd)
+        return lmerged
+
     merged = dict()
     lunique = []
     for cmd in commands:
@@ -909,22 +1099,27 @@ def _merge_timerange(commands):
             compound = tuple((x, cmd[x]) for x in compound_key)
 
             # skip invalid timeranges so they don't remove the whole agent group
+            interval = None
             if '~' in cmd['timerange']:
                 t0,t1 = cmd['timerange'].split('~', 1)
-                startTime = qa.totime(t0)['value']
-                endTime = qa.totime(t1)['value']
+                startTime = timeToSeconds(t0)
+                endTime = timeToSeconds(t1)
                 if endTime <= startTime:
                     raise ValueError
-
-            # merge timerange duplicate compound keys
-            try:
-                merged[compound]['timerange'] += ',' + cmd['timerange']
-            except KeyError:
-                merged[compound] = copy.deepcopy(cmd)
+                interval = (t0, t1, startTime, endTime)
+
+            # merge timerange duplicate compound keys, time intervals are kept
+            # as numbers to be merged, other timeranges as they are
+            if not merged.has_key(compound):
+                merged[compound] = (copy.deepcopy(cmd), [], [])
+            if interval is None:
+                merged[compound][2].append(cmd['timerange'])
+            else:
+                merged[compound][1].append(interval)
         except:
             # add merged keys to non-mergeable keys, also on errors like
             # non-hashable keys
-            lunique.extend(merged.values())
+            lunique.extend(merged_commands(merged))
             # append non mergeable key
             lunique.append(copy.deepcopy(cmd))
             # reset merge to preserve ordering of manual and other flags
@@ -933,7 +1128,7 @@ def _merge_timerange(commands):
             merged = dict()
 
     # add remaining merged keys to non-mergeable keys
-    lunique.extend(merged.values())
+    lunique.extend(merged_commands(merged))
     return lunique
 
 def parseAgents(aflocal, flagdict, myrows, apply, writeflags, display=''):
@@ -1820,44 +2015,48 @@ def evaluateParameters(pardict):
     cmddict = OrderedDict()
     
     for key,val in pardict.iteritems():
-        newval = None        
-                
-        if val.startswith('['):
-            newval = ast.literal_eval(val)
-        elif val.startswith('{'):
-            newval = eval(val)
-        elif val == 'True' or val == 'False':
-            if eval(val) == True or eval(val) == False:
-                newval = eval(val)
-        if newval == None:
-            try:
-                # Try int
-                int(val)
-                newval = int(val)
-            except:
-                # Try float
-                try:
-                    float(val)
-                    newval = float(val)
-                except:
-                    # Try string                    
-                    if val.count("'") > 0:
-                        val = val.strip("'")
-                    elif val.count('"') > 0:
-                        val = val.strip('"')
-                        
-                    # CAS-6553 cannot have only one quote. remove it
-                    if val.count("'") == 1:
-                        val = val.replace("'", '')
-                    elif val.count('"') == 1:
-                        val = val.replace('"', '')
-                        
-                    newval = str(val).strip()
-        
-        cmddict[key] = newval
+        cmddict[key] = _evaluateValue(val)
     
     return cmddict
 
+def _evaluateValue(val):
+    '''Evaluate a parameter value string to its correct Python type'''
+
+    if val.startswith('['):
+        return ast.literal_eval(val)
+    elif val.startswith('{'):
+        return eval(val)
+    elif val == 'True':
+        return True
+    elif val == 'False':
+        return False
+
+    # Quoted strings cannot be numbers
+    if not val.startswith("'") and not val.startswith('"'):
+        try:
+            # Try int
+            return int(val)
+        except ValueError:
+            # Try float
+            try:
+                return float(val)
+            except ValueError:
+                pass
+
+    # Try string
+    if val.count("'") > 0:
+        val = val.strip("'")
+    elif val.count('"') > 0:
+        val = val.strip('"')
+
+    # CAS-6553 cannot have only one quote. remove it
+    if val.count("'") == 1:
+        val = val.replace("'", '')
+    elif val.count('"') == 1:
+        val = val.replace('"', '')
+
+    return str(val).strip()
+
 def evaluateFlagParameters(pardict, pars):
     """Check if a flagdata parameter dictionary is valid
 
@@ -2041,6 +2240,28 @@ def evaluateNumpyType(elem):
     # return the casted element  
     return val
 
+def _iterSDMTableRows(xmlfile):
+    '''Iterate over the rows of an SDM table XML file w/o building its DOM.
+       Each row is returned as a dictionary with the text of the first
+       element with each tag in the row (as from getElementsByTagName).
+       Rows are cleared once returned, so that only empty row elements
+       are kept in memory while parsing.'''
+
+    from xml.etree import cElementTree as ElementTree
+
+    for event, elem in ElementTree.iterparse(xmlfile):
+        if elem.tag.split('}')[-1] != 'row':
+            continue
+        row = {}
+        for child in elem.iter():
+            if child is elem:
+                continue
+            tag = child.tag.split('}')[-1]
+            if not row.has_key(tag):
+                row[tag] = child.text
+        yield row
+        elem.clear()
+
 def parseXML(sdmfile, mytbuff):
     '''
 #   readflagxml: reads Antenna.xml and Flag.xml SDM tables and parses
@@ -2084,12 +2305,6 @@ def parseXML(sdmfile, mytbuff):
     polmode = 1
 
 #
-    try:
-        from xml.dom import minidom
-    except ImportError, e:
-        print 'failed to load xml.dom.minidom:\n', e
-        exit(1)
-
     if type(mytbuff) != float:
         casalog.post('Found incorrect type for tbuff','SEVERE')
         exit(1)
@@ -2111,35 +2326,29 @@ def parseXML(sdmfile, mytbuff):
                      'WARN')
 
     # construct look-up dictionary of name vs. id from Antenna.xml
-    xmlants = minidom.parse(sdmfile + '/Antenna.xml')
     antdict = {}
-    rowlist = xmlants.getElementsByTagName('row')
-    for rownode in rowlist:
-        rowname = rownode.getElementsByTagName('name')
-        ant = str(rowname[0].childNodes[0].nodeValue).strip()
-        rowid = rownode.getElementsByTagName('antennaId')
+    nants = 0
+    for row in _iterSDMTableRows(sdmfile + '/Antenna.xml'):
+        ant = str(row['name']).strip()
         # CAS-4532: remove spaces between content and tags
-        antid = str(rowid[0].childNodes[0].nodeValue).strip()
+        antid = str(row['antennaId']).strip()
         antdict[antid] = ant
-    casalog.post('Found ' + str(rowlist.length)
+        nants += 1
+    casalog.post('Found ' + str(nants)
                  + ' rows in Antenna.xml')
 
     # construct look-up dictionary of name vs. id from SpectralWindow.xml
     if spwexist:
-        xmlspws = minidom.parse(sdmfile + '/SpectralWindow.xml')
         spwdict = {}
-        rowlist = xmlspws.getElementsByTagName('row')
         ispw = 0
         wvrnominal = False
-        for rownode in rowlist:
-            rowid = rownode.getElementsByTagName('spectralWindowId')
+        for row in _iterSDMTableRows(sdmfile + '/SpectralWindow.xml'):
             # CAS-4532: remove spaces between content and tags
-            spwid = str(rowid[0].childNodes[0].nodeValue).strip()
+            spwid = str(row['spectralWindowId']).strip()
             spwdict[spwid] = {}
             spwdict[spwid]['index'] = ispw
-            if rownode.getElementsByTagName('name'):
-                rowname = rownode.getElementsByTagName('name')
-                spwname = str(rowname[0].childNodes[0].nodeValue).strip()
+            if row.has_key('name'):
+                spwname = str(row['name']).strip()
                 if spwname == 'WVR#NOMINAL':
                     wvrnominal = True
                 spwdict[spwid]['name'] = spwname
@@ -2151,7 +2360,7 @@ def parseXML(sdmfile, mytbuff):
 #            spwdict[spwid] = {}
 #            spwdict[spwid]['index'] = ispw
             ispw += 1
-        casalog.post('Found ' + str(rowlist.length)
+        casalog.post('Found ' + str(ispw)
                      + ' rows in SpectralWindow.xml')
 
     # report chosen spw and pol modes
@@ -2170,27 +2379,22 @@ def parseXML(sdmfile, mytbuff):
                      )
 
     # now read Flag.xml into dictionary row by row
-    xmlflags = minidom.parse(sdmfile + '/Flag.xml')
+    # NOTE: Flag.xml is streamed row by row, building its whole DOM took minutes
+    #       and gigabytes of memory for SDMs with hundreds of thousands of flags
     flagdict = {}
-    rowlist = xmlflags.getElementsByTagName('row')
-    nrows = rowlist.length
     newsdm = -1
     newspw = -1
     newpol = -1
-    for fid in range(nrows):
-        rownode = rowlist[fid]
-        rowfid = rownode.getElementsByTagName('flagId')
-        fidstr = str(rowfid[0].childNodes[0].nodeValue).strip()
+    for (fid, row) in enumerate(_iterSDMTableRows(sdmfile + '/Flag.xml')):
+        fidstr = str(row['flagId']).strip()
         flagdict[fid] = {}
         flagdict[fid]['id'] = fidstr
-        rowid = rownode.getElementsByTagName('antennaId')
-        antid = rowid[0].childNodes[0].nodeValue
+        antid = row['antennaId']
         # check if there is a numAntenna specified (new format)
-        rownant = rownode.getElementsByTagName('numAntenna')
         antname = ''
-        if rownant.__len__() > 0:
+        if row.has_key('numAntenna'):
             xid = antid.split()
-            nant = int(rownant[0].childNodes[0].nodeValue)
+            nant = int(row['numAntenna'])
             if newsdm < 0:
                 casalog.post('Found numAntenna=' + str(nant)
                              + ' must be a new style SDM')
@@ -2226,13 +2430,11 @@ def parseXML(sdmfile, mytbuff):
             ana = antdict[aid]
             antname = ana
         # start and end times in mjd ns
-        rowstart = rownode.getElementsByTagName('startTime')
-        start = int(rowstart[0].childNodes[0].nodeValue)
+        start = int(row['startTime'])
         startmjds = float(start) * 1.0E-9 - mytbuff
         t = qa.quantity(startmjds, 's')
         starttime = qa.time(t, form='ymd', prec=9)[0]
-        rowend = rownode.getElementsByTagName('endTime')
-        end = int(rowend[0].childNodes[0].nodeValue)
+        end = int(row['endTime'])
         endmjds = float(end) * 1.0E-9 + mytbuff
         t = qa.quantity(endmjds, 's')
         endtime = qa.time(t, form='ymd', prec=9)[0]
@@ -2242,15 +2444,13 @@ def parseXML(sdmfile, mytbuff):
         flagdict[fid]['time'] = times
         flagdict[fid]['interval'] = intervs
         # reasons
-        rowreason = rownode.getElementsByTagName('reason')
-        reas = str(rowreason[0].childNodes[0].nodeValue)
+        reas = str(row['reason'])
         # Replace any white space with underscores
         reason = reas.replace(' ','_')
     # NEW SDM ADDITIONS 2011-11-01
-        rownspw = rownode.getElementsByTagName('numSpectralWindow')
         spwstring = ''
-        if spwmode != 0 and rownspw.__len__() > 0:
-            nspw = int(rownspw[0].childNodes[0].nodeValue)
+        if spwmode != 0 and row.has_key('numSpectralWindow'):
+            nspw = int(row['numSpectralWindow'])
         # has a new-style spw specification
             if newspw < 0:
                 if not spwexist:
@@ -2261,8 +2461,7 @@ def parseXML(sdmfile, mytbuff):
                              + ' must be a new style SDM')
             newspw = 1
             if nspw > 0:
-                rowspwid = rownode.getElementsByTagName('spectralWindowId')
-                spwids = rowspwid[0].childNodes[0].nodeValue
+                spwids = row['spectralWindowId']
                 xspw = spwids.split()
                 for isp in range(nspw):
                     spid = str(xspw[2 + isp])
@@ -2282,18 +2481,15 @@ def parseXML(sdmfile, mytbuff):
                         else:
                             spwstring += ',' + spstr
         polstring = ''
-        rownpol = rownode.getElementsByTagName('numPolarizationType')
-        if polmode != 0 and rownpol.__len__() > 0:
-            npol = int(rownpol[0].childNodes[0].nodeValue)
+        if polmode != 0 and row.has_key('numPolarizationType'):
+            npol = int(row['numPolarizationType'])
         # has a new-style pol specification
             if newpol < 0:
                 casalog.post('Found numPolarizationType=' + str(npol)
                              + ' must be a new style SDM')
             newpol = 1
             if npol > 0:
-                rowpolid = \
-                    rownode.getElementsByTagName('polarizationType')
-                polids = rowpolid[0].childNodes[0].nodeValue
+                polids = row['polarizationType']
                 xpol = polids.split()
                 for ipol in range(npol):
                     polid = str(xpol[2 + ipol])
@@ -2350,9 +2546,9 @@ def parseXML(sdmfile, mytbuff):
         flagdict[fid]['mode'] = 'online'
 
     flags = {}
-    if rowlist.length > 0:
+    if len(flagdict) > 0:
         flags = flagdict
-        casalog.post('Found ' + str(rowlist.length)
+        casalog.post('Found ' + str(len(flagdict))
                      + ' flags in Flag.xml')
     else:
         casalog.post('No valid flags found in Flag.xml')
@@ -2646,12 +2842,6 @@ def readXML(sdmfile, mytbuff):
     polmode = 1
 
 #
-    try:
-        from xml.dom import minidom
-    except ImportError, e:
-        print 'failed to load xml.dom.minidom:\n', e
-        exit(1)
-
     if type(mytbuff) != float:
         casalog.post('Found incorrect type for tbuff','SEVERE')
         exit(1)
@@ -2673,35 +2863,29 @@ def readXML(sdmfile, mytbuff):
                      'WARN')
 
     # construct look-up dictionary of name vs. id from Antenna.xml
-    xmlants = minidom.parse(sdmfile + '/Antenna.xml')
     antdict = {}
-    rowlist = xmlants.getElementsByTagName('row')
-    for rownode in rowlist:
-        rowname = rownode.getElementsByTagName('name')
-        ant = str(rowname[0].childNodes[0].nodeValue)
-        rowid = rownode.getElementsByTagName('antennaId')
+    nants = 0
+    for row in _iterSDMTableRows(sdmfile + '/Antenna.xml'):
+        ant = str(row['name'])
         # CAS-4532: remove spaces between content and tags
-        antid = str(rowid[0].childNodes[0].nodeValue).strip()
+        antid = str(row['antennaId']).strip()
         antdict[antid] = ant
-    casalog.post('Found ' + str(rowlist.length)
+        nants += 1
+    casalog.post('Found ' + str(nants)
                  + ' antennas in Antenna.xml')
 
     # construct look-up dictionary of name vs. id from SpectralWindow.xml
     if spwexist:
-        xmlspws = minidom.parse(sdmfile + '/SpectralWindow.xml')
         spwdict = {}
-        rowlist = xmlspws.getElementsByTagName('row')
         ispw = 0
-        for rownode in rowlist:
-            rowid = rownode.getElementsByTagName('spectralWindowId')
+        for row in _iterSDMTableRows(sdmfile + '/SpectralWindow.xml'):
             # CAS-4532: remove spaces between content and tags
-            spwid = str(rowid[0].childNodes[0].nodeValue).strip()
+            spwid = str(row['spectralWindowId']).strip()
             spwdict[spwid] = {}
             spwdict[spwid]['index'] = ispw
             # SMC: 6/3/2012 ALMA SDM does not have name
-            if rownode.getElementsByTagName('name'):
-                rowname = rownode.getElementsByTagName('name')
-                spw = str(rowname[0].childNodes[0].nodeValue)
+            if row.has_key('name'):
+                spw = str(row['name'])
                 spwdict[spwid]['name'] = spw
             else:
                 spwmode = -1
@@ -2711,7 +2895,7 @@ def readXML(sdmfile, mytbuff):
 #            spwdict[spwid] = {}
 #            spwdict[spwid]['index'] = ispw
             ispw += 1
-        casalog.post('Found ' + str(rowlist.length)
+        casalog.post('Found ' + str(ispw)
                      + ' spw in SpectralWindow.xml')
 
     # report chosen spw and pol modes
@@ -2730,27 +2914,20 @@ def readXML(sdmfile, mytbuff):
                      )
 
     # now read Flag.xml into dictionary row by row
-    xmlflags = minidom.parse(sdmfile + '/Flag.xml')
     flagdict = {}
-    rowlist = xmlflags.getElementsByTagName('row')
-    nrows = rowlist.length
     newsdm = -1
     newspw = -1
     newpol = -1
-    for fid in range(nrows):
-        rownode = rowlist[fid]
-        rowfid = rownode.getElementsByTagName('flagId')
-        fidstr = str(rowfid[0].childNodes[0].nodeValue)
+    for (fid, row) in enumerate(_iterSDMTableRows(sdmfile + '/Flag.xml')):
+        fidstr = str(row['flagId'])
         flagdict[fid] = {}
         flagdict[fid]['id'] = fidstr
-        rowid = rownode.getElementsByTagName('antennaId')
-        antid = rowid[0].childNodes[0].nodeValue
+        antid = row['antennaId']
         # check if there is a numAntenna specified (new format)
-        rownant = rownode.getElementsByTagName('numAntenna')
         antname = ''
-        if rownant.__len__() > 0:
+        if row.has_key('numAntenna'):
             xid = antid.split()
-            nant = int(rownant[0].childNodes[0].nodeValue)
+            nant = int(row['numAntenna'])
             if newsdm < 0:
                 casalog.post('Found numAntenna=' + str(nant)
                              + ' must be a new style SDM')
@@ -2786,13 +2963,11 @@ def readXML(sdmfile, mytbuff):
             ana = antdict[aid]
             antname = ana
         # start and end times in mjd ns
-        rowstart = rownode.getElementsByTagName('startTime')
-        start = int(rowstart[0].childNodes[0].nodeValue)
+        start = int(row['startTime'])
         startmjds = float(start) * 1.0E-9 - mytbuff
         t = qa.quantity(startmjds, 's')
         starttime = qa.time(t, form='ymd', prec=9)[0]
-        rowend = rownode.getElementsByTagName('endTime')
-        end = int(rowend[0].childNodes[0].nodeValue)
+        end = int(row['endTime'])
         endmjds = float(end) * 1.0E-9 + mytbuff
         t = qa.quantity(endmjds, 's')
         endtime = qa.time(t, form='ymd', prec=9)[0]
@@ -2802,15 +2977,13 @@ def readXML(sdmfile, mytbuff):
         flagdict[fid]['time'] = times
         flagdict[fid]['interval'] = intervs
         # reasons
-        rowreason = rownode.getElementsByTagName('reason')
-        reas = str(rowreason[0].childNodes[0].nodeValue)
+        reas = str(row['reason'])
         # Replace any white space with underscores
         reason = reas.replace(' ','_')
     # NEW SDM ADDITIONS 2011-11-01
-        rownspw = rownode.getElementsByTagName('numSpectralWindow')
         spwstring = ''
-        if spwmode != 0 and rownspw.__len__() > 0:
-            nspw = int(rownspw[0].childNodes[0].nodeValue)
+        if spwmode != 0 and row.has_key('numSpectralWindow'):
+            nspw = int(row['numSpectralWindow'])
         # has a new-style spw specification
             if newspw < 0:
                 if not spwexist:
@@ -2821,9 +2994,7 @@ def readXML(sdmfile, mytbuff):
                              + ' must be a new style SDM')
             newspw = 1
             if nspw > 0:
-                rowspwid = \
-                    rownode.getElementsByTagName('spectralWindowId')
-                spwids = rowspwid[0].childNodes[0].nodeValue
+                spwids = row['spectralWindowId']
                 xspw = spwids.split()
                 for isp in range(nspw):
                     spid = str(xspw[2 + isp])
@@ -2836,18 +3007,15 @@ def readXML(sdmfile, mytbuff):
                     else:
                         spwstring += ',' + spstr
         polstring = ''
-        rownpol = rownode.getElementsByTagName('numPolarizationType')
-        if polmode != 0 and rownpol.__len__() > 0:
-            npol = int(rownpol[0].childNodes[0].nodeValue)
+        if polmode != 0 and row.has_key('numPolarizationType'):
+            npol = int(row['numPolarizationType'])
         # has a new-style pol specification
             if newpol < 0:
                 casalog.post('Found numPolarizationType=' + str(npol)
                              + ' must be a new style SDM')
             newpol = 1
             if npol > 0:
-                rowpolid = \
-                    rownode.getElementsByTagName('polarizationType')
-                polids = rowpolid[0].childNodes[0].nodeValue
+                polids = row['polarizationType']
                 xpol = polids.split()
                 for ipol in range(npol):
                     polid = str(xpol[2 + ipol])
@@ -2897,9 +3065,9 @@ def readXML(sdmfile, mytbuff):
         flagdict[fid]['mode'] = 'online'
 
     flags = {}
-    if rowlist.length > 0:
+    if len(flagdict) > 0:
         flags = flagdict
-        casalog.post('Found ' + str(rowlist.length)
+        casalog.post('Found ' + str(len(flagdict))
                      + ' flags in Flag.xml')
     else:
         casalog.post('No valid flags found in Flag.xml')
@@ -166,6 +166,10 @@ argparser.add_argument( "--pipeline",dest='pipeline',action='store_const',const=
                         help='start CASA pipeline run' )
 argparser.add_argument( "-c",dest='execute',default=[],nargs='+',
                         help='python eval string or python script to execute' )
+argparser.add_argument( "--startup-profile",dest='startupprofile',action='store_const',const=True,default=False,
+                        help='print the time spent in each start up stage and import' )
+argparser.add_argument( "--lazy-init",dest='lazyinit',action='store_const',const=True,default=False,
+                        help='import tasks and the testing environment on first use' )
 
 casa['flags'] = argparser.parse_args( )
 #### must keep args in sync with 'casa' state...
@@ -1,5 +1,9 @@
 from math import *
-from tasks import *
+if casa['flags'].lazyinit:
+    from casa_startup import lazy_import_tasks
+    lazy_import_tasks(globals())
+else:
+    from tasks import *
 from parameter_dictionary import *
 from task_help import *
 import numpy as np
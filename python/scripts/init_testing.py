@@ -32,5 +32,10 @@ def pybot_setup( ):
         print "OUTPUT: ", output
         print "ERROR:  ", err
 
-import publish_summary
-import runUnitTest
+if casa['flags'].lazyinit:
+    from casa_startup import lazy_import_module
+    lazy_import_module(globals(),'publish_summary')
+    lazy_import_module(globals(),'runUnitTest')
+else:
+    import publish_summary
+    import runUnitTest
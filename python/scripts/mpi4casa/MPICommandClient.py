@@ -17,6 +17,9 @@ from MPICommunicator import MPICommunicator
 # Import MPIMonitorClient singleton
 from MPIMonitorClient import MPIMonitorClient
 
+# Import MPICommandRequestQueue
+from MPICommandRequestQueue import MPICommandRequestQueue
+
 # Define log levels
 log_levels = ['DEBUG','DEBUG1','DEBUG2','NORMAL','NORMAL1','NORMAL2','NORMAL3','NORMAL4','NORMAL5',
               'INFO','INFO1','INFO2','INFO3','INFO4','INFO5']
@@ -94,7 +97,7 @@ class MPICommandClient:
             self.__command_response_handler_service_event_controller.clear()            
             
             # Initialize command request queue service state
-            self.__command_request_queue = []
+            self.__command_request_queue = MPICommandRequestQueue()
             self.__command_request_queue_service_on = False
             self.__command_request_queue_service_running = False
             self.__command_request_queue_service_thread = None             
@@ -106,6 +109,13 @@ class MPICommandClient:
             self.__command_request_input_queue = []
             self.__command_request_input_queue_lock = threading.Lock()
             
+            # Ids of the command requests to be cancelled if they have not been sent yet,
+            # also protected by the command request input queue lock
+            self.__cancelled_command_request_id_list = []
+            
+            # Condition used to wake up the threads waiting for command responses
+            self.__command_response_condition = threading.Condition()
+            
             # Instantiate MPICommunicator reference
             self.__communicator = MPICommunicator()
             
@@ -143,55 +153,62 @@ class MPICommandClient:
                 if len(self.__command_response_list) == len(self.__command_request_list):
                     self.__command_response_handler_service_event_controller.wait()
                 
-                # First check if there is a command response msg available
-                msg_available = False
+                # Block until the next command response msg (or the stop wake-up msg) arrives
                 try:
-                    msg_available = self.__communicator.command_response_probe()
+                    command_response = self.__communicator.command_response_recv()
                 except:
-                    msg_available = False
                     formatted_traceback = traceback.format_exc()
-                    casalog.post("Exception checking if command response msg is available: %s" 
-                                 % str(formatted_traceback),"SEVERE",casalog_call_origin)                 
-                    
-                # Then receive, store and post command response msg
-                if (msg_available):            
-                    try:
-                        # Receive command response
-                        command_response = self.__communicator.command_response_recv()
-                        server = command_response['server']
-                        successful = command_response['successful']
-                        command_id = command_response['id']
-                        # Mark immediately server as not-busy
-                        self.__monitor_client.set_server_status_keyword(server,'busy',False)
-                        # Store command response
-                        self.__command_response_list[command_id] = command_response 
-                        # If there are no pending command responses clear the event controller
-                        if len(self.__command_response_list) == len(self.__command_request_list):
-                            self.__command_response_handler_service_event_controller.clear()                             
-                        # Mark command request as received
-                        self.__command_request_list[command_id]['status'] = 'response received' 
-                        self.__command_response_list[command_id]['status'] = 'response received' 
-                        # Notify that command response has been received
-                        if successful:
-                            casalog.post("Command request with id %s successfully handled by server n# %s" 
-                                         % (str(command_id),str(server)),MPIEnvironment.command_handling_log_level,casalog_call_origin)                                  
-                        else:
-                            casalog.post("Command request with id %s failed in server n# %s with traceback %s" 
-                                         % (str(command_id),str(server),str(command_response['traceback'])),
-                                         "SEVERE",casalog_call_origin)          
-                        # If this request belongs to a group update the group response object
-                        if self.__command_request_list[command_id].has_key('group'):
-                            command_group_response_id = self.__command_request_list[command_id]['group']
-                            self.__command_group_response_list[command_group_response_id]['list'].remove(command_id)
-                            # If there are no requests pending from this group send the group response signal
-                            if len(self.__command_group_response_list[command_group_response_id]['list']) == 0:
-                                self.__command_group_response_list[command_group_response_id]['event'].set()
-                    except:
-                        formatted_traceback = traceback.format_exc()
-                        casalog.post("Exception receiving command request response msg: %s" 
-                                     % str(formatted_traceback),"SEVERE",casalog_call_origin)
-                else:
-                    time.sleep(MPIEnvironment.mpi_command_response_handler_service_sleep_time) 
+                    casalog.post("Exception receiving command request response msg: %s" 
+                                 % str(formatted_traceback),"SEVERE",casalog_call_origin)
+                    continue
+                
+                # Wake-up msg sent to ourselves by __stop_command_response_handler_service
+                if command_response.has_key('signal'):
+                    continue
+                
+                # Then store and post command response msg
+                try:
+                    server = command_response['server']
+                    successful = command_response['successful']
+                    command_id = command_response['id']
+                    # Mark immediately server as not-busy
+                    self.__monitor_client.set_server_status_keyword(server,'busy',False)
+                    # Store command response
+                    self.__command_response_list[command_id] = command_response 
+                    # If there are no pending command responses clear the event controller
+                    if len(self.__command_response_list) == len(self.__command_request_list):
+                        self.__command_response_handler_service_event_controller.clear()
+                        # A command request may have been pushed in the meantime
+                        if len(self.__command_response_list) != len(self.__command_request_list):
+                            self.__command_response_handler_service_event_controller.set()
+                    # Mark command request as received
+                    self.__command_request_list[command_id]['status'] = 'response received' 
+                    self.__command_response_list[command_id]['status'] = 'response received' 
+                    # Wake up the command request queue service as the server is available again
+                    self.__command_request_queue_service_event_controller.set()
+                    # Wake up the threads waiting for command responses
+                    self.__command_response_condition.acquire()
+                    self.__command_response_condition.notifyAll()
+                    self.__command_response_condition.release()
+                    # Notify that command response has been received
+                    if successful:
+                        casalog.post("Command request with id %s successfully handled by server n# %s" 
+                                     % (str(command_id),str(server)),MPIEnvironment.command_handling_log_level,casalog_call_origin)                                  
+                    else:
+                        casalog.post("Command request with id %s failed in server n# %s with traceback %s" 
+                                     % (str(command_id),str(server),str(command_response['traceback'])),
+                                     "SEVERE",casalog_call_origin)          
+                    # If this request belongs to a group update the group response object
+                    if self.__command_request_list[command_id].has_key('group'):
+                        command_group_response_id = self.__command_request_list[command_id]['group']
+                        self.__command_group_response_list[command_group_response_id]['list'].remove(command_id)
+                        # If there are no requests pending from this group send the group response signal
+                        if len(self.__command_group_response_list[command_group_response_id]['list']) == 0:
+                            self.__command_group_response_list[command_group_response_id]['event'].set()
+                except:
+                    formatted_traceback = traceback.format_exc()
+                    casalog.post("Exception handling command request response msg: %s" 
+                                 % str(formatted_traceback),"SEVERE",casalog_call_origin)
 
             # Mark service as not running
             self.__command_response_handler_service_running = False            
@@ -235,6 +252,14 @@ class MPICommandClient:
             self.__command_response_handler_service_on = False
             # Send signal to the thread to be awakened
             self.__command_response_handler_service_event_controller.set()            
+            # The thread may be blocked receiving a command response, so send it a wake-up msg
+            try:
+                self.__communicator.command_response_wakeup_send()
+            except:
+                formatted_traceback = traceback.format_exc()
+                casalog.post("Exception sending wake-up msg to MPI command response handler service: %s" 
+                             % str(formatted_traceback),"SEVERE",casalog_call_origin)
+                return
         
             while (self.__command_response_handler_service_running):
                 time.sleep(MPIEnvironment.mpi_check_stop_service_sleep_time)
@@ -251,42 +276,40 @@ class MPICommandClient:
                        
             while self.__command_request_queue_service_on:
                 
-                # Wait until there are pending command responses
-                self.__command_request_input_queue_lock.acquire()
-                if len(self.__command_request_queue) == 0 and len(self.__command_request_input_queue) == 0:
-                    self.__command_request_input_queue_lock.release()
-                    self.__command_request_queue_service_event_controller.wait()
-                else:
-                    self.__command_request_input_queue_lock.release()
+                # Clear the event controller before inspecting the queues, so that
+                # any new request or response arriving afterwards wakes us up again
+                self.__command_request_queue_service_event_controller.clear()
                     
                 # Pick up jobs from input queue
                 self.__command_request_input_queue_lock.acquire()
-                while len(self.__command_request_input_queue) > 0:
-                    self.__command_request_queue.append(self.__command_request_input_queue.pop(0))
+                command_request_input_queue = self.__command_request_input_queue
+                self.__command_request_input_queue = []
+                cancelled_command_request_id_list = self.__cancelled_command_request_id_list
+                self.__cancelled_command_request_id_list = []
                 self.__command_request_input_queue_lock.release()
+                for command_request in command_request_input_queue:
+                    self.__command_request_queue.append(command_request)
+                    
+                # Drop the cancelled command requests that are still queued
+                if len(cancelled_command_request_id_list) > 0:
+                    self.__drop_cancelled_command_requests(cancelled_command_request_id_list)
+                
+                # Wait until there are pending command requests
+                if len(self.__command_request_queue) == 0:
+                    self.__command_request_queue_service_event_controller.wait()
+                    continue
 
                 # Get list of available servers
+                matching_command_request_id_list = []
                 available_servers_list = self.__monitor_client.get_server_rank_available()
                 if len(available_servers_list) >= 1:
                     # Get list of matching command requests
-                    matching_command_request_id_list = self.__match_available_servers_with_command_requests(available_servers_list)
+                    matching_command_request_id_list = self.__command_request_queue.match_available_servers(available_servers_list)
                     # Iterate over matching command request list
                     for command_request_id in matching_command_request_id_list:
-                        command_request_found = False
-                        command_request_queue_idx = 0
-                        # Iterate over command request queue to find the corresponding index
-                        for command_request in self.__command_request_queue:
-                            if command_request['id'] == command_request_id:
-                                command_request_found = True
-                                break
-                            else:
-                                command_request_queue_idx = command_request_queue_idx + 1
                         # Extract command request from queue and send it
-                        if command_request_found:
-                            command_request = self.__command_request_queue.pop(command_request_queue_idx)
-                            # If command request queue us empty clear the event controller
-                            if len(self.__command_request_queue) == 0:
-                                self.__command_request_queue_service_event_controller.clear()                            
+                        command_request = self.__command_request_queue.pop(command_request_id)
+                        if command_request is not None:
                             server = command_request['server']
                             try:
                                 # Mark assigned server as busy and set command info in server status
@@ -310,49 +333,56 @@ class MPICommandClient:
                                 # Notify exception
                                 casalog.post("Exception sending command request with id# %s to server n# %s: %s"
                                              % (str(command_request_id),str(server),str(formatted_traceback)),
-                                             "SEVERE",casalog_call_origin)                       
+                                             "SEVERE",casalog_call_origin)
                         else:
                             casalog.post("Command request with id# %s not found" % 
                                          str(command_request_id),"SEVERE",casalog_call_origin)
-                else:
-                    # Sleep in order not to saturate the system
-                    time.sleep(MPIEnvironment.mpi_command_request_queue_service_sleep_time)
+                    # Wake up the threads waiting for command requests to be sent (or failed)
+                    self.__command_response_condition.acquire()
+                    self.__command_response_condition.notifyAll()
+                    self.__command_response_condition.release()
+                    
+                # Nothing could be dispatched: wait until a server is released (response received) 
+                # or new command requests are pushed. The heartbeat timeout covers servers recovering 
+                # from a timeout condition, which is detected by the MPIMonitorClient
+                if len(matching_command_request_id_list) == 0:
+                    self.__command_request_queue_service_event_controller.wait(MPIEnvironment.mpi_monitor_status_service_heartbeat)
                 
             # Mark service as not running
             self.__command_request_queue_service_running = False
             
             
-        def __match_available_servers_with_command_requests(self,available_servers):
-            
-            matching_command_request_id_list = []
-            unassigned_command_request_id_list = []
-            available_servers_left = list(available_servers)
-            for command_request in self.__command_request_queue:
-                server = command_request['server']
-                command_request_id = command_request['id']
-                # Command request does not have any pre-assigned server
-                if server is None:
-                    matching_command_request_id_list.append(command_request_id)
-                    unassigned_command_request_id_list.append(command_request_id)
-                # Assigned server is within the list of available servers 
-                elif server in available_servers_left:
-                    matching_command_request_id_list.append(command_request_id)
-                    # Remove server from the list of available servers to avoid multiple assignment
-                    available_servers_left.remove(server)
-                    
-                # Exit loop if we have enough matching requests
-                if len(matching_command_request_id_list) >= len(available_servers):
-                    break
-                
-            # Assign servers to the remaining requests
-            for command_request in self.__command_request_queue:
-                if command_request['id'] in unassigned_command_request_id_list:
-                    server = available_servers_left.pop()
-                    command_request['server'] = server
-                
-            # Return matching command request id list
-            return matching_command_request_id_list  
-        
+        def __drop_cancelled_command_requests(self,command_request_id_list):
+            
+            casalog_call_origin = "MPICommandClient::drop_cancelled_command_requests"
+            
+            for command_request_id in command_request_id_list:
+                # Command requests already sent to a server are not found in the queue
+                command_request = self.__command_request_queue.pop(command_request_id)
+                if command_request is None:
+                    continue
+                # Simulate response
+                command_response = dict(command_request)
+                command_response['status']='cancelled'
+                command_response['successful']=False
+                command_response['ret']=None
+                command_response['traceback']="Command request cancelled before being sent to a server"
+                self.__command_request_list[command_request_id]['status']='cancelled'
+                self.__command_response_list[command_request_id]=command_response
+                casalog.post("Command request with id# %s cancelled" % str(command_request_id),
+                             MPIEnvironment.command_handling_log_level,casalog_call_origin)
+                # If this request belongs to a group update the group response object
+                if self.__command_request_list[command_request_id].has_key('group'):
+                    command_group_response_id = self.__command_request_list[command_request_id]['group']
+                    self.__command_group_response_list[command_group_response_id]['list'].remove(command_request_id)
+                    if len(self.__command_group_response_list[command_group_response_id]['list']) == 0:
+                        self.__command_group_response_list[command_group_response_id]['event'].set()
+                        
+            # Wake up the threads waiting for command responses
+            self.__command_response_condition.acquire()
+            self.__command_response_condition.notifyAll()
+            self.__command_response_condition.release()
+            
             
         def __start_command_request_queue_service(self):
         
@@ -792,25 +822,31 @@ class MPICommandClient:
             if block:
                 
                 # Wait until command request response is received or timeout
+                # NOTE: The response handler notifies the condition each time a response is stored,
+                #       the heartbeat timeout is only needed to detect servers in timeout condition
                 pending_command_request_id_list = list(command_request_id_list)
-                while len(pending_command_request_id_list)>0:
-                    for command_request_id in command_request_id_list:
-                        # Check if command request id is still pending
-                        if command_request_id in pending_command_request_id_list:
-                            # Check if we have response for command request id
-                            if self.__command_response_list.has_key(command_request_id):
-                                # Remove command request id from pending list
-                                pending_command_request_id_list.remove(command_request_id)
-                            else:
-                                server = self.__command_request_list[command_request_id]['server']
-                                if server is not None and self.__monitor_client.get_server_status_keyword(server,'timeout'):
-                                    casalog.post("Command request with id# %s sent to server n# %s, but the server has timed out" 
-                                                 % (str(command_request_id),str(server)),"SEVERE",casalog_call_origin)
+                self.__command_response_condition.acquire()
+                try:
+                    while len(pending_command_request_id_list)>0:
+                        for command_request_id in command_request_id_list:
+                            # Check if command request id is still pending
+                            if command_request_id in pending_command_request_id_list:
+                                # Check if we have response for command request id
+                                if self.__command_response_list.has_key(command_request_id):
                                     # Remove command request id from pending list
                                     pending_command_request_id_list.remove(command_request_id)
-                                
-                            
-                    time.sleep(MPIEnvironment.mpi_push_command_request_block_mode_sleep_time)
+                                else:
+                                    server = self.__command_request_list[command_request_id]['server']
+                                    if server is not None and self.__monitor_client.get_server_status_keyword(server,'timeout'):
+                                        casalog.post("Command request with id# %s sent to server n# %s, but the server has timed out" 
+                                                     % (str(command_request_id),str(server)),"SEVERE",casalog_call_origin)
+                                        # Remove command request id from pending list
+                                        pending_command_request_id_list.remove(command_request_id)
+                                    
+                        if len(pending_command_request_id_list)>0:
+                            self.__command_response_condition.wait(MPIEnvironment.mpi_monitor_status_service_heartbeat)
+                finally:
+                    self.__command_response_condition.release()
                     
                 # Gather command response list
                 for command_request_id in command_request_id_list:
@@ -857,6 +893,63 @@ class MPICommandClient:
                 return command_response_list
             
             
+        def get_any_command_response(self,command_request_id_list):
+            """ Block until the response of at least one of the command requests is available
+
+            Returns the list of command responses available, including the simulated
+            responses of the command requests whose assigned server has timed out, so
+            that the responses can be processed as they arrive.
+            """
+            
+            casalog_call_origin = "MPICommandClient::get_any_command_response"
+            
+            if self.__life_cycle_state == 0:
+                casalog.post("Services not started","WARN",casalog_call_origin)
+                return       
+            elif self.__life_cycle_state == 2:
+                casalog.post("MPICommandClient life cycle finalized","WARN",casalog_call_origin)
+                return            
+            
+            command_response_list = []
+            self.__command_response_condition.acquire()
+            try:
+                while len(command_request_id_list) > 0:
+                    for command_request_id in command_request_id_list:
+                        if self.__command_response_list.has_key(command_request_id):
+                            command_response = dict(self.__command_response_list[command_request_id])
+                            command_response_list.append(command_response)
+                        else:
+                            server = self.__command_request_list[command_request_id]['server']
+                            if server is not None and self.__monitor_client.get_server_status_keyword(server,'timeout'):
+                                casalog.post("Command request with id# %s sent to server n# %s, but the server has timed out" 
+                                             % (str(command_request_id),str(server)),"SEVERE",casalog_call_origin)
+                                command_response = self.__format_command_response_timeout(command_request_id)
+                                command_response_list.append(command_response)
+                    if len(command_response_list) > 0:
+                        break
+                    self.__command_response_condition.wait(MPIEnvironment.mpi_monitor_status_service_heartbeat)
+            finally:
+                self.__command_response_condition.release()
+                
+            return command_response_list
+        
+        
+        def cancel_command_request(self,command_request_id_list):
+            """ Cancel the command requests that have not been sent to a server yet
+
+            The cancelled command requests get a response that is not successful
+            and has status 'cancelled'. The command requests already sent are not
+            affected, their responses have to be retrieved as usual.
+            """
+            
+            self.__command_request_input_queue_lock.acquire()
+            self.__cancelled_command_request_id_list.extend(command_request_id_list)
+            self.__command_request_input_queue_lock.release()
+            
+            # Wake up the command request queue service to drop them
+            self.__command_request_queue_service_event_controller.set()
+            
+            
         def get_command_response_event(self,command_request_id_list):
             
             # Get command group response id
@@ -1035,12 +1128,18 @@ class MPICommandClient:
                 return            
             
             pending_command_request_id_list = list(command_request_id_list)
-            while len(pending_command_request_id_list) > 0:
-                for command_request_id in command_request_id_list:
-                    print self.__command_request_list[command_request_id]
-                    if self.__command_request_list[command_request_id]['status'] == 'request sent':
-                        pending_command_request_id_list.remove(command_request_id)
-                time.sleep(MPIEnvironment.mpi_push_command_request_block_mode_sleep_time)            
+            self.__command_response_condition.acquire()
+            try:
+                while len(pending_command_request_id_list) > 0:
+                    for command_request_id in command_request_id_list:
+                        if command_request_id in pending_command_request_id_list:
+                            print self.__command_request_list[command_request_id]
+                            if self.__command_request_list[command_request_id]['status'] != 'holding queue':
+                                pending_command_request_id_list.remove(command_request_id)
+                    if len(pending_command_request_id_list) > 0:
+                        self.__command_response_condition.wait(MPIEnvironment.mpi_monitor_status_service_heartbeat)
+            finally:
+                self.__command_response_condition.release()
             
             
                       
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+from collections import deque # To handle FIFO queues with O(1) append/popleft
+
+
+class MPICommandRequestQueue:
+    """ Indexed queue of command requests waiting to be sent to a server
+
+    Command requests pinned to a server are kept in a per-server FIFO queue,
+    and command requests w/o pre-assigned server in a shared FIFO queue. All
+    of them are indexed by command request id, so that matching available
+    servers and extracting the matched requests does not depend on the
+    number of queued command requests.
+    """
+
+    def __init__(self):
+
+        # Queued command requests indexed by id
+        self.__command_request_index = {}
+
+        # FIFO queue of ids of command requests w/o pre-assigned server
+        self.__unassigned_command_request_queue = deque()
+
+        # FIFO queues of ids of command requests with pre-assigned server, indexed by server
+        self.__assigned_command_request_queue = {}
+
+
+    def __len__(self):
+
+        return len(self.__command_request_index)
+
+
+    def __contains__(self,command_request_id):
+
+        return self.__command_request_index.has_key(command_request_id)
+
+
+    def append(self,command_request):
+
+        command_request_id = command_request['id']
+        server = command_request['server']
+
+        self.__command_request_index[command_request_id] = command_request
+        if server is None:
+            self.__unassigned_command_request_queue.append(command_request_id)
+        else:
+            if not self.__assigned_command_request_queue.has_key(server):
+                self.__assigned_command_request_queue[server] = deque()
+            self.__assigned_command_request_queue[server].append(command_request_id)
+
+
+    def pop(self,command_request_id):
+        """ Extract command request from the queue, returns None if not found """
+
+        # NOTE: The id is left in the per-server or shared queue and skipped when matching
+        return self.__command_request_index.pop(command_request_id,None)
+
+
+    def __next_command_request_id(self,command_request_id_queue):
+
+        # Skip the ids of command requests that have been already extracted
+        while len(command_request_id_queue) > 0:
+            command_request_id = command_request_id_queue.popleft()
+            if self.__command_request_index.has_key(command_request_id):
+                return command_request_id
+
+        return None
+
+
+    def match_available_servers(self,available_servers):
+        """ Match available servers with queued command requests
+
+        Each available server gets the oldest command request pinned to it if any,
+        otherwise the oldest command request w/o pre-assigned server, which is then
+        assigned to it. Returns the list of matching command request ids.
+        """
+
+        matching_command_request_id_list = []
+        for server in available_servers:
+
+            command_request_id = None
+
+            # First try with the command requests pinned to this server
+            if self.__assigned_command_request_queue.has_key(server):
+                command_request_id = self.__next_command_request_id(self.__assigned_command_request_queue[server])
+
+            # Then try with the command requests w/o pre-assigned server
+            if command_request_id is None:
+                command_request_id = self.__next_command_request_id(self.__unassigned_command_request_queue)
+                if command_request_id is not None:
+                    self.__command_request_index[command_request_id]['server'] = server
+
+            if command_request_id is not None:
+                matching_command_request_id_list.append(command_request_id)
+
+        return matching_command_request_id_list
+
+
+# EOF
@@ -109,28 +109,23 @@ class MPICommandServer:
                           
             while (self.__command_request_handler_service_on):
                 
-                # First check if there is a command request msg available
-                msg_available = False
+                # Block until the next command request msg (or the stop wake-up msg) arrives
+                msg_received = False
                 try:
-                    msg_available = self.__communicator.command_request_probe()
-                except Exception as instance:
-                    casalog.post("Exception checking if command request msg is available: %s" 
-                                 % str(instance),"SEVERE",casalog_call_origin)
-                    msg_available = False
+                    command_request = self.__communicator.command_request_recv()
+                    msg_received = True
+                except:
+                    formatted_traceback = traceback.format_exc()
+                    casalog.post("Exception receiving command request msg: %s" 
+                                 % str(formatted_traceback),"SEVERE",casalog_call_origin)
+                    msg_received = False
                     
-                # Then receive command request msg
-                msg_received = False
-                if (msg_available):
-                    try:
-                        command_request = self.__communicator.command_request_recv()
-                        casalog.post("Received command request msg: %s" 
-                                     % command_request['command'],MPIEnvironment.command_handling_log_level,casalog_call_origin)
-                        msg_received = True
-                    except:
-                        formatted_traceback = traceback.format_exc()
-                        casalog.post("Exception receiving command request msg: %s" 
-                                     % str(formatted_traceback),"SEVERE",casalog_call_origin)
-                        msg_received = False
+                # Wake-up msg sent to ourselves by __stop_command_request_handler_service
+                if msg_received and command_request.has_key('signal'):
+                    continue
+                elif msg_received:
+                    casalog.post("Received command request msg: %s" 
+                                 % command_request['command'],MPIEnvironment.command_handling_log_level,casalog_call_origin)
                         
                 # Finally process command request and send back response
                 if (msg_received):
@@ -217,8 +212,6 @@ class MPICommandServer:
                         formatted_traceback = traceback.format_exc()
                         casalog.post("Exception sending back command response: %s" 
                                      % str(formatted_traceback),"SEVERE",casalog_call_origin)                
-                else:
-                    time.sleep(MPIEnvironment.mpi_command_request_handler_service_sleep_time) 
         
             # Mark service as not running
             self.__command_request_handler_service_running = False            
@@ -259,6 +252,15 @@ class MPICommandServer:
                 return             
 
             self.__command_request_handler_service_on = False
+            
+            # The thread is blocked receiving a command request, so send it a wake-up msg
+            try:
+                self.__communicator.command_request_wakeup_send()
+            except:
+                formatted_traceback = traceback.format_exc()
+                casalog.post("Exception sending wake-up msg to MPI command request handler service: %s" 
+                             % str(formatted_traceback),"SEVERE",casalog_call_origin)
+                return
         
             while (self.__command_request_handler_service_running):
                 time.sleep(MPIEnvironment.mpi_check_stop_service_sleep_time)
@@ -102,11 +102,19 @@ class MPICommunicator:
                                                               tag=self.__command_channel)
         
         
+        # NOTE: Receive from any source to get also the wake-up msg sent by the server to itself
         def command_request_recv(self):
-            return self.__command_request_communicator.recv(source=MPIEnvironment.mpi_client_rank,
+            return self.__command_request_communicator.recv(source=MPIEnvironment.mpi_any_source,
                                                             tag=self.__command_channel)
         
         
+        # Convenience method to wake up the command request handler service of this server
+        def command_request_wakeup_send(self):
+            self.__command_request_communicator.bsend(obj={'signal':'wakeup'},
+                                                      dest=MPIEnvironment.mpi_processor_rank,
+                                                      tag=self.__command_channel)
+        
+        
         def command_response_send(self,response):
             self.__command_response_communicator.bsend(obj=response,
                                                        dest=MPIEnvironment.mpi_client_rank,
@@ -123,6 +131,13 @@ class MPICommunicator:
                                                              tag=self.__command_channel)
         
         
+        # Convenience method to wake up the command response handler service of the client
+        def command_response_wakeup_send(self):
+            self.__command_response_communicator.bsend(obj={'signal':'wakeup'},
+                                                       dest=MPIEnvironment.mpi_client_rank,
+                                                       tag=self.__command_channel)
+        
+        
         def ping_status_request_send(self,server):
             self.__ping_status_request_communicator.bsend(obj={},
                                                           dest=server,
@@ -140,10 +140,14 @@ class MPIInterfaceCore:
             return ret        
         
         
-        def odo(self, job, nodes):
-            """Execute a job on a subset of engines in non-blocking mode"""             
+        def odo(self, job, nodes, parameters=None):
+            """Execute a job on a subset of engines in non-blocking mode
             
-            cmd_ids = self.__command_client.push_command_request(job,block=False,target_server=nodes)
+               The optional parameters dictionary is sent (pickled) along with the job,
+               its items are defined as variables in the engines while the job runs            
+            """             
+            
+            cmd_ids = self.__command_client.push_command_request(job,block=False,target_server=nodes,parameters=parameters)
             
             return cmd_ids
         
@@ -7,15 +7,20 @@ import traceback
 import unittest
 import testhelper
 import filecmp
+import numpy
 from taskinit import mstool,tbtool,cbtool,casalog,casac,casa
 from tasks import setjy,flagdata,applycal,uvcontsub
 from mpi4casa.MPIEnvironment import MPIEnvironment
 from mpi4casa.MPICommandClient import MPICommandClient
 from mpi4casa.MPIMonitorClient import MPIMonitorClient
 from mpi4casa.MPICommandServer import MPICommandServer
+from mpi4casa.MPICommandRequestQueue import MPICommandRequestQueue
 from mpi4casa.MPIInterface import MPIInterface
 from parallel.parallel_task_helper import ParallelTaskHelper
 from parallel.parallel_task_helper import ParallelTaskWorker
+from parallel.parallel_task_helper import JobSchedulingPolicy, LongestProcessingTimeFirstPolicy
+from parallel.parallel_task_helper import ConsolidateResultsReducer, DictionaryReducer
+from parallel.parallel_task_helper import JobData
 
 
 def waitForFile( file, seconds):
@@ -745,6 +750,30 @@ class test_MPICommandClient(unittest.TestCase):
         self.assertEqual(command_response_list[1]['status'], 'response received', "Command status should be 'response received'")
         self.assertEqual(command_response_list[1]['ret'], None, "Command return variable should be None")            
             
+    def test_get_any_command_response_and_cancel(self):
+        
+        # Keep all the servers busy, with more command requests queued
+        nservers = len(self.server_list)
+        command_request_id_list = []
+        for idx in range(2*nservers):
+            command_request_id_list.extend(self.client.push_command_request("time.sleep(s); s",False,None,{'s':3+idx%2}))
+        
+        # The first responses arrive before the rest of the command requests complete
+        command_response_list = self.client.get_any_command_response(command_request_id_list)
+        self.assertTrue(len(command_response_list) >= 1, "At least one command response should be available")
+        self.assertTrue(len(command_response_list) < len(command_request_id_list), "Not all the command responses should be available")
+        
+        # Cancel the command requests that have not been sent yet
+        self.client.cancel_command_request(command_request_id_list)
+        command_response_list = self.client.get_command_response(command_request_id_list,True,True)
+        status_list = [command_response['status'] for command_response in command_response_list]
+        self.assertTrue(status_list.count('response received') >= nservers, "The command requests sent should complete")
+        self.assertEqual(status_list.count('response received')+status_list.count('cancelled'), 2*nservers, 
+                         "The other command requests should be cancelled")
+        for command_response in command_response_list:
+            if command_response['status'] == 'cancelled':
+                self.assertEqual(command_response['successful'], False, "Cancelled command request should not be successful")
+            
     def test_singleton_behaviour(self):
         
         # Delete current MPICommandClient singleton instance reference
@@ -1010,8 +1039,23 @@ class test_MPIInterface(unittest.TestCase):
                 rethrow = True
                 break
         self.assertEqual(rethrow,True,"Exception not retrown")
-        self.assertEqual(str(sys.exc_info()[1]).find("ZeroDivisionError:")>=0, True, "Trace-back should contain ZeroDivisionError")      
-        
+        self.assertEqual(str(sys.exc_info()[1]).find("ZeroDivisionError:")>=0, True, "Trace-back should contain ZeroDivisionError")
+
+        # Async execution of a job with parameters sent along with the command
+        params = {'imagerpars':{'nchan':21,'csys':{'direction0':{'crval':numpy.array([1.5,0.5])}}}}
+        jobIds = self.CL.odo("yp = imagerpars['nchan']*2 + len(imagerpars['csys']['direction0']['crval'])",[1, 2],params)
+        status = self.CL.check_job(jobIds)
+        ntries = 0
+        while status == False and ntries < 10:
+            ntries += 1
+            time.sleep(1)
+            status = self.CL.check_job(jobIds)
+        self.assertEqual(status,True,"Error executing a job with parameters via odo")
+        res = self.CL.pull('yp',[1,2])
+        self.assertEqual(res,{1: 44, 2: 44},"Error using the parameters of a job")
+        res = self.CL.pull("'imagerpars' in globals()",[1,2])
+        self.assertEqual(res,{1: False, 2: False},"The parameters of a job should be removed after it runs")
+
         # Check queue status
         jobIds = self.CL.odo("time.sleep(5)",1)
         time.sleep(1)
@@ -1921,6 +1965,275 @@ class test_mpi4casa_runtime_settings(unittest.TestCase):
                          "getNumCPUs(use_aipsrc=True) wrong after setNumCPUs(3,self.server_list)")                                      
         
 
+class test_mpi4casa_dispatch_benchmark(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.client = MPICommandClient()
+        self.client.set_log_mode('redirect')
+        self.client.start_services()
+        
+        # Prepare list of servers
+        self.server_list = []
+        server_list = self.client.get_server_status()
+        for server in server_list:
+            if not server_list[server]['timeout']:
+                self.server_list.append(server_list[server]['rank'])
+                
+    def run_trivial_jobs(self,njobs,target_server=None):
+        
+        start_time = time.time()
+        command_request_id_list = []
+        for job in range(njobs):
+            command_request_id_list.extend(self.client.push_command_request("a+b",False,target_server,{'a':job,'b':1}))
+        command_response_list = self.client.get_command_response(command_request_id_list,True,True)
+        elapsed_time = time.time() - start_time
+        
+        self.assertEqual(len(command_response_list), njobs, "Command response list should contain %s elements" % njobs)
+        for command_response in command_response_list:
+            self.assertEqual(command_response['successful'], True, "Command execution was not successful")
+        
+        return elapsed_time
+    
+    def test_mpi4casa_dispatch_benchmark_throughput(self):
+        """Measure jobs per second and per-job dispatch overhead with trivial jobs"""
+        
+        njobs = 100*len(self.server_list)
+        elapsed_time = self.run_trivial_jobs(njobs)
+        
+        # The jobs are trivial so the execution time is dominated by the dispatch overhead
+        jobs_per_second = njobs / elapsed_time
+        overhead_per_job = elapsed_time * len(self.server_list) / njobs
+        casalog.post("Dispatched %s trivial jobs to %s servers in %.3fs: %.1f jobs/s, %.2fms overhead per job"
+                     % (njobs,len(self.server_list),elapsed_time,jobs_per_second,1000*overhead_per_job),
+                     "INFO","test_mpi4casa_dispatch_benchmark")
+        
+    def test_mpi4casa_dispatch_benchmark_latency(self):
+        """Measure round-trip latency of trivial jobs pushed in blocking mode to a single server"""
+        
+        njobs = 100
+        start_time = time.time()
+        for job in range(njobs):
+            command_response_list = self.client.push_command_request("a+b",True,self.server_list[0],{'a':job,'b':1})
+            self.assertEqual(command_response_list[0]['ret'], job+1, "Command return variable should be %s" % (job+1))
+        elapsed_time = time.time() - start_time
+        
+        casalog.post("Round-trip latency of trivial jobs in blocking mode: %.2fms per job" % (1000*elapsed_time/njobs),
+                     "INFO","test_mpi4casa_dispatch_benchmark")
+        
+
+class test_MPICommandRequestQueue(unittest.TestCase):
+    
+    def test_MPICommandRequestQueue_matching(self):
+        
+        command_request_queue = MPICommandRequestQueue()
+        command_request_queue.append({'id':1,'server':None})
+        command_request_queue.append({'id':2,'server':2})
+        command_request_queue.append({'id':3,'server':None})
+        command_request_queue.append({'id':4,'server':2})
+        
+        # Server 1 gets the oldest unassigned request, server 2 its own pinned request
+        matching_command_request_id_list = command_request_queue.match_available_servers([1,2])
+        self.assertEqual(matching_command_request_id_list, [1,2], "Wrong matching command request list")
+        self.assertEqual(command_request_queue.pop(1)['server'], 1, "Unassigned command request should be assigned to server 1")
+        self.assertEqual(command_request_queue.pop(2)['server'], 2, "Pinned command request should stay in server 2")
+        self.assertEqual(len(command_request_queue), 2, "Two command requests should be left in the queue")
+        
+        # Command requests pinned to a busy server are not dispatched to other servers
+        matching_command_request_id_list = command_request_queue.match_available_servers([1,3])
+        self.assertEqual(matching_command_request_id_list, [3], "Only the unassigned command request should match")
+        self.assertEqual(command_request_queue.pop(5), None, "Unknown command request should not be found")
+        
+    def test_MPICommandRequestQueue_order(self):
+        
+        # Command requests 0 and 4 are pinned to server 1
+        command_request_queue = MPICommandRequestQueue()
+        for command_request_id in range(8):
+            server = None
+            if command_request_id % 4 == 0:
+                server = 1
+            command_request_queue.append({'id':command_request_id,'server':server})
+        
+        # Extracted command requests (e.g. cancelled) are skipped
+        command_request_queue.pop(2)
+        
+        dispatch_list = []
+        while len(command_request_queue) > 0:
+            matching_command_request_id_list = command_request_queue.match_available_servers([1,2])
+            for command_request_id in matching_command_request_id_list:
+                command_request_queue.pop(command_request_id)
+            dispatch_list.append(matching_command_request_id_list)
+        self.assertEqual(dispatch_list, [[0,1],[4,3],[5,6],[7]], "Command requests should be dispatched in FIFO order")
+        
+
+class test_MPICommandRequestQueue_benchmark(unittest.TestCase):
+    
+    def setUp(self):
+        
+        self.server_list = range(1,65)
+        
+    def fill_queue(self,nrequests,pinned_fraction=0.5):
+        
+        command_request_queue = MPICommandRequestQueue()
+        npinned = int(nrequests*pinned_fraction)
+        for command_request_id in range(nrequests):
+            server = None
+            if command_request_id < npinned:
+                server = self.server_list[command_request_id % len(self.server_list)]
+            command_request_queue.append({'id':command_request_id,'server':server,'command':'a+b'})
+            
+        return command_request_queue
+    
+    def dispatch_queue(self,command_request_queue,ndispatch):
+        
+        ndispatched = 0
+        while ndispatched < ndispatch:
+            matching_command_request_id_list = command_request_queue.match_available_servers(self.server_list)
+            for command_request_id in matching_command_request_id_list:
+                command_request_queue.pop(command_request_id)
+            ndispatched += len(matching_command_request_id_list)
+            
+        return ndispatched
+    
+    def test_MPICommandRequestQueue_scaling_benchmark(self):
+        """Measure per-dispatch cost from 10 to 100k queued command requests"""
+        
+        ndispatch = 10
+        cost_per_dispatch = {}
+        for nrequests in [10,100,1000,10000,100000]:
+            command_request_queue = self.fill_queue(nrequests)
+            start_time = time.time()
+            ndispatched = self.dispatch_queue(command_request_queue,ndispatch)
+            elapsed_time = time.time() - start_time
+            cost_per_dispatch[nrequests] = elapsed_time / ndispatched
+            casalog.post("Per-dispatch cost with %s queued command requests: %.2fus" 
+                         % (nrequests,1.0e6*cost_per_dispatch[nrequests]),"INFO","test_MPICommandRequestQueue")
+            self.assertEqual(len(command_request_queue), nrequests-ndispatched, 
+                             "Dispatched command requests should be removed from the queue")
+        
+
+class test_ParallelTaskHelper_scheduling(unittest.TestCase):
+    
+    class FixedSizePolicy(LongestProcessingTimeFirstPolicy):
+        
+        def __init__(self, sizes):
+            self.sizes = sizes
+            
+        def estimateSize(self, vis):
+            return self.sizes[vis]
+    
+    def test_longest_processing_time_first_order(self):
+        
+        jobList = [['flagdata()',{'vis':'a.ms'}],
+                   ['flagdata()',{'vis':'b.ms'}],
+                   ['flagdata()',{'vis':'c.ms'}],
+                   ['flagdata()',{'vis':'d.ms'}]]
+        policy = self.FixedSizePolicy({'a.ms':(10,100),'b.ms':(30,100),'c.ms':(10,200),'d.ms':(10,100)})
+        orderedJobList = policy.orderJobs(jobList)
+        
+        orderedVisList = [JobSchedulingPolicy.getJobParameters(job)['vis'] for job in orderedJobList]
+        self.assertEqual(orderedVisList, ['b.ms','c.ms','a.ms','d.ms'], "Jobs should be ordered by decreasing size")
+        self.assertEqual(JobSchedulingPolicy().orderJobs(jobList), jobList, "Default policy should keep the job order")
+        
+    def test_parse_disk_usage(self):
+        
+        self.assertEqual(LongestProcessingTimeFirstPolicy.parseDiskUsage('75M'), 75*1024**2)
+        self.assertEqual(LongestProcessingTimeFirstPolicy.parseDiskUsage('1.5G'), int(1.5*1024**3))
+        self.assertEqual(LongestProcessingTimeFirstPolicy.parseDiskUsage('0'), 0)
+        
+    def test_scheduling_report(self):
+        
+        command_response_list = [{'server':1,'command_start_time':0.0,'command_stop_time':8.0},
+                                 {'server':1,'command_start_time':8.0,'command_stop_time':10.0},
+                                 {'server':2,'command_start_time':0.0,'command_stop_time':5.0},
+                                 {'server':2,'status':'timeout'}]
+        report = ParallelTaskHelper.getSchedulingReport(command_response_list)
+        
+        self.assertEqual(report['njobs'], 3, "Responses w/o timing info should be skipped")
+        self.assertEqual(report['makespan'], 10.0, "Wrong makespan")
+        self.assertEqual(report['servers'][1]['njobs'], 2, "Wrong number of jobs for server 1")
+        self.assertEqual(report['servers'][1]['utilization'], 1.0, "Wrong utilization for server 1")
+        self.assertEqual(report['servers'][2]['utilization'], 0.5, "Wrong utilization for server 2")
+        
+
+class test_ParallelTaskHelper_reducers(unittest.TestCase):
+    
+    def test_consolidate_results(self):
+        
+        self.assertEqual(ParallelTaskHelper.consolidateResults({'a.ms':True,'b.ms':False,'c.ms':True},'flagdata'), False)
+        self.assertEqual(ParallelTaskHelper.consolidateResults({'a.ms':True,'b.ms':True},'flagdata'), True)
+        ret = ParallelTaskHelper.consolidateResults({'a.ms':{'flagged':1,'name':'Summary','spw':{'0':{'total':4}}},
+                                                     'b.ms':{'flagged':2,'name':'Summary','spw':{'0':{'total':6}}}},'flagdata')
+        self.assertEqual(ret, {'flagged':3,'name':'Summary','spw':{'0':{'total':10}}})
+        
+        # Failed jobs added before the first boolean return value
+        reducer = ConsolidateResultsReducer('flagdata')
+        reducer.add('a.ms', None)
+        reducer.add('b.ms', True)
+        self.assertEqual(reducer.getResult(), False, "Failed jobs should make the result False")
+        
+        # Failed jobs added before the first dictionary
+        reducer = ConsolidateResultsReducer('flagdata')
+        reducer.add('a.ms', False)
+        reducer.add('b.ms', {'n':1})
+        reducer.add('c.ms', None)
+        reducer.add('d.ms', {'n':2})
+        self.assertEqual(reducer.getResult(), {'n':3}, "Failed jobs should be skipped when summing dictionaries")
+        
+        reducer = ConsolidateResultsReducer('flagdata')
+        reducer.add('a.ms', False)
+        self.assertEqual(reducer.getResult(), False, "Only failed jobs should make the result False")
+        
+    def test_failed_job(self):
+        
+        def run(jobList):
+            helper = ParallelTaskHelper('flagdata', {'vis':'test.mms'})
+            helper._executionList = jobList
+            helper.executeJobs()
+            return helper.postExecution()
+        
+        bypass_parallel_processing = ParallelTaskHelper.getBypassParallelProcessing()
+        ParallelTaskHelper.bypassParallelProcessing(1)
+        try:
+            ret = run([JobData('(lambda vis: True)',{'vis':'a.ms'}),
+                       JobData('(lambda vis: True)',{'vis':'b.ms'})])
+            self.assertEqual(ret, True, "Successful jobs should make the result True")
+            
+            # The job of b.ms raises an exception
+            ret = run([JobData('(lambda vis: True)',{'vis':'a.ms'}),
+                       JobData('(lambda vis: 1/0)',{'vis':'b.ms'}),
+                       JobData('(lambda vis: True)',{'vis':'c.ms'})])
+            self.assertEqual(ret, False, "A job that raised an exception should make the result False")
+            
+            # The job of a.ms, completed first, raises an exception
+            ret = run([JobData('(lambda vis: 1/0)',{'vis':'a.ms'}),
+                       JobData('(lambda vis: {"n":1})',{'vis':'b.ms'}),
+                       JobData('(lambda vis: {"n":2})',{'vis':'c.ms'})])
+            self.assertEqual(ret, {'n':3}, "A failed job should not change the kind of result")
+        finally:
+            ParallelTaskHelper.bypassParallelProcessing(bypass_parallel_processing)
+        
+    def test_dictionary_reducer(self):
+        
+        reducer = DictionaryReducer({'min':'min','max':'max','mean':('mean','npts'),'bins':'first'})
+        reducer.add('a.ms', {'DATA':{'min':1.0,'max':5.0,'mean':2.0,'npts':10,
+                                     'bins':numpy.arange(4),'counts':numpy.array([1,2,3])}})
+        reducer.add('b.ms', {'DATA':{'min':0.5,'max':4.0,'mean':4.0,'npts':30,
+                                     'bins':numpy.arange(4),'counts':numpy.array([1,1,1])}})
+        reducer.add('c.ms', False)
+        ret = reducer.getResult()['DATA']
+        
+        self.assertEqual(ret['min'], 0.5, "Wrong minimum")
+        self.assertEqual(ret['max'], 5.0, "Wrong maximum")
+        self.assertEqual(ret['npts'], 40, "Wrong number of points")
+        self.assertEqual(ret['mean'], 3.5, "Wrong weighted mean")
+        self.assertEqual(list(ret['bins']), [0,1,2,3], "Histogram bins should not be added")
+        self.assertEqual(list(ret['counts']), [2,3,4], "Wrong histogram counts")
+        
+        reducer.reset()
+        self.assertEqual(reducer.getResult(), None, "Reducer should be empty after reset")
+        
+
 def suite():
     return [test_MPICommandClient,
             test_MPIInterface,
@@ -1932,4 +2245,13 @@ def suite():
             test_mpi4casa_NullSelection,
             test_mpi4casa_plotms,
             test_mpi4casa_log_level,
-            test_mpi4casa_runtime_settings]
+            test_mpi4casa_runtime_settings,
+            test_MPICommandRequestQueue,
+            test_ParallelTaskHelper_scheduling,
+            test_ParallelTaskHelper_reducers]
+
+def benchmark():
+    # Not in the default suite, run e.g. with
+    # python -m unittest test_mpi4casa.test_mpi4casa_dispatch_benchmark
+    return [test_mpi4casa_dispatch_benchmark,
+            test_MPICommandRequestQueue_benchmark]
@@ -0,0 +1,172 @@
+import os
+import copy
+from collections import OrderedDict
+from taskinit import casalog, mstool, msmdtool, tbtool
+
+'''
+A process-wide cache of MS metadata and resolved data selections, so that
+the tasks and helpers that look at the same MS repeatedly (e.g. the spw and
+scan ids of a selection in split, mstransform, partition and update_spw)
+open the MS and resolve each selection only once.
+
+    msseltoindex      : ms.msseltoindex of a selection
+    msselectedindices : ms.msselect followed by ms.msselectedindices
+    getscansummary    : ms.getscansummary, optionally of a selection
+    scannumbers       : msmd.scannumbers
+    getsubtable       : columns of a subtable, e.g. SPECTRAL_WINDOW,
+                        DATA_DESCRIPTION, FIELD or ANTENNA
+    clear             : empty the cache
+
+The entries are keyed by (absolute path of the MS, modification time of the
+MS, request). The modification time is the latest of the table files of the
+MS and its subtables (and of the SubMSs of an MMS), so an entry is not used
+after the MS has been changed. The functions return copies of the cached
+values, which the callers can modify.
+'''
+
+# Maximum number of entries kept, the least recently used are dropped first
+maxentries = 1000
+
+_cache = OrderedDict()
+
+def tablemtime(table):
+    '''Return the modification time of a table: the latest modification time
+       of the table.dat and table.f0 files of the table and of its subtables,
+       and of the SubMSs of an MMS. table.dat is rewritten whenever the table
+       is flushed after a change, so the other data files need not be looked
+       at, and neither need the lock files, which are written when the table
+       is opened.'''
+
+    latest = 0.0
+    for name in ('table.dat', 'table.f0'):
+        try:
+            latest = max(latest, os.path.getmtime(os.path.join(table, name)))
+        except OSError:
+            pass
+    try:
+        entries = os.listdir(table)
+    except OSError:
+        return latest
+    for name in entries:
+        path = os.path.join(table, name)
+        if name == 'SUBMSS':
+            # The SubMSs of an MMS
+            for subms in os.listdir(path):
+                latest = max(latest, tablemtime(os.path.join(path, subms)))
+        elif os.path.isfile(os.path.join(path, 'table.dat')):
+            latest = max(latest, tablemtime(path))
+    return latest
+
+def clear():
+    '''Remove all the entries of the cache'''
+    _cache.clear()
+
+def _getcached(vis, request, compute):
+    '''Return a copy of the cached value of request for vis, calling compute()
+       to get the value if it is not in the cache yet. Exceptions raised by
+       compute() are not cached.'''
+
+    key = (os.path.abspath(vis), tablemtime(vis), request)
+    if key in _cache:
+        value = _cache.pop(key)
+    else:
+        value = compute()
+        casalog.post('Cached %s of %s' % (request[0],vis), 'DEBUG1')
+    _cache[key] = value
+    while len(_cache) > maxentries:
+        _cache.popitem(last=False)
+    return copy.deepcopy(value)
+
+def _selectionkey(selection):
+    '''Return a hashable key for a selection dictionary'''
+    if not isinstance(selection, dict):
+        return ()
+    return tuple(sorted([(str(k), repr(v)) for (k, v) in selection.items()]))
+
+def msseltoindex(vis, **selection):
+    '''Return ms.msseltoindex(vis=vis, **selection), e.g.
+       msseltoindex('my.ms', spw='0~3:10~20', field='3C286')'''
+
+    def compute():
+        myms = mstool()
+        return myms.msseltoindex(vis=vis, **selection)
+
+    return _getcached(vis, ('msseltoindex', _selectionkey(selection)), compute)
+
+def msselectedindices(vis, selection):
+    '''Return the selected indices of a selection dictionary, as given by
+       ms.msselect(selection) followed by ms.msselectedindices()'''
+
+    def compute():
+        myms = mstool()
+        myms.open(vis)
+        try:
+            myms.msselect(selection)
+            return myms.msselectedindices()
+        finally:
+            myms.close()
+
+    return _getcached(vis, ('msselectedindices', _selectionkey(selection)), compute)
+
+def getscansummary(vis, selection={}):
+    '''Return ms.getscansummary() of the MS, after ms.msselect(items=selection)
+       if a selection dictionary is given'''
+
+    def compute():
+        myms = mstool()
+        myms.open(vis)
+        try:
+            if isinstance(selection, dict) and selection != {}:
+                myms.msselect(items=selection)
+            return myms.getscansummary()
+        finally:
+            myms.close()
+
+    return _getcached(vis, ('getscansummary', _selectionkey(selection)), compute)
+
+def scannumbers(vis):
+    '''Return msmd.scannumbers() of the MS'''
+
+    def compute():
+        mymsmd = msmdtool()
+        mymsmd.open(vis)
+        try:
+            return mymsmd.scannumbers()
+        finally:
+            mymsmd.close()
+
+    return _getcached(vis, ('scannumbers',), compute)
+
+def getsubtable(vis, subtable, columns=None):
+    '''Return columns of a subtable of the MS as a dictionary of arrays.
+       vis       --> name of the MS
+       subtable  --> name of the subtable, e.g. 'SPECTRAL_WINDOW'
+       columns   --> list of columns to read, default all the columns
+
+       Columns that cannot be read with getcol (e.g. empty or with cells of
+       varying shapes) are read with getvarcol.'''
+
+    def compute():
+        mytb = tbtool()
+        mytb.open(os.path.join(vis, subtable))
+        try:
+            cols = {}
+            if columns is None:
+                colnames = mytb.colnames()
+            else:
+                colnames = columns
+            for col in colnames:
+                try:
+                    cols[col] = mytb.getcol(col)
+                except Exception:
+                    cols[col] = mytb.getvarcol(col)
+            return cols
+        finally:
+            mytb.close()
+
+    if columns is not None:
+        columns = list(columns)
+        request = ('getsubtable', subtable, tuple(columns))
+    else:
+        request = ('getsubtable', subtable)
+    return _getcached(vis, request, compute)
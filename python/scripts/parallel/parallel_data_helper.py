@@ -8,8 +8,9 @@ import math
 import time
 import subprocess
 from taskinit import *
-from parallel.parallel_task_helper import ParallelTaskHelper, JobData
+from parallel.parallel_task_helper import ParallelTaskHelper, JobData, CollectResultsReducer
 import partitionhelper as ph
+import mscache
 import inspect
 from numpy.f2py.auxfuncs import throw_error
 from mpi4casa.MPIEnvironment import MPIEnvironment
@@ -304,16 +305,14 @@ class ParallelDataHelper(ParallelTaskHelper):
             myspwsel = '*'
     
         spwlist = []
-        msTool = mstool()
         try:
-            seldict = msTool.msseltoindex(vis=msfile,spw=myspwsel)
+            seldict = mscache.msseltoindex(msfile, spw=myspwsel)
         except:
             return spwlist
     
         spwids = list(set(seldict['spw']))
         spwlist = map(str,spwids)
     
-        del msTool
         return spwlist
                     
 #    @dump_args
@@ -343,20 +342,13 @@ class ParallelDataHelper(ParallelTaskHelper):
         scanlist = []
         if scansel.isspace() or scansel.__len__() == 0:
             # Get all the scan ids
-            mymsmd = msmdtool()
-            mymsmd.open(msfile)
-            scans = mymsmd.scannumbers()
-            mymsmd.close()
+            scans = mscache.scannumbers(msfile)
             scanlist = map(str,scans)
         else:
             try:            
-                myms.open(msfile)
-                myms.msselect({'scan':scansel})
-                scans = myms.msselectedindices()['scan']
+                scans = mscache.msselectedindices(msfile, {'scan':scansel})['scan']
                 scanlist = map(str,scans)
-                myms.close()
             except:
-                myms.close()
                 scanlist = []
             
         return scanlist
@@ -1010,7 +1002,7 @@ class ParallelDataHelper(ParallelTaskHelper):
             
                     try:
                         # The dictionary with selected indices
-                        seldict = self._msTool.msseltoindex(vis=self._arg['vis'],scan=scans,spw=spws,polarization=corr_sel)
+                        seldict = mscache.msseltoindex(self._arg['vis'],scan=scans,spw=spws,polarization=corr_sel)
                     except:
                         self._msTool.close()
                         continue
@@ -1038,7 +1030,7 @@ class ParallelDataHelper(ParallelTaskHelper):
         
                 try:
                     # The dictionary with selected indices
-                    seldict = self._msTool.msseltoindex(vis=self._arg['vis'],scan=scans,spw=spws, polarization=corr_sel)
+                    seldict = mscache.msseltoindex(self._arg['vis'],scan=scans,spw=spws, polarization=corr_sel)
                 except:
                     self._msTool.reset()
                     continue
@@ -1441,6 +1433,14 @@ class ParallelDataHelper(ParallelTaskHelper):
         
         return start, width
 
+    def getResultKey(self, parameters):
+        """ The return values of the jobs are indexed by output sub-MS """
+        return parameters['outputvis']
+
+    def getResultReducer(self):
+        """ All the output sub-MSs are needed to build the output MMS """
+        return CollectResultsReducer(self._taskName)
+
 #    @dump_args
     def postExecution(self):
         """ This method overrides the postExecution method of ParallelTaskHelper,
@@ -1456,19 +1456,9 @@ class ParallelDataHelper(ParallelTaskHelper):
         # dictionary of the form:
         # {'path/outputvis.data/SUBMSS/outputvis.0000.ms':True,
         #  'path/outuputvis.data/SUBMSS/outputvis.0001.ms':False}
-        outputList = {}
-      
-#        if (ParallelTaskHelper.getBypassParallelProcessing()==1):
-        if (self._cluster == None):
-            # This is the list of output SubMSs
-            outputList = self._sequential_return_list
-            self._sequential_return_list = {}
-        elif (self._cluster != None):
-            command_response_list =  self._cluster.get_command_response(self._command_request_id_list,True,True)
-            # Format list in the form of vis dict
-            for command_response in command_response_list:
-                outvis = command_response['parameters']['outputvis']
-                outputList[outvis] = command_response['ret']
+        outputList = self.reduceResults()
+            
+        ParallelTaskHelper.postSchedulingReport(self._schedulingReport,self._taskName)
                                                                      
                      
         # List of failed MSs. TBD
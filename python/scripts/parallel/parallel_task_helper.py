@@ -3,8 +3,13 @@ from taskinit import *
 import os
 import copy
 import shutil
+import time
+import numpy
 import partitionhelper as ph
 
+# To handle process-based parallelization when MPI is not available
+import multiprocessing
+
 # To handle thread-based Tier-2 parallelization
 import thread 
 import threading
@@ -117,6 +122,297 @@ class JobData:
                 return self._returnValues[0]
         return self._returnValues
 
+def executeLocalJob(commandLine, ompNumThreads=0):
+    """
+    Execute the command line of a JobData in the current process, either
+    directly (sequential mode) or in a worker of the local process pool.
+    Returns a dictionary with the return value of the first command, the
+    exception message and traceback if any, and the timing information.
+    The exception is not raised, so that it can be sent back by a worker.
+    """
+    
+    result = {'server':os.getpid(), 'ret':None, 'exception':None, 'traceback':None}
+    
+    # Limit the OpenMP threads of each worker to avoid over-subscription
+    if ompNumThreads > 0:
+        casalog.ompSetNumThreads(ompNumThreads)
+    
+    result['command_start_time'] = time.time()
+    try:
+        namespace = {}
+        exec("from taskinit import *; from tasks import *; " + commandLine) in namespace
+        result['ret'] = namespace['returnVar0']
+    except Exception, instance:
+        result['exception'] = str(instance)
+        result['traceback'] = traceback.format_exc()
+    result['command_stop_time'] = time.time()
+    
+    return result
+
+def executeIndexedLocalJob(job_arguments):
+    """
+    Execute a job in a worker of the local process pool, see executeLocalJob.
+    job_arguments is a (job index, command line, OpenMP threads) tuple, and
+    the job index is returned with the result so that the results can be
+    processed in the order the jobs complete.
+    """
+    
+    idx, commandLine, ompNumThreads = job_arguments
+    return idx, executeLocalJob(commandLine, ompNumThreads)
+
+
+class JobSchedulingPolicy:
+    """
+    This class defines the order in which ParallelTaskHelper.executeJobs
+    pushes the jobs. The default policy keeps the jobs in the order they
+    were generated.
+    
+    NOTE: The jobs are pushed w/o pre-assigned server, so the MPICommandClient
+          hands the next queued job to the first server that becomes available,
+          i.e. servers that finish early pick up the next job dynamically.
+    """
+    
+    def orderJobs(self, jobList):
+        """
+        Return a new list with the jobs of jobList in execution order.
+        """
+        return list(jobList)
+    
+    @staticmethod
+    def getJobParameters(job):
+        """
+        Return the parameters of a job, which is either a [command,parameters]
+        pair (MPI mode) or a JobData object (sequential mode).
+        """
+        if isinstance(job, JobData):
+            return job.getCommandArguments()
+        return job[1]
+    
+
+class LongestProcessingTimeFirstPolicy(JobSchedulingPolicy):
+    """
+    Longest-processing-time-first policy: the jobs are pushed by decreasing
+    size of their input sub-MS, so that a large sub-MS is not the last one to
+    be started while the other servers are idle. The size of a sub-MS is
+    estimated by its disk usage and then by its number of rows. Jobs with
+    the same size (e.g. sub-jobs with different selections of the same MS)
+    keep their original order.
+    """
+    
+    __units = {'K':1024, 'M':1024**2, 'G':1024**3, 'T':1024**4, 'P':1024**5}
+    
+    def orderJobs(self, jobList):
+        
+        sizeCache = {}
+        jobSizeList = []
+        for job in jobList:
+            vis = JobSchedulingPolicy.getJobParameters(job).get('vis')
+            if not sizeCache.has_key(vis):
+                sizeCache[vis] = self.estimateSize(vis)
+            jobSizeList.append(sizeCache[vis])
+            
+        # NOTE: sorted is stable also in reverse mode
+        order = sorted(range(len(jobList)), key=lambda idx: jobSizeList[idx], reverse=True)
+        return [jobList[idx] for idx in order]
+    
+    def estimateSize(self, vis):
+        """
+        Return a (disk usage in bytes, number of rows) tuple for the given MS.
+        Quantities that cannot be determined are set to 0.
+        """
+        diskUsage = 0
+        nrows = 0
+        if not isinstance(vis, str) or not os.path.exists(vis):
+            return (diskUsage, nrows)
+        
+        try:
+            diskUsage = LongestProcessingTimeFirstPolicy.parseDiskUsage(ph.getDiskUsage(vis))
+        except Exception, instance:
+            casalog.post("Cannot get disk usage of %s: %s" % (vis,instance),"DEBUG","estimateSize")
+            
+        tbTool = tbtool()
+        try:
+            tbTool.open(vis)
+            nrows = tbTool.nrows()
+        except Exception, instance:
+            casalog.post("Cannot get number of rows of %s: %s" % (vis,instance),"DEBUG","estimateSize")
+        tbTool.close()
+            
+        return (diskUsage, nrows)
+    
+    @staticmethod
+    def parseDiskUsage(size):
+        """
+        Convert a human readable size as returned by partitionhelper.getDiskUsage
+        (e.g. '75M', '1.2G') into bytes.
+        """
+        size = size.strip().upper()
+        if len(size) > 0 and LongestProcessingTimeFirstPolicy.__units.has_key(size[-1]):
+            return int(float(size[:-1]) * LongestProcessingTimeFirstPolicy.__units[size[-1]])
+        return int(float(size))
+    
+
+class ResultReducer:
+    """
+    This class folds the return values of the jobs of a ParallelTaskHelper
+    into the result of the task. The return values are added one at a time
+    as the jobs complete, so they do not have to be kept until all the jobs
+    have finished. Tasks can set their own reducer with
+    ParallelTaskHelper.setResultReducer.
+    """
+    
+    def __init__(self, taskname=''):
+        self._taskname = taskname
+        self.reset()
+    
+    def reset(self):
+        """
+        Start a new reduction.
+        """
+        self._result = None
+    
+    def add(self, vis, ret):
+        """
+        Fold the return value ret of the job of sub-MS vis into the result.
+        ret is False if the job raised an exception.
+        """
+        raise NotImplementedError
+    
+    def getResult(self):
+        return self._result
+    
+
+class CollectResultsReducer(ResultReducer):
+    """
+    Keep the return values in a dictionary indexed by sub-MS, i.e. the result
+    of ParallelTaskHelper.postExecution when _consolidateOutput is False.
+    """
+    
+    def reset(self):
+        self._result = {}
+        
+    def add(self, vis, ret):
+        self._result[vis] = ret
+        
+
+class ConsolidateResultsReducer(ResultReducer):
+    """
+    Default reducer, equivalent to ParallelTaskHelper.consolidateResults:
+    boolean return values are combined with AND, and dictionaries are summed
+    item by item with ParallelTaskHelper.sum_dictionaries. The kind of
+    reduction is set by the first return value that is True or a dictionary,
+    so failed jobs (False or None) are kept until it is known. They make a
+    boolean result False, and are skipped when summing dictionaries.
+    """
+    
+    def reset(self):
+        self._result = None
+        self._failed = []
+        
+    def add(self, vis, ret):
+        if self._result is None:
+            if ret is True:
+                self._result = True
+                # Jobs that failed before the kind of reduction was known
+                for subMs in self._failed:
+                    self.add(subMs, False)
+            elif isinstance(ret,dict):
+                self._result = {}
+            elif not ret:
+                self._failed.append(vis)
+                return
+            
+        if isinstance(self._result,bool):
+            if not ret:
+                casalog.post("%s failed for sub-MS %s" % (self._taskname,vis),"WARN","consolidateResults")
+                self._result = False
+        elif isinstance(ret,dict):
+            try:
+                self._result = ParallelTaskHelper.sum_dictionaries(ret,self._result)
+            except Exception, instance:
+                casalog.post("Error post processing MMS results %s: %s" % (vis,instance),"WARN","consolidateResults")
+                
+    def getResult(self):
+        # Only failed jobs
+        if self._result is None and len(self._failed) > 0:
+            return False
+        return self._result
+        
+
+class DictionaryReducer(ResultReducer):
+    """
+    Fold dictionaries (e.g. flagdata summaries or statistics) item by item.
+    The operation applied to an item is given by its key in operations,
+    otherwise the default operation is used:
+       'sum'          : add the values (e.g. counts or histograms with the same bins)
+       'min', 'max'   : element-wise minimum or maximum
+       'first'        : keep the first value (e.g. histogram bins or names)
+       ('mean', key)  : mean weighted by the item key of the same dictionary,
+                        e.g. ('mean','npts')
+    Nested dictionaries are folded recursively, and string values are never
+    added, as in ParallelTaskHelper.sum_dictionaries. For example:
+       DictionaryReducer({'min':'min', 'max':'max', 'mean':('mean','npts')})
+    """
+    
+    def __init__(self, operations={}, default='sum', taskname=''):
+        self._operations = dict(operations)
+        self._default = default
+        ResultReducer.__init__(self, taskname)
+        
+    def reset(self):
+        self._result = None
+        # Accumulated weights of the weighted means, indexed by item path
+        self._weights = {}
+        
+    def add(self, vis, ret):
+        if not isinstance(ret,dict):
+            return
+        if self._result is None:
+            self._result = {}
+        try:
+            self.__fold(ret, self._result, ())
+        except Exception, instance:
+            casalog.post("Error post processing MMS results %s: %s" % (vis,instance),"WARN","DictionaryReducer")
+            
+    def __fold(self, item_dict, ret_dict, path):
+        for key in item_dict:
+            item = item_dict[key]
+            if isinstance(item,dict):
+                if not ret_dict.has_key(key):
+                    ret_dict[key] = {}
+                self.__fold(item, ret_dict[key], path + (key,))
+                continue
+            
+            operation = self._operations.get(key, self._default)
+            if isinstance(operation,tuple) and operation[0] == 'mean':
+                weight = item_dict.get(operation[1], 1.0)
+                total = self._weights.get(path + (key,), 0.0)
+                self._weights[path + (key,)] = total + weight
+                if total + weight > 0:
+                    if ret_dict.has_key(key):
+                        ret_dict[key] = (ret_dict[key]*total + item*weight) / (total + weight)
+                    else:
+                        ret_dict[key] = item
+            elif not ret_dict.has_key(key):
+                ret_dict[key] = item
+            elif isinstance(ret_dict[key],str) or operation == 'first':
+                continue
+            elif operation == 'sum':
+                ret_dict[key] = ret_dict[key] + item
+            elif operation == 'min':
+                if isinstance(item,numpy.ndarray) or isinstance(ret_dict[key],numpy.ndarray):
+                    ret_dict[key] = numpy.minimum(ret_dict[key],item)
+                else:
+                    ret_dict[key] = min(ret_dict[key],item)
+            elif operation == 'max':
+                if isinstance(item,numpy.ndarray) or isinstance(ret_dict[key],numpy.ndarray):
+                    ret_dict[key] = numpy.maximum(ret_dict[key],item)
+                else:
+                    ret_dict[key] = max(ret_dict[key],item)
+            else:
+                raise ValueError, "Unknown operation %s for item %s" % (operation,key)
+    
+    
 class ParallelTaskHelper:
     """
     This is the extension of the TaskHelper to allow for parallel
@@ -128,6 +424,9 @@ class ParallelTaskHelper:
     __bypass_parallel_processing = 0
     __async_mode = False
     __multithreading = False    
+    __scheduling_policy = LongestProcessingTimeFirstPolicy()
+    __local_workers = 1
+    __local_omp_num_threads = 0
     
     def __init__(self, task_name, args = {}):
         self._arg = dict(args)
@@ -149,8 +448,17 @@ class ParallelTaskHelper:
             self._cluster = MPICommandClient()
         # jagonzal: To inhibit return values consolidation
         self._consolidateOutput = True
-        # jagonzal (CAS-4287): Add a cluster-less mode to by-pass parallel processing for MMSs as requested 
-        self._sequential_return_list = {}
+        # Reduction of the job results as they complete (see setResultReducer)
+        self._resultReducer = None
+        self._activeResultReducer = None
+        self._progressCallback = None
+        self._abortOnFailure = False
+        self._njobs = 0
+        self._ncompleted = 0
+        self._aborted = False
+        # Timing of the jobs run sequentially and report about the last execution
+        self._sequential_timing_list = []
+        self._schedulingReport = None
         
     def override_arg(self,arg,value):
         self._arguser[arg] = value
@@ -220,24 +528,40 @@ class ParallelTaskHelper:
         
         casalog.origin("ParallelTaskHelper")
         
+        # Order the jobs according to the scheduling policy, only useful if they run concurrently
+        if (self.__bypass_parallel_processing == 0) or \
+           (ParallelTaskHelper.__local_workers > 1 and len(self._executionList) > 1):
+            self._executionList = ParallelTaskHelper.__scheduling_policy.orderJobs(self._executionList)
+        
+        # Start the reduction of the results of the jobs
+        self._activeResultReducer = self.getResultReducer()
+        self._activeResultReducer.reset()
+        self._njobs = len(self._executionList)
+        self._ncompleted = 0
+        self._aborted = False
+        
         # jagonzal (CAS-4287): Add a cluster-less mode to by-pass parallel processing for MMSs as requested 
         if (self.__bypass_parallel_processing == 1):
-            for job in self._executionList:
-                parameters = job.getCommandArguments()
+            if ParallelTaskHelper.__local_workers > 1 and len(self._executionList) > 1:
+                # Run the jobs in a pool of local processes, each one used for a single job
+                # so that no tool state is carried over from one sub-MS to the next one
+                pool = multiprocessing.Pool(processes=min(ParallelTaskHelper.__local_workers,len(self._executionList)),
+                                            maxtasksperchild=1)
                 try:
-                    exec("from taskinit import *; from tasks import *; " + job.getCommandLine())
-                    # jagonzal: Special case for partition
-                    if (parameters.has_key('outputvis')):
-                        self._sequential_return_list[parameters['outputvis']] = returnVar0
-                    else:
-                        self._sequential_return_list[parameters['vis']] = returnVar0
-                except Exception, instance:
-                    str_instance = str(instance)
-                    if (string.find(str_instance,"NullSelection") == 0):
-                        casalog.post("Error running task sequentially %s: %s" % (job.getCommandLine(),str_instance),"WARN","executeJobs")
-                        traceback.print_tb(sys.exc_info()[2])
-                    else:
-                        casalog.post("Ignoring NullSelection error from %s" % (parameters['vis']),"INFO","executeJobs")
+                    job_argument_list = [(idx,job.getCommandLine(),ParallelTaskHelper.__local_omp_num_threads)
+                                         for (idx,job) in enumerate(self._executionList)]
+                    # Reduce the results in the order the jobs complete
+                    for idx, result in pool.imap_unordered(executeIndexedLocalJob,job_argument_list):
+                        if not self.__storeLocalJobResult(self._executionList[idx],result):
+                            break
+                    pool.close()
+                finally:
+                    pool.terminate()
+                    pool.join()
+            else:
+                for job in self._executionList:
+                    if not self.__storeLocalJobResult(job,executeLocalJob(job.getCommandLine())):
+                        break
             self._executionList = []
         else:
             for job in self._executionList:
@@ -245,14 +569,74 @@ class ParallelTaskHelper:
                 self._command_request_id_list.append(command_request_id[0])
 
 
-    def postExecution(self):   
+    def __storeLocalJobResult(self, job, result):
+        """
+        Reduce the result returned by executeLocalJob for a job run in sequential
+        mode or in the local process pool. Returns False if the remaining jobs
+        have to be aborted.
+        """
+        
+        parameters = job.getCommandArguments()
+        # jagonzal: Special case for partition
+        if (parameters.has_key('outputvis')):
+            vis = parameters['outputvis']
+        else:
+            vis = parameters['vis']
+        if result['exception'] is not None:
+            if (string.find(result['exception'],"NullSelection") == -1):
+                casalog.post("Error running task sequentially %s: %s" % (job.getCommandLine(),result['exception']),"WARN","executeJobs")
+                casalog.post(result['traceback'],"WARN","executeJobs")
+            else:
+                casalog.post("Ignoring NullSelection error from %s" % (parameters['vis']),"INFO","executeJobs")
+        self._sequential_timing_list.append({'server':result['server'],
+                                             'command_start_time':result['command_start_time'],
+                                             'command_stop_time':result['command_stop_time']})
+        
+        return self.__jobCompleted(vis,result['ret'],result['exception'])
+    
+    def __jobCompleted(self, vis, ret, error=None):
+        """
+        Fold the return value of a job into the result of the task, report the
+        progress and check whether the remaining jobs have to be aborted, which
+        is the case if the job failed and abort on failure is enabled. Returns
+        False if the remaining jobs have to be aborted.
+        """
+        
+        # NullSelection errors only mean that there is no data to process in the sub-MS
+        failed = (error is not None and str(error).find("NullSelection") == -1) or ret is False
+        if error is None:
+            self._activeResultReducer.add(vis,ret)
+        elif failed:
+            self._activeResultReducer.add(vis,False)
+        self._ncompleted += 1
+        
+        if self._progressCallback is not None:
+            try:
+                self._progressCallback(self._ncompleted,self._njobs,vis,ret)
+            except Exception, instance:
+                casalog.post("Error in progress callback for %s: %s" % (vis,instance),"WARN","postExecution")
+        else:
+            casalog.post("%s: %s/%s sub-MSs processed" % (self._taskName,self._ncompleted,self._njobs),
+                         "INFO","postExecution")
+            
+        if failed and self._abortOnFailure and not self._aborted:
+            casalog.post("%s failed for sub-MS %s, aborting the jobs not started yet" % (self._taskName,vis),
+                         "SEVERE","postExecution")
+            self._aborted = True
+            
+        return not self._aborted
+    
+    def reduceResults(self):
+        """
+        Wait for the jobs to complete and return the result of the task, as
+        given by the result reducer (see setResultReducer). The return values
+        of the jobs are folded as they arrive. In sequential mode or with the
+        local process pool this has been done already by executeJobs.
+        """
         
-        casalog.origin("ParallelTaskHelper")
-           
-        ret_list = {}
         if (self.__bypass_parallel_processing==1):
-            ret_list = self._sequential_return_list
-            self._sequential_return_list = {}        
+            self._schedulingReport = ParallelTaskHelper.getSchedulingReport(self._sequential_timing_list)
+            self._sequential_timing_list = []
         elif (self._cluster != None):
             # jagonzal (CAS-7631): Support for thread-based Tier-2 parallelization
             if ParallelTaskHelper.getMultithreadingMode():
@@ -260,44 +644,98 @@ class ParallelTaskHelper:
                 ParallelTaskWorker.releaseTaskLock()
                 event.wait()
                 ParallelTaskWorker.acquireTaskLock()
-            # Get command response
-            command_response_list =  self._cluster.get_command_response(self._command_request_id_list,True,True)
-            # Format list in the form of vis dict
-            ret_list = {}
-            for command_response in command_response_list:
-                vis = command_response['parameters']['vis']
-                ret_list[vis] = command_response['ret']
+            # Get the command responses as they arrive, keeping only their timing
+            timing_list = []
+            ncancelled = 0
+            pending_command_request_id_list = list(self._command_request_id_list)
+            while len(pending_command_request_id_list) > 0:
+                command_response_list = self._cluster.get_any_command_response(pending_command_request_id_list)
+                for command_response in command_response_list:
+                    pending_command_request_id_list.remove(command_response['id'])
+                    if command_response.get('status') == 'cancelled':
+                        ncancelled += 1
+                        continue
+                    timing_list.append(dict([(key,command_response[key]) for key in 
+                                             ['server','command_start_time','command_stop_time'] 
+                                             if command_response.has_key(key)]))
+                    if command_response['successful']:
+                        error = None
+                    else:
+                        error = command_response['traceback']
+                    if not self.__jobCompleted(self.getResultKey(command_response['parameters']),
+                                               command_response['ret'],error):
+                        self._cluster.cancel_command_request(pending_command_request_id_list)
+            if ncancelled > 0:
+                casalog.post("%s: %s jobs cancelled" % (self._taskName,ncancelled),"WARN","postExecution")
+            self._schedulingReport = ParallelTaskHelper.getSchedulingReport(timing_list)
         else:
             return None
         
-        ret = ret_list
-        if self._consolidateOutput: ret = ParallelTaskHelper.consolidateResults(ret_list,self._taskName)
+        ret = self._activeResultReducer.getResult()
+        self._activeResultReducer = None
+        return ret
+        
+    def postExecution(self):   
+        
+        casalog.origin("ParallelTaskHelper")
+        
+        if (self.__bypass_parallel_processing!=1) and (self._cluster == None):
+            return None
+        
+        ret = self.reduceResults()
+        
+        ParallelTaskHelper.postSchedulingReport(self._schedulingReport,self._taskName)
         
         return ret
+    
+    def getResultKey(self, parameters):
+        """
+        Return the key of the return value of a job run on a MPI server,
+        given its parameters: by default the input sub-MS.
+        """
+        return parameters['vis']
+    
+    def setResultReducer(self, reducer=None):
+        """
+        Set the ResultReducer used to fold the return values of the jobs into
+        the result of the task, e.g. DictionaryReducer({'min':'min','max':'max'}).
+        None restores the default: ConsolidateResultsReducer, or
+        CollectResultsReducer if _consolidateOutput is False.
+        """
+        self._resultReducer = reducer
+        
+    def getResultReducer(self):
+        if self._resultReducer is not None:
+            return self._resultReducer
+        elif self._consolidateOutput:
+            return ConsolidateResultsReducer(self._taskName)
+        else:
+            return CollectResultsReducer(self._taskName)
+        
+    def setProgressCallback(self, callback=None):
+        """
+        Set a function called each time a job completes, as
+        callback(ncompleted, njobs, vis, ret), where ret is the return value
+        of the job of sub-MS vis. None restores the default, which logs the
+        number of sub-MSs processed.
+        """
+        self._progressCallback = callback
         
+    def setAbortOnFailure(self, abort=True):
+        """
+        If abort is True, the jobs that have not been started yet are
+        cancelled when a job fails (i.e. raises an exception other than a
+        NullSelection or returns False). The jobs already running complete.
+        """
+        self._abortOnFailure = abort
         
     @staticmethod
     def consolidateResults(ret_list,taskname):
         
-        index = 0
-        if isinstance(ret_list.values()[0],bool):
-            retval = True
-            for subMs in ret_list:
-                if not ret_list[subMs]:
-                    casalog.post("%s failed for sub-MS %s" % (taskname,subMs),"WARN","consolidateResults")
-                    retval = False
-                index += 1
-            return retval
-        elif any(isinstance(v,dict) for v in ret_list.itervalues()):
-            ret_dict = {}
-            for subMs in ret_list:
-                dict_i = ret_list[subMs]
-                if isinstance(dict_i,dict):
-                    try:
-                        ret_dict = ParallelTaskHelper.sum_dictionaries(dict_i,ret_dict)
-                    except Exception, instance:
-                        casalog.post("Error post processing MMS results %s: %s" % (subMs,instance),"WARN","consolidateResults")
-            return ret_dict
+        reducer = ConsolidateResultsReducer(taskname)
+        for subMs in ret_list:
+            reducer.add(subMs,ret_list[subMs])
+        return reducer.getResult()
         
         
     @staticmethod
@@ -318,6 +756,64 @@ class ParallelTaskHelper:
         return ret_dict   
     
     
+    @staticmethod
+    def getSchedulingReport(command_response_list):
+        """
+        Compute the makespan and the per-server utilization from the
+        command_start_time/command_stop_time of the command responses.
+        Returns a dictionary of the form:
+        {'njobs':3, 'makespan':20.0,
+         'servers':{1:{'njobs':2,'busy':18.0,'utilization':0.9},
+                    2:{'njobs':1,'busy':16.0,'utilization':0.8}}}
+        """
+        
+        report = {'njobs':0, 'makespan':0.0, 'servers':{}}
+        start_time = None
+        stop_time = None
+        for command_response in command_response_list:
+            # Responses simulated by the client (e.g. timeout) do not have timing info
+            if not (command_response.has_key('command_start_time') and command_response.has_key('command_stop_time')):
+                continue
+            server = command_response['server']
+            if not report['servers'].has_key(server):
+                report['servers'][server] = {'njobs':0, 'busy':0.0, 'utilization':0.0}
+            report['servers'][server]['njobs'] += 1
+            report['servers'][server]['busy'] += command_response['command_stop_time'] - command_response['command_start_time']
+            report['njobs'] += 1
+            if start_time is None or command_response['command_start_time'] < start_time:
+                start_time = command_response['command_start_time']
+            if stop_time is None or command_response['command_stop_time'] > stop_time:
+                stop_time = command_response['command_stop_time']
+            
+        if report['njobs'] > 0:
+            report['makespan'] = stop_time - start_time
+            for server in report['servers']:
+                if report['makespan'] > 0:
+                    report['servers'][server]['utilization'] = report['servers'][server]['busy'] / report['makespan']
+                
+        return report
+    
+    @staticmethod
+    def postSchedulingReport(report,taskname):
+        
+        if report is None or report['njobs'] == 0:
+            return
+        
+        casalog.post("%s: %s jobs executed with a makespan of %.2fs" % (taskname,report['njobs'],report['makespan']),
+                     "INFO","postSchedulingReport")
+        for server in sorted(report['servers']):
+            server_report = report['servers'][server]
+            casalog.post("Server %s: %s jobs, busy %.2fs, utilization %.1f%%" 
+                         % (server,server_report['njobs'],server_report['busy'],100*server_report['utilization']),
+                         "INFO","postSchedulingReport")
+        
+    def getLastSchedulingReport(self):
+        """
+        Return the scheduling report (see getSchedulingReport) of the last
+        execution of the jobs of this helper.
+        """
+        return self._schedulingReport
+    
     @staticmethod
     def getResult(command_request_id_list,taskname):
         
@@ -333,6 +829,9 @@ class ParallelTaskHelper:
             vis = command_response['parameters']['vis']
             ret_list[vis] = command_response['ret']
             
+        # Post scheduling report
+        ParallelTaskHelper.postSchedulingReport(ParallelTaskHelper.getSchedulingReport(command_response_list),taskname)
+            
         # Consolidate results and return
         ret = ParallelTaskHelper.consolidateResults(ret_list,taskname)
         
@@ -472,6 +971,34 @@ class ParallelTaskHelper:
     def getMultithreadingMode():
         return ParallelTaskHelper.__multithreading
     
+    @staticmethod
+    def setLocalWorkers(workers=1, ompthreads=0):
+        """
+        Set the number of local processes used to run the sub-MS jobs
+        concurrently when MPI is not available (1 => sequential processing)
+        and the maximum number of OpenMP threads of each process (0 => default).
+        """
+        ParallelTaskHelper.__local_workers = max(1,int(workers))
+        ParallelTaskHelper.__local_omp_num_threads = max(0,int(ompthreads))
+        
+    @staticmethod
+    def getLocalWorkers():
+        return ParallelTaskHelper.__local_workers, ParallelTaskHelper.__local_omp_num_threads
+    
+    @staticmethod
+    def setSchedulingPolicy(policy=None):
+        """
+        Set the JobSchedulingPolicy used to order the jobs in executeJobs,
+        None restores the default LongestProcessingTimeFirstPolicy.
+        """
+        if policy is None:
+            policy = LongestProcessingTimeFirstPolicy()
+        ParallelTaskHelper.__scheduling_policy = policy
+        
+    @staticmethod
+    def getSchedulingPolicy():
+        return ParallelTaskHelper.__scheduling_policy
+    
     @staticmethod
     def isParallelMS(vis):
         """
@@ -555,11 +1082,12 @@ class ParallelTaskWorker:
 
     def getEnvironment(self):
         
-        stack=inspect.stack()
-        for stack_level in range(len(stack)):
-            frame_globals=sys._getframe(stack_level).f_globals
-            if frame_globals.has_key('update_params'):
-                return dict(frame_globals)
+        # Walk the frames w/o inspect.stack, which reads the source context of each one
+        frame=sys._getframe(0)
+        while frame is not None:
+            if frame.f_globals.has_key('update_params'):
+                return dict(frame.f_globals)
+            frame=frame.f_back
             
         raise Exception("CASA top level environment not found")
         
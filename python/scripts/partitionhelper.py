@@ -9,6 +9,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from __main__ import *
 from taskinit import *
+import mscache
 
 
 class convertToMMS():
@@ -328,6 +329,9 @@ class convertToMMS():
 #    getMMSScanNrows    'Get the number of rows of a scan in an MMS dictionary.'
 #    getSpwIds          'Get the Spw IDs of a scan.'
 #    getDiskUsage       'eturn the size in bytes of an MS in disk.'
+#    getASDMScans       'Get the scans of an ASDM and an estimate of their sizes.'
+#    selectASDMScans    'Get the scans selected by a scans parameter of asdm2MS.'
+#    getASDMScanGroups  'Plan the import of an ASDM into sub-MSs by scan.'
 #
 # ----------------------------------------------------------------------
 
@@ -395,13 +399,7 @@ def getScanList(msfile, selection={}):
        
        Return a list of the scans in this MS/MMS. '''
     
-    msTool=mstool()
-    msTool.open(msfile)
-    if isinstance(selection, dict) and selection != {}:
-        msTool.msselect(items=selection)
-        
-    scand = msTool.getscansummary()
-    msTool.close()
+    scand = mscache.getscansummary(msfile, selection)
         
     scanlist = scand.keys()
     
@@ -426,13 +424,7 @@ def getScanNrows(msfile, myscan, selection={}):
             msN = ph.getScanNrows('referenceMS', s)
             assert (mmsN == msN)
     '''
-    msTool=mstool()
-    msTool.open(msfile)
-    if isinstance(selection, dict) and selection != {}:
-        msTool.msselect(items=selection)
-        
-    scand = msTool.getscansummary()
-    msTool.close()
+    scand = mscache.getscansummary(msfile, selection)
     
     Nrows = 0
     if not scand.has_key(str(myscan)):
@@ -475,13 +467,7 @@ def getSpwIds(msfile, myscan, selection={}):
     '''
     import numpy as np
     
-    msTool=mstool()
-    msTool.open(msfile)
-    if isinstance(selection, dict) and selection != {}:
-        msTool.msselect(items=selection)
-        
-    scand = msTool.getscansummary()
-    msTool.close()
+    scand = mscache.getscansummary(msfile, selection)
     
     spwlist = []
 
@@ -713,9 +699,155 @@ def getSubtables(vis):
         if (type(theKeyw)==str and theKeyw.split(' ')[0]=='Table:'
             and not k=='SORTED_TABLE'):
             theSubTables.append(os.path.basename(theKeyw.split(' ')[1]))
-            
+
     return theSubTables
 
+def getASDMScans(asdm):
+    """Return the scans of an ASDM and an estimate of their sizes.
+
+    Keyword arguments:
+       asdm  --> name of the ASDM
+
+    It returns a list of ((execblock, scan), size) tuples in the order of the
+    exec blocks and scans, where execblock is the 0-based index of the exec
+    block in ExecBlock.xml (as used in the scans parameter of asdm2MS) and
+    scan is the scan number. The size is the sum of dataSize of the rows of
+    Main.xml of the scan, or its number of rows if dataSize is not known.
+    """
+
+    from xml.dom import minidom
+
+    def getvalue(rownode, tag):
+        nodes = rownode.getElementsByTagName(tag)
+        if len(nodes) == 0 or len(nodes[0].childNodes) == 0:
+            return None
+        return str(nodes[0].childNodes[0].nodeValue).strip()
+
+    # 0-based index of each exec block
+    execblocks = {}
+    xmlexecblock = minidom.parse(asdm+'/ExecBlock.xml')
+    for rownode in xmlexecblock.getElementsByTagName("row"):
+        execblocks[getvalue(rownode, "execBlockId")] = len(execblocks)
+
+    sizes = {}
+    xmlscans = minidom.parse(asdm+'/Scan.xml')
+    for rownode in xmlscans.getElementsByTagName("row"):
+        eb = execblocks[getvalue(rownode, "execBlockId")]
+        sizes[(eb, int(getvalue(rownode, "scanNumber")))] = 0
+
+    # Main.xml has no rows when the Main table is stored in binary form
+    xmlmain = minidom.parse(asdm+'/Main.xml')
+    for rownode in xmlmain.getElementsByTagName("row"):
+        eb = execblocks[getvalue(rownode, "execBlockId")]
+        scan = (eb, int(getvalue(rownode, "scanNumber")))
+        datasize = getvalue(rownode, "dataSize")
+        if datasize is None:
+            sizes[scan] = sizes.get(scan, 0) + 1
+        else:
+            sizes[scan] = sizes.get(scan, 0) + int(datasize)
+
+    scanlist = sorted(sizes.keys())
+    if sum(sizes.values()) == 0:
+        return [(key, 1) for key in scanlist]
+
+    return [(key, sizes[key]) for key in scanlist]
+
+def selectASDMScans(scanlist, scans=''):
+    """Return the scans of scanlist selected by a scans parameter of asdm2MS.
+
+    Keyword arguments:
+       scanlist  --> list of (execblock, scan) tuples
+       scans     --> scans parameter of asdm2MS, e.g. '0:1~3,5;1:' or '1,2'.
+                     Default: '', all the scans.
+
+    A ValueError is raised if scans cannot be parsed.
+    """
+
+    if scans.strip() == '':
+        return list(scanlist)
+
+    selected = set()
+    execblocks = set([eb for (eb, scan) in scanlist])
+    for scanspec in scans.split(';'):
+        if scanspec.strip() == '':
+            continue
+        if ':' in scanspec:
+            (ebspec, scanspec) = scanspec.split(':', 1)
+            ebs = set([int(ebspec)])
+        else:
+            ebs = execblocks
+        if scanspec.strip() == '':
+            selected.update([(eb, scan) for (eb, scan) in scanlist if eb in ebs])
+            continue
+        for item in scanspec.split(','):
+            if '~' in item:
+                (first, last) = item.split('~')
+                scannos = range(int(first), int(last)+1)
+            else:
+                scannos = [int(item)]
+            selected.update([(eb, scan) for eb in ebs for scan in scannos])
+
+    return [scan for scan in scanlist if scan in selected]
+
+def getASDMScanGroups(asdm, ngroups, scans=''):
+    """Plan the import of an ASDM into ngroups sub-MSs by scan.
+
+    Keyword arguments:
+       asdm     --> name of the ASDM
+       ngroups  --> number of groups of scans (sub-MSs)
+       scans    --> scans parameter of asdm2MS to select the scans to import.
+                    Default: '', all the scans.
+
+    The selected scans are split, in order, into at most ngroups groups of
+    consecutive scans with similar sizes (see getASDMScans). It returns a list
+    with the scans parameter of asdm2MS for each group, e.g. ['0:1~3','0:4,5'].
+    """
+
+    scanlist = getASDMScans(asdm)
+    sizes = dict(scanlist)
+    selected = selectASDMScans([scan for (scan, size) in scanlist], scans)
+    if len(selected) == 0:
+        return []
+
+    ngroups = max(1, min(ngroups, len(selected)))
+    total = float(sum([sizes[scan] for scan in selected]))
+
+    groups = []
+    current = []
+    cumsize = 0
+    for (k, scan) in enumerate(selected):
+        current.append(scan)
+        cumsize += sizes[scan]
+        ngroups_left = ngroups - len(groups) - 1
+        nscans_left = len(selected) - k - 1
+        if ngroups_left > 0 and (cumsize >= total*(len(groups)+1)/ngroups or
+                                 nscans_left == ngroups_left):
+            groups.append(current)
+            current = []
+    groups.append(current)
+
+    # Write the scans parameter of each group, e.g. 0:1~3,5;1:2
+    scanspecs = []
+    for group in groups:
+        ebspecs = []
+        for eb in sorted(set([eb for (eb, scan) in group])):
+            scannos = [scan for (e, scan) in group if e == eb]
+            ranges = []
+            first = last = scannos[0]
+            for scan in scannos[1:] + [None]:
+                if scan is not None and scan == last + 1:
+                    last = scan
+                    continue
+                if first == last:
+                    ranges.append('%s'%first)
+                else:
+                    ranges.append('%s~%s'%(first,last))
+                first = last = scan
+            ebspecs.append('%s:%s'%(eb,','.join(ranges)))
+        scanspecs.append(';'.join(ebspecs))
+
+    return scanspecs
+
 
 def makeMMS(outputvis, submslist, copysubtables=False, omitsubtables=[], parallelaxis=''):
     """Create a Multi-MS from a list of MSs
@@ -968,55 +1100,79 @@ def getPartitonMap(msfilename, nsubms, selection={}, axis=['field','spw','scan']
         else:
             ddIspectralWindowInfo[ddi]['isWVR'] = False
             
-    # Make an array for total number of visibilites per ddi and scan separatelly
-    nVisPerDDI = {}
-    nVisPerScan = {}
-    nVisPerField = {}
-            
-            
-    # Iterate over scan list
-    scanDdiMap = {}
+    # Generate the map of scan/ddi pairs per subMS
+    plotname_prefix = os.path.basename(msfilename) + ' axis ' + string.join(axis)
+    submScanDdiMap = getPartitonMapFromSummary(scanSummary, ddIspectralWindowInfo, nsubms, axis,
+                                               plotMode=plotMode, plotname_prefix=plotname_prefix)
+    
+    
+    # Return map of scan/ddi pairs per subMs
+    return submScanDdiMap
+
+
+def getPartitonMapFromSummary(scanSummary, ddIspectralWindowInfo, nsubms, axis=['field','spw','scan'],
+                              plotMode=0, plotname_prefix=''):
+    """Generates a partition scan/spw map from the scan summary of an MS (see getPartitonMap)
+    
+    Keyword arguments:
+        scanSummary             --    Scan summary as returned by ms.getscansummary
+        ddIspectralWindowInfo   --    DDI info as returned by ms.getspectralwindowinfo, with the isWVR key
+        nsubms                  --    Number of subMSs 
+        axis                    --    Vector of strings containing the axis for load distribution (scan,spw,field)
+        plotMode                --    Integer in the range 0-3 to determine the plot generation mode
+        plotname_prefix         --    Prefix of the plot titles and filenames
+        
+        Returns a map of the sub-MSs with the corresponding scan/spw selections and the number of visibilities
+    """
+    
+    # Compress the timestamps of the scan summary into groups with the same scan,
+    # field and list of DDIs, which have the same number of visibilities per row,
+    # and keep the scan/ddi pairs (and their field) in order of first appearance
+    scanKeys = list()
+    scanDdiPairs = list()
+    nrowsPerGroup = {}
     for scan in scanSummary:
-        # Initialize scan sub-map
-        scanDdiMap[scan] = {}
+        scanKeys.append(scan)
+        scanDDIs = set()
         # Iterate over timestamps for this scan
         for timestamp in scanSummary[scan]:
-            # Get list of ddis for this timestamp
-            DDIds = scanSummary[scan][timestamp]['DDIds']
+            DDIds = tuple(scanSummary[scan][timestamp]['DDIds'])
             fieldId = str(scanSummary[scan][timestamp]['FieldId'])
             # Get number of rows per ddi (assume all DDIs have the same number of rows)
             # In ALMA data WVR DDI has only one row per antenna but it is separated from the other DDIs
             nrowsPerDDI = scanSummary[scan][timestamp]['nRow'] / len(DDIds)
-            # Iterate over DDIs for this timestamp
-            for ddi in DDIds:
-                # Convert to string to be used as a map key
-                ddi = str(ddi)
-                # Check if DDI entry is already present for this scan, otherwise initialize it
-                if not scanDdiMap[scan].has_key(ddi):
-                    scanDdiMap[scan][ddi] = {}
-                    scanDdiMap[scan][ddi]['nVis'] = 0                   
-                    scanDdiMap[scan][ddi]['fieldId'] = fieldId                    
-                    scanDdiMap[scan][ddi]['isWVR'] = ddIspectralWindowInfo[ddi]['isWVR']
-                # Calculate number of visibilities
-                nvis = nrowsPerDDI*ddIspectralWindowInfo[ddi]['NumChan']*ddIspectralWindowInfo[ddi]['NumCorr']
-                # Add number of rows and vis from this timestamp
-                scanDdiMap[scan][ddi]['nVis'] = scanDdiMap[scan][ddi]['nVis'] + nvis
-                # Update ddi nvis
-                if not nVisPerDDI.has_key(ddi):
-                    nVisPerDDI[ddi] = nvis
-                else:
-                    nVisPerDDI[ddi] = nVisPerDDI[ddi] + nvis
-                # Update scan nvis
-                if not nVisPerScan.has_key(scan):
-                    nVisPerScan[scan] = nvis
-                else:
-                    nVisPerScan[scan] = nVisPerScan[scan] + nvis
-                # Update field nvis
-                if not nVisPerField.has_key(fieldId):
-                    nVisPerField[fieldId] = nvis
-                else:
-                    nVisPerField[fieldId] = nVisPerField[fieldId] + nvis         
-                    
+            group = (scan, fieldId, DDIds)
+            nrowsPerGroup[group] = nrowsPerGroup.get(group, 0) + nrowsPerDDI
+            if not scanDDIs.issuperset(DDIds):
+                for ddi in DDIds:
+                    if ddi not in scanDDIs:
+                        scanDDIs.add(ddi)
+                        scanDdiPairs.append((scan, str(ddi), fieldId))
+    
+    # Make the scan/ddi map
+    scanDdiMap = {}
+    for scan in scanKeys:
+        scanDdiMap[scan] = {}
+    for (scan, ddi, fieldId) in scanDdiPairs:
+        scanDdiMap[scan][ddi] = {}
+        scanDdiMap[scan][ddi]['nVis'] = 0
+        scanDdiMap[scan][ddi]['fieldId'] = fieldId
+        scanDdiMap[scan][ddi]['isWVR'] = ddIspectralWindowInfo[ddi]['isWVR']
+    
+    # Make an array for total number of visibilites per ddi, scan and field separatelly
+    nVisPerDDI = {}
+    nVisPerScan = {}
+    nVisPerField = {}
+    for ((scan, fieldId, DDIds), nrowsPerDDI) in nrowsPerGroup.iteritems():
+        for ddi in DDIds:
+            ddi = str(ddi)
+            # Calculate number of visibilities
+            nvis = nrowsPerDDI*ddIspectralWindowInfo[ddi]['NumChan']*ddIspectralWindowInfo[ddi]['NumCorr']
+            scanDdiMap[scan][ddi]['nVis'] = scanDdiMap[scan][ddi]['nVis'] + nvis
+            nVisPerDDI[ddi] = nVisPerDDI.get(ddi, 0) + nvis
+            nVisPerScan[scan] = nVisPerScan.get(scan, 0) + nvis
+            nVisPerField[fieldId] = nVisPerField.get(fieldId, 0) + nvis
+    
 
     # Sort the scan/ddi pairs depending on the number of visibilities
     ddiList = list()
@@ -1039,35 +1195,39 @@ def getPartitonMap(msfilename, nsubms, selection={}, axis=['field','spw','scan']
                      % (nsubms,nScanDDIPairs,nScanDDIPairs),"WARN","getPartitonMap")
         nsubms = nScanDDIPairs            
     
-    ddiArray = np.array(ddiList)
-    scanArray = np.array(scanList)
     nVisArray = np.array(nVisList)
     
     nVisSortIndex = np.argsort(nVisArray)
     nVisSortIndex[:] = nVisSortIndex[::-1]
     
-    ddiArray = ddiArray[nVisSortIndex]
-    scanArray = scanArray[nVisSortIndex]
-    nVisArray = nVisArray[nVisSortIndex]
-          
-            
-    # Make a map for the contribution of each subMS to each scan
-    scanNvisDistributionPerSubMs = {}
-    for scan in scanSummary:
-        scanNvisDistributionPerSubMs[scan] = np.zeros(nsubms)
-     
-     
-    # Make a map for the contribution of each subMS to each ddi   
-    ddiNvisDistributionPerSubMs = {}
-    for ddi in ddIspectralWindowInfo:
-        ddiNvisDistributionPerSubMs[ddi] = np.zeros(nsubms)
-        
-        
-    # Make a map for the contribution of each subMS to each field   
-    fieldList = np.unique(fieldList)
-    fieldNvisDistributionPerSubMs = {}
-    for field in fieldList:
-        fieldNvisDistributionPerSubMs[field] = np.zeros(nsubms)
+    
+    # Make an integer index for each scan, ddi and field, and the arrays 
+    # with the contribution of each subMS to each of them
+    scanIds = dict((scan,idx) for (idx,scan) in enumerate(scanKeys))
+    ddiIds = dict((ddi,idx) for (idx,ddi) in enumerate(ddIspectralWindowInfo.keys()))
+    fieldKeys = list(np.unique(fieldList))
+    fieldIds = dict((field,idx) for (idx,field) in enumerate(fieldKeys))
+    
+    scanNvisDistribution = np.zeros((len(scanIds),nsubms))
+    ddiNvisDistribution = np.zeros((len(ddiIds),nsubms))
+    fieldNvisDistribution = np.zeros((len(fieldIds),nsubms))
+    
+    # Each axis taken into account for the load distribution is given by the
+    # id of each pair, the total number of visibilities of each id and the
+    # contribution of each subMS to each id
+    axisList = list()
+    if 'scan' in axis:
+        axisList.append(([scanIds[scanList[pair]] for pair in nVisSortIndex],
+                         [nVisPerScan[scan] for scan in scanKeys],
+                         scanNvisDistribution))
+    if 'spw' in axis:
+        axisList.append(([ddiIds[ddiList[pair]] for pair in nVisSortIndex],
+                         [nVisPerDDI.get(ddi,0) for ddi in ddIspectralWindowInfo.keys()],
+                         ddiNvisDistribution))
+    if 'field' in axis:
+        axisList.append(([fieldIds[fieldList[pair]] for pair in nVisSortIndex],
+                         [nVisPerField[field] for field in fieldKeys],
+                         fieldNvisDistribution))
         
         
     # Make an array for total number of visibilites per subms
@@ -1085,39 +1245,29 @@ def getPartitonMap(msfilename, nsubms, selection={}, axis=['field','spw','scan']
         submScanDdiMap[subms]['nVisTotal'] = 0
         
         
-    # Iterate over the scan/ddi map and assign each pair to a subMS
-    for pair in range(len(ddiArray)):
+    # Iterate over the scan/ddi pairs in descending number of visibilities and assign each pair to a subMS
+    subMsIdx = np.arange(nsubms)
+    for (sortIdx, pair) in enumerate(nVisSortIndex):
         
-        ddi = ddiArray[pair]
-        scan = scanArray[pair]
-        field = scanDdiMap[scan][ddi]['fieldId']
+        ddi = ddiList[pair]
+        scan = scanList[pair]
+        field = fieldList[pair]
+        nVis = nVisList[pair]
                    
         # Select the subMS that with bigger (scan/ddi/field gap)
         # We use the average as a refLevel to include global structure information
         # But we also take into account the actual max value in case we are distributing large uneven chunks
         jointNvisGap = np.zeros(nsubms)
-        if 'scan' in axis:
-            refLevel = max(nVisPerScan[scan]/nsubms,scanNvisDistributionPerSubMs[scan].max())
-            jointNvisGap = jointNvisGap + refLevel - scanNvisDistributionPerSubMs[scan]
-        if 'spw' in axis:
-            refLevel = max(nVisPerDDI[ddi]/nsubms,ddiNvisDistributionPerSubMs[ddi].max())
-            jointNvisGap = jointNvisGap + refLevel - ddiNvisDistributionPerSubMs[ddi]
-        if 'field' in axis:
-            refLevel = max(nVisPerField[field]/nsubms,fieldNvisDistributionPerSubMs[field].max())
-            jointNvisGap = jointNvisGap + refLevel - fieldNvisDistributionPerSubMs[field]        
+        for (pairIds, nVisPerId, nvisDistribution) in axisList:
+            idNvisDistribution = nvisDistribution[pairIds[sortIdx]]
+            refLevel = max(nVisPerId[pairIds[sortIdx]]/nsubms,idNvisDistribution.max())
+            jointNvisGap = jointNvisGap + refLevel - idNvisDistribution
             
-        optimalSubMs = np.where(jointNvisGap == jointNvisGap.max())
-        optimalSubMs = optimalSubMs[0] # np.where returns a tuple
-        
         # In case of multiple candidates select the subms with minum number of total visibilities
-        if len(optimalSubMs) > 1:
-            subIdx = np.argmin(nvisPerSubMs[optimalSubMs])
-            optimalSubMs = optimalSubMs[subIdx]
-        else:
-            optimalSubMs = optimalSubMs[0]        
+        optimalSubMs = subMsIdx[jointNvisGap == jointNvisGap.max()]
+        optimalSubMs = optimalSubMs[np.argmin(nvisPerSubMs[optimalSubMs])]
                 
         # Store the scan/ddi pair info in the selected optimal subms
-        nVis = scanDdiMap[scan][ddi]['nVis']
         nvisPerSubMs[optimalSubMs] = nvisPerSubMs[optimalSubMs] + nVis
         submScanDdiMap[optimalSubMs]['scanList'].append(int(scan))
         submScanDdiMap[optimalSubMs]['ddiList'].append(int(ddi))
@@ -1126,15 +1276,17 @@ def getPartitonMap(msfilename, nsubms, selection={}, axis=['field','spw','scan']
         submScanDdiMap[optimalSubMs]['nVisTotal'] = submScanDdiMap[optimalSubMs]['nVisTotal'] + nVis
         
         # Also update the counters for the subms-scan and subms-ddi maps            
-        scanNvisDistributionPerSubMs[scan][optimalSubMs] = scanNvisDistributionPerSubMs[scan][optimalSubMs] + nVis
-        ddiNvisDistributionPerSubMs[ddi][optimalSubMs] = ddiNvisDistributionPerSubMs[ddi][optimalSubMs] + nVis
-        fieldNvisDistributionPerSubMs[field][optimalSubMs] = fieldNvisDistributionPerSubMs[field][optimalSubMs] + nVis
+        scanNvisDistribution[scanIds[scan],optimalSubMs] += nVis
+        ddiNvisDistribution[ddiIds[ddi],optimalSubMs] += nVis
+        fieldNvisDistribution[fieldIds[field],optimalSubMs] += nVis
             
 
     # Generate plots
     if plotMode > 0:
         plt.close()
-        plotname_prefix = os.path.basename(msfilename) + ' axis ' + string.join(axis)
+        scanNvisDistributionPerSubMs = dict((scan,scanNvisDistribution[idx]) for (scan,idx) in scanIds.items())
+        ddiNvisDistributionPerSubMs = dict((ddi,ddiNvisDistribution[idx]) for (ddi,idx) in ddiIds.items())
+        fieldNvisDistributionPerSubMs = dict((field,fieldNvisDistribution[idx]) for (field,idx) in fieldIds.items())
         plotVisDistribution(nVisPerScan,scanNvisDistributionPerSubMs,plotname_prefix,'scan',plotMode=plotMode)
         plotVisDistribution(nVisPerDDI,ddiNvisDistributionPerSubMs,plotname_prefix,'ddi',plotMode=plotMode)
         plotVisDistribution(nVisPerField,fieldNvisDistributionPerSubMs,plotname_prefix,'field',plotMode=plotMode)
@@ -527,46 +527,39 @@ class PyParallelContSynthesisImager(PySynthesisImager):
 #############################################
     def initializeImagersBase(self,thisSelPars,partialSelPars):
         #
-        # Start the imagers on all nodes.
-        #
-        joblist=[]
-        for node in self.listOfNodes:
-            joblist.append( self.PH.runcmd("toolsi = casac.synthesisimager()", node) );
-        self.PH.checkJobs(joblist);
-
+        # Start the imagers on all nodes, select the data and define the
+        # images with a single command per node. The parameter records are
+        # sent along with the command instead of being converted to strings.
         #
         # Select data.  If partialSelPars is True, use the thisSelPars
         # data structure as a list of partitioned selections.
         #
-        joblist=[];
         nodes=self.listOfNodes;#[1];
         if (not partialSelPars):
             nodes = [1];
-        for node in nodes:
-            for mss in sorted( self.selpars.keys() ):
-                if (partialSelPars):
-                    selStr=str(thisSelPars[str(node-1)][mss]);
-                else:
-                    #joblist.append( self.PH.runcmd("toolsi.selectdata( "+str(thisSelPars[mss])+")", node) )
-                    selStr=str(thisSelPars[mss]);
-                joblist.append( self.PH.runcmd("toolsi.selectdata( "+selStr+")", node) )
-        self.PH.checkJobs(joblist);
-
-        #
-        # Call defineimage at each node.
-        #
-        joblist=[];
-        for node in nodes:
-            ## For each image-field, define imaging parameters
-            nimpars = copy.deepcopy(self.allimpars)
-            #print "nimpars = ",nimpars;
-            ngridpars = copy.deepcopy(self.allgridpars)
-            for fld in range(0,self.NF):
-                if self.NN>1:
-                    nimpars[str(fld)]['imagename'] = self.PH.getpath(node) + '/' + nimpars[str(fld)]['imagename']+'.n'+str(node)
-
-                joblist.append( self.PH.runcmd("toolsi.defineimage( impars=" + str( nimpars[str(fld)] ) 
-                                               + ", gridpars=" + str( ngridpars[str(fld)] )   + ")", node ) )
+        joblist=[]
+        for node in self.listOfNodes:
+            imagerpars = {'selparslist':[], 'imparslist':[], 'gridparslist':[]}
+            if node in nodes:
+                for mss in sorted( self.selpars.keys() ):
+                    if (partialSelPars):
+                        imagerpars['selparslist'].append( thisSelPars[str(node-1)][mss] )
+                    else:
+                        imagerpars['selparslist'].append( thisSelPars[mss] )
+
+                ## For each image-field, define imaging parameters
+                nimpars = copy.deepcopy(self.allimpars)
+                #print "nimpars = ",nimpars;
+                ngridpars = copy.deepcopy(self.allgridpars)
+                for fld in range(0,self.NF):
+                    if self.NN>1:
+                        nimpars[str(fld)]['imagename'] = self.PH.getpath(node) + '/' + nimpars[str(fld)]['imagename']+'.n'+str(node)
+                    imagerpars['imparslist'].append( nimpars[str(fld)] )
+                    imagerpars['gridparslist'].append( ngridpars[str(fld)] )
+
+            joblist.append( self.PH.runcmd("from refimagerhelper import configureSynthesisImager\n"
+                                           "toolsi = configureSynthesisImager(**imagerpars)",
+                                           node, parameters={'imagerpars':imagerpars}) )
         self.PH.checkJobs(joblist);
         
 #############################################
@@ -711,7 +704,8 @@ class PyParallelContSynthesisImager(PySynthesisImager):
         joblist=[];
         for node in self.listOfNodes:
             ## Set weighting pars
-            joblist.append( self.PH.runcmd("toolsi.setweighting( **" + str(self.weightpars) + ")", node ) )
+            joblist.append( self.PH.runcmd("toolsi.setweighting( **weightpars )", node,
+                                           parameters={'weightpars':self.weightpars} ) )
         self.PH.checkJobs( joblist )
 
         ## If only one field, do the get/gather/set of the weight density.
@@ -930,31 +924,23 @@ class PyParallelCubeSynthesisImager():
         #print "****** SELPARS in init **********", self.allselpars
         #print "****** SELIMPARS in init **********", self.allimpars
         
+        # Configure the imager of each node with a single command. The parameter
+        # records (including the csys records) are sent along with the command
+        # instead of being converted to strings and evaluated at each node.
         joblist=[]
         #### MPIInterface related changes
         #for node in range(0,self.NN):
         for node in self.listOfNodes:
-            joblist.append( self.PH.runcmd("from refimagerhelper import ImagerParameters, PySynthesisImager", node) )
-        self.PH.checkJobs( joblist )
-
-        joblist=[]
-        #### MPIInterface related changes
-        #for node in range(0,self.NN):
-        for node in self.listOfNodes:
-
-            joblist.append( self.PH.runcmd("paramList = ImagerParameters()", node) )
-            joblist.append( self.PH.runcmd("paramList.setSelPars("+str(self.allselpars[str(node)])+")", node) )
-            joblist.append( self.PH.runcmd("paramList.setImagePars("+str(self.allimpars[str(node)])+")", node) )
-
-            joblist.append( self.PH.runcmd("paramList.setGridPars("+str(self.allgridpars)+")", node) )
-            joblist.append( self.PH.runcmd("paramList.setWeightPars("+str(self.weightpars)+")", node) )
-            joblist.append( self.PH.runcmd("paramList.setDecPars("+str(self.decpars)+")", node) )
-            joblist.append( self.PH.runcmd("paramList.setIterPars("+str(self.iterpars)+")", node) )
-            joblist.append( self.PH.runcmd("paramList.setNormPars("+str(self.allnormpars)+")", node) )
-
-            joblist.append( self.PH.runcmd("paramList.checkParameters()", node) )
-
-            joblist.append( self.PH.runcmd("imager = PySynthesisImager(params=paramList)", node) )
+            imagerpars = {'selpars':self.allselpars[str(node)],
+                          'impars':self.allimpars[str(node)],
+                          'gridpars':self.allgridpars,
+                          'weightpars':self.weightpars,
+                          'decpars':self.decpars,
+                          'iterpars':self.iterpars,
+                          'normpars':self.allnormpars}
+            joblist.append( self.PH.runcmd("from refimagerhelper import configurePySynthesisImager\n"
+                                           "paramList, imager = configurePySynthesisImager(**imagerpars)",
+                                           node, parameters={'imagerpars':imagerpars}) )
 
         self.PH.checkJobs( joblist )
 
@@ -1376,9 +1362,11 @@ class PyParallelImagerHelper():
         print '...done'
 
 #############################################
-    def runcmd(self, cmdstr="", node=-1):
+    # parameters : dictionary of variables (e.g. parameter records) sent along
+    #              with the command to a node, and defined while it runs there
+    def runcmd(self, cmdstr="", node=-1, parameters=None):
          if node >= 0:
-              return self.CL.odo( cmdstr , node)
+              return self.CL.odo( cmdstr , node, parameters)
          else:
               self.CL.pgc( cmdstr )
 
@@ -1410,7 +1398,32 @@ class PyParallelImagerHelper():
             shutil.rmtree( dirname + "/" + aname )
 ##########################################################################################
 
-
+#############################################
+# Run at the nodes of PyParallelContSynthesisImager, to start the imager, select
+# the data and define the images in a single command.
+def configureSynthesisImager(selparslist=[], imparslist=[], gridparslist=[]):
+    toolsi = casac.synthesisimager()
+    for selpars in selparslist:
+        toolsi.selectdata( selpars )
+    for (impars, gridpars) in zip(imparslist, gridparslist):
+        toolsi.defineimage( impars=impars, gridpars=gridpars )
+    return toolsi
+
+#############################################
+# Run at the nodes of PyParallelCubeSynthesisImager, to set the parameters and
+# start the imager in a single command.
+def configurePySynthesisImager(selpars, impars, gridpars, weightpars, decpars, iterpars, normpars):
+    paramList = ImagerParameters()
+    paramList.setSelPars(selpars)
+    paramList.setImagePars(impars)
+    paramList.setGridPars(gridpars)
+    paramList.setWeightPars(weightpars)
+    paramList.setDecPars(decpars)
+    paramList.setIterPars(iterpars)
+    paramList.setNormPars(normpars)
+    paramList.checkParameters()
+    imager = PySynthesisImager(params=paramList)
+    return (paramList, imager)
 
 ######################################################
 ######################################################
@@ -239,42 +239,41 @@ class ss_setjy_helper:
 	  #mjds=inparams[src]['mjds']
 	  mjds=inparams[vfid]['mjds']
 	  fluxes=[]
-          # call solar_system_fd() per spw (for scalebychan freqlist has an extra dimention)
+          # call solar_system_fd() once for the frequency ranges of all the spws
+          # (for scalebychan freqlist has an extra dimention)
           #nspwused=len(inparams[src]['freqlist'])
           nspwused=len(inparams[vfid]['freqlist'])
-
-          # warning for many channels but it is really depends on the source
-          if scalebychan:
-            maxnf=0
-            for ispw in range(nspwused):
-              #nf = len(inparams[src]['freqlist'][ispw])
-              nf = len(inparams[vfid]['freqlist'][ispw])
-              maxnf = max(nf,maxnf)
-            if maxnf >= 3840 and src.upper()!="MARS": # mars shoulde be ok
-              self._casalog.post("Processing %s spw(s) and at least some of them are a few 1000 channels or more. This may take \
-                            many minutes (>3min per spw for 3840 channels) in some cases. Please be patient." % nspwused,"WARN")
-              
-	  for i in range(nspwused): # corresponds to n spw
-	    if type(freqlist[0][0])==list:
-	      #infreqs=inparams[src]['freqlist'][i]
-	      infreqs=inparams[vfid]['freqlist'][i]
-	    else:
-	      #infreqs=[inparams[src]['freqlist'][i]]
-	      infreqs=[inparams[vfid]['freqlist'][i]]
-            self._casalog.post("Calling solar_system_fd: %s(%s) for spw%s freqs=%s" % (src, vfid,i,freqlist[i]),'DEBUG1')
-            #print "calling solar system fd..."
-	    (errcodes, subfluxes, fluxerrs, sizes, dirs)=\
-               ss_setjy.solar_system_fd(source_name=src, MJDs=mjds, frequencies=infreqs, observatory=observatory, casalog=self._casalog)
-            # for old code
-	    #(errcodes, subfluxes, fluxerrs, sizes, dirs)=\
-            #   ss_setjy.solar_system_fd(source_name=src, MJDs=mjds, frequencies=infreqs, casalog=self._casalog)
+          allfreqs=[]
+          nfreqs=[]
+          for i in range(nspwused): # corresponds to n spw
+            if type(freqlist[0][0])==list:
+              #infreqs=inparams[src]['freqlist'][i]
+              infreqs=inparams[vfid]['freqlist'][i]
+            else:
+              #infreqs=[inparams[src]['freqlist'][i]]
+              infreqs=[inparams[vfid]['freqlist'][i]]
+            allfreqs.extend(infreqs)
+            nfreqs.append(len(infreqs))
+          self._casalog.post("Calling solar_system_fd: %s(%s) for %s spw(s) freqs=%s" % (src, vfid, nspwused, freqlist),'DEBUG1')
+          (allerrcodes, allfluxes, fluxerrs, sizes, dirs)=\
+             ss_setjy.solar_system_fd(source_name=src, MJDs=mjds, frequencies=allfreqs, observatory=observatory, casalog=self._casalog)
+          # for old code
+          #(errcodes, subfluxes, fluxerrs, sizes, dirs)=\
+          #   ss_setjy.solar_system_fd(source_name=src, MJDs=mjds, frequencies=infreqs, casalog=self._casalog)
           # for nf freq ranges, nt mjds
-          # errcodes[nf][nt], subfluxes[nf][nt], fluxerrs[nf][nt], sizes[nt],  dirs[nt]
-            self._casalog.post("+++++ solar_system_fd() returned values +++++", 'DEBUG1')
-            self._casalog.post(" fluxes(fds)=%s" % subfluxes, 'DEBUG1')
-            self._casalog.post(" sizes=%s" % sizes, 'DEBUG1')
-            self._casalog.post(" directions=%s\n" % dirs, 'DEBUG1')
-
+          # errcodes[nt][nf], subfluxes[nt][nf], fluxerrs[nt][nf], sizes[nt],  dirs[nt]
+          self._casalog.post("+++++ solar_system_fd() returned values +++++", 'DEBUG1')
+          self._casalog.post(" fluxes(fds)=%s" % allfluxes, 'DEBUG1')
+          self._casalog.post(" sizes=%s" % sizes, 'DEBUG1')
+          self._casalog.post(" directions=%s\n" % dirs, 'DEBUG1')
+
+          # split the returned values by spw, the error codes checked below
+          # are those of the last spw
+          nf0=0
+          for nf in nfreqs:
+            errcodes=[errs[nf0:nf0+nf] for errs in allerrcodes]
+            subfluxes=[fds[nf0:nf0+nf] for fds in allfluxes]
+            nf0+=nf
           # packed fluxes for all spws 
 	    fluxes.append(subfluxes)    
             #print "fluxes=",fluxes
@@ -85,6 +85,75 @@ class compositenumber:
 
 
 
+class pointingset(object):
+    """
+    A set of pointings held as numpy arrays:
+        ra, dec : directions in radians
+        epoch   : reference frame (e.g. 'J2000') of each pointing
+        time    : dwell time of each pointing in seconds
+
+    The set can be used like the list of direction strings which the
+    pointing methods of simutil used to return: len(), indexing and
+    iteration give strings 'epoch ra dec', and a set can be added to a
+    list.  The strings are only formatted when they are asked for, e.g.
+    when the pointings are written to a file or given to sm.setfield.
+    """
+    def __init__(self, ra=[], dec=[], epoch='', time=0.):
+        self.ra = pl.array(ra, dtype=float).ravel()
+        self.dec = pl.array(dec, dtype=float).ravel()
+        npos = len(self.ra)
+        if is_array_type(epoch):
+            self.epoch = pl.array(list(epoch), dtype=object)
+        else:
+            self.epoch = pl.array([epoch.strip()] * npos, dtype=object)
+        self.time = pl.zeros(npos) + time
+
+    def __len__(self):
+        return len(self.ra)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return pointingset(self.ra[i], self.dec[i], self.epoch[i], self.time[i])
+        return self.format(i)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.format(i)
+
+    def __add__(self, other):
+        if isinstance(other, pointingset):
+            return pointingset(pl.concatenate([self.ra, other.ra]),
+                               pl.concatenate([self.dec, other.dec]),
+                               list(self.epoch) + list(other.epoch),
+                               pl.concatenate([self.time, other.time]))
+        return self.tolist() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self.tolist()
+
+    def format(self, i):
+        """
+        Returns pointing i as a direction string 'epoch ra dec', with ra
+        in hms and dec in dms.
+        """
+        xstr = qa.formxxx({'value': pl.degrees(self.ra[i]), 'unit': 'deg'},
+                          format='hms', prec=5)
+        ystr = qa.formxxx({'value': pl.degrees(self.dec[i]), 'unit': 'deg'},
+                          format='dms', prec=5)
+        if self.epoch[i]:
+            return "%s %s %s" % (self.epoch[i], xstr, ystr)
+        return "%s %s" % (xstr, ystr)
+
+    def tolist(self):
+        """
+        Returns the pointings as a list of direction strings.
+        """
+        return [self.format(i) for i in xrange(len(self))]
+
+
+
+
+
 class simutil:
     def __init__(self, direction="",
                  centerfreq=qa.quantity("245GHz"),
@@ -451,12 +520,12 @@ class simutil:
 
     def calc_pointings2(self, spacing, size, maptype="hex", direction=None, relmargin=0.5, beam=0.):   
         """
-        If direction is a list, simply returns direction and the number of
-        pointings in it.
+        If direction is a list, simply returns the pointings in it as a
+        pointingset.
         
-        Otherwise, returns a hexagonally packed list of pointings separated by
-        spacing and fitting inside an area specified by direction and mapsize, 
-        as well as the number of pointings.  The hexagonal packing starts with a
+        Otherwise, returns a hexagonally packed pointingset of pointings
+        separated by spacing and fitting inside an area specified by direction
+        and mapsize.  The hexagonal packing starts with a
         horizontal row centered on direction, and the other rows alternate
         being horizontally offset by a half spacing.  
         """
@@ -480,94 +549,66 @@ class simutil:
         if type(direction)==type([]):
             if len(direction) > 1:                
                 if self.verbose: self.msg("you are inputing the precise pointings in 'direction' - if you want to calculate a mosaic, give a single direction string and set maptype",priority="warn")
-                return direction
+                return self.pointing_set(direction)
             else: direction=direction[0]
 
 
         # haveing eliminated other options, we need to calculate:
         epoch, centx, centy = self.direction_splitter()
+        centx = centx['value']
+        centy = centy['value']
+        # pointings are calculated in degrees
+        x = pl.zeros(0)
+        y = pl.zeros(0)
 
         shorttype=str.upper(maptype[0:3])
 #        if not shorttype=="HEX":
 #            self.msg("can't calculate map of maptype "+maptype,priority="error")
-        if shorttype == "HEX": 
-            # this is hexagonal grid - Kana will add other types here
+        if shorttype == "HEX" or shorttype == "SQU":
             self.isquantity(spacing)
-            spacing  = qa.quantity(spacing)
-            yspacing = qa.mul(0.866025404, spacing)
-            
-            xsize=qa.quantity(size[0])
-            ysize=qa.quantity(size[1])
-
-            nrows = 1+ int(pl.floor(qa.convert(qa.div(ysize, yspacing), '')['value']
-                                    - 2.309401077 * relmargin))
-
-            availcols = 1 + qa.convert(qa.div(xsize, spacing),
-                                       '')['value'] - 2.0 * relmargin
-            ncols = int(pl.floor(availcols))
-
-            # By making the even rows shifted spacing/2 ahead, and possibly shorter,
-            # the top and bottom rows (nrows odd), are guaranteed to be short.
-            if availcols - ncols >= 0.5 and nrows>1:                            # O O O
-                evencols = ncols                                    #  O O O
-                ncolstomin = 0.5 * (ncols - 0.5)
+            spacing = qa.convert(qa.quantity(spacing), 'deg')['value']
+            xsize = qa.convert(qa.quantity(size[0]), 'deg')['value']
+            ysize = qa.convert(qa.quantity(size[1]), 'deg')['value']
+
+            if shorttype == "HEX": 
+                # this is hexagonal grid - Kana will add other types here
+                yspacing = 0.866025404 * spacing
+                nrows = 1+ int(pl.floor(ysize / yspacing - 2.309401077 * relmargin))
+                availcols = 1 + xsize / spacing - 2.0 * relmargin
+                ncols = int(pl.floor(availcols))
+
+                # By making the even rows shifted spacing/2 ahead, and possibly shorter,
+                # the top and bottom rows (nrows odd), are guaranteed to be short.
+                if availcols - ncols >= 0.5 and nrows>1:                # O O O
+                    evencols = ncols                                    #  O O O
+                    ncolstomin = 0.5 * (ncols - 0.5)
+                else:
+                    evencols = ncols - 1                                #  O O 
+                    ncolstomin = 0.5 * (ncols - 1)                      # O O O
+                odd = (pl.arange(max(nrows, 0)) % 2) == 1
+                rowcols = pl.where(odd, ncols, evencols)
+                rowstart = pl.where(odd, ncolstomin, ncolstomin - 0.5)
             else:
-                evencols = ncols - 1                                #  O O 
-                ncolstomin = 0.5 * (ncols - 1)                      # O O O
-            pointings = []
-
-            # Start from the top because in the Southern hemisphere it sets first.
-            y = qa.add(centy, qa.mul(0.5 * (nrows - 1), yspacing))
-            for row in xrange(0, nrows):         # xrange stops early.
-                xspacing = qa.mul(1.0 / pl.cos(qa.convert(y, 'rad')['value']),spacing)
-                ystr = qa.formxxx(y, format='dms',prec=5)
-                
-                if row % 2:                             # Odd
-                    xmin = qa.sub(centx, qa.mul(ncolstomin, xspacing))
-                    stopcolp1 = ncols
-                else:                                   # Even (including 0)
-                    xmin = qa.sub(centx, qa.mul(ncolstomin - 0.5,
-                                                xspacing))
-                    stopcolp1 = evencols
-                for col in xrange(0, stopcolp1):        # xrange stops early.
-                    x = qa.formxxx(qa.add(xmin, qa.mul(col, xspacing)),
-                                   format='hms',prec=5)
-                    pointings.append("%s%s %s" % (epoch, x, ystr))
-                y = qa.sub(y, yspacing)
-        elif shorttype =="SQU":
-            # lattice gridding
-            self.isquantity(spacing)
-            spacing  = qa.quantity(spacing)
-            yspacing = spacing
-    
-            xsize=qa.quantity(size[0])
-            ysize=qa.quantity(size[1])
+                # lattice gridding
+                yspacing = spacing
+                nrows = 1+ int(pl.floor(ysize / yspacing - 2.0 * relmargin))
+                availcols = 1 + xsize / spacing - 2.0 * relmargin
+                ncols = int(pl.floor(availcols))
 
-            nrows = 1+ int(pl.floor(qa.convert(qa.div(ysize, yspacing), '')['value']
-                                    - 2.0 * relmargin))
-
-            availcols = 1 + qa.convert(qa.div(xsize, spacing), '')['value'] \
-                        - 2.0 * relmargin
-            ncols = int(pl.floor(availcols))
-
-
-            ncolstomin = 0.5 * (ncols - 1)                           # O O O O
-            pointings = []                                           # O O O O
+                ncolstomin = 0.5 * (ncols - 1)                           # O O O O
+                rowcols = pl.zeros(max(nrows, 0)) + ncols                # O O O O
+                rowstart = pl.zeros(max(nrows, 0)) + ncolstomin
 
             # Start from the top because in the Southern hemisphere it sets first.
-            y = qa.add(centy, qa.mul(0.5 * (nrows - 1), yspacing))
-            for row in xrange(0, nrows):         # xrange stops early.
-                xspacing = qa.mul(1.0 / pl.cos(qa.convert(y, 'rad')['value']),spacing)
-                ystr = qa.formxxx(y, format='dms',prec=5)
-
-                xmin = qa.sub(centx, qa.mul(ncolstomin, xspacing))
-                stopcolp1 = ncols
-        
-                for col in xrange(0, stopcolp1):        # xrange stops early.
-                    x = qa.formxxx(qa.add(xmin, qa.mul(col, xspacing)),
-                                   format='hms',prec=5)
-                    pointings.append("%s%s %s" % (epoch, x, ystr))
-                y = qa.sub(y, yspacing)
+            rowy = centy + (0.5 * (nrows - 1) - pl.arange(max(nrows, 0))) * yspacing
+            xspacing = spacing / pl.cos(pl.radians(rowy))
+            cols = pl.arange(max(ncols, 0))
+            # one row of the grid per pointing row, masked to the columns in each row
+            inrow = cols[pl.newaxis, :] < rowcols[:, pl.newaxis]
+            gridx = centx + (cols[pl.newaxis, :] - rowstart[:, pl.newaxis]) * xspacing[:, pl.newaxis]
+            gridy = rowy[:, pl.newaxis] + pl.zeros(len(cols))
+            x = gridx[inrow]
+            y = gridy[inrow]
         if shorttype == "ALM": 
             # OT algorithm
             self.isquantity(spacing)
@@ -581,26 +622,21 @@ class simutil:
             angle = 0. # deg
 
             if str.upper(maptype[0:8]) == 'ALMA2012':
-                x,y = self.getTrianglePoints(xsize_asec, ysize_asec, angle, spacing_asec)
+                xasec,yasec = self.getTrianglePoints(xsize_asec, ysize_asec, angle, spacing_asec)
             else:
                 if beam<=0: 
                     beam=spacing_asec*pbcoeff*pl.sqrt(3) # ASSUMES ALMA default and arcsec
-                x,y = self.getTriangularTiling(xsize_asec, ysize_asec, angle, spacing_asec, beam)
+                xasec,yasec = self.getTriangularTiling(xsize_asec, ysize_asec, angle, spacing_asec, beam)
 
-            pointings = []
-            nx=len(x)
-            for i in range(nx):
             # Start from the top because in the Southern hemisphere it sets first.
-                y1=qa.add(centy, str(y[nx-i-1])+"arcsec")
-                ycos=pl.cos(qa.convert(y1,"rad")['value'])
-                ystr = qa.formxxx(y1, format='dms',prec=5)
-                xstr = qa.formxxx(qa.add(centx, str(x[nx-i-1]/ycos)+"arcsec"), format='hms',prec=5)
-                pointings.append("%s%s %s" % (epoch, xstr, ystr))
-            
+            y = centy + pl.array(yasec, dtype=float)[::-1] / 3600.
+            x = centx + pl.array(xasec, dtype=float)[::-1] / 3600. / pl.cos(pl.radians(y))
 
         # if could not fit any pointings, then return single pointing
-        if(len(pointings)==0):
-            pointings.append(direction)
+        if(len(x)==0):
+            pointings = self.pointing_set(direction)
+        else:
+            pointings = pointingset(pl.radians(x), pl.radians(y), epoch)
 
         self.msg("using %i generated pointing(s)" % len(pointings),origin='calc_pointings')
         self.pointings=pointings
@@ -623,6 +659,8 @@ class simutil:
         and scan time (optional,in sec).
         Parameter:
              filename:  (str) the name of input file
+        Returns the number of pointings, the pointings as a pointingset
+        and the list of scan times.
        
         The input file (ASCII) should contain at least 3 fields separated
         by a space which specify positions with epoch, ra and dec (in dms
@@ -642,7 +680,9 @@ class simutil:
         f=open(filename)
         line= '  '
         time=[]
-        pointings=[]
+        epochs=[]
+        ra=[]
+        dec=[]
 
         # add option of different epoch in a header line like read_antenna?
 
@@ -657,15 +697,15 @@ class simutil:
                             time.append(float(splitline[4]))
                         else:
                             time.append(0.)
-                        xstr = qa.formxxx(qa.quantity(splitline[0]), format='hms',prec=5)
+                        ra.append(qa.convert(qa.quantity(splitline[0]),'rad')['value'])
                         de0=splitline[1]
                         # casa insists that strings with : are RA, so...
                         if de0.count(":")>0:
-                            ystr = qa.formxxx(qa.div(qa.quantity(de0),15), format='dms',prec=5)
+                            dec.append(qa.convert(qa.div(qa.quantity(de0),15),'rad')['value'])
                         else:
-                            ystr = qa.formxxx(qa.quantity(de0), format='dms',prec=5)
+                            dec.append(qa.convert(qa.quantity(de0),'rad')['value'])
                         # ASSUME ICRS
-                        pointings.append("ICRS %s %s" % (xstr,ystr))
+                        epochs.append("ICRS")
                 ### ignoring line that has less than 3 elements
                     elif(len(line.split()) >2):
                         splitline=line.split()
@@ -676,12 +716,16 @@ class simutil:
                             time.append(float(splitline[3]))
                         else:
                             time.append(0.)
-                        xstr = qa.formxxx(qa.quantity(ra0), format='hms',prec=5)
-                        ystr = qa.formxxx(qa.quantity(de0), format='dms',prec=5)
-                        pointings.append("%s %s %s" % (epoch,xstr,ystr))
+                        ra.append(qa.convert(qa.quantity(ra0),'rad')['value'])
+                        dec.append(qa.convert(qa.quantity(de0),'rad')['value'])
+                        epochs.append(epoch)
             except:
                 break
         f.close()
+        # a line may have failed after its time was read
+        npos=len(epochs)
+        time=time[:npos]
+        pointings=pointingset(ra[:npos],dec[:npos],epochs,time)
 
         # need an error check here if zero valid pointings were read
         if len(pointings) < 1:
@@ -715,6 +759,9 @@ class simutil:
         """
         f=open(filename,"write")
         f.write('#Epoch     RA          DEC      TIME[sec]\n')
+        # the strings of a pointingset are only formatted here
+        if isinstance(pointings,pointingset):
+            pointings=pointings.tolist()
         if type(pointings)!=type([]):
             pointings=[pointings]
         npos=len(pointings)
@@ -737,50 +784,49 @@ class simutil:
     
 
 
+    ###########################################################
+
+    def pointing_set(self, directions=None):
+        """
+        Returns directions as a pointingset.  directions can be a
+        pointingset, a direction string or a list of direction strings.
+        """
+        if directions==None:
+            directions=self.direction
+        if isinstance(directions, pointingset):
+            return directions
+        if type(directions)!=type([]):
+            directions=[directions]
+        epochs=[]
+        ra=pl.zeros(len(directions))
+        dec=pl.zeros(len(directions))
+        for i in xrange(len(directions)):
+            epoch, x, y = self.direction_splitter(directions[i])
+            epochs.append(epoch.strip())
+            ra[i]=qa.convert(x,'rad')['value']
+            dec[i]=qa.convert(y,'rad')['value']
+        return pointingset(ra, dec, epochs)
+
+
+
     ###########################################################
 
     def average_direction(self, directions=None):
         # RI TODO make deal with list of measures as well as list of strings
         """
-        Returns the average of directions as a string, and relative offsets
+        Returns the average of directions as a string, and relative offsets.
+        directions can be a pointingset or a list of direction strings.
+        R.A. is averaged after wrapping it around the first direction.
         """
         if directions==None:
             directions=self.direction
-        epoch0, x, y = self.direction_splitter(directions[0])
-        i = 1
-        avgx = 0.0
-        avgy = 0.0
-        for drn in directions:
-            epoch, x, y = self.direction_splitter(drn)
-            # in principle direction_splitter returns directions in degrees,
-            # but can we be sure?
-            x=qa.convert(x,'deg')
-            y=qa.convert(y,'deg')
-            x = x['value']
-            y = y['value']
-            if epoch != epoch0:                     # Paranoia
-                print "[simutil] WARN: precession not handled by average_direction()"
-            x = self.wrapang(x, avgx, 360.0)
-            avgx += (x - avgx) / i
-            avgy += (y - avgy) / i
-            i += 1
-        offsets=pl.zeros([2,i-1])
-        i=0
-        cosdec=pl.cos(avgy*pl.pi/180.)
-        for drn in directions:
-            epoch, x, y = self.direction_splitter(drn)
-            x=qa.convert(x,'deg')
-            y=qa.convert(y,'deg')
-            x = x['value']
-            y = y['value']
-            x = self.wrapang(x, avgx, 360.0)
-            offsets[:,i]=[(x-avgx)*cosdec,y-avgy]  # apply cosdec to make offsets on sky
-            i+=1
-        avgx = qa.toangle('%17.12fdeg' % avgx)
-        avgy = qa.toangle('%17.12fdeg' % avgy)
-        avgx = qa.formxxx(avgx, format='hms',prec=5)
-        avgy = qa.formxxx(avgy, format='dms',prec=5)
-        return "%s%s %s" % (epoch0, avgx, avgy), offsets
+        pointings = self.pointing_set(directions)
+        if len(set(pointings.epoch)) > 1:       # Paranoia
+            print "[simutil] WARN: precession not handled by average_direction()"
+        x = pl.degrees(pointings.ra)
+        y = pl.degrees(pointings.dec)
+        x = self.wrapang(x, self.wrapang(x[0], 0.0, 360.0), 360.0)
+        return self._direction_offsets(pointings.epoch[0], x, y, x.mean(), y.mean())
 
 
 
@@ -789,44 +835,30 @@ class simutil:
     def median_direction(self, directions=None):
         # RI TODO make deal with list of measures as well as list of strings
         """
-        Returns the median of directions as a string, and relative offsets
+        Returns the median of directions as a string, and relative offsets.
+        directions can be a pointingset or a list of direction strings.
         """
         if directions==None:
             directions=self.direction
-        epoch0, x, y = self.direction_splitter(directions[0])
-        i = 1
-        avgx = 0.0
-        avgy = 0.0
-        xx=[]
-        yy=[]
-        for drn in directions:            
-            epoch, x, y = self.direction_splitter(drn)
-            # in principle direction_splitter returns directions in degrees,
-            # but can we be sure?
-            x=qa.convert(x,'deg')
-            y=qa.convert(y,'deg')
-            x = x['value']
-            y = y['value']
-            if epoch != epoch0:                     # Paranoia
-                print "[simutil] WARN: precession not handled by average_direction()"
-            x = self.wrapang(x, avgx, 360.0)
-            xx.append(x)
-            yy.append(y)
-            i += 1
-        avgx = pl.median(xx)
-        avgy = pl.median(yy)
-        offsets=pl.zeros([2,i-1])
-        i=0
+        pointings = self.pointing_set(directions)
+        if len(set(pointings.epoch)) > 1:       # Paranoia
+            print "[simutil] WARN: precession not handled by average_direction()"
+        x = self.wrapang(pl.degrees(pointings.ra), 0.0, 360.0)
+        y = pl.degrees(pointings.dec)
+        return self._direction_offsets(pointings.epoch[0], x, y, pl.median(x), pl.median(y))
+
+
+
+    def _direction_offsets(self, epoch0, x, y, avgx, avgy):
+        """
+        Returns the center avgx, avgy (deg) as a string, and the offsets
+        of x, y (deg) from it on the sky in degrees.
+        """
         cosdec=pl.cos(avgy*pl.pi/180.)
-        for drn in directions:
-            epoch, x, y = self.direction_splitter(drn)
-            x=qa.convert(x,'deg')
-            y=qa.convert(y,'deg')
-            x = x['value']
-            y = y['value']
-            x = self.wrapang(x, avgx, 360.0)
-            offsets[:,i]=[(x-avgx)*cosdec,y-avgy]  # apply cosdec to make offsets on sky
-            i+=1
+        x = self.wrapang(x, avgx, 360.0)
+        offsets=pl.array([(x-avgx)*cosdec, y-avgy])  # apply cosdec to make offsets on sky
+        if epoch0:
+            epoch0 = epoch0 + ' '
         avgx = qa.toangle('%17.12fdeg' % avgx)
         avgy = qa.toangle('%17.12fdeg' % avgy)
         avgx = qa.formxxx(avgx, format='hms',prec=5)
@@ -846,7 +878,7 @@ class simutil:
         import re
         if direction == None:
             direction=self.direction
-        if type(direction) == type([]):
+        if type(direction) == type([]) or isinstance(direction, pointingset):
             direction=self.average_direction(direction)[0]
         dirl = direction.split()
         if len(dirl) == 3:
@@ -911,10 +943,15 @@ class simutil:
     def wrapang(self, ang, target, period = 360.0):
         """
         Returns ang wrapped so that it is within +-period/2 of target.
+        ang can be a number or an array of angles.
         """
         dang       = ang - target
         period     = pl.absolute(period)
         halfperiod = 0.5 * period
+        if pl.ndim(dang) > 0:
+            nwraps = pl.where(pl.absolute(dang) > halfperiod,
+                              pl.floor(0.5 + dang / period), 0.0)
+            return ang - nwraps * period
         if pl.absolute(dang) > halfperiod:
             nwraps = pl.floor(0.5 + float(dang) / period)
             ang -= nwraps * period
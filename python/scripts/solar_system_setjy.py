@@ -25,8 +25,13 @@
 # version 2.0
 # last edited: 2016Aug15
 # Modified by TT to avoid uncessary file open: 2012Dec13
+#
+# the models are integrated over all of the frequency ranges (e.g. all the
+# channels of all the spws) at once with numpy, and the model files and
+# ephemeris tables are read only once per process.
 
 
+import numpy
 from numpy import searchsorted
 from scipy import array
 from scipy.interpolate import interp1d
@@ -41,10 +46,87 @@ KK = qa.constants('K')['value']
 CC = qa.constants('C')['value'] 
 
 
+# model files and ephemeris tables already read, keyed by file name and
+# modification time.  they are kept for the life of the process.
+_model_cache = {}
+_ephemeris_cache = {}
+
+def _cached (cache, filename, read):
+    """
+    return read(filename), reading the file only the first time (or again
+    after it has been modified)
+    """
+    key = (filename, os.path.getmtime(filename))
+    if not cache.has_key(key):
+        cache[key] = read(filename)
+    return cache[key]
+
+def _read_model (filename):
+    """
+    read a model file of frequency (GHz) and Tb (or flux density), return
+    the lists of frequencies (Hz) and values
+    """
+    freqs = []
+    values = []
+    ff = open(filename)
+    for line in ff:
+        [freq,value] = line[:-1].split()
+        freqs.append(1.0e9*float(freq))
+        values.append(float(value))
+    ff.close()
+    return [ freqs, values ]
+
+def _read_time_model (filename):
+    """
+    read a model file of Tb (or flux density) as a function of time and
+    frequency, return the lists of frequencies (Hz), MJDs and values (one
+    list per MJD)
+    """
+    ff = open(filename)
+    # first line holds frequencies, like:
+    # 30.0 80.0 115.0 150.0 200.0 230.0 260.0 300.0 330.0 360.0 425.0 650.0 800.0 950.0 1000.0
+    line = ff.readline()[:-1]
+    fields = line.split()
+    freqs = []
+    for field in fields:
+        freqs.append(1.0e9*float(field))
+    # model output lines look like:
+    #2010 01 01 00 00  55197.00000 189.2 195.8 198.9 201.2 203.7 204.9 205.9 207.1 207.8 208.5 209.8 213.0 214.6 214.8 214.5 
+    modelMJDs = []
+    modelTbs = []
+    for line in ff:
+        fields = line[:-1].split()
+        modelMJDs.append(float(fields[5]))
+        lTbs = []
+        for ii in range(len(freqs)):
+            lTbs.append(float(fields[6+ii]))
+        modelTbs.append(lTbs)
+    ff.close()
+    return [ freqs, modelMJDs, modelTbs ]
+
+def _read_ephemeris (tablename):
+    """
+    read the keywords and columns of an ephemeris table that are used by
+    solar_system_fd(), return them in a dictionary
+    """
+    tb.open(tablename)
+    try:
+        ephemeris = {}
+        ephemeris['NAME'] = tb.getkeyword('NAME')
+        ephemeris['earliest'] = tb.getkeyword('earliest')['m0']['value']
+        ephemeris['latest'] = tb.getkeyword('latest')['m0']['value']
+        if ('radii' in tb.keywordnames()):
+            ephemeris['radii'] = tb.getkeyword('radii')['value']
+        column_names = tb.colnames()
+        for column_name in ['MJD', 'RA', 'DEC', 'Rho', 'RadVel', 'DiskLat', 'NP_ang']:
+            if (column_name in column_names):
+                ephemeris[column_name] = tb.getcol(column_name).tolist()
+    finally:
+        tb.close()
+    return ephemeris
+
+
 class solar_system_setjy:
-    def __init__(self):
-        self.models={}
-    
 
     def solar_system_fd (self, source_name, MJDs, frequencies, observatory, casalog=None):
         '''
@@ -179,16 +261,15 @@ class solar_system_setjy:
     # ephemeris tables by casacore's MeasComet class.
 
         for ephemeris_file in ephemeris_files:
-            tb.open(ephemeris_path + ephemeris_file)
-            table_source_name = tb.getkeyword('NAME').capitalize()
+            ephemeris = _cached(_ephemeris_cache, ephemeris_path + ephemeris_file, _read_ephemeris)
+            table_source_name = ephemeris['NAME'].capitalize()
             if (table_source_name != capitalized_source_name):
                 continue
-            first_time = tb.getkeyword('earliest')['m0']['value']
-            last_time = tb.getkeyword('latest')['m0']['value']
+            first_time = ephemeris['earliest']
+            last_time = ephemeris['latest']
             if (first_time < MJDs[0] and last_time > MJDs[-1]):
                 ephemeris_file_OK = True
                 break
-            tb.close()
     #
     # if we didn't find an ephemeris file, set the statuses and return.
     #
@@ -208,27 +289,26 @@ class solar_system_setjy:
                 directions.append(me.direction('J2000',0.0,0.0))
             return [ statuses, fds, dfds, Rhats, directions ]
 
-        Req = 1000.0 * (tb.getkeyword('radii')['value'][0] + tb.getkeyword('radii')['value'][1]) / 2
-        Rp = 1000.0 * tb.getkeyword('radii')['value'][2]
-        times = tb.getcol('MJD').tolist()
-        RAs = tb.getcol('RA').tolist()
-        DECs = tb.getcol('DEC').tolist()
-        distances = tb.getcol('Rho').tolist()
-        RadVels = tb.getcol('RadVel').tolist()
-        column_names = tb.colnames()
-        if ('DiskLat' in column_names):
-            selats = tb.getcol('DiskLat').tolist()
+        Req = 1000.0 * (ephemeris['radii'][0] + ephemeris['radii'][1]) / 2
+        Rp = 1000.0 * ephemeris['radii'][2]
+        times = ephemeris['MJD']
+        RAs = ephemeris['RA']
+        DECs = ephemeris['DEC']
+        distances = ephemeris['Rho']
+        RadVels = ephemeris['RadVel']
+        if (ephemeris.has_key('DiskLat')):
+            selats = ephemeris['DiskLat']
             has_selats = 1
         else:
             has_selats = 0
             selat = 0.0
-        if ('NP_ang' in column_names):
-            NPangs = tb.getcol('NP_ang').tolist()
+        if (ephemeris.has_key('NP_ang')):
+            NPangs = ephemeris['NP_ang']
             has_NPangs= 1
         else:
             has_NPangs = 0
             NPang = 0.0
-        tb.close()
+        afrequencies = numpy.array(frequencies, dtype=float).reshape(-1, 2)
         MJD_shifted_frequencies = []
         DDs = []
         Rmeans = []
@@ -286,8 +366,6 @@ class solar_system_setjy:
     #
             RadVel = self.interpolate_list (times, RadVels, MJD)[1] * AU / 86400000.0
             rv = me.radialvelocity('geo',str(RadVel)+'km/s')
-            shifted_frequencies = []
-            for frequency in frequencies:
     #
     # the measure for radial velocity could be obtained via:
     # me.measure(rv,'topo')['m0']['value']
@@ -295,28 +373,36 @@ class solar_system_setjy:
     # hand, but i'd rather do it with casa toolkit calls.  unfortunately,
     # it's a bit convoluted in casa...
     #
-                newfreq0 = me.tofrequency('topo',me.todoppler('optical',me.measure(rv,'topo')),me.frequency('topo',str(frequency[0])+'Hz'))['m0']['value']
-                newfreq1 = me.tofrequency('topo',me.todoppler('optical',me.measure(rv,'topo')),me.frequency('topo',str(frequency[1])+'Hz'))['m0']['value']
+    # the doppler shifted frequency is proportional to the frequency, so
+    # get the ratio once (at the mean frequency) and apply it to all of
+    # the frequencies.
+    #
+            if (len(afrequencies) > 0):
+                reffreq = afrequencies.mean()
+                newfreq = me.tofrequency('topo',me.todoppler('optical',me.measure(rv,'topo')),me.frequency('topo',repr(reffreq)+'Hz'))['m0']['value']
+                ratio = newfreq / reffreq
+            else:
+                ratio = 1.0
     #
     # should check units to be sure frequencies are in Hz
     #
     # now, we want to calculate the model shifted in the opposite direction
     # as the doppler shift, so take that into account.
     #
-                delta_frequency0 = frequency[0] - newfreq0
-                newfreq0 = frequency[0] + delta_frequency0
-                delta_frequency1 = frequency[1] - newfreq1
-                newfreq1 = frequency[1] + delta_frequency1
-                shifted_frequencies.append([newfreq0,newfreq1])
-                average_delta_frequency = (delta_frequency0 + delta_frequency1)/2
+            delta_frequencies = afrequencies - afrequencies * ratio
+            shifted_frequencies = afrequencies + delta_frequencies
+            if (len(afrequencies) > 0):
+                average_delta_frequency = delta_frequencies.mean()
+            else:
+                average_delta_frequency = 0.0
     #
     # should we print this to the log?
     #
-    #           print 'MJD, geo & topo velocities (km/s), and shift (MHz) = %7.1f  %5.1f  %5.1f  %6.3f' % \
-    #                 (MJD, RadVel, me.measure(rv,'topo')['m0']['value']/1000, average_delta_frequency/1.0e6)
-                msg='MJD, geo & topo velocities (km/s), and shift (MHz) = %7.1f  %5.1f  %5.1f  %6.3f' % \
-                     (MJD, RadVel, me.measure(rv,'topo')['m0']['value']/1000, average_delta_frequency/1.0e6)
-                casalog.post(msg, 'INFO2')
+    #       print 'MJD, geo & topo velocities (km/s), and shift (MHz) = %7.1f  %5.1f  %5.1f  %6.3f' % \
+    #             (MJD, RadVel, me.measure(rv,'topo')['m0']['value']/1000, average_delta_frequency/1.0e6)
+            msg='MJD, geo & topo velocities (km/s), and shift (MHz) = %7.1f  %5.1f  %5.1f  %6.3f' % \
+                 (MJD, RadVel, me.measure(rv,'topo')['m0']['value']/1000, average_delta_frequency/1.0e6)
+            casalog.post(msg, 'INFO2')
             MJD_shifted_frequencies.append(shifted_frequencies)
     #       me.done()
         for ii in range(len(MJDs)):
@@ -328,46 +414,31 @@ class solar_system_setjy:
                 brightnesses = brightnesses[0]
                 dbrightnesses = dbrightnesses[0]
             else:
-                tstatuses = []
-                brightnesses = []
-                dbrightnesses = []
-                for shifted_frequency in shifted_frequencies:
-                    [status,brightness,dbrightness] = self.brightness_planet_int (capitalized_source_name, shifted_frequency)
-                    tstatuses.append(status)
-                    brightnesses.append(brightness)
-                    dbrightnesses.append(dbrightness)
-            tfds = []
-            tdfds = []
-            for jj in range (len(tstatuses)):
+                [tstatuses,brightnesses,dbrightnesses] = self.brightness_planet_ints (capitalized_source_name, shifted_frequencies)
+            tstatuses = numpy.array(tstatuses, dtype=int)
+            flux_densities = numpy.array(brightnesses, dtype=float)  # brigtnesses contains flux density already
 #
 # if a status of 6 was returned, then it's a body with a current
 # flux density model, but a model from the past which was not
 # flux density was used, so don't multiply by apparent size.
 #
-                 if (tstatuses[jj] == 0 or tstatuses[jj] == 6):
-                    flux_density = brightnesses[jj]  # brigtnesses contains flux density already
-                    if (capitalized_source_name not in MODEL_IS_FD_BODIES or tstatuses[jj] == 6):
-                        flux_density *= 1.0e26 * pi * Rmeans[ii]*Rmeans[ii]/ (DDs[ii]*DDs[ii])
-                    tstatuses[jj] = 0
-    #
-    # mean apparent planet radius, in arcseconds (used if we ever
-    # calculate the primary beam reduction)
-    #
-                    psize = (Rmeans[ii] / DDs[ii]) * RAD2ASEC
+            OK = (tstatuses == 0) | (tstatuses == 6)
+            if (capitalized_source_name not in MODEL_IS_FD_BODIES):
+                scaled = OK
+            else:
+                scaled = (tstatuses == 6)
+            flux_densities[scaled] *= 1.0e26 * pi * Rmeans[ii]*Rmeans[ii]/ (DDs[ii]*DDs[ii])
+            tstatuses[OK] = 0
     #
     # primary beam reduction factor (should call a function, but
     # just set to 1.0 for now...
     #
-                    pbfactor = 1.0
-                    flux_density *= pbfactor
-                    tfds.append(flux_density)
-                    tdfds.append(0.0)
-                 else:
-                    tfds.append(0.0)
-                    tdfds.append(0.0)
-            statuses.append(tstatuses)
-            fds.append(tfds)
-            dfds.append(tdfds)
+            pbfactor = 1.0
+            flux_densities *= pbfactor
+            flux_densities[~OK] = 0.0
+            statuses.append(tstatuses.tolist())
+            fds.append(flux_densities.tolist())
+            dfds.append([0.0] * len(tstatuses))
         return [ statuses, fds, dfds, Rhats, directions ]
 
 
@@ -396,7 +467,7 @@ class solar_system_setjy:
         else:
             model_data_filename = model_data_path + source_name + '_Tb_time.dat'
         try:
-            ff = open(model_data_filename)
+            [freqs, modelMJDs, modelTbs] = _cached(_model_cache, model_data_filename, _read_time_model)
         except:
             for MJD in MJDs:
                 estatuses = []
@@ -411,25 +482,7 @@ class solar_system_setjy:
                 dTbs.append(edTbs)
             return [ statuses, Tbs, dTbs ]
 
-    # first line holds frequencies, like:
-    # 30.0 80.0 115.0 150.0 200.0 230.0 260.0 300.0 330.0 360.0 425.0 650.0 800.0 950.0 1000.0
-        line = ff.readline()[:-1]
-        fields = line.split()
-        freqs = []
-        for field in fields:
-            freqs.append(1.0e9*float(field))
-    # model output lines look like:
-    #2010 01 01 00 00  55197.00000 189.2 195.8 198.9 201.2 203.7 204.9 205.9 207.1 207.8 208.5 209.8 213.0 214.6 214.8 214.5 
-        modelMJDs = []
-        modelTbs = []
-        for line in ff:
-            fields = line[:-1].split()
-            modelMJDs.append(float(fields[5]))
-            lTbs = []
-            for ii in range(len(freqs)):
-                lTbs.append(float(fields[6+ii]))
-            modelTbs.append(lTbs)
-        ff.close()
+        afrequencies = numpy.array(frequencies, dtype=float).reshape(-1, 2)
         old_model_already_called = False
         for MJD in MJDs:
     #
@@ -456,14 +509,7 @@ class solar_system_setjy:
 # only call this once - not for every time (since the old
 # models are not a function of time)
 #
-                    tstatuses = []
-                    tTbs = []
-                    tdTbs = []
-                    for frequency in frequencies:
-                        [tstatus,tTb,tdTb] = self.brightness_planet_int (source_name, frequency)
-                        tstatuses.append(tstatus)
-                        tTbs.append(tTb)
-                        tdTbs.append(tdTb)
+                    [tstatuses,tTbs,tdTbs] = self.brightness_planet_ints (source_name, frequencies)
                     old_model_already_called = True
                 estatuses = []
                 eTbs = []
@@ -505,16 +551,11 @@ class solar_system_setjy:
                         mfds.append((2.0 * HH * freqs[ii]**3.0 / CC**2.0) * \
                                     ((1.0 / (exp(HH * freqs[ii] / (KK * mTbs[-1])) - 1.0)) - \
                                      (1.0 / (exp(HH * freqs[ii] / (KK * Tbg)) - 1.0))))
-                estatuses = []
-                eTbs = []
-                edTbs = []
-                for frequency in frequencies:
-                    if (frequency[0] < freqs[0] or frequency[1] > freqs[-1]):
-                        estatuses.append(2)
-                        eTbs.append(0.0)
-                        edTbs.append(0.0)
-                    else:
-                        [estatus, eTb, edTb] = self.integrate_Tb (freqs, mfds, frequency)
+                OK = (afrequencies[:,0] >= freqs[0]) & (afrequencies[:,1] <= freqs[-1])
+                estatuses = numpy.where(OK, 0, 2)
+                eTbs = numpy.zeros(len(afrequencies))
+                if (OK.any()):
+                    eTbs[OK] = self.integrate_Tbs (freqs, mfds, afrequencies[OK])
     #
     # should we print out the Tb we found?  not sure.  i have a
     # vague recollection that crystal requested it, but i'm not
@@ -522,9 +563,9 @@ class solar_system_setjy:
     # planck correction (along with the background), so it wouldn't
     # be trivial.
     #
-                        estatuses.append(estatus)
-                        eTbs.append(eTb)
-                        edTbs.append(edTb)
+                estatuses = estatuses.tolist()
+                eTbs = eTbs.tolist()
+                edTbs = [0.0] * len(afrequencies)
             statuses.append(estatuses)
             Tbs.append(eTbs)
             dTbs.append(edTbs)
@@ -541,6 +582,23 @@ class solar_system_setjy:
                         example: [ 224.234567e9, 224.236567e9 ]
         '''
 
+        [statuses, Tbs, dTbs] = self.brightness_planet_ints (source_name, [frequency])
+        return [ statuses[0], Tbs[0], dTbs[0] ]
+
+
+    def brightness_planet_ints (self, source_name, frequencies):
+        '''
+        brightness_planet_int() for many frequency ranges at once.  inputs:
+            source_name = source name string
+            frequencies = list (or array) of [start, stop] frequencies for
+                          which to calculate the integrated model.
+                          example:
+                          [ [ 224.234567e9, 224.236567e9 ],
+                            [ 224.236567e9, 224.238567e9 ] ]
+        returned are the lists of statuses, brightnesses and uncertainties,
+        one per frequency range.
+        '''
+
     # those bodies which are tabulations of flux density.  currently, for
     # the non-time-variable ones, none of them are flux density. but
     # leave this in just in case somewhere down the road we have bodies
@@ -548,28 +606,20 @@ class solar_system_setjy:
     # (evolved stars, for instance).
         MODEL_IS_FD_BODIES = [ ]
 
-        if not self.models.has_key(source_name):
-            model_data_path = os.environ['CASAPATH'].split()[0]+'/data/alma/SolarSystemModels/'
-            if (source_name in MODEL_IS_FD_BODIES):
-                model_data_filename = model_data_path + source_name + '_fd.dat'
-            else:
-                model_data_filename = model_data_path + source_name + '_Tb.dat'
-            try:
-                ff = open(model_data_filename)
-            except:
-                return [ 3, 0.0, 0.0 ]
-            fds = []
-            Tbs = []
-            freqs = []
-            for line in ff:
-                [freq,Tb] = line[:-1].split()
-                freqs.append(1.0e9*float(freq))
-                if (source_name in MODEL_IS_FD_BODIES):
-# don't know what Tb is, so just set to 0.0
-                    Tbs.append(0.0)
-                    fds.append(float(Tb))
-                else:
-                    Tbs.append(float(Tb))
+        afrequencies = numpy.array(frequencies, dtype=float).reshape(-1, 2)
+        nfrequencies = len(afrequencies)
+        model_data_path = os.environ['CASAPATH'].split()[0]+'/data/alma/SolarSystemModels/'
+        if (source_name in MODEL_IS_FD_BODIES):
+            model_data_filename = model_data_path + source_name + '_fd.dat'
+        else:
+            model_data_filename = model_data_path + source_name + '_Tb.dat'
+        try:
+            [freqs, values] = _cached(_model_cache, model_data_filename, _read_model)
+        except:
+            return [ [3] * nfrequencies, [0.0] * nfrequencies, [0.0] * nfrequencies ]
+        if (source_name in MODEL_IS_FD_BODIES):
+            fds = values
+        else:
 #
 # note: here, when we have the planck results, get a proper
 # estimate of the background temperature.
@@ -578,23 +628,14 @@ class solar_system_setjy:
 # needs to be done on the brightness, not on the brightness
 # *temperature*.
 #
-                    Tbg = 2.725
-                    fds.append((2.0 * HH * freqs[-1]**3.0 / CC**2.0) * \
-                                ((1.0 / (exp(HH * freqs[-1] / (KK * Tbs[-1])) - 1.0)) - \
-                                 (1.0 / (exp(HH * freqs[-1] / (KK * Tbg)) - 1.0))))
-            ff.close()
-# TT added.  store them for future calls
-            srcn=source_name
-            self.models[srcn]={}
-            self.models[srcn]['fds']=fds
-            self.models[srcn]['freqs']=freqs
-        else:
-            #recover fds, freqs, instead of reading them in from the file
-            fds=self.models[source_name]['fds']
-            freqs=self.models[source_name]['freqs']
-        if (frequency[0] < freqs[0] or frequency[1] > freqs[-1]):
-            return [ 2, 0.0, 0.0 ]
-        else:
+            Tbg = 2.725
+            afreqs = numpy.array(freqs)
+            fds = (2.0 * HH * afreqs**3.0 / CC**2.0) * \
+                  ((1.0 / (numpy.exp(HH * afreqs / (KK * numpy.array(values))) - 1.0)) - \
+                   (1.0 / (numpy.exp(HH * afreqs / (KK * Tbg)) - 1.0)))
+        OK = (afrequencies[:,0] >= freqs[0]) & (afrequencies[:,1] <= freqs[-1])
+        statuses = numpy.where(OK, 0, 2)
+        Tbs = numpy.zeros(nfrequencies)
     #
     # should we print out the Tb we found?  not sure.  i have a
     # vague recollection that crystal requested it, but i'm not
@@ -603,7 +644,9 @@ class solar_system_setjy:
     # be trivial.  and here, we'd have to return a variable and
     # work on that.
     #
-            return self.integrate_Tb (freqs, fds, frequency)
+        if (OK.any()):
+            Tbs[OK] = self.integrate_Tbs (freqs, fds, afrequencies[OK])
+        return [ statuses.tolist(), Tbs.tolist(), [0.0] * nfrequencies ]
 
 
     def nearest_index (self, input_list, value):
@@ -619,6 +662,20 @@ class solar_system_setjy:
         return ind
 
 
+    def nearest_indices (self, input_list, values):
+        """
+        find the indices of the list input_list that are closest to each
+        of the values
+        """
+
+        input_list = numpy.asarray(input_list, dtype=float)
+        values = numpy.asarray(values, dtype=float)
+        ind = searchsorted(input_list, values)
+        ind = numpy.minimum(len(input_list)-1, ind)
+        ind = numpy.maximum(1, ind)
+        return numpy.where(values < (input_list[ind-1] + input_list[ind]) / 2.0, ind - 1, ind)
+
+
     def interpolate_list (self, freqs, Tbs, frequency):
         ind = self.nearest_index (freqs, frequency)
         low = max(0,ind-5)
@@ -677,25 +734,88 @@ class solar_system_setjy:
         return [ 0, brightness, 0.0 ]
 
 
+    def interpolate_array (self, freqs, Tbs, frequencies):
+        """
+        interpolate_list() for an array of frequencies, returns the array of
+        brightnesses.  the frequencies that have the same nearest tabulated
+        point use the same window of tabulated values, so the interpolation
+        functions are made once per window and evaluated for all of them.
+        frequencies outside of their window (where interpolate_list() fails)
+        get the nearest tabulated point.
+        """
+
+        frequencies = numpy.asarray(frequencies, dtype=float)
+        ind = self.nearest_indices (freqs, frequencies)
+        brightnesses = numpy.array(Tbs, dtype=float)[ind]
+        order = numpy.argsort(ind, kind='mergesort')
+        sorted_ind = ind[order]
+        starts = numpy.flatnonzero(numpy.concatenate(([True], sorted_ind[1:] != sorted_ind[:-1])))
+        ends = numpy.concatenate((starts[1:], [len(order)]))
+        for (start, end) in zip(starts, ends):
+            nind = int(sorted_ind[start])
+            low = max(0,nind-5)
+            if (low == 0):
+                high = 11
+            else:
+                high = min(len(freqs),nind+5)
+                if (high == len(freqs)):
+                    low = high - 11
+            aTbs = array(Tbs[low:high])
+            afreqs = array(freqs[low:high])
+            selected = order[start:end]
+            values = frequencies[selected]
+    #
+    # same checks as in interpolate_list(), per frequency
+    #
+            range = max(aTbs) - min(aTbs)
+            try:
+                func = interp1d (afreqs, aTbs, kind='cubic', bounds_error=False)
+                interpolated = func(values)
+            except:
+                interpolated = numpy.empty(len(values))
+                interpolated.fill(numpy.nan)
+            OK = (interpolated >= min(aTbs)-range/2) & (interpolated <= max(aTbs)+range/2)
+            if (not OK.all()):
+                func = interp1d (afreqs, aTbs, kind='linear', bounds_error=False)
+                interpolated = numpy.where(OK, interpolated, func(values))
+                OK = (interpolated >= min(aTbs)-range/2) & (interpolated <= max(aTbs)+range/2)
+            brightnesses[selected[OK]] = interpolated[OK]
+        return brightnesses
+
+
     def integrate_Tb (self, freqs, Tbs, frequency):
-        [status,low_Tb,low_dTb] = self.interpolate_list (freqs, Tbs, frequency[0])
-        low_index = self.nearest_index (freqs, frequency[0])
-        if (frequency[0] > freqs[low_index]):
-            low_index = low_index + 1
-
-        [status,hi_Tb,hi_dTb] = self.interpolate_list (freqs, Tbs, frequency[1])
-        hi_index = self.nearest_index (freqs, frequency[1])
-        if (frequency[1] < freqs[hi_index]):
-            hi_index = hi_index - 1
-
-        if (low_index > hi_index):
-            Tb = (frequency[1] - frequency[0]) * (low_Tb + hi_Tb) / 2
-        else:
-            Tb = (freqs[low_index] - frequency[0]) * (low_Tb + Tbs[low_index]) / 2 + \
-                 (frequency[1] - freqs[hi_index]) * (hi_Tb + Tbs[hi_index]) / 2
-            ii = low_index
-            while (ii < hi_index):
-               Tb += (freqs[ii+1] - freqs[ii]) * (Tbs[ii+1] + Tbs[ii]) / 2
-               ii += 1
-        Tb /= (frequency[1] - frequency[0])
-        return [ 0, Tb, 0.0 ]
+        return [ 0, float(self.integrate_Tbs (freqs, Tbs, [frequency])[0]), 0.0 ]
+
+
+    def integrate_Tbs (self, freqs, Tbs, frequencies):
+        """
+        integrate_Tb() for many [start, stop] frequency ranges at once,
+        returns the array of averaged brightnesses.  the sums of the
+        trapezoids between the tabulated points are taken from their
+        cumulative sum.
+        """
+
+        afreqs = numpy.asarray(freqs, dtype=float)
+        aTbs = numpy.asarray(Tbs, dtype=float)
+        frequencies = numpy.asarray(frequencies, dtype=float).reshape(-1, 2)
+        frequency0 = frequencies[:,0]
+        frequency1 = frequencies[:,1]
+
+        low_Tb = self.interpolate_array (freqs, Tbs, frequency0)
+        low_index = self.nearest_indices (afreqs, frequency0)
+        low_index = numpy.where(frequency0 > afreqs[low_index], low_index + 1, low_index)
+
+        hi_Tb = self.interpolate_array (freqs, Tbs, frequency1)
+        hi_index = self.nearest_indices (afreqs, frequency1)
+        hi_index = numpy.where(frequency1 < afreqs[hi_index], hi_index - 1, hi_index)
+
+        cumulative_Tb = numpy.concatenate(([0.0], numpy.cumsum((afreqs[1:] - afreqs[:-1]) * (aTbs[1:] + aTbs[:-1]) / 2)))
+        inside = (low_index <= hi_index)
+        low_index = numpy.where(inside, low_index, 0)
+        hi_index = numpy.where(inside, hi_index, 0)
+        Tb = numpy.where(inside,
+                         (afreqs[low_index] - frequency0) * (low_Tb + aTbs[low_index]) / 2 + \
+                         (frequency1 - afreqs[hi_index]) * (hi_Tb + aTbs[hi_index]) / 2 + \
+                         (cumulative_Tb[hi_index] - cumulative_Tb[low_index]),
+                         (frequency1 - frequency0) * (low_Tb + hi_Tb) / 2)
+        return Tb / (frequency1 - frequency0)
@@ -4,6 +4,11 @@ import traceback
 if os.environ.has_key('LD_PRELOAD'):
     del os.environ['LD_PRELOAD']
 
+from casa_startup import startup_flag, startup_profiler
+if startup_flag('--startup-profile'):
+    startup_profiler.enable( )
+
+startup_profiler.stage("IPython")
 from IPython import start_ipython
 
 __pylib = os.path.dirname(os.path.realpath(__file__))
@@ -36,7 +41,10 @@ casa_shutdown_handlers = [ ]
 
 try:
     __startup_scripts = filter( os.path.isfile, map(lambda f: __pylib + '/' + f, __init_scripts ) )
-    start_ipython( argv=["-c", "for i in " + str(__startup_scripts) + ": execfile( i )", "-i"] )
+    start_ipython( argv=["-c", "from casa_startup import startup_profiler\n" +
+                               "for i in " + str(__startup_scripts) + ":\n" +
+                               "    startup_profiler.stage(i.split('/')[-1]); execfile( i )\n" +
+                               "startup_profiler.report( )", "-i"] )
 except:
     print "Unexpected error:", sys.exc_info()[0]
     traceback.print_exc(file=sys.stdout)
@@ -2,8 +2,13 @@ import os
 import shutil
 import numpy
 import pdb
+import multiprocessing
+import traceback
 from taskinit import *
 from cleanhelper import *
+from parallel.parallel_task_helper import ParallelTaskHelper
+from mpi4casa.MPIEnvironment import MPIEnvironment
+from mpi4casa.MPICommandClient import MPICommandClient
 im,cb,ms,tb,me,ia,po,sm,cl,cs,rg,sl,dc,vp,msmd,fi,fn,imd,sdms=gentools(['im','cb','ms','tb','me','ia','po','sm','cl','cs','rg','sl','dc','vp','msmd','fi','fn','imd','sdms'])
 
 def clean(vis, imagename,outlierfile, field, spw, selectdata, timerange,
@@ -16,7 +21,12 @@ def clean(vis, imagename,outlierfile, field, spw, selectdata, timerange,
           veltype, imsize, cell, phasecenter, restfreq, stokes, weighting,
           robust, uvtaper, outertaper, innertaper, modelimage, restoringbeam,
           pbcor, minpb, usescratch, noise, npixels, npercycle, cyclefactor,
-          cyclespeedup, nterms, reffreq, chaniter, flatnoise, allowchunk):
+          cyclespeedup, nterms, reffreq, chaniter, flatnoise, allowchunk,
+          chaniterblock={}):
+
+    # task inputs, to clean blocks of channels in parallel for chaniter=T
+    cleanargs=dict(locals())
+    del cleanargs['chaniterblock']
 
     #Python script
     casalog.origin('clean')
@@ -229,7 +239,8 @@ def clean(vis, imagename,outlierfile, field, spw, selectdata, timerange,
            ((type(imagename) == str) and imagename.isspace())):
             raise Exception, 'Cannot proceed with blank imagename'
 
-        opim=imset.checkimageusage(imagename)
+        # (the images of a block of channels are checked by the parent process)
+        opim=[] if chaniterblock else imset.checkimageusage(imagename)
         if(len(opim) != 0):
             raise Exception, 'image '+str(opim[0])+' is opened by another process' if(len(opim)==1) else  'images '+str(opim)+' are under use by other processes'
         multifield=False
@@ -269,7 +280,16 @@ def clean(vis, imagename,outlierfile, field, spw, selectdata, timerange,
                 dochaniter=True
 
         # make a template cube for interactive chanter=T
-        if dochaniter:
+        if dochaniter and chaniterblock:
+            # block of channels cleaned by a worker of a parallel chaniter=T
+            # run, the template cubes are already made by the parent process
+            nchaniter=chaniterblock['nchaniter']
+            finalimagename=chaniterblock['finalimagename']
+            imset.finalimages=finalimagename
+            (freqs,finc,newmode,tmppath)=imset.initChaniter(localnchan,spw,localstart,localwidth,
+                                                            finalimagename,mode,chaniterblock['tmpdir'])
+            mode=newmode
+        elif dochaniter:
             imset.makeTemplateCubes(imagename,outlierfile, field, spw, selectdata,
                                     timerange, uvrange, antenna, scan, str(observation),intent,
                                     mode, facets, cfcache, 
@@ -309,9 +329,25 @@ def clean(vis, imagename,outlierfile, field, spw, selectdata, timerange,
             nchaniter=1
             finalimagename=''
             tmppath=''
+
+        chanlist=xrange(nchaniter)
+        chanplanes={}
+        if dochaniter and chaniterblock:
+            chanlist=xrange(chaniterblock['channels'][0],chaniterblock['channels'][1])
+        elif dochaniter and not interactive:
+            nworkers=getChaniterWorkers()
+            if nworkers > 1:
+                # the channels are cleaned by the workers, and the images
+                # of the template cubes must not be in use by this process
+                imCln.close()
+                runChaniterBlocks(imset,cleanargs,finalimagename,nchaniter,imagermode,nworkers)
+                chanlist=[]
+                sclt='SAULT'
+                if (scaletype=='PBCOR') or (scaletype=='pbcor'):
+                    sclt='NONE'
          
         # loop over channels for per-channel clean
-        for j in xrange(nchaniter):
+        for j in chanlist:
             if dochaniter:
 
                 print "Processing channel %s of %s" % (j+1, nchaniter)
@@ -753,7 +789,11 @@ def clean(vis, imagename,outlierfile, field, spw, selectdata, timerange,
                                     casalog.post('Multi-term PSF '+psfim+' not made','WARN')
             
             if dochaniter and not imset.skipclean :
-                imset.storeCubeImages(finalimagename,imset.imagelist,j,imagermode)
+                if chaniterblock:
+                    # the parent process puts the planes in the cubes
+                    chanplanes[j]=imset.getChanPlanes(imset.imagelist,imagermode)
+                else:
+                    imset.storeCubeImages(finalimagename,imset.imagelist,j,imagermode)
 
             ## Set frame conversion layer for all masks at the end. This doesn't happen from C++.
             ## This is because setReferenceFrame is called within makemultifieldmask2 to
@@ -768,6 +808,10 @@ def clean(vis, imagename,outlierfile, field, spw, selectdata, timerange,
                     imset.resmooth(modelimages[k], residualimage[k], restoredimage[k], "common")
         imCln.close()
         ####################################################################
+        if dochaniter and chaniterblock:
+            imset.cleanupTempFiles(tmppath)
+            del imCln
+            return chanplanes
         if dochaniter:
             imset.cleanupTempFiles(tmppath)
             imset.imagelist=finalimagename
@@ -831,3 +875,100 @@ def clean(vis, imagename,outlierfile, field, spw, selectdata, timerange,
         print '*** Error *** ',instance
         raise Exception, instance
 
+
+
+# Number of blocks of channels per worker for a parallel chaniter=T clean,
+# more than one so that the workers stay busy when the channels do not
+# take the same time to clean (e.g. flagged channels are skipped)
+chaniterBlocksPerWorker=4
+
+def getChaniterWorkers():
+    """
+    Number of processes available to clean the channels of a chaniter=T
+    clean in parallel: the MPI servers if MPI is enabled, otherwise the
+    local workers of ParallelTaskHelper (see ParallelTaskHelper.setLocalWorkers)
+    """
+    if MPIEnvironment.is_mpi_enabled:
+        if not MPIEnvironment.is_mpi_client:
+            return 1
+        return len(MPIEnvironment.mpi_server_rank_list())
+    return ParallelTaskHelper.getLocalWorkers()[0]
+
+def getChaniterBlocks(nchan, nworkers):
+    """
+    Split the channels into contiguous blocks of about the same size
+
+    returns: list of [start, stop) channel ranges
+    """
+    nblocks=min(nchan, chaniterBlocksPerWorker*nworkers)
+    bounds=[(k*nchan)/nblocks for k in xrange(nblocks+1)]
+    return [[bounds[k],bounds[k+1]] for k in xrange(nblocks)]
+
+def cleanChaniterBlock(cleanargs, chaniterblock, ompthreads=0):
+    """
+    Clean a block of channels of a chaniter=T clean in a worker process
+    (local process or MPI server)
+
+    returns: dictionary with the channel planes returned by clean, and
+    the exception message and traceback if any
+    """
+    result={'ret':None, 'exception':None, 'traceback':None}
+    if ompthreads > 0:
+        casalog.ompSetNumThreads(ompthreads)
+    try:
+        result['ret']=clean(chaniterblock=chaniterblock, **cleanargs)
+    except Exception, instance:
+        result['exception']=str(instance)
+        result['traceback']=traceback.format_exc()
+    return result
+
+def runChaniterBlocks(imset, cleanargs, finalimagename, nchaniter, imagermode, nworkers):
+    """
+    Clean the channels of a chaniter=T clean in blocks distributed over the
+    MPI servers or a pool of local processes. Each block is cleaned in its
+    own temporary directory, and the channel planes are sent back in memory
+    and put in the template cubes by this process, as the blocks complete.
+    """
+    cleanargs=dict(cleanargs, interactive=False, allowchunk=False)
+    blocks=getChaniterBlocks(nchaniter, nworkers)
+    jobs=[]
+    for k in xrange(len(blocks)):
+        jobs.append({'finalimagename':finalimagename, 'channels':blocks[k],
+                     'nchaniter':nchaniter, 'tmpdir':'_tmpimdir'+str(k)+'/'})
+    casalog.post("Cleaning %s channels in %s blocks with %s workers" % (nchaniter, len(jobs), nworkers))
+
+    def storeblock(job, result):
+        if result['exception'] is not None:
+            casalog.post(str(result['traceback']), 'SEVERE')
+            raise Exception, 'Error cleaning channels %s~%s: %s' \
+                  % (job['channels'][0], job['channels'][1]-1, result['exception'])
+        imset.putCubePlanes(finalimagename, result['ret'], imagermode)
+        casalog.post("Processed channels %s~%s of %s" % (job['channels'][0]+1, job['channels'][1], nchaniter))
+
+    if MPIEnvironment.is_mpi_enabled:
+        client=MPICommandClient()
+        client.start_services()
+        command_request_id_list=[]
+        for job in jobs:
+            command_request_id=client.push_command_request("__import__('task_clean').cleanChaniterBlock(cleanargs,chaniterblock)",
+                                                           False,None,{'cleanargs':cleanargs,'chaniterblock':job})
+            command_request_id_list.append(command_request_id[0])
+        for job, command_request_id in zip(jobs, command_request_id_list):
+            command_response=client.get_command_response([command_request_id],True,True)[0]
+            if command_response['successful']:
+                storeblock(job, command_response['ret'])
+            else:
+                storeblock(job, {'exception':'command request failed', 'traceback':command_response['traceback']})
+    else:
+        # one process per block, so that no tool state is carried over
+        pool=multiprocessing.Pool(processes=min(nworkers,len(jobs)), maxtasksperchild=1)
+        try:
+            ompthreads=ParallelTaskHelper.getLocalWorkers()[1]
+            async_result_list=[pool.apply_async(cleanChaniterBlock, (cleanargs, job, ompthreads))
+                               for job in jobs]
+            pool.close()
+            for job, async_result in zip(jobs, async_result_list):
+                storeblock(job, async_result.get())
+        finally:
+            pool.terminate()
+            pool.join()
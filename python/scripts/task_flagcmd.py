@@ -166,7 +166,7 @@ def flagcmd(
                             flaglist = []
                             for ifile in inpfile:
                                 casalog.post('Will read commands from the file '+ifile)                    
-                                flaglist = flaglist + fh.readFile(ifile)
+                                flaglist = flaglist + fh.readAndParseFile(ifile)
                             
                             myflagcmd = fh.parseDictionary(flaglist, reason)
                         
@@ -183,7 +183,7 @@ def flagcmd(
                              casalog.post('Input file is empty', 'ERROR')
                              
                         casalog.post('Will read commands from the file '+inpfile)
-                        flaglist = fh.readFile(inpfile)
+                        flaglist = fh.readAndParseFile(inpfile)
                         casalog.post('%s'%flaglist,'DEBUG')
                         
                         myflagcmd = fh.parseDictionary(flaglist, reason)
@@ -503,9 +503,6 @@ def readFromTable(
                     rowl.append(i)
             rowlist = rowl
             
-        # Define the way to parse the strings
-        myParser = fh.Parser(' ', '=')
-        
         for i in rowlist:
             flagd = {}
             cmd = f_cmd[i]
@@ -540,11 +537,8 @@ def readFromTable(
                     flagd['addantenna'] = antpardict
                     cmd = newcmd
 
-            # Get a dictionary without type evaluation
-            preparsing = myParser.parseNoEval(cmd)
-            
-            # Evaluate the types into a new dictionary
-            parsed = fh.evaluateParameters(preparsing)
+            # Get a dictionary with the evaluated types
+            parsed = fh.parseCommand(cmd)
 
             flagd['command'] = parsed
             
@@ -2038,7 +2032,7 @@ def readCalCmds(caltable, msfile, flaglist, rows, reason, useapplied):
         elif isinstance(flaglist, str):
 
             casalog.post('Reading from input file '+flaglist)
-            cmdlist = fh.readFile(flaglist)
+            cmdlist = fh.readAndParseFile(flaglist)
 
             # Make a FLAG_CMD compatible dictionary and select by reason
             myflagcmd = fh.parseDictionary(cmdlist, reason, False)
@@ -356,13 +356,11 @@ def flagdata(vis,
                 else:                    
                     # inpfile is a file
                     if isinstance(inpfile, str) and os.path.isfile(inpfile):
-                        flaglist = fh.readFile(inpfile)
-                        nlines = len(flaglist)
-                        casalog.post('Read %s command(s) from file: %s'%(nlines, inpfile))                              
+                        flaglist = fh.readAndParse([inpfile])
                          
                     # inpfile is a list of files
                     elif isinstance(inpfile, list) and os.path.isfile(inpfile[0]):
-                        flaglist = fh.readFiles(inpfile)
+                        flaglist = fh.readAndParse(inpfile)
                          
                     # Python list of strings
                     elif isinstance(inpfile, list):                    
@@ -1,10 +1,15 @@
 import os
 import shutil
+from multiprocessing.pool import ThreadPool
 from taskinit import *
 import flaghelper as fh
 import testhelper as th
+import partitionhelper as ph
 from casac import casac
 from parallel.parallel_data_helper import ParallelDataHelper
+from parallel.parallel_task_helper import ParallelTaskHelper
+from mpi4casa.MPIEnvironment import MPIEnvironment
+from mpi4casa.MPICommandClient import MPICommandClient
 import recipes.ephemerides.convertephem as ce
 
 def importasdm(
@@ -172,9 +177,6 @@ def importasdm(
     # make agentflagger tool local
     aflocal = casac.agentflagger()
 
-    # make table tool local
-    tblocal = casac.table()
-
     try:
         casalog.origin('importasdm')
         viso = ''
@@ -202,10 +204,12 @@ def importasdm(
             + wvr_corrected_data + '" --asis "' + asis \
             + '" --logfile "' + casalog.logfile() + '"'
 
+        # The scans are selected per sub-MS when importing directly into a Multi-MS
+        scans_string = ''
         if len(scans) > 0:
-            execute_string = execute_string + ' --scans ' + scans
+            scans_string = scans_string + ' --scans ' + scans
         if ignore_time:
-            execute_string = execute_string + ' --ignore-time'
+            scans_string = scans_string + ' --ignore-time'
         if useversion == 'v3':
             if not process_syspower:
                 execute_string = execute_string + ' --no-syspower'
@@ -286,13 +290,6 @@ def importasdm(
                         raise Exception, "Cannot overwrite online flags file '%s'; overwrite is set to False."% of
                 
             
-        execute_string = execute_string + ' ' + asdm + ' ' + viso
-
-        if showversion:
-            casalog.post("You set option \'showversion\' to True. Will just output the version information and then terminate."
-                         , 'WARN')
-            execute_string = theexecutable + ' --revision'
-
         if with_pointing_correction:
             execute_string = execute_string + ' --with-pointing-correction'
 
@@ -304,21 +301,77 @@ def importasdm(
                     casalog.post('A tabulation timestep of <= 1 days is recommended.', 'WARN')
                 execute_string = execute_string + ' --polyephem-tabtimestep '+str(polyephem_tabtimestep)
 
-        casalog.post('Running ' + theexecutable
-                     + ' standalone invoked as:')
-        # print execute_string
-        casalog.post(execute_string)
-        exitcode = os.system(execute_string)
-        if exitcode != 0:
-            if not showversion:
-                casalog.post(theexecutable
-                             + ' terminated with exit code '
-                             + str(exitcode), 'SEVERE')
+        # Import the groups of scans of the sub-MSs of a Multi-MS concurrently
+        # instead of partitioning the MS after importing it, when possible
+        scangroups = []
+        if createmms and not showversion:
+            scangroups = _getScanGroups(asdm, separationaxis, numsubms, wvr_corrected_data,
+                                        compression, scans, ignore_time)
+
+        if len(scangroups) > 0:
+            outputPath, outputBase = os.path.split(os.path.abspath(viso))
+            outputBase = os.path.splitext(outputBase)[0]
+            dataDir = os.path.join(outputPath, outputBase+'.data')
+            if os.path.exists(dataDir):
+                shutil.rmtree(dataDir)
+            os.mkdir(dataDir)
+            submslist = [dataDir+'/%s.%04d.ms'%(outputBase,i) for i in xrange(len(scangroups))]
+            # The MS or Multi-MS would otherwise be overwritten by asdm2MS
+            if os.path.exists(viso):
+                shutil.rmtree(viso)
+
+            # The commands may run on MPI servers with another working directory
+            asdmpath = os.path.abspath(asdm)
+            commands = []
+            for (group, subms) in zip(scangroups, submslist):
+                # All the sub-MSs get the same time dependent subtables, which
+                # are shared by the sub-MSs of the Multi-MS
+                command = execute_string + ' --scans "' + group + '" --ignore-time ' + asdmpath + ' ' + subms
+                if remove_ref_undef:
+                    command = command + ' && fixspwbackport ' + subms
+                if bdfflags:
+                    command = command + ' && ' + _bdflagsString(ocorr_mode, group, lazy, compression) \
+                              + ' ' + asdmpath + ' ' + subms
+                commands.append(command)
+
+            casalog.post('Will create a Multi-MS with %s sub-MSs for: %s'%(len(commands),viso))
+            casalog.post('Running ' + theexecutable + ' standalone for each sub-MS invoked as:')
+            for command in commands:
+                casalog.post(command)
+            exitcodes = _runCommands(commands)
+            for (command, exitcode) in zip(commands, exitcodes):
+                if exitcode != 0:
+                    casalog.post(command + ' terminated with exit code '
+                                 + str(exitcode), 'SEVERE')
+            if max(exitcodes) != 0:
+                shutil.rmtree(dataDir, ignore_errors=True)
                 raise Exception, \
                     'ASDM conversion error. Please check if it is a valid ASDM and that data/alma/asdm is up to date.'
+        else:
+            execute_string = execute_string + scans_string + ' ' + asdm + ' ' + viso
+
+            if showversion:
+                casalog.post("You set option \'showversion\' to True. Will just output the version information and then terminate."
+                             , 'WARN')
+                execute_string = theexecutable + ' --revision'
+
+            casalog.post('Running ' + theexecutable
+                         + ' standalone invoked as:')
+            # print execute_string
+            casalog.post(execute_string)
+            exitcode = os.system(execute_string)
+            if exitcode != 0:
+                if not showversion:
+                    casalog.post(theexecutable
+                                 + ' terminated with exit code '
+                                 + str(exitcode), 'SEVERE')
+                    raise Exception, \
+                        'ASDM conversion error. Please check if it is a valid ASDM and that data/alma/asdm is up to date.'
 
-        if showversion:
-            return
+            if showversion:
+                return
+
+            submslist = []
         
         #
         # Possibly remove the name of the measurement set expected to contain the corrected data from the list of of produced measurement
@@ -327,6 +380,12 @@ def importasdm(
         if not os.path.exists(visoc):
             vistoproc = [myviso for myviso in vistoproc if myviso != visoc]
 
+        # The MSs to post-process, the sub-MSs when importing directly into a Multi-MS
+        if len(submslist) > 0:
+            mstoproc = submslist
+        else:
+            mstoproc = vistoproc
+
         # CAS-7369. HISTORY should be written after createmms is tested
         #
         # Populate the HISTORY table of the MS with information about the context in which it's been created
@@ -336,7 +395,7 @@ def importasdm(
             param_names = importasdm.func_code.co_varnames[:importasdm.func_code.co_argcount] 
             param_vals = [eval(p) for p in param_names]
 
-            for myviso in vistoproc:
+            for myviso in mstoproc:
                 write_history(mslocal, myviso, 'importasdm', param_names, 
                               param_vals, casalog) 
 
@@ -349,8 +408,8 @@ def importasdm(
             mslocal = None 
             
         # 
-        # Do we apply fixspwbackport
-        if remove_ref_undef :
+        # Do we apply fixspwbackport (already done for each sub-MS of a Multi-MS)
+        if remove_ref_undef and len(submslist) == 0:
             casalog.post('remove_ref_undef=True: fixspwbackport will be applied ...')
             
             for myviso in vistoproc:
@@ -365,20 +424,13 @@ def importasdm(
                                  + str(cmdexitcode), 'SEVERE')
                     raise Exception, 'fixspwbackport error.'
 
-        # Binary Flag processing
-        if bdfflags:
+        # Binary Flag processing (already done for each sub-MS of a Multi-MS)
+        if bdfflags and len(submslist) == 0:
             
             casalog.post('Parameter bdfflags==True: flags from the ASDM binary data will be used to set the MS flags ...')
             
             bdffexecutable = 'bdflags2MS '
-            bdffexecstring_base = bdffexecutable + ' -f ALL' + ' --ocm "' + ocorr_mode \
-            + '" --logfile "' + casalog.logfile() + '"'
- 
-            if len(scans) > 0:
-                bdffexecstring_base = bdffexecstring_base + ' --scans ' + scans
-
-            if lazy and not compression:
-                bdffexecstring_base = bdffexecstring_base + ' --lazy=true'
+            bdffexecstring_base = _bdflagsString(ocorr_mode, scans, lazy, compression)
 
             for myviso in vistoproc:
                 if myviso.find("wvr-corrected") != -1:
@@ -400,90 +452,20 @@ def importasdm(
                           'ASDM binary flags conversion error. Please check if it is a valid ASDM and that data/alma/asdm is up to date.'
 
 
-        theephemfields = ce.findattachedephemfields(myviso,field='*')
-        if len(theephemfields)>0: 
-            # until asdm2MS does this internally: recalc the UVW coordinates for ephem fields
-            imt = imtool()
-            imt.open(myviso, usescratch=False)
-            imt.calcuvw(theephemfields, refcode='J2000', reuse=False)
-            imt.close()
-
-        if convert_ephem2geo:
-            for myviso in vistoproc:
-                ce.convert2geo(myviso, '*') # convert any attached ephemerides to GEO
-        
-        if len(theephemfields)>0: 
-            # also set the direction column in the SOURCE table
-            tblocal.open(myviso+'/FIELD', nomodify=False)
-            sourceids = tblocal.getcol('SOURCE_ID')
-            ftimes = tblocal.getcol('TIME')
-            ftimekw = tblocal.getcolkeywords('TIME')
-            tmpa = tblocal.getcol('PHASE_DIR')
-            origphasedir = tmpa
-
-            affectedsids = []
-            thesamplefields = []
-            for fld in theephemfields: # determine all source ids used by the ephem fields
-                if not (sourceids[fld] in affectedsids): # this source id wasn't handled yet
-                    affectedsids.append(sourceids[fld])
-                    thesamplefields.append(fld)
-                    # need to temporarily change the offset (not all mosaics have an element at (0,0))
-                    tmpa[0][0][fld]=0.
-                    tmpa[1][0][fld]=0.
-                #endif
-            #endfor
-            tblocal.putcol('PHASE_DIR', tmpa)
-            tblocal.close()
-
-            tblocal.open(myviso+'/SOURCE')
-            sourceposref = tblocal.getcolkeywords('DIRECTION')['MEASINFO']['Ref']
-            tblocal.close()
-
-            directions = []
-            msmdlocal = casac.msmetadata()
-            msmdlocal.open(myviso)
-            
-            for fld in thesamplefields:
-                thedirmeas = msmdlocal.phasecenter(fld)
-                if thedirmeas['refer']!=sourceposref:
-                    casalog.post('Ephemeris is in '+thedirmeas['refer']+' instead of '+sourceposref
-                                 +' frame.\nEntry in SOURCE table will be converted to '+sourceposref, 'WARN')
-                    melocal = metool()
-                    melocal.doframe(thedirmeas)
-                    thedirmeas = melocal.measure(thedirmeas, sourceposref)
-
-                directions.append([thedirmeas['m0']['value'], thedirmeas['m1']['value']])
-                thetime = me.epoch(v0=str(ftimes[fld])+'s', rf=ftimekw['MEASINFO']['Ref'])
-                casalog.post("Will set SOURCE direction for SOURCE_ID "+str(sourceids[fld])
-                             +" to ephemeris phase center for time "+str(thetime['m0']['value'])+" "+thetime['m0']['unit']+" "+thetime['refer']) 
-            #endfor
-            msmdlocal.close()
-             
-            # restore original PHASE_DIR
-            tblocal.open(myviso+'/FIELD', nomodify=False)
-            tblocal.putcol('PHASE_DIR', origphasedir)
-            tblocal.close()
-
-            # write source directions
-            tblocal.open(myviso+'/SOURCE', nomodify=False)
-            ssourceids = tblocal.getcol('SOURCE_ID')
-            sdirs = tblocal.getcol('DIRECTION')
-            for row in xrange(0,len(ssourceids)):
-                for i in xrange(0,len(affectedsids)):
-                    if ssourceids[row]==affectedsids[i]:
-                        sdirs[0][row] = directions[i][0]
-                        sdirs[1][row] = directions[i][1]
-                        break
-                #endfor
-            #endfor
-            tblocal.putcol('DIRECTION', sdirs) # write back corrected directions
-            tblocal.close()
-                
-        #end if        
+        for myviso in mstoproc:
+            _fixEphemerisFields(myviso, convert_ephem2geo)
 
         ##############################################################################################3
         # CAS-7369 - Create an output Multi-MS (MMS)
-        if createmms:
+        if createmms and len(submslist) > 0:
+            # Link the subtables of the sub-MSs, except SOURCE and HISTORY, as
+            # done by partition
+            subtabs = ph.getSubtables(submslist[0])
+            subtabs = [st for st in subtabs if st not in ['SOURCE','HISTORY']]
+            ph.makeMMS(viso, submslist, True, subtabs, 'scan')
+            shutil.rmtree(dataDir)
+
+        elif createmms:
             # Get the default parameters of partition
             from tasks import partition
             fpars = partition.parameters
@@ -619,3 +601,175 @@ def importasdm(
         print '*** Error ***', instance
 
 
+def _getScanGroups(asdm, separationaxis, numsubms, wvr_corrected_data, compression,
+                   scans, ignore_time):
+    """Return the scans parameter of asdm2MS of each sub-MS of a Multi-MS imported
+    directly from the ASDM, or [] if the MS has to be imported and then partitioned.
+    """
+    if separationaxis.lower() != 'scan':
+        reason = 'separationaxis=%s'%separationaxis
+    elif wvr_corrected_data != 'no':
+        reason = 'wvr_corrected_data=%s'%wvr_corrected_data
+    elif compression:
+        reason = 'compression=True'
+    elif len(scans) > 0 and not ignore_time:
+        reason = 'scans are selected and ignore_time=False'
+    else:
+        reason = None
+
+    if reason is not None:
+        casalog.post('The MS will be imported and then partitioned into a Multi-MS (%s)'%reason)
+        return []
+
+    if isinstance(numsubms,str) and numsubms == 'auto':
+        # One sub-MS per server, as partition
+        if MPIEnvironment.is_mpi_enabled and ParallelTaskHelper.getBypassParallelProcessing() == 0:
+            numsubms = len(MPIEnvironment.mpi_server_rank_list())
+        else:
+            numsubms = 8
+
+    try:
+        scangroups = ph.getASDMScanGroups(asdm, int(numsubms), scans)
+    except Exception, instance:
+        casalog.post('Cannot plan the scans of the sub-MSs from the ASDM (%s), the MS will '
+                     'be imported and then partitioned into a Multi-MS'%instance, 'WARN')
+        return []
+
+    if len(scangroups) == 0:
+        casalog.post('No scans selected in the ASDM, the MS will be imported and then '
+                     'partitioned into a Multi-MS', 'WARN')
+
+    return scangroups
+
+def _bdflagsString(ocorr_mode, scans, lazy, compression):
+    """Return the bdflags2MS command line, without the ASDM and MS names."""
+    bdffexecstring = 'bdflags2MS ' + ' -f ALL' + ' --ocm "' + ocorr_mode \
+        + '" --logfile "' + casalog.logfile() + '"'
+
+    if len(scans) > 0:
+        bdffexecstring = bdffexecstring + ' --scans ' + scans
+
+    if lazy and not compression:
+        bdffexecstring = bdffexecstring + ' --lazy=true'
+
+    return bdffexecstring
+
+def _runCommands(commands):
+    """Run shell commands concurrently and return their exit codes.
+
+    The commands are run on the MPI servers when CASA runs with MPI, otherwise
+    in as many local processes as set with ParallelTaskHelper.setLocalWorkers.
+    """
+    if MPIEnvironment.is_mpi_enabled and ParallelTaskHelper.getBypassParallelProcessing() == 0:
+        client = MPICommandClient()
+        client.start_services()
+        command_request_id_list = []
+        for command in commands:
+            command_request_id = client.push_command_request('os.system(command)',False,None,
+                                                             {'command':command})
+            command_request_id_list.append(command_request_id[0])
+
+        exitcodes = {}
+        for command_response in client.get_command_response(command_request_id_list,True,True):
+            if command_response['successful']:
+                exitcodes[command_response['id']] = command_response['ret']
+            else:
+                casalog.post('Error running %s: %s'%(command_response['parameters']['command'],
+                                                     command_response['traceback']),'SEVERE')
+                exitcodes[command_response['id']] = -1
+        return [exitcodes[request_id] for request_id in command_request_id_list]
+
+    # Each thread waits for its own process
+    workers = min(ParallelTaskHelper.getLocalWorkers()[0], len(commands))
+    if workers <= 1:
+        return [os.system(command) for command in commands]
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(os.system, commands)
+    finally:
+        pool.close()
+        pool.join()
+
+def _fixEphemerisFields(myviso, convert_ephem2geo):
+    """Recalculate the UVW coordinates of the ephemeris fields of an MS, optionally
+    convert its ephemerides to GEO, and set the directions of their sources."""
+
+    tblocal = casac.table()
+
+    theephemfields = ce.findattachedephemfields(myviso,field='*')
+    if len(theephemfields)>0: 
+        # until asdm2MS does this internally: recalc the UVW coordinates for ephem fields
+        imt = imtool()
+        imt.open(myviso, usescratch=False)
+        imt.calcuvw(theephemfields, refcode='J2000', reuse=False)
+        imt.close()
+
+    if convert_ephem2geo:
+        ce.convert2geo(myviso, '*') # convert any attached ephemerides to GEO
+
+    if len(theephemfields)>0: 
+        # also set the direction column in the SOURCE table
+        tblocal.open(myviso+'/FIELD', nomodify=False)
+        sourceids = tblocal.getcol('SOURCE_ID')
+        ftimes = tblocal.getcol('TIME')
+        ftimekw = tblocal.getcolkeywords('TIME')
+        tmpa = tblocal.getcol('PHASE_DIR')
+        origphasedir = tmpa
+
+        affectedsids = []
+        thesamplefields = []
+        for fld in theephemfields: # determine all source ids used by the ephem fields
+            if not (sourceids[fld] in affectedsids): # this source id wasn't handled yet
+                affectedsids.append(sourceids[fld])
+                thesamplefields.append(fld)
+                # need to temporarily change the offset (not all mosaics have an element at (0,0))
+                tmpa[0][0][fld]=0.
+                tmpa[1][0][fld]=0.
+            #endif
+        #endfor
+        tblocal.putcol('PHASE_DIR', tmpa)
+        tblocal.close()
+
+        tblocal.open(myviso+'/SOURCE')
+        sourceposref = tblocal.getcolkeywords('DIRECTION')['MEASINFO']['Ref']
+        tblocal.close()
+
+        directions = []
+        msmdlocal = casac.msmetadata()
+        msmdlocal.open(myviso)
+        
+        for fld in thesamplefields:
+            thedirmeas = msmdlocal.phasecenter(fld)
+            if thedirmeas['refer']!=sourceposref:
+                casalog.post('Ephemeris is in '+thedirmeas['refer']+' instead of '+sourceposref
+                             +' frame.\nEntry in SOURCE table will be converted to '+sourceposref, 'WARN')
+                melocal = metool()
+                melocal.doframe(thedirmeas)
+                thedirmeas = melocal.measure(thedirmeas, sourceposref)
+
+            directions.append([thedirmeas['m0']['value'], thedirmeas['m1']['value']])
+            thetime = me.epoch(v0=str(ftimes[fld])+'s', rf=ftimekw['MEASINFO']['Ref'])
+            casalog.post("Will set SOURCE direction for SOURCE_ID "+str(sourceids[fld])
+                         +" to ephemeris phase center for time "+str(thetime['m0']['value'])+" "+thetime['m0']['unit']+" "+thetime['refer']) 
+        #endfor
+        msmdlocal.close()
+         
+        # restore original PHASE_DIR
+        tblocal.open(myviso+'/FIELD', nomodify=False)
+        tblocal.putcol('PHASE_DIR', origphasedir)
+        tblocal.close()
+
+        # write source directions
+        tblocal.open(myviso+'/SOURCE', nomodify=False)
+        ssourceids = tblocal.getcol('SOURCE_ID')
+        sdirs = tblocal.getcol('DIRECTION')
+        for row in xrange(0,len(ssourceids)):
+            for i in xrange(0,len(affectedsids)):
+                if ssourceids[row]==affectedsids[i]:
+                    sdirs[0][row] = directions[i][0]
+                    sdirs[1][row] = directions[i][1]
+                    break
+            #endfor
+        #endfor
+        tblocal.putcol('DIRECTION', sdirs) # write back corrected directions
+        tblocal.close()
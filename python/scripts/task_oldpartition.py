@@ -4,7 +4,7 @@ import string
 import copy
 import math
 from taskinit import *
-from parallel.parallel_task_helper import ParallelTaskHelper, JobData
+from parallel.parallel_task_helper import ParallelTaskHelper, JobData, CollectResultsReducer
 import partitionhelper as ph
 import flaghelper as fh
 
@@ -336,6 +336,13 @@ class PartitionHelper(ParallelTaskHelper):
         return scanList
 
 
+    def getResultReducer(self):
+        '''
+        The output sub-MSs of all the jobs are needed to build the output
+        reference ms.
+        '''
+        return CollectResultsReducer(self._taskName)
+
     def postExecution(self):
         '''
         This overrides the post execution portion of the task helper
@@ -358,8 +365,7 @@ class PartitionHelper(ParallelTaskHelper):
             
             # jagonzal (CAS-4287): Add a cluster-less mode to by-pass parallel processing for MMSs as requested 
             if (ParallelTaskHelper.getBypassParallelProcessing()==1):
-                outputList = self._sequential_return_list
-                self._sequential_return_list = {}
+                outputList = self.reduceResults()
             else:
                 outputList = self._jobQueue.getOutputJobs()
             # We created a data directory and many SubMSs,
@@ -24,10 +24,101 @@ from taskinit import * # necessary for tb.open() to work
 from matplotlib.ticker import MultipleLocator, FormatStrFormatter, ScalarFormatter
 import matplotlib.transforms
 import inspect
+from collections import OrderedDict
+from caltablehelper import getcellcolumn
 
 TOP_MARGIN  = 0.25   # Used if showatm=T or showtksy=T
 BOTTOM_MARGIN = 0.25 # Used if showfdm=T
 MAX_ATM_CALC_CHANNELS = 512
+MAX_ATM_MODEL_CACHE_ENTRIES = 128  # Number of ATM models kept by getAtmModel
+
+# Caches of the inputs of CalcAtmTransmission, which is called for every page,
+# spw and timestamp when showatm or showtsky is set.  The PWV tables, weather
+# conditions and scan times are read once per ms and are cleared at the start
+# of each plotbandpass run.  The ATM models only depend on their arguments,
+# so they are kept across runs, discarding the least recently used ones.
+pwvTableCache = {}
+weatherCache = {}
+scanTimesCache = {}
+atmModelCache = OrderedDict()
+
+class PageRenderer:
+    """
+    Saves the pages of plotbandpass to png files.  With nprocesses > 0, the
+    pages are rendered in parallel: each page is saved by a child process
+    forked by savefig, which inherits a copy of the current figure and draws
+    it with the Agg backend, while plotbandpass goes on with the data of the
+    next pages.  At most nprocesses pages are rendered at the same time, and
+    wait() must be called before using the png files.  The file names and
+    contents are the same as when the pages are saved one after another.
+    """
+    def __init__(self, nprocesses=0):
+        self.nprocesses = nprocesses
+        self.children = []   # list of [pid, plotfilename], oldest first
+        self.failed = []
+
+    def reset(self, nprocesses=0):
+        """
+        Waits for the pages of a previous run, then sets the number of processes.
+        """
+        self.wait()
+        self.nprocesses = nprocesses
+
+    def savefig(self, plotfilename, density):
+        if (self.nprocesses < 1):
+            pb.savefig(plotfilename, format='png', dpi=density)
+            return
+        self.poll()
+        while (len(self.children) >= self.nprocesses):
+            self.waitForPage(self.children[0][0])
+        figure = pb.gcf()
+        pid = os.fork()
+        if (pid == 0):
+            status = 1
+            try:
+                from matplotlib.backends.backend_agg import FigureCanvasAgg
+                FigureCanvasAgg(figure)
+                figure.savefig(plotfilename, format='png', dpi=density)
+                status = 0
+            except:
+                import traceback
+                traceback.print_exc()
+            # Do not run the exit handlers of the parent (e.g. the casac tools)
+            os._exit(status)
+        self.children.append([pid, plotfilename])
+
+    def poll(self):
+        """
+        Collects the pages which are already rendered, without blocking.
+        """
+        for [pid, plotfilename] in list(self.children):
+            self.waitForPage(pid, os.WNOHANG)
+
+    def waitForPage(self, pid, options=0):
+        (donepid, status) = os.waitpid(pid, options)
+        if (donepid == 0):
+            return
+        for i in range(len(self.children)):
+            if (self.children[i][0] == pid):
+                if (status != 0):
+                    self.failed.append(self.children[i][1])
+                del self.children[i]
+                break
+
+    def wait(self):
+        """
+        Waits until all the pages are rendered.  Returns the list of files
+        which could not be rendered.
+        """
+        while (len(self.children) > 0):
+            self.waitForPage(self.children[0][0])
+        failed = self.failed
+        self.failed = []
+        for plotfilename in failed:
+            casalog.post("Failed to render %s" % (plotfilename), 'WARN')
+        return(failed)
+
+pageRenderer = PageRenderer()
 
 markeredgewidth=0.0
 
@@ -180,7 +271,7 @@ def makeplot(figfile,msFound,msAnt,overlayAntennas,pages,pagectr,density,
     if (interactive == False or True):
         casalogPost(debug,"Building %s" % (plotfilename))
 #        print "Building %s" % (plotfilename)
-    pb.savefig(plotfilename, format='png', dpi=density)
+    pageRenderer.savefig(plotfilename, density)
     return(plotfilename)
 
 def utdatestring(mjdsec):
@@ -246,13 +337,18 @@ def openBpolyFile(caltable, debug):
          frequenciesGHz.append(freqs)
       polynomialAmplitude = []
       polynomialPhase = []
+      # Read the coefficients of all the rows at once, only if some row uses them
+      if ('A&P' in polyMode or 'A' in polyMode):
+          polyCoeffAmp = getcellcolumn(mytb, 'POLY_COEFF_AMP', 'CAL_DESC_ID')
+      if ('A&P' in polyMode or 'P' in polyMode):
+          polyCoeffPhase = getcellcolumn(mytb, 'POLY_COEFF_PHASE', 'CAL_DESC_ID')
       for i in range(len(polyMode)):
           polynomialAmplitude.append([1])
           polynomialPhase.append([0])
           if (polyMode[i] == 'A&P' or polyMode[i] == 'A'):
-              polynomialAmplitude[i]  = mytb.getcell('POLY_COEFF_AMP',i)[0][0][0]
+              polynomialAmplitude[i]  = polyCoeffAmp[i][0][0][0]
           if (polyMode[i] == 'A&P' or polyMode[i] == 'P'):
-              polynomialPhase[i] = mytb.getcell('POLY_COEFF_PHASE',i)[0][0][0]
+              polynomialPhase[i] = polyCoeffPhase[i][0][0][0]
 
       mytb.close()
       mytb.open(caltable+'/CAL_DESC')
@@ -682,7 +778,8 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
                  pdftk='pdftk', channeldiff=False, edge=8, resample=1,
                  platformingThreshold=DEFAULT_PLATFORMING_THRESHOLD,
                  platformingSigma=5.0, basebands=[], showBasebandNumber=False,
-                 scans='', figfileSequential=False, chanrangeSetXrange=False):
+                 scans='', figfileSequential=False, chanrangeSetXrange=False,
+                 renderprocesses=0):
     """
     This is a task to plot bandpass and Tsys calibration tables faster and more
     flexibly than plotcal, including the ability to overlay the atmospheric 
@@ -693,8 +790,35 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
     http://casaguides.nrao.edu/index.php?title=Plotbandpass
     -- Todd Hunter
     """
+    try:
+        return(plotbandpass_core(**locals()))
+    finally:
+        # Reap the page rendering processes also when returning early
+        pageRenderer.wait()
+
+def plotbandpass_core(caltable='', antenna='', field='', spw='', yaxis='amp',
+                      xaxis='chan', figfile='', plotrange=[0,0,0,0], 
+                      caltable2='', overlay='', showflagged=False, timeranges='',
+                      buildpdf=False, caltable3='', markersize=3, density=108,
+                      interactive=True, showpoints='auto', showlines='auto',
+                      subplot='22', zoom='', poln='', showatm=False, pwv='auto',
+                      gs='gs', convert='convert', chanrange='',
+                      solutionTimeThresholdSeconds=30.0, debug=False,
+                      phase='', vis='',showtsky=False, showfdm=False,showatmfield='',
+                      lo1='', showimage=False, showatmPoints=False, parentms='', 
+                      pdftk='pdftk', channeldiff=False, edge=8, resample=1,
+                      platformingThreshold=DEFAULT_PLATFORMING_THRESHOLD,
+                      platformingSigma=5.0, basebands=[], showBasebandNumber=False,
+                      scans='', figfileSequential=False, chanrangeSetXrange=False,
+                      renderprocesses=0):
+    """
+    Does the work of plotbandpass(), which waits for the pages rendered in
+    parallel processes whatever the exit point.
+    """
     casalog.origin('plotbandpass')
     casalogPost(debug,"%s" % (PLOTBANDPASS_REVISION_STRING))
+    clearAtmosphereCaches()
+    pageRenderer.reset()
     DEBUG = debug
     help = False
     vm = '' # unused variable, now that msmd is available in casa
@@ -710,7 +834,8 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
         print "   showatmPoints=False, parentms='', pdftk='pdftk', channeldiff=False,"
         print "   edge=8, resample=1, vis='',platformingThreshold=%f," % (DEFAULT_PLATFORMING_THRESHOLD)
         print "   platformingSigma=%.1f, basebands=[], showBasebandNumber=False," % (5.0)
-        print "   scans='')"
+        print "   scans='', figfileSequential=False, chanrangeSetXrange=False,"
+        print "   renderprocesses=0)"
         print " antenna: must be either an ID (int or string or list), or a single antenna name or list"
         print " basebands: show only spws from the specified baseband or list of basebands (default:None=all)"
         print " buildpdf: True/False, if True and figfile is set, assemble pngs into a pdf"
@@ -742,6 +867,7 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
         print " plotrange: define axis limits: [x0,x1,y0,y1] where 0,0 means auto"
         print " poln: polarizations to plot (e.g. 'XX','YY','RR','LL' or '' for both)"
         print " pwv: define the pwv to use for the showatm option: 'auto' or value in mm"
+        print " renderprocesses: number of processes rendering the pngs in parallel (interactive=False)"
         print " resample: channel expansion factor to use when computing MAD of derivative (for channeldiff>0)"
         print " scans: show only solutions for the specified scans (int, list, or string)"
         print " showatm: compute and overlay the atmospheric transmission curve"
@@ -889,6 +1015,12 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
     if (interactive==False and figfile=='' and channeldiff == False):
         print "With interactive=False and channeldiff=False, you must specify figfile='yourFileName' (.png will be appended if necessary)."
         return()
+
+    if (renderprocesses > 0):
+        if (interactive):
+            print "renderprocesses is ignored with interactive=True, the pages are rendered one after another."
+        else:
+            pageRenderer.reset(int(renderprocesses))
   
     pxl = 0 # polarization number to use for setting xlimits if plotrange=[0,0...]
     chanrangePercent = None
@@ -1176,10 +1308,12 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
         print "The field_id is -1 (invalid) for all rows of this caltable."
         print "Did you remember to run assignFieldAndScanToSolution()?"
         return()
+    if ('SPECTRAL_WINDOW_ID' in names):
+        spwColumnName = 'SPECTRAL_WINDOW_ID'
+    else:
+        spwColumnName = 'CAL_DESC_ID'
     try:
-        flags = {}
-        for f in range(len(fields)):
-            flags[f] = mytb.getcell('FLAG',f)
+        flags = dict(enumerate(getcellcolumn(mytb, 'FLAG', spwColumnName)))
     except:
         print "No Flag column found. Are you sure this is a bandpass solution file, or is it the .ms?"
         print "If it is a solution file, does it contain solutions for both TDM and FDM spws?"
@@ -1222,9 +1356,9 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
             measFreqRef = mytb.getcol('MEAS_FREQ_REF')
             originalSpw_casa33 = range(len(measFreqRef))
             chanFreqGHz_casa33 = []     # used by showFDM
-            for i in originalSpw_casa33:
-                # They array shapes can vary.
-                chanFreqGHz_casa33.append(1e-9 * mytb.getcell('CHAN_FREQ',i))
+            # They array shapes can vary.
+            for chanFreq in getcellcolumn(mytb, 'CHAN_FREQ'):
+                chanFreqGHz_casa33.append(1e-9 * chanFreq)
             mytb.close()
         except:
             print "2) Could not open the associated measurement set tables (%s). Will not translate antenna names." % (msName)
@@ -1251,9 +1385,9 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
         originalSpws = range(len(mytb.getcol('MEAS_FREQ_REF')))
         originalSpw = originalSpws  # may need to do a global replace of this
         originalSpwNames = mytb.getcol('NAME')
-        for i in originalSpws:
-            # They array shapes can vary.
-            chanFreqGHz.append(1e-9 * mytb.getcell('CHAN_FREQ',i))
+        # They array shapes can vary.
+        for chanFreq in getcellcolumn(mytb, 'CHAN_FREQ'):
+            chanFreqGHz.append(1e-9 * chanFreq)
         mytb.close()
         #      CAS-6801 changes
         mytb.open(antennaTable)
@@ -1694,19 +1828,20 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
               mytb.close()
               mytb.open(spectralWindowTable2)
               chanFreqGHz2 = []
-              originalSpws2 = range(len(mytb.getcol('MEAS_FREQ_REF')))
-              for i in originalSpws2:
-                  # The array shapes can vary.
-                  chanFreqGHz2.append(1e-9 * mytb.getcell('CHAN_FREQ',i))
+              # The array shapes can vary.
+              for chanFreq in getcellcolumn(mytb, 'CHAN_FREQ'):
+                  chanFreqGHz2.append(1e-9 * chanFreq)
               originalSpws2 = range(len(mytb.getcol('MEAS_FREQ_REF')))
               originalSpw2 = originalSpws2  # may want to do a global replace of this <----------------------------------
   
           uniqueSpwsInCalTable2 = np.unique(cal_desc_id2)
           mytb.open(caltable2)
+          if (tableFormat2 == 34):
+              spwColumnName2 = 'SPECTRAL_WINDOW_ID'
+          else:
+              spwColumnName2 = 'CAL_DESC_ID'
           try:
-              flags2 = {}
-              for f in range(len(fields2)):
-                  flags2[f] = mytb.getcell('FLAG',f)
+              flags2 = dict(enumerate(getcellcolumn(mytb, 'FLAG', spwColumnName2)))
           except:
               print "bOverlay: No Flag column found. Are you sure this is a bandpass solution file, or is it the .ms?"
               print "If it is a solution file, does it contain solutions for both TDM and FDM spws?"
@@ -2397,6 +2532,7 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
                                    2,xant,ispw,subplot,resample,debug,
                                    figfileSequential,figfileNumber))
          figfileNumber += 1
+      pageRenderer.wait()
       if (len(plotfiles) > 0 and buildpdf):
           pdfname = figfile+'.pdf'
           filelist = ''
@@ -2433,18 +2569,13 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
     mytb.open(caltable)
     uniqueScanNumbers = sorted(np.unique(mytb.getcol('SCAN_NUMBER')))
     if (ParType == 'Complex'):  # casa >= 3.4
-        gain = {}
-        for f in range(len(fields)):
-            gain[f] = mytb.getcell('CPARAM',f)
+        gain = dict(enumerate(getcellcolumn(mytb, 'CPARAM', spwColumnName)))
     else: # casa 3.3
-        gain = {}
 # #      gain = mytb.getcol('FPARAM')       # 2,128,576
         if ('FPARAM' in mytb.colnames()):
-            for f in range(len(fields)):
-                gain[f] = mytb.getcell('FPARAM',f)
+            gain = dict(enumerate(getcellcolumn(mytb, 'FPARAM', spwColumnName)))
         else:
-            for f in range(len(fields)):
-                gain[f] = mytb.getcell('GAIN',f)
+            gain = dict(enumerate(getcellcolumn(mytb, 'GAIN', spwColumnName)))
     nPolarizations =  len(gain[0])
     if (debug):
         print "(1)Set nPolarizations = %d" % nPolarizations
@@ -2462,18 +2593,15 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
     nRows = len(gain)
     if (bOverlay):
           mytb.open(caltable2)
-          gain2 = {}
           if (ParType == 'Complex'):
 # #            gain2 = mytb.getcol('CPARAM')
-              for f in range(len(fields2)):
-                  gain2[f] = mytb.getcell('CPARAM',f)
+              gain2 = dict(enumerate(getcellcolumn(mytb, 'CPARAM', spwColumnName2)))
           else:
 # #            gain2 = mytb.getcol('FPARAM')
-              for f in range(len(fields2)):
-                  if (tableFormat2 == 34):
-                      gain2[f] = mytb.getcell('FPARAM',f)
-                  else:
-                      gain2[f] = mytb.getcell('GAIN',f)
+              if (tableFormat2 == 34):
+                  gain2 = dict(enumerate(getcellcolumn(mytb, 'FPARAM', spwColumnName2)))
+              else:
+                  gain2 = dict(enumerate(getcellcolumn(mytb, 'GAIN', spwColumnName2)))
           mytb.close()
           ggx2 = {}
           for g in range(len(gain2)):
@@ -5111,6 +5239,7 @@ def plotbandpass(caltable='', antenna='', field='', spw='', yaxis='amp',
     # end of while(xant) loop
     if (debug): print "Finished while(xant) loop----------------"
     pb.draw()
+    pageRenderer.wait()
     if (len(plotfiles) == 1 and figfileSequential):
         # rename the single file to remove ".000"
         newplotfiles = [plotfiles[0].split('.000.png')[0]+'.png']
@@ -5445,37 +5574,11 @@ def CalcAtmTransmission(chans,freqs,xaxis,pwv,vm, mymsmd,vis,asdm,antenna,timest
     P = 563.0
     H = 20.0
     T = 273.0
-    roundedScanTimes = []
     if (type(mymsmd) != str):
-        if (verbose):
-            print "Looking for scans for field integer = %d" % (field)
-        scans = mymsmd.scansforfield(field)
-        if (verbose):
-            print "For field %s, Got scans = " % str(field),scans
-        for myscan in scans:
-            roundedScanTimes.append(np.unique(np.round(mymsmd.timesforscan(myscan))))
-#   This method was much slower and not necessary.  Removed for CAS-8065
-#        scantimes = mymsmd.timesforscans(scans) # is often longer than the scans array
-#        roundedScanTimes = np.unique(np.round(scantimes,0))
-#        scans, roundedScanTimes = getScansForTimes(mymsmd,roundedScanTimes) # be sure that each scantime has a scan associated, round to nearest second to save time (esp. for single dish data)
-#        if (verbose): print "scantimes = %s" % (str(scantimes))
-#        if (verbose): print "scans = %s" % (str(scans))
-        mindiff = 1e20
-        bestscan = 1
-        for i in range(len(roundedScanTimes)):
-            stime = roundedScanTimes[i]
-            meantime = np.mean(stime)
-            tdiff = np.abs(meantime-timestamp)
-    #        if (verbose): print "tdiff = %s" % (str(tdiff))
-            if (tdiff < mindiff):
-                bestscan = scans[i]
-                if (verbose): print "bestscan = %s" % (str(bestscan))
-                mindiff = tdiff
+        [bestscan, mindiff] = getClosestScanForField(vis, mymsmd, field, timestamp, verbose)
         if (verbose):
               print "For timestamp=%.1f, got closest scan = %d, %.0f sec away" %(timestamp, bestscan,mindiff)
-        if (verbose): print "Calling getWeather()"
-        [conditions,myTimes] = getWeather(vis,bestscan,antenna,verbose,mymsmd)
-        if (verbose): print "Done getWeather()"
+        conditions = getWeatherConditions(vis, bestscan, antenna, verbose, mymsmd)
         P = conditions['pressure']
         H = conditions['humidity']
         T = conditions['temperature']+273.15
@@ -5485,27 +5588,6 @@ def CalcAtmTransmission(chans,freqs,xaxis,pwv,vm, mymsmd,vis,asdm,antenna,timest
             H = 20
     else:
         conditions = {}
-    if (type(mymsmd) != str):
-      if ('elevation' not in conditions.keys()):
-        # Someone cleared the POINTING table, so calculate elevation from Ra/Dec/MJD
-#        myfieldId =  mymsmd.fieldsforname(mymsmd.fieldsforscan(bestscan))
-        myfieldId =  mymsmd.fieldsforscan(bestscan)[0]
-        myscantime = np.mean(mymsmd.timesforscan(bestscan))
-        mydirection = getRADecForField(vis, myfieldId, verbose)
-        if (verbose):
-            print "myfieldId = %s" % (str(myfieldId))
-            print "mydirection = %s" % (str(mydirection))
-            print "Scan =  %d, time = %.1f,  Field = %d, direction = %s" % (bestscan, myscantime, myfieldId, str(mydirection))
-        telescopeName = mymsmd.observatorynames()[0]
-        if (len(telescopeName) < 1):
-            telescopeName = 'ALMA'
-        print "telescope = %s" % (telescopeName)
-        myazel = computeAzElFromRADecMJD(mydirection, myscantime/86400., telescopeName)
-        conditions['elevation'] = myazel[1] * 180/math.pi
-        conditions['azimuth'] = myazel[0] * 180/math.pi
-        if (verbose):
-            print "Computed elevation = %.1f deg" % (conditions['elevation'])
-    else:
         conditions['elevation'] = 90
         bestscan = -1
     if (verbose):
@@ -5517,9 +5599,6 @@ def CalcAtmTransmission(chans,freqs,xaxis,pwv,vm, mymsmd,vis,asdm,antenna,timest
     else:
         airmass = 1.0/math.cos((90-conditions['elevation'])*math.pi/180.)
 
-    tropical = 1
-    midLatitudeSummer = 2
-    midLatitudeWinter = 3
     numchan = len(freqs)
     reffreq=0.5*(freqs[numchan/2-1]+freqs[numchan/2])
     originalnumchan = numchan
@@ -5529,6 +5608,147 @@ def CalcAtmTransmission(chans,freqs,xaxis,pwv,vm, mymsmd,vis,asdm,antenna,timest
         chans = range(0,originalnumchan,(originalnumchan/numchan))
 
     chansep = (freqs[-1]-freqs[0])/(numchan-1)
+    [dry, wet, TebbSky, rf, cs, n] = getAtmModel(H, T, P, pwvmean, reffreq, chansep, numchan, verbose)
+
+    chans = range(n)
+    transmission = np.exp(-airmass*(wet+dry))
+    TebbSky *= (1-np.exp(-airmass*(wet+dry)))/(1-np.exp(-wet-dry))
+
+    if (refFreqInTable*1e-9>np.mean(freqs)):
+        if ((net_sideband % 2) == 0):
+            sense = 1
+        else:
+            sense = 2
+    else:
+        if ((net_sideband % 2) == 0):
+            sense = 2
+        else:
+            sense = 1
+
+    if (sense == 1):
+        # The following looks right for LSB   sense=1
+#        freq = rf.value + cs.value*0.001*(0.5*n-1-np.array(range(n)))
+        freq = rf + cs*0.001*(0.5*n-1-np.array(range(n)))
+        if (xaxis.find('chan')>=0):
+            trans = np.zeros(len(transmission))
+            Tebb = np.zeros(len(TebbSky))
+            for i in range(len(transmission)):
+                trans[i] = transmission[len(transmission)-1-i]
+                Tebb[i] = TebbSky[len(TebbSky)-1-i]
+            transmission = trans
+            TebbSky = Tebb
+    else:
+        # Using numchan can cause an inconsistency for small number of channels
+#        freq = rf.value+cs.value*0.001*(np.array(range(numchan))-0.5*numchan+1)
+        # The following looks right for USB  sense=2
+        freq = rf+cs*0.001*(np.array(range(n))-0.5*n+1)
+        
+    if (verbose): print "Done CalcAtmTransmission"
+    return(freq, chans, transmission, pwvmean, airmass, TebbSky, missingCalWVRErrorPrinted)
+
+def clearAtmosphereCaches():
+    """
+    Clears the PWV, weather and scan time caches used by CalcAtmTransmission.
+    """
+    pwvTableCache.clear()
+    weatherCache.clear()
+    scanTimesCache.clear()
+
+def getClosestScanForField(vis, mymsmd, field, timestamp, verbose=False):
+    """
+    Returns the scan of the specified field whose mean time is closest to the
+    timestamp, and the time difference.  The mean time of each scan is
+    computed once per ms and field.
+    """
+    key = (vis, field)
+    if (key not in scanTimesCache):
+        if (verbose):
+            print "Looking for scans for field integer = %d" % (field)
+        scans = mymsmd.scansforfield(field)
+        if (verbose):
+            print "For field %s, Got scans = " % str(field),scans
+        meanScanTimes = []
+        for myscan in scans:
+            meanScanTimes.append(np.mean(np.unique(np.round(mymsmd.timesforscan(myscan)))))
+#   This method was much slower and not necessary.  Removed for CAS-8065
+#        scantimes = mymsmd.timesforscans(scans) # is often longer than the scans array
+#        roundedScanTimes = np.unique(np.round(scantimes,0))
+#        scans, roundedScanTimes = getScansForTimes(mymsmd,roundedScanTimes) # be sure that each scantime has a scan associated, round to nearest second to save time (esp. for single dish data)
+        scanTimesCache[key] = (scans, np.array(meanScanTimes))
+    (scans, meanScanTimes) = scanTimesCache[key]
+    mindiff = 1e20
+    bestscan = 1
+    if (len(scans) > 0):
+        tdiff = np.abs(meanScanTimes-timestamp)
+        i = np.argmin(tdiff)
+        if (tdiff[i] < mindiff):
+            bestscan = scans[i]
+            if (verbose): print "bestscan = %s" % (str(bestscan))
+            mindiff = tdiff[i]
+    return([bestscan, mindiff])
+
+def getWeatherConditions(vis, scan, antenna, verbose, mymsmd):
+    """
+    Returns the weather conditions of a scan as returned by getWeather, with
+    the elevation computed from the field direction if the POINTING table is
+    empty.  The conditions are computed once per ms, scan and antenna.
+    """
+    key = (vis, scan, str(antenna))
+    if (key not in weatherCache):
+        if (verbose): print "Calling getWeather()"
+        [conditions,myTimes] = getWeather(vis,scan,antenna,verbose,mymsmd)
+        if (verbose): print "Done getWeather()"
+        if ('elevation' not in conditions.keys()):
+            # Someone cleared the POINTING table, so calculate elevation from Ra/Dec/MJD
+#            myfieldId =  mymsmd.fieldsforname(mymsmd.fieldsforscan(scan))
+            myfieldId =  mymsmd.fieldsforscan(scan)[0]
+            myscantime = np.mean(mymsmd.timesforscan(scan))
+            mydirection = getRADecForField(vis, myfieldId, verbose)
+            if (verbose):
+                print "myfieldId = %s" % (str(myfieldId))
+                print "mydirection = %s" % (str(mydirection))
+                print "Scan =  %d, time = %.1f,  Field = %d, direction = %s" % (scan, myscantime, myfieldId, str(mydirection))
+            telescopeName = mymsmd.observatorynames()[0]
+            if (len(telescopeName) < 1):
+                telescopeName = 'ALMA'
+            print "telescope = %s" % (telescopeName)
+            myazel = computeAzElFromRADecMJD(mydirection, myscantime/86400., telescopeName)
+            conditions['elevation'] = myazel[1] * 180/math.pi
+            conditions['azimuth'] = myazel[0] * 180/math.pi
+            if (verbose):
+                print "Computed elevation = %.1f deg" % (conditions['elevation'])
+        weatherCache[key] = conditions
+    return(dict(weatherCache[key]))
+
+def getAtmModel(H, T, P, pwvmean, reffreq, chansep, numchan, verbose=False):
+    """
+    Computes the dry and wet opacity and the sky temperature at zenith with
+    the ATM model.  Returns [dry, wet, TebbSky, refFreq, chanSep, numChan].
+    The last MAX_ATM_MODEL_CACHE_ENTRIES models computed are cached, as the
+    same model is requested for many antennas and timestamps.
+    """
+    key = (H, T, P, pwvmean, reffreq, chansep, numchan)
+    if (key in atmModelCache):
+        # Move it to the end, as the most recently used
+        model = atmModelCache.pop(key)
+        atmModelCache[key] = model
+        if (verbose): print "Using the cached ATM model"
+    else:
+        model = computeAtmModel(H, T, P, pwvmean, reffreq, chansep, numchan, verbose)
+        atmModelCache[key] = model
+        if (len(atmModelCache) > MAX_ATM_MODEL_CACHE_ENTRIES):
+            atmModelCache.popitem(last=False)
+    [dry, wet, TebbSky, rf, cs, n] = model
+    # TebbSky is scaled in place by the caller
+    return([dry, wet, np.array(TebbSky), rf, cs, n])
+
+def computeAtmModel(H, T, P, pwvmean, reffreq, chansep, numchan, verbose=False):
+    """
+    Computes the ATM model for getAtmModel.
+    """
+    tropical = 1
+    midLatitudeSummer = 2
+    midLatitudeWinter = 3
     nbands = 1
     if (verbose): print "Opening casac.atmosphere()"
     if (type(casac.Quantity) != type):  # casa 4.x
@@ -5579,41 +5799,7 @@ def CalcAtmTransmission(chans,freqs,xaxis,pwv,vm, mymsmd,vis,asdm,antenna,timest
         if (myat.getChanSep()['unit'] != 'MHz'):
             print "There is a unit mismatch for chanSep in the code."
 
-    chans = range(n)
-    transmission = np.exp(-airmass*(wet+dry))
-    TebbSky *= (1-np.exp(-airmass*(wet+dry)))/(1-np.exp(-wet-dry))
-
-    if (refFreqInTable*1e-9>np.mean(freqs)):
-        if ((net_sideband % 2) == 0):
-            sense = 1
-        else:
-            sense = 2
-    else:
-        if ((net_sideband % 2) == 0):
-            sense = 2
-        else:
-            sense = 1
-
-    if (sense == 1):
-        # The following looks right for LSB   sense=1
-#        freq = rf.value + cs.value*0.001*(0.5*n-1-np.array(range(n)))
-        freq = rf + cs*0.001*(0.5*n-1-np.array(range(n)))
-        if (xaxis.find('chan')>=0):
-            trans = np.zeros(len(transmission))
-            Tebb = np.zeros(len(TebbSky))
-            for i in range(len(transmission)):
-                trans[i] = transmission[len(transmission)-1-i]
-                Tebb[i] = TebbSky[len(TebbSky)-1-i]
-            transmission = trans
-            TebbSky = Tebb
-    else:
-        # Using numchan can cause an inconsistency for small number of channels
-#        freq = rf.value+cs.value*0.001*(np.array(range(numchan))-0.5*numchan+1)
-        # The following looks right for USB  sense=2
-        freq = rf+cs*0.001*(np.array(range(n))-0.5*n+1)
-        
-    if (verbose): print "Done CalcAtmTransmission"
-    return(freq, chans, transmission, pwvmean, airmass, TebbSky, missingCalWVRErrorPrinted)
+    return([dry, wet, np.array(TebbSky), rf, cs, n])
 
 def RescaleTrans(trans, lim, subplotRows, lo1='', xframe=0):
     # Input: the array of transmission or TebbSky values and current limits
@@ -6546,25 +6732,23 @@ def readPWVFromASDM_CALATMOSPHERE(vis):
     mytb.close()
     return(pwvtime, antenna, pwv)
     
-def getMedianPWV(vis='.', myTimes=[0,999999999999], asdm='', verbose=False):
+def readPWVTable(vis='.', asdm='', verbose=False):
     """
-    Extracts the PWV measurements from the WVR on all antennas for the
-    specified time range.  The time range is input as a two-element list of
-    MJD seconds (default = all times).  First, it tries to find the ASDM_CALWVR
-    table in the ms.  If that fails, it then tries to find CalWVR.xml in the
-    specified ASDM, or failing that, an ASDM of the same name (-.ms).  If neither of 
-    these exist, then it tries to find CalWVR.xml in the present working directory.
-    If it still fails, it looks for CalWVR.xml in the .ms directory.  Thus,
-    you only need to copy this xml file from the ASDM into your ms, rather
-    than the entire ASDM. Returns the median and standard deviation in millimeters.
-    For further help and examples, see https://safe.nrao.edu/wiki/bin/view/ALMA/GetMedianPWV
-    -- Todd Hunter
+    Reads the PWV measurements for getMedianPWV, from the ASDM_CALWVR or 
+    ASDM_CALATMOSPHERE table of the ms, or from CalWVR.xml.  Returns the
+    times and PWV values sorted by time, and the return value of getMedianPWV 
+    if they could not be read.  The result is cached for each ms and ASDM,
+    until clearAtmosphereCaches() is called.
     """
+    key = (vis, asdm)
+    if (key not in pwvTableCache):
+        pwvTableCache[key] = readPWVTableUncached(vis, asdm, verbose)
+    return(pwvTableCache[key])
+
+def readPWVTableUncached(vis='.', asdm='', verbose=False):
     pwvmean = 0
     success = False
     mytb = createCasaTool(tbtool)
-    if (verbose):
-        print "in getMedianPWV with myTimes = %s" % (str(myTimes))
     try:
       if (os.path.exists("%s/ASDM_CALWVR"%vis)):
           mytb.open("%s/ASDM_CALWVR" % vis)
@@ -6579,11 +6763,11 @@ def getMedianPWV(vis='.', myTimes=[0,999999999999], asdm='', verbose=False):
                   success = True
                   if (len(pwv) < 1):
                       print "Found no data in ASDM_CALWVR nor ASDM_CALATMOSPHERE table"
-                      return(0,-1)
+                      return([None, None, (0,-1)])
               else:
                   if (verbose):
                       print "Did not find ASDM_CALATMOSPHERE in the ms"
-                  return(0,-1)
+                  return([None, None, (0,-1)])
           if (verbose):
               print "Opened ASDM_CALWVR table, len(pwvtime)=%s" % (str(len(pwvtime)))
       else:
@@ -6594,7 +6778,7 @@ def getMedianPWV(vis='.', myTimes=[0,999999999999], asdm='', verbose=False):
               success = True
               if (len(pwv) < 1):
                   print "Found no data in ASDM_CALATMOSPHERE table"
-                  return(0,-1)
+                  return([None, None, (0,-1)])
           else:
               if (verbose):
                   print "Did not find ASDM_CALATMOSPHERE in the ms"
@@ -6608,14 +6792,14 @@ def getMedianPWV(vis='.', myTimes=[0,999999999999], asdm='', verbose=False):
            if (os.path.exists(asdm) == False):
                print "Could not open ASDM = %s" % (asdm)
                mytb.done()
-               return(0,-1)
+               return([None, None, (0,-1)])
            try:
                [pwvtime,pwv,antenna] = readpwv(asdm)
            except:
                if (verbose):
                    print "Could not open ASDM = %s" % (asdm)
                mytb.done()
-               return(pwvmean,-1)
+               return([None, None, (pwvmean,-1)])
        else:
            try:
                tryasdm = vis.split('.ms')[0]
@@ -6636,40 +6820,53 @@ def getMedianPWV(vis='.', myTimes=[0,999999999999], asdm='', verbose=False):
                        if (verbose):
                            print "No CalWVR.xml file found, so no PWV retrieved. Copy it to this directory and try again."
                        mytb.done()
-                       return(pwvmean,-1)
-    try:
-        matches = np.where(np.array(pwvtime)>myTimes[0])[0]
-    except:
-        print "Found no times > %d" % (myTimes[0])
-        mytb.done()
-        return(0,-1)
+                       return([None, None, (pwvmean,-1)])
+    pwvtime = np.array(pwvtime)
+    pwv = np.array(pwv)
+    sortIndex = np.argsort(pwvtime, kind='mergesort')
+    return([pwvtime[sortIndex], pwv[sortIndex], None])
+
+def getMedianPWV(vis='.', myTimes=[0,999999999999], asdm='', verbose=False):
+    """
+    Extracts the PWV measurements from the WVR on all antennas for the
+    specified time range.  The time range is input as a two-element list of
+    MJD seconds (default = all times).  First, it tries to find the ASDM_CALWVR
+    table in the ms.  If that fails, it then tries to find CalWVR.xml in the
+    specified ASDM, or failing that, an ASDM of the same name (-.ms).  If neither of 
+    these exist, then it tries to find CalWVR.xml in the present working directory.
+    If it still fails, it looks for CalWVR.xml in the .ms directory.  Thus,
+    you only need to copy this xml file from the ASDM into your ms, rather
+    than the entire ASDM. Returns the median and standard deviation in millimeters.
+    The PWV measurements are read only once per ms (see readPWVTable).
+    For further help and examples, see https://safe.nrao.edu/wiki/bin/view/ALMA/GetMedianPWV
+    -- Todd Hunter
+    """
+    if (verbose):
+        print "in getMedianPWV with myTimes = %s" % (str(myTimes))
+    [pwvtime, pwv, errorReturn] = readPWVTable(vis, asdm, verbose)
+    if (errorReturn is not None):
+        return(errorReturn)
     if (len(pwv) < 1):
         print "Found no PWV data"
         return(0,-1)
-    ptime = np.array(pwvtime)[matches]
-    matchedpwv = np.array(pwv)[matches]
-    matches2 = np.where(ptime<myTimes[-1])[0]
-    if (len(matches2) < 1):
+    # The measurements are sorted by time, so the ones within the time range
+    # are found by bisection
+    start = np.searchsorted(pwvtime, myTimes[0], side='right')
+    stop = np.searchsorted(pwvtime, myTimes[-1], side='left')
+    if (stop <= start):
         # look for the value with the closest start time
-        mindiff = 1e12
-        for i in range(len(pwvtime)):
-            if (abs(myTimes[0]-pwvtime[i]) < mindiff):
-                mindiff = abs(myTimes[0]-pwvtime[i])
-                pwvmean = pwv[i]*1000
-        matchedpwv = []
-        for i in range(len(pwvtime)):
-            if (abs(abs(myTimes[0]-pwvtime[i]) - mindiff) < 1.0):
-                matchedpwv.append(pwv[i])
+        tdiff = np.abs(myTimes[0]-pwvtime)
+        mindiff = min(1e12, np.min(tdiff))
+        matchedpwv = pwv[np.abs(tdiff - mindiff) < 1.0]
         pwvmean = 1000*np.median(matchedpwv)
         if (verbose):
             print "Taking the median of %d pwv measurements from all antennas = %.3f mm" % (len(matchedpwv),pwvmean)
         pwvstd = np.std(matchedpwv)
     else:
-        pwvmean = 1000*np.median(matchedpwv[matches2])
-        pwvstd = np.std(matchedpwv[matches2])
+        pwvmean = 1000*np.median(pwv[start:stop])
+        pwvstd = np.std(pwv[start:stop])
         if (verbose):
-            print "Taking the median of %d pwv measurements from all antennas = %.3f mm" % (len(matches2),pwvmean)
-#    mytb.done()
+            print "Taking the median of %d pwv measurements from all antennas = %.3f mm" % (stop-start,pwvmean)
     return(pwvmean,pwvstd)
 # end of getMedianPWV
 
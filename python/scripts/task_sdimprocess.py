@@ -8,6 +8,31 @@ from taskinit import casalog, gentools, utilstool, qatool
 
 import sdutil
 
+# maximum size of the blocks of xy-planes processed at once
+MAX_BLOCK_BYTES = 512 * 1024 * 1024
+
+def iterate_plane_blocks(imshape, bytes_per_pixel, max_bytes=None):
+    """
+    Generate blc and trc of blocks of xy-planes of an image of shape imshape
+    (2 to 4 axes with the direction axes first). The planes of a block are
+    contiguous along the third axis, and a block takes at most max_bytes
+    for bytes_per_pixel bytes of working arrays per pixel (at least one plane).
+    max_bytes defaults to MAX_BLOCK_BYTES.
+    """
+    if max_bytes is None:
+        max_bytes = MAX_BLOCK_BYTES
+    ndim = len(imshape)
+    nx = imshape[0]
+    ny = imshape[1]
+    n2 = imshape[2] if ndim > 2 else 1
+    n3 = imshape[3] if ndim > 3 else 1
+    nplane = max(1, int(max_bytes // (nx * ny * bytes_per_pixel)))
+    for i3 in xrange(n3):
+        for i2 in xrange(0, n2, nplane):
+            blc = [0, 0, i2, i3][:ndim]
+            trc = [nx-1, ny-1, min(i2+nplane, n2)-1, i3][:ndim]
+            yield blc, trc
+
 def create_4d_image(infile, outfile):
     (ia,) = gentools(['ia'])
     ia.open(infile)
@@ -57,20 +82,16 @@ class sdimprocess_worker(sdutil.sdtask_interface):
         self.tmppolyname = 'polyfit.'+tmpstr+'.im'
         # set tempolary filename
         self.tmprealname = []
-        self.tmpimagname = []
         self.image = None
         self.convimage = None
         self.polyimage = None
         self.imageorg = None
         self.realimage = None
-        self.imagimage = None
         if type(self.infiles) == str:
             self.tmprealname.append( 'fft.'+tmpstr+'.real..0.im' )
-            self.tmpimagname.append( 'fft.'+tmpstr+'.imag.0.im' )
         else:
             for i in range(len(self.infiles)):
                 self.tmprealname.append( 'fft.%s.%s.real.im' % (tmpstr,i) )
-                self.tmpimagname.append( 'fft.%s.%s.imag.im' % (tmpstr,i) )
 
         # default output filename
         if self.outfile == '':
@@ -251,36 +272,17 @@ class sdimprocess_worker(sdutil.sdtask_interface):
             if tmpia.isopen(): tmpia.close()
             imshape = modelimg.shape()
             # the axis order of [ra, dec, chan(, pol)] is assumed throughout the task.
-            ndim = len(imshape)
             nx = imshape[0]
             ny = imshape[1]
-            # an xy-plane can be fit simultaneously (doing per plane to save memory)
-            if ndim == 3:
-                get_blc = lambda i, j: [0, 0, i]
-                get_trc = lambda i, j: [nx-1, ny-1, i]
-                imshape2 = imshape[2]
-                imshape3 = 1
-            elif ndim == 4:
-                get_blc = lambda i, j: [0, 0, i, j]
-                get_trc = lambda i, j: [nx-1, ny-1, i, j]
-                imshape2 = imshape[2]
-                imshape3 = imshape[3]
-            else: # ndim == 2 
-                get_blc = lambda i, j: [0,0]
-                get_trc = lambda i, j: [nx-1, ny-1]
-                imshape2 = 1
-                imshape3 = 1
-                
-            for i3 in range(imshape3):
-                for i2 in range(imshape2):
-                    blc = get_blc(i2, i3)
-                    trc = get_trc(i2, i3)
-                    dslice = modelimg.getchunk(blc, trc)
-                    mslice = modelimg.getchunk(blc, trc, getmask=True)
-                    model = self._get_polyfit_model_array(dslice.reshape(nx,ny),
-                                                          mslice.reshape(nx,ny),
-                                                          axis, order)
-                    modelimg.putchunk(model, blc)
+            # blocks of xy-planes are fit simultaneously (bounded to save memory)
+            for blc, trc in iterate_plane_blocks(imshape, 32):
+                dblock = modelimg.getchunk(blc, trc)
+                mblock = modelimg.getchunk(blc, trc, getmask=True)
+                blockshape = dblock.shape
+                model = self._get_polyfit_model_array(dblock.reshape(nx,ny,-1),
+                                                      mblock.reshape(nx,ny,-1),
+                                                      axis, order)
+                modelimg.putchunk(model.reshape(blockshape), blc)
                 
             # the fit model image itself is free from invalid pixels
             modelimg.calcmask('T', asdefault=True)
@@ -288,24 +290,39 @@ class sdimprocess_worker(sdutil.sdtask_interface):
         finally: modelimg.close()
 
     def _get_polyfit_model_array(self, data, mask, axis, order):
-        if axis ==1:
-            tmp  = data.transpose()
-            data = tmp
-            tmp  = mask.transpose()
-            mask = tmp
-            del tmp
-        nx = data.shape[0]
-        ny = data.shape[1]
-        x = range(nx)
-        flag = mask ^ True #invert mask for masked array
-        mdata = numpy.ma.masked_array(data,flag)
-        retc = numpy.ma.polyfit(x,mdata,order)
-        del flag
-        coeffs = retc.transpose()
-        tmpmodel = numpy.zeros([nx, ny])
-        for iy in range(ny):
-            tmpmodel[:,iy] = numpy.poly1d(coeffs[iy])(x)
-        if axis == 1: return tmpmodel.transpose()
+        """
+        Fit a polynomial along axis to each column of the xy-plane(s) in
+        data, of shape (nx, ny) or (nx, ny, nplane), and return the models.
+        As numpy.ma.polyfit does for a plane, a row with a masked pixel is
+        excluded from the fit of all the columns of the plane. The planes
+        with the same excluded rows are fit by a single least-squares solve.
+        """
+        if axis == 1:
+            data = data.swapaxes(0, 1)
+            mask = mask.swapaxes(0, 1)
+        shape = data.shape
+        nx = shape[0]
+        ny = shape[1]
+        data = data.reshape((nx, ny, -1))
+        nplane = data.shape[2]
+        x = numpy.arange(nx, dtype=float)
+        # rows used in the fit of each plane
+        valid = mask.reshape((nx, ny, -1)).all(axis=1)
+        groups = {}
+        for iplane in xrange(nplane):
+            groups.setdefault(valid[:,iplane].tostring(), []).append(iplane)
+        tmpmodel = numpy.zeros((nx, ny, nplane))
+        for planes in groups.itervalues():
+            rows = valid[:,planes[0]]
+            columns = data[:,:,planes].reshape((nx, -1))
+            coeffs = numpy.polyfit(x[rows], columns[rows], order)
+            # evaluate all the columns by Horner's scheme (as numpy.polyval)
+            fit = numpy.zeros(columns.shape)
+            for c in coeffs:
+                fit = fit * x[:,numpy.newaxis] + c
+            tmpmodel[:,:,planes] = fit.reshape((nx, ny, len(planes)))
+        tmpmodel = tmpmodel.reshape(shape)
+        if axis == 1: return tmpmodel.swapaxes(0, 1)
         return tmpmodel
 
     def __execute_basket_weaving(self):
@@ -331,12 +348,7 @@ class sdimprocess_worker(sdutil.sdtask_interface):
             raise RuntimeError('Direction axes don\'t exist.')
         nx = imshape_out[direction_axis0]
         ny = imshape_out[direction_axis1]
-        tmp=[]
         nfile = len(self.infiles)
-        for i in xrange(nfile):
-            tmp.append(numpy.zeros(imshape_out,dtype=float))
-        maskedpixel=numpy.array(tmp)
-        del tmp
 
         # direction
         dirs = []
@@ -361,160 +373,79 @@ class sdimprocess_worker(sdutil.sdtask_interface):
         # mask
         for i in range(nfile):
             self.realimage = create_4d_image(self.infiles[i], self.tmprealname[i])
-            self.imagimage = self.realimage.subimage(outfile=self.tmpimagname[i])
             
             # replace masked pixels with 0.0
-            if not self.realimage.getchunk(getmask=True).all():
-                casalog.post("Replacing masked pixels with 0.0 in %d-th image" % (i))
-                self.realimage.replacemaskedpixels(0.0)
+            for blc, trc in iterate_plane_blocks(self.realimage.shape(), 1):
+                if not self.realimage.getchunk(blc, trc, getmask=True).all():
+                    casalog.post("Replacing masked pixels with 0.0 in %d-th image" % (i))
+                    self.realimage.replacemaskedpixels(0.0)
+                    break
             self.realimage.close()
-            self.imagimage.close()
           
         # Below working images are all 4D regardless of dimension of input images  
         # image shape for temporary images (always 4D)
         ia.open(self.tmprealname[0])
         imshape = ia.shape()
-        ndim = len(imshape)
         ia.close()
 
         if len(self.thresh) == 0:
             casalog.post( 'Use whole region' )
-        else:
-            for i in range(nfile):
-                self.realimage = ia.newimage( self.tmprealname[i] )
-                for iaxis2 in range(imshape[2]):
-                    for iaxis3 in range(imshape[3]):
-                        pixmsk = self.realimage.getchunk( [0,0,iaxis2,iaxis3], [nx-1,ny-1,iaxis2,iaxis3])
-                        for ix in range(pixmsk.shape[0]):
-                            for iy in range(pixmsk.shape[1]):
-                                if self.thresh[0] == self.nolimit:
-                                    if pixmsk[ix][iy] > self.thresh[1]:
-                                        maskedpixel[i][ix][iy][iaxis2][iaxis3]=pixmsk[ix][iy]
-                                        pixmsk[ix][iy] = 0.0
-                                elif self.thresh[1] == self.nolimit:
-                                    if pixmsk[ix][iy] < self.thresh[0]:
-                                        maskedpixel[i][ix][iy][iaxis2][iaxis3]=pixmsk[ix][iy]
-                                        pixmsk[ix][iy] = 0.0
-                                else:
-                                    if pixmsk[ix][iy] < self.thresh[0] or pixmsk[ix][iy] > self.thresh[1]:
-                                        maskedpixel[i][ix][iy][iaxis2][iaxis3]=pixmsk[ix][iy]
-                                        pixmsk[ix][iy] = 0.0
-                        self.realimage.putchunk( pixmsk, [0,0,iaxis2,iaxis3] )
-                self.realimage.close()
-        maskedvalue=None
-        if any(maskedpixel.flatten()!=0.0):
-                maskedvalue=maskedpixel.mean(axis=0)
-        del maskedpixel
 
         # set weight factor
         weights = numpy.ones( shape=(nfile,nx,ny), dtype=float )
-        eps = 1.0e-5
-        dtor = numpy.pi / 180.0
-        for i in range(nfile):
-            if abs(numpy.sin(dirs[i]*dtor)) < eps:
-                # direction is around 0 deg
-                maskw = 0.5 * nx * masks[i] 
-                for ix in range(nx):
-                    for iy in range(ny):
-                        dd = abs( float(ix) - 0.5 * (nx-1) )
-                        if dd < maskw:
-                            cosd = numpy.cos(0.5*numpy.pi*dd/maskw)
-                            weights[i][ix][iy] = 1.0 - cosd * cosd
-                        if weights[i][ix][iy] == 0.0:
-                            weights[i][ix][iy] += eps*0.01
-            elif abs(numpy.cos(dirs[i]*dtor)) < eps:
-                # direction is around 90 deg
-                maskw = 0.5 * ny * masks[i]
-                for ix in range(nx):
-                    for iy in range(ny):
-                        dd = abs( float(iy) - 0.5 * (ny-1) )
-                        if dd < maskw:
-                            cosd = numpy.cos(0.5*numpy.pi*dd/maskw)
-                            weights[i][ix][iy] = 1.0 - cosd * cosd
-                        if weights[i][ix][iy] == 0.0:
-                            weights[i][ix][iy] += eps*0.01
-            else:
-                maskw = 0.5 * numpy.sqrt( nx * ny ) * masks[i]
-                for ix in range(nx):
-                    for iy in range(ny):
-                        tand = numpy.tan((dirs[i]-90.0)*dtor)
-                        dd = abs( ix * tand - iy - 0.5 * (nx-1) * tand + 0.5 * (ny-1) )
-                        dd = dd / numpy.sqrt( 1.0 + tand * tand )
-                        if dd < maskw:
-                            cosd = numpy.cos(0.5*numpy.pi*dd/maskw)
-                            weights[i][ix][iy] = 1.0 - cosd * cosd
-                        if weights[i][ix][iy] == 0.0:
-                            weights[i][ix][iy] += eps*0.01 
-            # shift
-            xshift = -((ny-1)/2)
-            yshift = -((nx-1)/2)
-            for ix in range(xshift,0,1):
-                tmp = weights[i,:,0].copy()
-                weights[i,:,0:ny-1] = weights[i,:,1:ny].copy()
-                weights[i,:,ny-1] = tmp
-            for iy in range(yshift,0,1):
-                tmp = weights[i,0:1].copy()
-                weights[i,0:nx-1] = weights[i,1:nx].copy()
-                weights[i,nx-1:nx] = tmp
-
-        # FFT
+        denom = numpy.zeros( shape=(nx,ny), dtype=float )
         for i in range(nfile):
-            self.realimage = ia.newimage( self.tmprealname[i] )
-            self.imagimage = ia.newimage( self.tmpimagname[i] )
-            for iaxis2 in range(imshape[2]):
-                for iaxis3 in range(imshape[3]):
-                    pixval = self.realimage.getchunk( [0,0,iaxis2,iaxis3], [nx-1,ny-1,iaxis2,iaxis3] )
-                    pixval = pixval.reshape((nx,ny))
-                    pixfft = npfft.fft2( pixval )
-                    pixfft = pixfft.reshape((nx,ny,1,1))
-                    self.realimage.putchunk( pixfft.real, [0,0,iaxis2,iaxis3] )
-                    self.imagimage.putchunk( pixfft.imag, [0,0,iaxis2,iaxis3] )
-                    del pixval, pixfft
-            self.realimage.close()
-            self.imagimage.close()
-
-        # weighted mean
-        for ichan in range(imshape[2]):
-            for iaxis3 in range(imshape[3]):
-                pixout = numpy.zeros( shape=(nx,ny), dtype=complex )
-                denom = numpy.zeros( shape=(nx,ny), dtype=float )
-                for i in range(nfile):
-                    self.realimage = ia.newimage( self.tmprealname[i] )
-                    self.imagimage = ia.newimage( self.tmpimagname[i] )
-                    pixval = self.realimage.getchunk( [0,0,ichan,iaxis3], [nx-1,ny-1,ichan,iaxis3] ) \
-                        + self.imagimage.getchunk( [0,0,ichan,iaxis3], [nx-1,ny-1,ichan,iaxis3] ) * 1.0j
-                    pixval = pixval.reshape((nx,ny))
-                    pixout = pixout + pixval * weights[i]
-                    denom = denom + weights[i]
-                    self.realimage.close()
-                    self.imagimage.close()
-                pixout = pixout / denom
-                pixout = pixout.reshape((nx,ny,1,1))
-                self.realimage = ia.newimage( self.tmprealname[0] )
-                self.imagimage = ia.newimage( self.tmpimagname[0] )
-                self.realimage.putchunk( pixout.real, [0,0,ichan,iaxis3] )
-                self.imagimage.putchunk( pixout.imag, [0,0,ichan,iaxis3] )
+            weights[i] = self.__get_weight(dirs[i], masks[i], nx, ny)
+            denom = denom + weights[i]
+
+        # blc of a block of planes of the working images in outimage
+        if ndim_out == 4:
+            get_outblc = lambda blc: blc
+        elif ndim_out == 3:
+            # the degenerate axis added to the working images has one pixel
+            iaxis = 2 if imshape[3] == 1 else 3
+            get_outblc = lambda blc: [0, 0, blc[iaxis]]
+        else:
+            get_outblc = lambda blc: [0, 0]
+
+        # threshold, FFT, weighted mean and inverse FFT of blocks of planes.
+        # The planes of all the images are transformed at once by stacked FFTs.
+        for blc, trc in iterate_plane_blocks(imshape, 48):
+            pixout = None
+            maskedsum = None
+            for i in range(nfile):
+                self.realimage = ia.newimage( self.tmprealname[i] )
+                pixval = self.realimage.getchunk( blc, trc )
                 self.realimage.close()
-                self.imagimage.close()
-
-        # inverse FFT
-        self.realimage = ia.newimage( self.tmprealname[0] )
-        self.imagimage = ia.newimage( self.tmpimagname[0] )
-        for ichan in range(imshape[2]):
-            for iaxis3 in range(imshape[3]):
-                pixval = self.realimage.getchunk( [0,0,ichan,iaxis3], [nx-1,ny-1,ichan,iaxis3] ) \
-                    + self.imagimage.getchunk( [0,0,ichan,iaxis3], [nx-1,ny-1,ichan,iaxis3] ) * 1.0j
-                pixval = pixval.reshape((nx,ny))
-                pixifft = npfft.ifft2( pixval )
-                pixifft = pixifft.reshape((nx,ny,1,1))
-                self.realimage.putchunk(pixifft.real, blc=[0,0,ichan,iaxis3])
-                del pixval, pixifft
-        if maskedvalue is not None:
-            self.realimage.putchunk(self.realimage.getchunk()+maskedvalue)
-            
-        # put result into outimage
-        chunk = self.realimage.getchunk()
-        outimage.putchunk(chunk.reshape(imshape_out))
+                if len(self.thresh) > 0:
+                    # mask pixels beyond thresholds and keep their values
+                    pixmsk = self.__get_threshold_mask( pixval )
+                    if pixmsk.any():
+                        if maskedsum is None:
+                            maskedsum = numpy.zeros( pixval.shape, dtype=float )
+                        maskedsum[pixmsk] += pixval[pixmsk]
+                        pixval[pixmsk] = 0.0
+                    del pixmsk
+                pixfft = npfft.fft2( pixval, axes=(0,1) )
+                del pixval
+                pixfft *= weights[i].reshape((nx,ny,1,1))
+                if i == 0:
+                    pixout = pixfft
+                else:
+                    pixout += pixfft
+                del pixfft
+            pixout /= denom.reshape((nx,ny,1,1))
+            pixifft = npfft.ifft2( pixout, axes=(0,1) ).real
+            del pixout
+            if maskedsum is not None:
+                # add the mean of the masked values
+                pixifft += maskedsum / nfile
+                del maskedsum
+            if ndim_out < 4:
+                pixifft = pixifft.reshape([nx,ny] + [-1] * (ndim_out-2))
+            outimage.putchunk( pixifft, get_outblc(blc) )
+            del pixifft
+
         # handling of output image mask
         maskstr = ""
         for name in self.infiles:
@@ -522,10 +453,47 @@ class sdimprocess_worker(sdutil.sdtask_interface):
             maskstr += ("mask('%s')" % (name))
         outimage.calcmask(maskstr,name="basketweaving",asdefault=True)
         
-        self.realimage.close()
-        self.imagimage.close()
         outimage.close()
 
+    def __get_threshold_mask(self, pixval):
+        # pixels beyond thresholds
+        if self.thresh[0] == self.nolimit:
+            return pixval > self.thresh[1]
+        elif self.thresh[1] == self.nolimit:
+            return pixval < self.thresh[0]
+        else:
+            return numpy.logical_or(pixval < self.thresh[0], pixval > self.thresh[1])
+
+    def __get_weight(self, direction, mask, nx, ny):
+        # weight factor of an image in the Fourier domain, which masks
+        # the spatial frequencies along the scan direction
+        eps = 1.0e-5
+        dtor = numpy.pi / 180.0
+        ix = numpy.arange(nx, dtype=float).reshape((nx,1))
+        iy = numpy.arange(ny, dtype=float).reshape((1,ny))
+        if abs(numpy.sin(direction*dtor)) < eps:
+            # direction is around 0 deg
+            maskw = 0.5 * nx * mask
+            dd = abs( ix - 0.5 * (nx-1) ).repeat(ny, axis=1)
+        elif abs(numpy.cos(direction*dtor)) < eps:
+            # direction is around 90 deg
+            maskw = 0.5 * ny * mask
+            dd = abs( iy - 0.5 * (ny-1) ).repeat(nx, axis=0)
+        else:
+            maskw = 0.5 * numpy.sqrt( nx * ny ) * mask
+            tand = numpy.tan((direction-90.0)*dtor)
+            dd = abs( ix * tand - iy - 0.5 * (nx-1) * tand + 0.5 * (ny-1) )
+            dd = dd / numpy.sqrt( 1.0 + tand * tand )
+        weight = numpy.ones( shape=(nx,ny), dtype=float )
+        inside = dd < maskw
+        cosd = numpy.cos(0.5*numpy.pi*dd[inside]/maskw)
+        weight[inside] = 1.0 - cosd * cosd
+        weight[weight == 0.0] += eps*0.01
+        # shift
+        weight = numpy.roll(weight, -((ny-1)//2), axis=1)
+        weight = numpy.roll(weight, -((nx-1)//2), axis=0)
+        return weight
+
     def finalize(self):
         pass
 
@@ -533,7 +501,7 @@ class sdimprocess_worker(sdutil.sdtask_interface):
         # finalize image analysis tool
         if hasattr(self,'image') and self.image is not None:
             if self.image.isopen(): self.image.done()
-        tools = ['convimage', 'imageorg', 'realimage', 'imagimage']
+        tools = ['convimage', 'imageorg', 'realimage']
         for t in tools:
             if hasattr(self,t):
                 v = getattr(self,t)
@@ -542,7 +510,7 @@ class sdimprocess_worker(sdutil.sdtask_interface):
 
         # remove tempolary files
         filelist = ['tmpmskname', 'tmpconvname', 'tmppolyname',
-                    'tmprealname', 'tmpimagname']
+                    'tmprealname']
         existing_files = []
         for s in filelist:
             if hasattr(self, s):
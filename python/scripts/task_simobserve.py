@@ -662,8 +662,8 @@ def simobserve(
 
         msg("center = "+imcenter,origin='simobserve')
         if nfld > 1 and verbose:
-            for idir in range(min(len(pointings),20)):
-                msg("   "+pointings[idir],origin='simobserve')
+            for direction in pointings[:20]:
+                msg("   "+direction,origin='simobserve')
             if nfld >= 20:
                 msg("   (printing only first 20 - see pointing file for full list)")
 
@@ -885,9 +885,11 @@ def simobserve(
                 # auto-correlation should be unity for single dish obs.
                 sm.setauto(1.0)
 
+            # format the pointing directions once for all the fields and scans
+            fielddirs = util.pointing_set(pointings).tolist()
             for k in xrange(0,nfld):
                 src = project + '_%d' % k
-                sm.setfield(sourcename=src, sourcedirection=pointings[k],
+                sm.setfield(sourcename=src, sourcedirection=fielddirs[k],
                             calcode="OBJ", distance='0m')
                 if k == 0:
                     sourcefieldlist = src
@@ -942,7 +944,7 @@ def simobserve(
                 srces.append(src)
                 starttimes.append(str(sttime)+"s")
                 stoptimes.append(str(endtime)+"s")
-                dirs.append(pointings[kfld])
+                dirs.append(fielddirs[kfld])
                 kfld = kfld + 1
                 # advance start time - XX someday slew goes here
                 sttime = endtime
@@ -1,4 +1,29 @@
+import numpy
 from taskinit import mstool, casalog
+from parallel.parallel_task_helper import ParallelTaskHelper, ResultReducer, DictionaryReducer
+
+# Quantile sketches used to merge the statistics of the sub-MSs of a Multi-MS:
+# bits of the mantissa kept by the bins of the seed histograms computed with
+# the statistics of the sub-MSs, number of histogram bins of a window, maximum
+# number of values in a window for which the values themselves are returned,
+# maximum number of windows of a key refined in a pass, maximum number of
+# passes over the sub-MSs, and number of rows read at a time
+SKETCH_SEED_BITS = 8
+SKETCH_BINS = 1024
+SKETCH_VALUES = 10000
+SKETCH_WINDOWS = 8
+SKETCH_PASSES = 32
+SKETCH_ROWS = 1000
+
+# Data columns (as reduced by statistics2) and reporting axes supported by
+# the quantile sketches, with the corresponding ms.getdata items
+SKETCH_COLUMNS = {'DATA':'data', 'CORRECTED':'corrected_data',
+                  'MODEL':'model_data', 'FLOAT':'float_data'}
+SKETCH_AXES = {'ddid':('DATA_DESC_ID','data_desc_id'),
+               'field':('FIELD_ID','field_id'),
+               'integration':('TIME','time'),
+               'array':('ARRAY_ID','array_id'),
+               'scan':('SCAN_NUMBER','scan_number')}
 
 def visstat2(vis=None,
              axis=None,
@@ -23,13 +48,12 @@ def visstat2(vis=None,
              taql=None,
              monolithic_processing=None,
              intent=None,
-             reportingaxes=None):
+             reportingaxes=None,
+             sketchwindows=None):
 
     casalog.origin('visstat2')  
 
-    mslocal = mstool()
-
-    mslocal.open(vis)
+    args = dict(locals())
 
     if axis in ['amp', 'amplitude', 'phase', 'imag', 'imaginary', 'real']:
         complex_type = axis
@@ -46,29 +70,53 @@ def visstat2(vis=None,
         scan=''
         array=''
         observation = ''
+
+    if sketchwindows and not sketchwindows.has_key('*'):
+        # Quantile sketches of a sub-MS, see _mergeQuantiles
+        return _quantileSketches(vis, col, complex_type, useflags, reportingaxes,
+                                 _selection(spw, field, antenna, uvrange, timerange, correlation,
+                                            scan, intent, array, observation),
+                                 sketchwindows)
+
+    s = None
+    if not disableparallel and ParallelTaskHelper.isParallelMS(vis):
+        s = _parallelStatistics(args, col, complex_type, reportingaxes, timeaverage)
+
+    if s is None:
+        mslocal = mstool()
+        mslocal.open(vis)
+        s = mslocal.statistics2(column=col.upper(),
+                                complex_value=complex_type,
+                                useflags=useflags,
+                                useweights=False,
+                                spw=spw,
+                                field=field,
+#                                feed="",
+                                baseline=antenna,
+                                uvrange=uvrange,
+                                time=timerange,
+                                correlation=correlation,
+                                scan=scan,
+                                intent=intent,
+                                array=array,
+                                obs=str(observation),
+                                reportingaxes=str(reportingaxes),
+                                timeaverage=timeaverage,
+                                timebin=timebin,
+                                timespan=timespan,
+                                maxuvwdistance=maxuvwdistance)
         
-    s = mslocal.statistics2(column=col.upper(),
-                            complex_value=complex_type,
-                            useflags=useflags,
-                            useweights=False,
-                            spw=spw,
-                            field=field,
-#                            feed="",
-                            baseline=antenna,
-                            uvrange=uvrange,
-                            time=timerange,
-                            correlation=correlation,
-                            scan=scan,
-                            intent=intent,
-                            array=array,
-                            obs=str(observation),
-                            reportingaxes=str(reportingaxes),
-                            timeaverage=timeaverage,
-                            timebin=timebin,
-                            timespan=timespan,
-                            maxuvwdistance=maxuvwdistance)
-    
-    mslocal.close()
+        mslocal.close()
+
+    if sketchwindows:
+        # Seed histograms of the values of each key of a sub-MS, see _parallelStatistics
+        seeds = _quantileSketches(vis, col, complex_type, useflags, reportingaxes,
+                                  _selection(spw, field, antenna, uvrange, timerange, correlation,
+                                             scan, intent, array, observation),
+                                  sketchwindows)
+        for key in seeds:
+            if s.has_key(key):
+                s[key]['seed'] = seeds[key]['seed']['bins']
 
     for stats in s.keys():
         casalog.post(stats + " values --- ", "NORMAL")
@@ -95,5 +143,513 @@ def visstat2(vis=None,
     return s
 
 
+class StatisticsReducer(ResultReducer):
+    """
+    Merge the statistics2 results of the sub-MSs of a Multi-MS, key by key.
+    The number of points, sums, extrema and seed histograms of the sub-MSs
+    are combined, the mean and variance with the pairwise update of Chan et
+    al., and the standard deviation and rms are computed again from them as
+    in ClassicalStatistics. The statistics of a key found in a single sub-MS
+    are kept as they are, the quantiles of the other keys (see
+    getMergedKeys) have to be computed from the data of all the sub-MSs.
+    """
+    
+    def reset(self):
+        self._result = {}
+        self._merged = set()
+        # Sums of the squared deviations from the mean, by key
+        self._m2 = {}
+        
+    def add(self, vis, ret):
+        if not isinstance(ret,dict):
+            return
+        for (key, stats) in ret.items():
+            if not self._result.has_key(key) or self._result[key]['npts'] == 0:
+                self._result[key] = dict(stats)
+                if stats.has_key('seed'):
+                    self._result[key]['seed'] = dict(stats['seed'])
+                self._m2[key] = self._sumSquaredDeviations(stats)
+                continue
+            if stats['npts'] == 0:
+                continue
+            
+            merged = self._result[key]
+            npts = merged['npts'] + stats['npts']
+            delta = stats['mean'] - merged['mean']
+            merged['mean'] += delta * stats['npts'] / npts
+            self._m2[key] += self._sumSquaredDeviations(stats) + \
+                             delta * delta * merged['npts'] * stats['npts'] / npts
+            for item in ['npts', 'sum', 'sumsq']:
+                merged[item] += stats[item]
+            # Keep the position of the extrema in the sub-MS where they are found
+            if stats['min'] < merged['min']:
+                for item in ['min', 'minIndex', 'minDatasetIndex']:
+                    if stats.has_key(item):
+                        merged[item] = stats[item]
+            if stats['max'] > merged['max']:
+                for item in ['max', 'maxIndex', 'maxDatasetIndex']:
+                    if stats.has_key(item):
+                        merged[item] = stats[item]
+            if stats.has_key('seed') and merged.has_key('seed'):
+                for (ibin, count) in stats['seed'].items():
+                    merged['seed'][ibin] = merged['seed'].get(ibin, 0) + count
+            self._merged.add(key)
+            
+    def getResult(self):
+        for key in self._merged:
+            stats = self._result[key]
+            npts = stats['npts']
+            stats['variance'] = self._m2[key] / (npts - 1)
+            stats['stddev'] = numpy.sqrt(stats['variance'])
+            stats['rms'] = numpy.sqrt(stats['sumsq'] / npts)
+        return self._result
+    
+    def getMergedKeys(self):
+        """
+        Return the keys found in several sub-MSs, whose quantiles are not known.
+        """
+        return sorted(self._merged)
+    
+    def _sumSquaredDeviations(self, stats):
+        if stats['npts'] > 1:
+            return stats['variance'] * (stats['npts'] - 1)
+        return 0.0
+
+
+def _parallelStatistics(args, column, complex_value, reportingaxes, timeaverage):
+    """
+    Compute the statistics of a Multi-MS from the statistics of its sub-MSs,
+    processed in parallel and merged by StatisticsReducer. The median,
+    quartile and median absolute deviation of the keys found in several
+    sub-MSs are computed exactly from quantile sketches of the sub-MSs (see
+    _mergeQuantiles), starting from the seed histograms computed with the
+    statistics of the sub-MSs, so that the result is the one of a serial run.
+    Returns None if the Multi-MS has to be processed serially.
+    """
+    
+    if timeaverage or _sketchItem(column, complex_value) is None or \
+       _sketchAxes(reportingaxes) is None:
+        casalog.post("The statistics of the sub-MSs cannot be merged for axis %s and reporting axes %s, "
+                     "processing the Multi-MS serially" % (column, reportingaxes), "INFO")
+        return None
+    
+    args = dict(args)
+    args['disableparallel'] = True
+    args['sketchwindows'] = {'*':{'seed':[SKETCH_SEED_BITS]}}
+    reducer = StatisticsReducer('visstat2')
+    s = _runSubMSs(args, reducer)
+    if s is None:
+        casalog.post("Error processing the sub-MSs, processing the Multi-MS serially", "WARN")
+        return None
+    
+    seeds = {}
+    for key in s:
+        if s[key].has_key('seed'):
+            seeds[key] = s[key].pop('seed')
+    
+    keys = reducer.getMergedKeys()
+    if len(keys) > 0:
+        casalog.post("Computing the quantiles of %s keys found in several sub-MSs" % len(keys), "INFO")
+        try:
+            _mergeQuantiles(args, s, keys, seeds)
+        except Exception, instance:
+            casalog.post("Error merging the statistics of the sub-MSs: %s, processing the Multi-MS serially" 
+                         % instance, "WARN")
+            return None
+    
+    return s
+
+
+def _runSubMSs(args, reducer):
+    """
+    Run visstat2 with the given arguments on each sub-MS, and return the
+    result of the reducer, or None if a sub-MS failed.
+    """
+    
+    helper = ParallelTaskHelper('visstat2', args)
+    helper.setResultReducer(reducer)
+    helper.setAbortOnFailure(True)
+    ret = helper.go()
+    if helper._aborted or not isinstance(ret,dict):
+        return None
+    return ret
+
+
+def _medianRanks(npts):
+    n = int(round(npts))
+    if n % 2 == 1:
+        return [n / 2]
+    return [n / 2 - 1, n / 2]
+
+
+def _quantileRank(npts, quantile):
+    return int(numpy.ceil(quantile * int(round(npts)))) - 1
+
+
+def _mergeQuantiles(args, s, keys, seeds):
+    """
+    Compute the median, quartile (0.75 quantile) and median absolute
+    deviation from the median of the given keys of the merged statistics s,
+    with the conventions of ClassicalStatistics, without gathering the
+    values of the sub-MSs. The values of a key are partitioned into
+    intervals of their keys (see _toKeys) with the number of values of each
+    interval, starting from the bins of its seed histogram. Each pass over
+    the sub-MSs refines the intervals which may hold the median, the
+    quartile or the deviations at the median absolute deviation at the same
+    time, the latter while the median is only known to be in an interval,
+    until all of them are known exactly.
+    """
+    
+    partitions = {}
+    for key in keys:
+        if not seeds.has_key(key):
+            raise ValueError, "no seed histogram for %s" % key
+        partitions[key] = _seedPartition(seeds[key], SKETCH_SEED_BITS)
+        if numpy.sum(partitions[key][2]) != int(round(s[key]['npts'])):
+            raise ValueError, "inconsistent seed histogram for %s" % key
+    
+    npass = 0
+    while True:
+        windows = {}
+        for key in partitions.keys():
+            (quantiles, refine) = _resolveQuantiles(partitions[key], s[key]['npts'])
+            if quantiles is not None:
+                s[key].update(quantiles)
+                del partitions[key]
+                continue
+            (lo, hi, counts) = partitions[key]
+            windows[key] = {}
+            for i in refine:
+                nbins = SKETCH_BINS
+                if counts[i] <= SKETCH_VALUES:
+                    nbins = 0
+                windows[key][str(i)] = [_fromKey(lo[i]), _fromKey(hi[i]), nbins]
+        if len(windows) == 0:
+            break
         
+        npass += 1
+        if npass > SKETCH_PASSES:
+            raise ValueError, "quantile sketches not resolved after %s passes" % SKETCH_PASSES
+        args['sketchwindows'] = windows
+        sketches = _runSubMSs(args, DictionaryReducer({'min':'min', 'max':'max'}, taskname='visstat2'))
+        if sketches is None:
+            raise ValueError, "quantile sketches of the sub-MSs failed"
+        for key in windows:
+            partitions[key] = _refinePartition(partitions[key], windows[key], sketches[key])
+    
+    casalog.post("Quantiles of the sub-MSs merged in %s passes" % npass, "INFO")
+
+
+def _seedPartition(seed, bits):
+    """
+    Return the partition (lowest keys, highest keys, number of values) of
+    the values given by a seed histogram, see _quantileSketches.
+    """
+    
+    shift = 52 - bits
+    bins = sorted(seed.keys())
+    lo = numpy.array([ibin << shift for ibin in bins], dtype=numpy.uint64)
+    hi = numpy.array([((ibin + 1) << shift) - 1 for ibin in bins], dtype=numpy.uint64)
+    # The bins of the infinities extend over the keys of NaNs
+    lo = numpy.maximum(lo, numpy.uint64(_toKey(float('-inf'))))
+    hi = numpy.minimum(hi, numpy.uint64(_toKey(float('inf'))))
+    counts = numpy.array([seed[ibin] for ibin in bins], dtype=numpy.int64)
+    return (lo, hi, counts)
+
+
+def _resolveQuantiles(partition, npts):
+    """
+    Return the median, quartile and median absolute deviation from the
+    median given by a partition of the values, or None and the indices of
+    the intervals to refine to get them.
+    """
+    
+    (lo, hi, counts) = partition
+    cumulative = numpy.cumsum(counts)
+    def locate(rank):
+        return int(numpy.searchsorted(cumulative, rank, side='right'))
+    point = lo == hi
+    fromlo = _fromKeys(lo)
+    fromhi = _fromKeys(hi)
+    
+    medians = [locate(rank) for rank in _medianRanks(npts)]
+    quartile = locate(_quantileRank(npts, 0.75))
+    refine = set([i for i in medians + [quartile] if not point[i]])
+    
+    # The median is in [medianlo, medianhi], so the absolute deviation of
+    # the values of an interval from it is in [devmin, devmax]
+    medianlo = sum([fromlo[i] for i in medians]) / len(medians)
+    medianhi = sum([fromhi[i] for i in medians]) / len(medians)
+    devmin = numpy.maximum(numpy.maximum(fromlo - medianhi, medianlo - fromhi), 0.0)
+    devmax = numpy.maximum(fromhi - medianlo, medianhi - fromlo)
+    deviations = []
+    candidates = numpy.zeros(len(counts), dtype=bool)
+    for rank in _medianRanks(npts):
+        devlo = _rankBound(devmin, counts, rank)
+        devhi = _rankBound(devmax, counts, rank)
+        if devlo == devhi:
+            deviations.append(devlo)
+        else:
+            candidates |= (devmin <= devhi) & (devmax >= devlo)
+    candidates = numpy.flatnonzero(candidates & numpy.logical_not(point))
+    
+    if len(refine) == 0 and len(candidates) == 0:
+        return ({'median':float(medianlo), 'quartile':float(fromlo[quartile]),
+                 'medabsdevmed':float(sum(deviations) / len(deviations))}, [])
+    
+    # The intervals of the deviations with the most values first
+    candidates = candidates[numpy.argsort(-counts[candidates], kind='mergesort')]
+    for i in candidates[:max(SKETCH_WINDOWS - len(refine), 0)]:
+        refine.add(int(i))
+    return (None, sorted(refine))
+
+
+def _rankBound(bounds, counts, rank):
+    """
+    Return the bound of the value of given rank, given bounds of the values
+    of the intervals of a partition.
+    """
+    
+    order = numpy.argsort(bounds, kind='mergesort')
+    cumulative = numpy.cumsum(counts[order])
+    return bounds[order[numpy.searchsorted(cumulative, rank, side='right')]]
+
+
+def _refinePartition(partition, windows, sketches):
+    """
+    Return the partition of the values with the intervals of the windows
+    replaced by the ones given by their sketches.
+    """
+    
+    (lo, hi, counts) = partition
+    refined = {}
+    for (wid, window) in windows.items():
+        i = int(wid)
+        sketch = sketches[wid]
+        if sketch.has_key('values'):
+            keys = sorted(sketch['values'].keys())
+            newlo = numpy.array(keys, dtype=numpy.uint64)
+            newhi = newlo
+            newcounts = numpy.array([sketch['values'][key] for key in keys], dtype=numpy.int64)
+        else:
+            width = _binWidth(lo[i], hi[i], window[2])
+            bins = [int(ibin) for ibin in numpy.flatnonzero(sketch['counts'])]
+            newlo = [int(lo[i]) + ibin * width for ibin in bins]
+            newhi = [min(int(lo[i]) + (ibin + 1) * width - 1, int(hi[i])) for ibin in bins]
+            if len(bins) > 0:
+                newlo[0] = max(newlo[0], sketch['min'])
+                newhi[-1] = min(newhi[-1], sketch['max'])
+            newlo = numpy.array(newlo, dtype=numpy.uint64)
+            newhi = numpy.array(newhi, dtype=numpy.uint64)
+            newcounts = numpy.array([sketch['counts'][ibin] for ibin in bins], dtype=numpy.int64)
+        if numpy.sum(newcounts) != counts[i]:
+            raise ValueError, "inconsistent quantile sketches"
+        refined[i] = (newlo, newhi, newcounts)
+    
+    parts = []
+    start = 0
+    for i in sorted(refined.keys()):
+        parts.append((lo[start:i], hi[start:i], counts[start:i]))
+        parts.append(refined[i])
+        start = i + 1
+    parts.append((lo[start:], hi[start:], counts[start:]))
+    return tuple([numpy.concatenate([part[j] for part in parts]) for j in range(3)])
+
+
+def _quantileSketches(vis, column, complex_value, useflags, reportingaxes, selection, windows):
+    """
+    Compute the quantile sketches of the values of a MS in the given windows,
+    indexed by statistics key and window id, the windows of key '*' applying
+    to all the keys. The sketch of a window [lo, hi, nbins] is the histogram
+    of the keys (see _toKeys) of the values in [lo, hi] in nbins bins of
+    equal width with their lowest and highest key, or if nbins is 0 the
+    number of occurrences of each key. The sketch of a window [bits] is the
+    seed histogram of all the values, whose bins keep the sign, exponent and
+    bits first bits of the mantissa of the values. The sketches of the
+    sub-MSs of a Multi-MS are merged by adding them.
+    """
+    
+    item = _sketchItem(column, complex_value)
+    axes = _sketchAxes(reportingaxes)
+    
+    sketches = {}
+    for key in windows:
+        if key != '*':
+            sketches[key] = _newSketches(windows[key])
+    
+    mslocal = mstool()
+    mslocal.open(vis)
+    try:
+        if len(selection) > 0 and not mslocal.msselect(selection):
+            return {}
+        mslocal.iterinit(maxrows=SKETCH_ROWS)
+        mslocal.iterorigin()
+        more = True
+        while more:
+            chunk = mslocal.getdata([item, 'flag', 'time', 'interval'] + [axis[1] for axis in axes],
+                                    ifraxis=False)
+            rowkeys = _rowKeys(axes, chunk)
+            for key in set(rowkeys):
+                keywindows = windows.get(key, windows.get('*'))
+                if keywindows is None:
+                    continue
+                if not sketches.has_key(key):
+                    sketches[key] = _newSketches(keywindows)
+                rows = rowkeys == key
+                data = _sketchValues(chunk[item][:,:,rows], complex_value)
+                if useflags:
+                    data = data[numpy.logical_not(chunk['flag'][:,:,rows])]
+                else:
+                    data = data.ravel()
+                keys = _toKeys(data)
+                for (wid, window) in keywindows.items():
+                    _addToSketch(sketches[key][wid], keys, window)
+            more = mslocal.iternext()
+    finally:
+        mslocal.close()
+        
+    return sketches
+
+
+def _selection(spw, field, antenna, uvrange, timerange, correlation, scan, intent, array, observation):
+    """
+    Return the ms.msselect items of the data selection of statistics2.
+    """
+    
+    if isinstance(intent,list):
+        intent = ','.join([str(item) for item in intent])
+    items = {'spw':spw, 'field':field, 'baseline':antenna, 'uvdist':uvrange, 'time':timerange,
+             'polarization':correlation, 'scan':scan, 'scanintent':str(intent), 'array':array,
+             'observation':str(observation)}
+    return dict([(key, items[key]) for key in items if items[key] not in [None, '']])
+
+
+def _sketchItem(column, complex_value):
+    """
+    Return the ms.getdata item of the column, or None if the quantile
+    sketches do not support it.
+    """
+    
+    name = column.upper().split('_DATA')[0]
+    if not SKETCH_COLUMNS.has_key(name):
+        return None
+    if name != 'FLOAT' and complex_value not in ['amp', 'amplitude', 'phase', 'imag', 'imaginary', 'real']:
+        return None
+    return SKETCH_COLUMNS[name]
+
+
+def _sketchAxes(reportingaxes):
+    """
+    Return the (key name, ms.getdata item) of the reporting axes in the order
+    of the statistics keys, or None if the quantile sketches do not support
+    one of them. Unknown axes are ignored, as in statistics2.
+    """
+    
+    axes = []
+    for axis in str(reportingaxes).split(','):
+        if axis == 'subscan':
+            return None
+        if SKETCH_AXES.has_key(axis):
+            axes.append(SKETCH_AXES[axis])
+    return axes
+
+
+def _rowKeys(axes, chunk):
+    """
+    Return the statistics key of each row of a chunk of ms.getdata.
+    """
+    
+    columns = []
+    for (name, item) in axes:
+        if name == 'TIME':
+            # Start of the integration, formatted as std::to_string
+            values = ['%f' % value for value in chunk['time'] - chunk['interval'] / 2]
+        else:
+            values = ['%d' % value for value in chunk[item]]
+        columns.append(['%s=%s' % (name, value) for value in values])
+    if len(columns) == 0:
+        return numpy.array([''] * chunk['flag'].shape[-1])
+    return numpy.array([','.join(key) for key in zip(*columns)])
+
+
+def _sketchValues(data, complex_value):
+    if numpy.iscomplexobj(data):
+        if complex_value in ['amp', 'amplitude']:
+            data = numpy.abs(data)
+        elif complex_value == 'phase':
+            data = numpy.angle(data)
+        elif complex_value in ['imag', 'imaginary']:
+            data = data.imag
+        else:
+            data = data.real
+    return numpy.asarray(data, dtype=numpy.float64)
+
+
+def _toKeys(values):
+    """
+    Return the keys of values: unsigned integers in the same order as the
+    values, whose bits are the ones of the values with the sign bit set for
+    positive values, and all the bits flipped for negative values.
+    """
+    
+    bits = numpy.ascontiguousarray(values, dtype=numpy.float64).view(numpy.uint64)
+    sign = numpy.uint64(1 << 63)
+    return numpy.where(bits & sign != 0, ~bits, bits | sign)
+
+
+def _fromKeys(keys):
+    sign = numpy.uint64(1 << 63)
+    keys = numpy.asarray(keys, dtype=numpy.uint64)
+    return numpy.ascontiguousarray(numpy.where(keys & sign != 0, keys ^ sign, ~keys)).view(numpy.float64)
+
+
+def _toKey(value):
+    return int(_toKeys(numpy.array([value]))[0])
+
+
+def _fromKey(key):
+    return float(_fromKeys(numpy.array([key], dtype=numpy.uint64))[0])
+
+
+def _binWidth(lo, hi, nbins):
+    return (int(hi) - int(lo)) / nbins + 1
+
+
+def _newSketches(windows):
+    sketches = {}
+    for (wid, window) in windows.items():
+        if len(window) == 1:
+            sketches[wid] = {'bins':{}}
+        elif window[2] > 0:
+            sketches[wid] = {'counts':numpy.zeros(window[2], dtype=numpy.int64),
+                             'min':1 << 64, 'max':-1}
+        else:
+            sketches[wid] = {'values':{}}
+    return sketches
+
+
+def _addToSketch(sketch, keys, window):
+    if len(window) == 1:
+        _addOccurrences(sketch['bins'], keys >> numpy.uint64(52 - window[0]))
+        return
+    
+    lo, hi, nbins = _toKey(window[0]), _toKey(window[1]), window[2]
+    keys = keys[numpy.logical_and(keys >= numpy.uint64(lo), keys <= numpy.uint64(hi))]
+    if len(keys) == 0:
+        return
+    if nbins > 0:
+        bins = (keys - numpy.uint64(lo)) // numpy.uint64(_binWidth(lo, hi, nbins))
+        sketch['counts'] += numpy.bincount(bins.astype(numpy.int64), minlength=nbins)
+        sketch['min'] = min(sketch['min'], int(keys.min()))
+        sketch['max'] = max(sketch['max'], int(keys.max()))
+    else:
+        _addOccurrences(sketch['values'], keys)
+
 
+def _addOccurrences(occurrences, keys):
+    keys = numpy.sort(keys)
+    first = numpy.flatnonzero(numpy.concatenate(([True], keys[1:] != keys[:-1])))
+    counts = numpy.diff(numpy.append(first, len(keys)))
+    for (key, count) in zip(keys[first], counts):
+        key = int(key)
+        occurrences[key] = occurrences.get(key, 0) + int(count)
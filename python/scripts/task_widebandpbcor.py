@@ -240,7 +240,6 @@ def _calcTaylorFromCube(imtemplate="",reffreq='1.42GHz',cubename="sim.pb",newtay
        os.system(cpcmd)
 
    ia.open(cubename);
-   pbcube = ia.getchunk();
    csys = ia.coordsys();
    shp = ia.shape();
    ia.close();
@@ -279,81 +278,59 @@ def _calcTaylorFromCube(imtemplate="",reffreq='1.42GHz',cubename="sim.pb",newtay
      casalog.post('Cannot handle more than 5 terms for PB computation','SEVERE')
      return False;
    ptays=[];
-   if(nterms>0):
-     ia.open(newtay[0]);
-     ptays.append( ia.getchunk() );
-     ptays[0].fill(0.0);
-     ia.close();
-     pstart=[0.0];
-   if(nterms>1):
-     ia.open(newtay[1]);
-     ptays.append( ia.getchunk() );
-     ptays[1].fill(0.0);
-     ia.close();
-     pstart=[0.0,0.0];
-   if(nterms>2):
-     ia.open(newtay[2]);
-     ptays.append( ia.getchunk() );
-     ptays[2].fill(0.0);
-     ia.close();
-     pstart=[0.0,0.0,0.0];
-   if(nterms>3):
-     ia.open(newtay[3]);
-     ptays.append( ia.getchunk() );
-     ptays[3].fill(0.0);
-     ia.close();
-     pstart=[0.0,0.0,0.0,0.0];
-   if(nterms>4):
-     ia.open(newtay[4]);
-     ptays.append( ia.getchunk() );
-     ptays[4].fill(0.0);
+   for tt in range(0,nterms):
+     ia.open(newtay[tt]);
+     ptays.append( np.zeros( ia.shape() ) );
      ia.close();
-     pstart=[0.0,0.0,0.0,0.0,0.0];
    
    ##### Fit a nterms-term polynomial to each point !!!
   
-   # Linear fit
-   ptays=_linfit(ptays, freqs, pbcube[:,:,0,:], weightarr, pbthreshold);
+   # Linear fit (reading the PB cube in blocks of rows)
+   ptays=_linfit(ptays, freqs, cubename, weightarr, pbthreshold);
 
    # Set all values below the pbthreshold, to zero
    for tt in range(0,nterms):
        ptays[tt][ ptays[0]<pbthreshold  ] = 0.0
 
    # Write to disk.
-   if(nterms>0):
-     ia.open(newtay[0]);
-     ia.putchunk(ptays[0]);
-     ia.close();
-   if(nterms>1):
-     ia.open(newtay[1]);
-     ia.putchunk(ptays[1]);
-     ia.close();
-   if(nterms>2):
-     ia.open(newtay[2]);
-     ia.putchunk(ptays[2]);
-     ia.close();
-   if(nterms>3):
-     ia.open(newtay[3]);
-     ia.putchunk(ptays[3]);
-     ia.close();
-   if(nterms>4):
-     ia.open(newtay[4]);
-     ia.putchunk(ptays[4]);
+   for tt in range(0,nterms):
+     ia.open(newtay[tt]);
+     ia.putchunk(ptays[tt]);
      ia.close();
 
  ####################################################
+# Maximum size of the blocks of rows read and processed at once
+_maxblockbytes = 256*1024*1024
+
+def _blockrows(rowbytes):
+  # number of rows in a block, at least one
+  return max(1, int(_maxblockbytes // max(1,rowbytes)));
+
 def _linfit(ptays, freqs, pcube, wts, pbthresh):
+  """
+  Fit the PB spectrum of each pixel by a polynomial in freqs, and set the
+  coefficients in the ptays images. pcube is either an array with shape
+  (x, y, freq) or the name of the PB cube image (x, y, stokes, freq). The
+  pixels are fit by blocks of rows, as one matrix product of the inverse
+  Hessian and the Taylor-weighted sums of all the pixels of the block.
+  The cube image is read one block of rows at a time.
+  """
   #print 'Calculating PB Taylor Coefficients by applying Inv Hessian to Taylor-weighted sums'
   nterms=len(ptays);
   hess = np.zeros( (nterms,nterms) );
-  rhs = np.zeros( (nterms,1) );
-  soln = np.zeros( (nterms,1) );
   shp = ptays[0].shape;
-  if(len(freqs) != pcube.shape[2]):
-      casalog.post('Mismatch in frequency axes : '+ len(freqs)+ ' and ' + pcube.shape[2] , 'SEVERE');
+  if isinstance(pcube, str):
+      ia.open(pcube);
+      pshp = ia.shape();
+      ia.close();
+      nfreqs = pshp[3];
+  else:
+      nfreqs = pcube.shape[2];
+  if(len(freqs) != nfreqs):
+      casalog.post('Mismatch in frequency axes : '+ str(len(freqs))+ ' and ' + str(nfreqs) , 'SEVERE');
       return ptays;
   if(len(freqs) != len(wts)):
-      casalog.post('Mismatch in lengths of freqs : '+ len(freqs)+ ' and wts : '+ len(wts) , 'SEVERE');
+      casalog.post('Mismatch in lengths of freqs : '+ str(len(freqs))+ ' and wts : '+ str(len(wts)) , 'SEVERE');
       return ptays;
   
   for ii in range(0,nterms):
@@ -368,17 +345,33 @@ def _linfit(ptays, freqs, pcube, wts, pbthresh):
   casalog.post('Inv Hess : ' + str(invhess), 'NORMAL')
 
   casalog.post('Calculating Taylor-coefficients for the PB spectrum', 'NORMAL')
-  
-  for x in range(0,shp[0]):
-    for y in range(0,shp[1]):
-       if pcube[x,y,0] > pbthresh: # Calculate coeffs only where the largest beam is above thresh
-           for ii in range(0,nterms):
-               rhs[ii,0]=np.mean( (freqs**(ii)) * pcube[x,y,:] * wts)/normval;
-           soln = np.dot(invhess,rhs);
-           for ii in range(0,nterms):
-               ptays[ii][x,y]=soln[ii,0];
-    if(x%100 == 0):
-       casalog.post('--- finished rows '+str(x)+ ' to '+ str(x+99), 'NORMAL');
+
+  # Taylor weights of each frequency, the rhs of all the pixels of
+  # a block being the product of the weighted PB spectra with taylorwts
+  taylorwts = np.zeros( (nfreqs,nterms) );
+  for ii in range(0,nterms):
+      taylorwts[:,ii] = (freqs**(ii)) * wts / nfreqs / normval;
+  # the transposed solutions of all the pixels of a block
+  invhessT = invhess.transpose();
+
+  nrows = _blockrows( 4 * shp[1] * nfreqs * 8 );
+  for x0 in range(0,shp[0],nrows):
+    x1 = min(x0+nrows, shp[0]);
+    if isinstance(pcube, str):
+        ia.open(pcube);
+        pblock = ia.getchunk(blc=[x0,0,0,0], trc=[x1-1,shp[1]-1,0,nfreqs-1])[:,:,0,:];
+        ia.close();
+    else:
+        pblock = pcube[x0:x1];
+    # Calculate coeffs only where the largest beam is above thresh
+    sel = pblock[:,:,0] > pbthresh;
+    rhs = np.dot( pblock[sel], taylorwts );
+    soln = np.dot( rhs, invhessT );
+    for ii in range(0,nterms):
+        ptayrows = ptays[ii][x0:x1];
+        ptayrows[sel] = soln[:,ii].reshape( (-1,) + (1,)*(ptayrows.ndim-2) );
+    del pblock, rhs, soln
+    casalog.post('--- finished rows '+str(x0)+ ' to '+ str(x1-1), 'NORMAL');
 
   return ptays;  
 
@@ -507,80 +500,75 @@ def  _compute_alpha_beta(imagename, nterms, taylorlist, residuallist, threshold,
      cpcmd = 'cp -r ' + imtemplate + ' ' + namebeta;
      os.system(cpcmd);
 
-   ## Open and read the images to compute alpha/beta with
-   ptay=[];
-   for i in range(0,nterms):
-       ia.open(taylorlist[i]);
-       ptay.append(ia.getchunk());
-       ia.close();
-
-   ## If calc error, open residual images too
+   ## Compute alpha/beta (and error) by blocks of rows of the images
+   ia.open(taylorlist[0]);
+   shp = ia.shape();
+   ia.close();
+   nimages = nterms;
    if(calcerror==True):
-       pres=[];
+       nimages = 2*nterms;
+   nrows = _blockrows( (nimages+3) * int(np.prod(shp[1:])) * 8 );
+   for x0 in range(0,shp[0],nrows):
+       x1 = min(x0+nrows, shp[0]);
+       blc = [x0] + [0]*(len(shp)-1);
+       trc = [x1-1] + [n-1 for n in shp[1:]];
+
+       ## Open and read the images to compute alpha/beta with
+       ptay=[];
        for i in range(0,nterms):
-          ia.open(residuallist[i]);
-          pres.append(ia.getchunk());
+           ia.open(taylorlist[i]);
+           ptay.append(ia.getchunk(blc=blc,trc=trc));
+           ia.close();
+
+       ## If calc error, open residual images too
+       if(calcerror==True):
+           pres=[];
+           for i in range(0,nterms):
+              ia.open(residuallist[i]);
+              pres.append(ia.getchunk(blc=blc,trc=trc));
+              ia.close();
+
+       ## Calc alpha,beta from ptay0,ptay1,ptay2
+       ptay[0][ptay[0]<1e-06]=1.0;
+       ptay[0][ptay[0]<threshold]=1.0;
+       ptay[1][ptay[0]<threshold]=0.0;
+       if(nterms>2):
+          ptay[2][ptay[0]<threshold]=0.0;
+
+       alpha = ptay[1]/ptay[0];
+
+       if(nterms>2):
+          beta = (ptay[2]/ptay[0]) - 0.5*alpha*(alpha-1);
+
+       ia.open(namealpha);
+       ia.putchunk(alpha,blc=blc);
+       ia.close();
+       if(nterms>2):
+         ia.open(namebeta);
+         ia.putchunk(beta,blc=blc);
+         ia.close();
+
+       # calc error
+       if(calcerror):
+          pres[1][ptay[1]==0.0]=0.0
+          ptay[1][pres[1]==0.0]=1.0
+
+          aerror =  np.abs(alpha) * np.sqrt( (pres[0]/ptay[0])**2 + (pres[1]/ptay[1])**2 );
+          ia.open(nameerror);
+          ia.putchunk(aerror,blc=blc);
           ia.close();
 
-   ## Initialize arrays of empty images
-   #ia.open(nameintensity);
-   #intensity = ia.getchunk();
-   #intensity.fill(0.0);
-   #ia.close();
    ia.open(namealpha);
-   alpha = ia.getchunk();
-   alpha.fill(0.0);
-   ia.close();
-   if(calcerror):
-     ia.open(nameerror);
-     aerror = ia.getchunk();
-     aerror.fill(0.0);
-     ia.close();
-   if(nterms>2):
-     ia.open(namebeta);
-     beta = ia.getchunk();
-     beta.fill(0.0);
-     ia.close();
-
-
-   ## Calc alpha,beta from ptay0,ptay1,ptay2
-   #intensity = ptay[0];
-   #ia.open(nameintensity);
-   #ia.putchunk(intensity);
-   #ia.close();
-
-   ptay[0][ptay[0]<1e-06]=1.0;
-   ptay[0][ptay[0]<threshold]=1.0;
-   ptay[1][ptay[0]<threshold]=0.0;
-   if(nterms>2):
-      ptay[2][ptay[0]<threshold]=0.0;
-
-   alpha = ptay[1]/ptay[0];
-
-   if(nterms>2):
-      beta = (ptay[2]/ptay[0]) - 0.5*alpha*(alpha-1);
-
-   ia.open(namealpha);
-   ia.putchunk(alpha);
    ia.calcmask(mask='"'+nameintensity+'"'+'>'+str(threshold));
    ia.setbrightnessunit('')
    ia.close();
    if(nterms>2):
      ia.open(namebeta);
-     ia.putchunk(beta);
      ia.calcmask(mask='"'+nameintensity+'"'+'>'+str(threshold));
      ia.setbrightnessunit('')
      ia.close();
-
-   # calc error
    if(calcerror):
-
-      pres[1][ptay[1]==0.0]=0.0
-      ptay[1][pres[1]==0.0]=1.0
-
-      aerror =  np.abs(alpha) * np.sqrt( (pres[0]/ptay[0])**2 + (pres[1]/ptay[1])**2 );
       ia.open(nameerror);
-      ia.putchunk(aerror);
       ia.calcmask(mask='"'+nameintensity+'"'+'>'+str(threshold));
       ia.setbrightnessunit('')
       ia.close();
@@ -86,13 +86,13 @@ else:
         ####
         #### needed to allow pushing of the global 'casa' state dictionary
         ####
-        a=inspect.stack()
-        stacklevel=0
-        for k in range(len(a)):
-            if a[k][1] == "<string>":
-                stacklevel=k
-
-        myf=sys._getframe(stacklevel).f_globals
+        # Walk the frames w/o inspect.stack, which reads the source context of each one
+        frame=sys._getframe(0)
+        myf=frame.f_globals
+        while frame is not None:
+            if frame.f_code.co_filename == "<string>":
+                myf=frame.f_globals
+            frame=frame.f_back
 
         if myf.has_key('casa') and myf['casa'].has_key('files') and myf['casa']['files'].has_key('logfile') :
             logger.setlogfile(myf['casa']['files']['logfile'])
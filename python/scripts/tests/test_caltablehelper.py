@@ -0,0 +1,131 @@
+import os
+import shutil
+import time
+import numpy as np
+from taskinit import casalog, tbtool
+from caltablehelper import getcellcolumn, CalTableData
+import unittest
+
+'''
+Unit tests of the bulk column reads of calibration tables (caltablehelper),
+used by plotbandpass.
+'''
+
+datapath = os.environ.get('CASAPATH').split()[0] +\
+                            '/data/regression/unittest/bandpass/'
+
+class test_base(unittest.TestCase):
+
+    def setUp(self):
+        self.caltable = 'ngc5921.ref1a.bcal'
+        if os.path.exists(self.caltable):
+            shutil.rmtree(self.caltable)
+        fpath = os.path.join(datapath,self.caltable)
+        if os.path.lexists(fpath):
+            shutil.copytree(fpath, self.caltable)
+        else:
+            self.fail('Data does not exist -> '+fpath)
+
+    def tearDown(self):
+        shutil.rmtree(self.caltable, ignore_errors=True)
+
+    def getcells(self, table, colname):
+        mytb = tbtool()
+        mytb.open(table)
+        cells = [mytb.getcell(colname,row) for row in range(mytb.nrows())]
+        mytb.close()
+        return cells
+
+
+class test_getcellcolumn(test_base):
+
+    def test_same_as_getcell(self):
+        '''caltablehelper: getcellcolumn returns the same cells as getcell'''
+        mytb = tbtool()
+        mytb.open(self.caltable)
+        for colname in ['CPARAM','FLAG']:
+            cells = getcellcolumn(mytb, colname, 'SPECTRAL_WINDOW_ID')
+            reference = self.getcells(self.caltable, colname)
+            self.assertEqual(len(cells), len(reference))
+            for (cell, ref) in zip(cells, reference):
+                self.assertEqual(cell.shape, ref.shape)
+                self.assertTrue(np.all(cell == ref))
+        mytb.close()
+
+    def test_chunked_by_spw(self):
+        '''caltablehelper: Rows of varying shapes are read by spw'''
+        # Keep a different number of channels in each half of the table
+        mytb = tbtool()
+        mytb.open(self.caltable)
+        nrows = mytb.nrows()
+        flags = [mytb.getcell('FLAG',row) for row in range(nrows)]
+        mytb.close()
+
+        mytb.open(self.caltable, nomodify=False)
+        mytb.removecols('FLAG')
+        desc = {'FLAG': {'valueType': 'boolean', 'ndim': 2, 'option': 0,
+                         'dataManagerType': 'StandardStMan', 'comment': ''}}
+        mytb.addcols(desc)
+        mytb.putcol('SPECTRAL_WINDOW_ID', np.arange(nrows) % 2)
+        for row in range(nrows):
+            if row % 2:
+                mytb.putcell('FLAG', row, flags[row][:,:1])
+            else:
+                mytb.putcell('FLAG', row, flags[row])
+        mytb.close()
+
+        reference = self.getcells(self.caltable, 'FLAG')
+        mytb.open(self.caltable)
+        cells = getcellcolumn(mytb, 'FLAG', 'SPECTRAL_WINDOW_ID')
+        varcells = getcellcolumn(mytb, 'FLAG')
+        mytb.close()
+        for (cell, varcell, ref) in zip(cells, varcells, reference):
+            self.assertEqual(cell.shape, ref.shape)
+            self.assertTrue(np.all(cell == ref))
+            self.assertEqual(varcell.shape, ref.shape)
+            self.assertTrue(np.all(varcell == ref))
+
+    def test_caltabledata(self):
+        '''caltablehelper: CalTableData gives the cells by (antenna, spw, time)'''
+        caldata = CalTableData(self.caltable, ['CPARAM','FLAG'])
+        reference = self.getcells(self.caltable, 'CPARAM')
+        self.assertEqual(caldata.nrows, len(reference))
+        for row in range(caldata.nrows):
+            antenna = caldata.antenna[row]
+            spw = caldata.spw[row]
+            time = caldata.time[row]
+            self.assertEqual(caldata.getrow(antenna, spw, time), row)
+            self.assertTrue(np.all(caldata.getcell('CPARAM', antenna, spw, time) == reference[row]))
+        self.assertEqual(caldata.getrow(-1, 0, 0.0), None)
+
+        antenna = caldata.antenna[0]
+        spw = caldata.spw[0]
+        times = caldata.gettimes(antenna, spw)
+        self.assertTrue(np.all(np.diff(times) >= 0))
+        column = caldata.getcolumn('CPARAM', antenna, spw)
+        self.assertEqual(column.shape, (len(times),)+reference[0].shape)
+
+
+class test_getcellcolumn_benchmark(test_base):
+
+    def test_read_time(self):
+        '''caltablehelper: Time to read the FLAG column with getcell and getcellcolumn'''
+        start = time.time()
+        reference = self.getcells(self.caltable, 'FLAG')
+        getcell_time = time.time() - start
+
+        mytb = tbtool()
+        mytb.open(self.caltable)
+        start = time.time()
+        cells = getcellcolumn(mytb, 'FLAG', 'SPECTRAL_WINDOW_ID')
+        getcellcolumn_time = time.time() - start
+        mytb.close()
+
+        casalog.post("FLAG column read time: getcell %.3f s, getcellcolumn %.3f s" % (getcell_time,getcellcolumn_time),
+                     "INFO", "test_read_time")
+        self.assertEqual(len(cells), len(reference))
+
+
+def suite():
+    return [test_getcellcolumn,
+            test_getcellcolumn_benchmark]
@@ -0,0 +1,73 @@
+import time
+import unittest
+from __main__ import default
+from taskinit import casalog
+from casa_stack_manip import stack_find, stack_frame_find, find_casa
+
+'''
+Unit tests of the CASA top frame lookup (casa_stack_manip), used by taskinit,
+init_tasks and the task wrappers to access the CASA global dictionaries.
+'''
+
+class test_stack_find(unittest.TestCase):
+
+    def _nested_stack_find(self, depth, symbol, level='stack'):
+        if depth == 0:
+            return stack_find(symbol, level)
+        return self._nested_stack_find(depth-1, symbol, level)
+
+    def test_find_casa(self):
+        '''casa_stack_manip: The casa dictionary is found in the CASA top frame'''
+        casa = find_casa()
+        self.assertTrue(casa is not None)
+        self.assertTrue(casa.has_key('state'))
+        self.assertTrue(self._nested_stack_find(20, 'casa') is casa)
+
+    def test_stack_frame_find(self):
+        '''casa_stack_manip: The CASA top frame globals are returned'''
+        myf = stack_frame_find()
+        self.assertTrue(myf is not None)
+        self.assertTrue(myf.has_key('_casa_top_frame_'))
+        self.assertTrue(myf['casa'] is find_casa())
+
+    def test_missing_symbol(self):
+        '''casa_stack_manip: None is returned for undefined symbols'''
+        self.assertEqual(stack_find('__casa_stack_manip_undefined_symbol__'), None)
+
+    def test_unknown_level(self):
+        '''casa_stack_manip: An unknown stack level raises RuntimeError'''
+        self.assertRaises(RuntimeError, stack_find, 'casa', 'unknown')
+        self.assertRaises(RuntimeError, stack_frame_find, 'unknown')
+
+
+class test_stack_find_benchmark(unittest.TestCase):
+
+    def test_stack_find_latency(self):
+        '''casa_stack_manip: Latency of the top frame lookup'''
+        nlookups = 1000
+        start = time.time()
+        for i in xrange(nlookups):
+            casa = stack_find('casa')
+        latency = (time.time() - start) / nlookups
+        casalog.post("stack_find latency: %.2f us" % (latency*1e6), "INFO", "test_stack_find_latency")
+        self.assertTrue(casa is find_casa())
+
+    def test_taskinit_import_time(self):
+        '''casa_stack_manip: Time to import taskinit and to run the first task'''
+        import taskinit
+        start = time.time()
+        reload(taskinit)
+        import_time = time.time() - start
+
+        start = time.time()
+        default('flagdata')
+        first_task_time = time.time() - start
+
+        casalog.post("taskinit import time: %.3f s, first task (default) time: %.3f s" % (import_time,first_task_time),
+                     "INFO", "test_taskinit_import_time")
+        self.assertTrue(hasattr(taskinit, 'casalog'))
+
+
+def suite():
+    return [test_stack_find,
+            test_stack_find_benchmark]
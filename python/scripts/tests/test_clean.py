@@ -2,10 +2,12 @@ import os
 import sys
 import shutil
 import commands
+import time
 import numpy
 from __main__ import default
 from tasks import *
 from taskinit import *
+from parallel.parallel_task_helper import ParallelTaskHelper
 import unittest
 
 _ia = iatool( )
@@ -434,6 +436,24 @@ class clean_test1(unittest.TestCase):
         self.res = clean(vis=self.msfile, imagename=self.img + '2',
                          selectdata=True, observation='2', niter=10)
         self.assertFalse(os.path.exists(self.img + '2.image'))
+
+    def test47(self):
+        """Clean 47: Test chaniter=T clean of blocks of channels in parallel processes"""
+        flagdata(vis=self.msfile,mode='manualflag',spw='0:0~0')
+        self.res=clean(vis=self.msfile,imagename=self.img+'.serial',mode='channel',chaniter=True,
+                       spw='0',niter=10,imagermode='')
+        self.assertEqual(self.res, None)
+        ParallelTaskHelper.setLocalWorkers(2)
+        try:
+            self.res=clean(vis=self.msfile,imagename=self.img+'.parallel',mode='channel',chaniter=True,
+                           spw='0',niter=10,imagermode='')
+        finally:
+            ParallelTaskHelper.setLocalWorkers(1)
+        self.assertEqual(self.res, None)
+        for ext in ['.image','.model','.residual','.psf']:
+            self.assertTrue(self.compareimages(self.img+'.parallel'+ext, self.img+'.serial'+ext),
+                            "%s differs between serial and parallel chaniter=T clean" % ext)
+        self.assertFalse(os.path.exists('_tmpimdir0'))
         
      
 class clean_test2(unittest.TestCase):
@@ -1030,7 +1050,50 @@ class clean_multims_test(unittest.TestCase):
         shutil.rmtree(self.mask)
         
 
+class clean_benchmark(unittest.TestCase):
+    
+    # Input and output names
+    msfile = 'ngc7538_ut1.ms'
+    res = None
+    img = 'cleanbenchmark'
+
+    def setUp(self):
+        self.res = None
+        default(clean)
+        if (os.path.exists(self.msfile)):
+            os.system('rm -rf ' + self.msfile)
+            
+        datapath = os.environ.get('CASAPATH').split()[0] + '/data/regression/unittest/clean/'
+        shutil.copytree(datapath+self.msfile, self.msfile)
+    
+    def tearDown(self):
+        if (os.path.exists(self.msfile)):
+            os.system('rm -rf ' + self.msfile)
+
+        os.system('rm -rf ' + self.img+'*')
+        
+    def test_chaniter_workers(self):
+        """Clean benchmark: Time of chaniter=T clean with 1, 2 and 4 local workers"""
+        elapsed={}
+        for nworkers in [1,2,4]:
+            ParallelTaskHelper.setLocalWorkers(nworkers)
+            try:
+                start=time.time()
+                self.res=clean(vis=self.msfile,imagename=self.img+'.workers'+str(nworkers),mode='channel',
+                               chaniter=True,niter=10,imagermode='')
+                elapsed[nworkers]=time.time()-start
+            finally:
+                ParallelTaskHelper.setLocalWorkers(1)
+            self.assertEqual(self.res, None)
+        casalog.post("chaniter=T clean time with 1, 2, 4 workers: %.2f s, %.2f s, %.2f s"
+                     % (elapsed[1],elapsed[2],elapsed[4]), "INFO", "test_chaniter_workers")
+
+
 def suite():
     #return [clean_test1]
     return [clean_test1,clean_multifield_test,clean_multims_test,clean_multiterm_multifield_test]
 
+def benchmark():
+    # Not in the default suite, run e.g. with
+    # python -m unittest test_clean.clean_benchmark
+    return [clean_benchmark]
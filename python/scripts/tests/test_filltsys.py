@@ -0,0 +1,88 @@
+import numpy as np
+import filltsys
+import unittest
+
+'''
+Unit tests of the Tsys interpolation of filltsys, which interpolates the
+Tsys of all the rows of a chunk at once.
+'''
+
+def interpolate_rows(caltime, atsys, times):
+    # Tsys of each row, one row at a time as filled before
+    nscan = len(caltime)
+    ret = []
+    cleat = 0
+    for t in times:
+        if t < caltime[0]:
+            tsys = atsys[0]
+        elif t > caltime[nscan-1]:
+            tsys = atsys[nscan-1]
+        else:
+            # minimum index that satisfies caltime[idx] >= t,
+            # searched from the previous row
+            idx = min(nscan-1, cleat)
+            if caltime[idx] > t:
+                idx = 0
+            while caltime[idx] < t:
+                idx += 1
+            cleat = max(0, idx-1)
+            if caltime[idx] == t:
+                tsys = atsys[idx]
+            else:
+                tsys = filltsys.interpolateInTime(caltime[idx-1], atsys[idx-1],
+                                                  caltime[idx], atsys[idx], t)
+        ret.append(tsys)
+    return np.array(ret)
+
+
+class test_interpolateTsysInTime(unittest.TestCase):
+
+    def setUp(self):
+        self.caltime = np.array([100.0, 200.0, 250.0, 400.0])
+        self.atsys = np.array([[50.0, 60.0, 70.0],
+                               [55.0, 80.0, 90.0],
+                               [65.0, 70.0, 60.0],
+                               [40.0, 45.0, 50.0]])
+
+    def assertSameTsys(self, caltime, atsys, times):
+        tsys = filltsys.interpolateTsysInTime(caltime, atsys, times)
+        ref = interpolate_rows(caltime, atsys, times)
+        self.assertEqual(tsys.shape, ref.shape)
+        self.assertTrue(np.allclose(tsys, ref, rtol=1.0e-12, atol=0.0))
+
+    def test_bracketing(self):
+        '''filltsys: rows before, after, at and between the Tsys scans'''
+        times = np.array([10.0, 99.9, 100.0, 150.0, 200.0, 225.0, 250.0,
+                          399.0, 400.0, 400.1, 1000.0])
+        self.assertSameTsys(self.caltime, self.atsys, times)
+
+        tsys = filltsys.interpolateTsysInTime(self.caltime, self.atsys, times)
+        self.assertTrue(np.all(tsys[0] == self.atsys[0]))
+        self.assertTrue(np.all(tsys[4] == self.atsys[1]))
+        self.assertTrue(np.all(tsys[-1] == self.atsys[-1]))
+        self.assertTrue(np.allclose(tsys[3], (self.atsys[0] + self.atsys[1]) / 2))
+
+    def test_unordered_rows(self):
+        '''filltsys: rows whose time stamps are not in ascending order'''
+        times = np.array([300.0, 120.0, 400.0, 250.0, 50.0, 260.0, 100.0, 500.0, 210.0])
+        self.assertSameTsys(self.caltime, self.atsys, times)
+        self.assertSameTsys(self.caltime, self.atsys, times[::-1])
+
+    def test_single_scan(self):
+        '''filltsys: only one Tsys scan'''
+        times = np.array([50.0, 100.0, 150.0])
+        self.assertSameTsys(self.caltime[:1], self.atsys[:1], times)
+
+    def test_random(self):
+        '''filltsys: random time stamps around the Tsys scans'''
+        np.random.seed(22)
+        caltime = np.cumsum(np.random.uniform(10.0, 100.0, 20))
+        atsys = np.random.uniform(30.0, 300.0, (20, 128))
+        times = np.concatenate([np.random.uniform(0.0, caltime[-1] + 100.0, 500),
+                                caltime[::3]])
+        self.assertSameTsys(caltime, atsys, times)
+        self.assertSameTsys(caltime, atsys, np.sort(times))
+
+
+def suite():
+    return [test_interpolateTsysInTime]
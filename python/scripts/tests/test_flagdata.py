@@ -3,7 +3,7 @@ import unittest
 import os
 import filecmp
 import pprint
-from tasks import flagcmd, flagdata, mstransform
+from tasks import flagcmd, flagdata, mstransform, partition
 from taskinit import aftool, tbtool
 from __main__ import default
 import exceptions
@@ -3121,6 +3121,60 @@ class TestMergeManualTimerange(unittest.TestCase):
         self.assertEqual(res[5]['timerange'], '00:04~00:05,00:06~00:07')
         self.assertEqual(res[6]['mode'], 'summary3')
 
+    def test_merge_intervals(self):
+        cmds = [
+            {'mode': 'manual', 'antenna': 'DV01',
+             'timerange': '2013/11/15/10:25:30.516~2013/11/15/10:25:32.454'},
+            {'mode': 'manual', 'antenna': 'DV01',
+             'timerange': '2013/11/15/10:08:44.456~2013/11/15/10:08:47.502'},
+            {'mode': 'manual', 'antenna': 'DV01',
+             'timerange': '2013/11/15/10:25:31.000~2013/11/15/10:25:35.000'},
+            {'mode': 'manual', 'antenna': 'DV01',
+             'timerange': '2013/11/15/10:08:47.502~2013/11/15/10:08:48.000'},
+            {'mode': 'manual', 'antenna': 'DV01',
+             'timerange': '2013/11/15/10:25:32.000~2013/11/15/10:25:33.000'}
+            ]
+        res = fh._merge_timerange(cmds)
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]['timerange'],
+                         '2013/11/15/10:08:44.456~2013/11/15/10:08:48.000,'
+                         '2013/11/15/10:25:30.516~2013/11/15/10:25:35.000')
+
+class test_local_workers(test_base):
+    """flagdata:: Test processing of MMS sub-MSs with a pool of local processes"""
+
+    def setUp(self):
+        self.setUp_ngc5921(True)
+        # One sub-MS per scan
+        self.mms = 'ngc5921.local.mms'
+        shutil.rmtree(self.mms, True)
+        partition(vis=self.vis, outputvis=self.mms, separationaxis='scan', flagbackup=False)
+        self.bypass = ParallelTaskHelper.getBypassParallelProcessing()
+
+    def tearDown(self):
+        ParallelTaskHelper.setLocalWorkers(1)
+        ParallelTaskHelper.bypassParallelProcessing(self.bypass)
+        shutil.rmtree(self.mms, True)
+
+    def test_summary_local_workers(self):
+        '''flagdata: summary with local workers should match the sequential summary'''
+        flagdata(vis=self.mms, flagbackup=False, mode='manual', scan='1,4')
+        res1 = flagdata(vis=self.mms, mode='summary')
+
+        # The local process pool is used by ParallelTaskHelper in sequential mode
+        ParallelTaskHelper.bypassParallelProcessing(1)
+        ParallelTaskHelper.setLocalWorkers(2, 1)
+        helper = ParallelTaskHelper('flagdata', {'vis':self.mms, 'mode':'summary'})
+        res2 = helper.go()
+        report = helper.getLastSchedulingReport()
+
+        self.assertEqual(res1['flagged'], res2['flagged'])
+        self.assertEqual(res1['total'], res2['total'])
+        self.assertEqual(res1['scan'], res2['scan'])
+        # Each worker runs a single job, so the jobs ran in several processes
+        self.assertEqual(report['njobs'], 7)
+        self.assertTrue(len(report['servers']) > 1)
+
 # Cleanup class 
 class cleanup(test_base):
     
@@ -3416,4 +3470,5 @@ def suite():
             test_tbuff,
             TestMergeManualTimerange,
             test_preaveraging,
+            test_local_workers,
             cleanup]
@@ -1,6 +1,7 @@
 import shutil
 import unittest
 import os
+import time
 import shutil
 import filecmp
 import pprint
@@ -32,6 +33,37 @@ def test_eq(result, total, flagged):
     assert result['flagged'] == flagged, \
            "%s flags set; %s expected" % (result['flagged'], flagged)
 
+def create_mock_sdm(sdmname, nflags):
+    '''Create an SDM with only Antenna.xml, SpectralWindow.xml and a Flag.xml of nflags rows'''
+
+    if os.path.exists(sdmname):
+        shutil.rmtree(sdmname)
+    os.mkdir(sdmname)
+
+    with open(sdmname + '/Antenna.xml', 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<AntennaTable>\n')
+        for ant in range(4):
+            f.write('<row>\n<antennaId> Antenna_%d </antennaId>\n<name>DV%02d</name>\n</row>\n' % (ant,ant))
+        f.write('</AntennaTable>\n')
+
+    with open(sdmname + '/SpectralWindow.xml', 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<SpectralWindowTable>\n')
+        for (spw, name) in enumerate(['WVR#NOMINAL','WVR#Antenna_0','X1#ALMA_RB_03#BB_1#SW-01']):
+            f.write('<row>\n<spectralWindowId>SpectralWindow_%d</spectralWindowId>\n<name>%s</name>\n</row>\n' % (spw,name))
+        f.write('</SpectralWindowTable>\n')
+
+    with open(sdmname + '/Flag.xml', 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<FlagTable>\n')
+        for fid in range(nflags):
+            start = 4800000000000000000 + fid * 1000000000
+            f.write('<row>\n<flagId> Flag_%d </flagId>\n<startTime> %d </startTime>\n<endTime> %d </endTime>\n'
+                    '<reason>FOCUS ERROR</reason>\n<numAntenna>2</numAntenna>\n<numPolarizationType>2</numPolarizationType>\n'
+                    '<numSpectralWindow>3</numSpectralWindow>\n<antennaId> 1 2 Antenna_%d Antenna_%d </antennaId>\n'
+                    '<polarizationType>1 2 X Y</polarizationType>\n'
+                    '<spectralWindowId>1 3 SpectralWindow_0 SpectralWindow_1 SpectralWindow_2</spectralWindowId>\n</row>\n'
+                    % (fid, start, start + 500000000, fid % 4, (fid + 1) % 4))
+        f.write('</FlagTable>\n')
+
 def create_input(str_text, filename):
     '''Save the string in a text file'''
     
@@ -420,6 +452,21 @@ class test_flaghelper(test_base):
         self.assertDictEqual(reference, resdict, 'Failed to evaluateParameters with many whitespaces')
 
 
+    def test_parseCommand(self):
+        '''flaghelper: single pass parsing is the same as parseNoEval and evaluateParameters'''
+        myparser = fh.Parser(' ','=')
+        cmds = ["mode='extend' antenna='ea24 '  flagnearfreq=True",
+                " mode='manual'   antenna='ea24'      spw='0'   reason='MY WHITESPACES'",
+                "mode='clip' clipminmax=[0,4] clipzeros=False datacolumn=\"DATA\"",
+                "mode='tfcrop' ntime=2.5 maxnpieces=7 timedev={'a':1} reason=\"it's\" field='3'"]
+        for cmd in cmds:
+            reference = fh.evaluateParameters(myparser.parseNoEval(cmd))
+            resdict = fh.parseCommand(cmd)
+            self.assertEqual(reference.items(), resdict.items())
+            self.assertEqual([type(v) for v in reference.values()], [type(v) for v in resdict.values()])
+
+        self.assertRaises(ValueError, fh.parseCommand, "manual")
+
     @unittest.skip('CAS-6553 breaks this use-case.')
     def test_evaluateParameters2(self):
         '''flaghelper: parse and evaluate a string with a single quote inside'''
@@ -521,6 +568,59 @@ class test_flaghelper(test_base):
         
         self.assertTrue(fh.evaluateFlagParameters(adict, fparams))
         
+    def test_readAndParseFileCache(self):
+        '''flaghelper: parsed flag files are cached by their contents'''
+        cachedir = os.path.abspath('flaghelper_cache')
+        filename = 'flaghelper_cache.txt'
+        (olddir, oldmin) = (fh.parsedFileCacheDir, fh.parsedFileCacheMinLines)
+        fh.parsedFileCacheDir = cachedir
+        fh.parsedFileCacheMinLines = 1
+        try:
+            create_input("antenna='DV03&&*' spw='0' autocorr=false\nmode='clip' clipminmax=[0,4]", filename)
+            dlist1 = fh.readAndParseFile(filename)
+            self.assertEqual(len(os.listdir(cachedir)), 1)
+            dlist2 = fh.readAndParseFile(filename)
+            self.assertEqual([d.items() for d in dlist1], [d.items() for d in dlist2])
+            self.assertEqual(dlist2[0]['autocorr'], False)
+            self.assertEqual(dlist2[1].keys(), ['mode','clipminmax'])
+
+            # A modified file is parsed again
+            create_input("antenna='DV04&&*'", filename)
+            dlist3 = fh.readAndParseFile(filename)
+            self.assertEqual(dlist3, [{'antenna':'DV04&&*'}])
+            self.assertEqual(len(os.listdir(cachedir)), 2)
+        finally:
+            (fh.parsedFileCacheDir, fh.parsedFileCacheMinLines) = (olddir, oldmin)
+            shutil.rmtree(cachedir, True)
+
+    def test_readAndParseFileCacheEviction(self):
+        '''flaghelper: the least recently used parsed flag files are removed from the cache'''
+        cachedir = os.path.abspath('flaghelper_cache')
+        filename = 'flaghelper_cache.txt'
+        (olddir, oldmin, oldmax) = (fh.parsedFileCacheDir, fh.parsedFileCacheMinLines,
+                                    fh.parsedFileCacheMaxFiles)
+        fh.parsedFileCacheDir = cachedir
+        fh.parsedFileCacheMinLines = 1
+        fh.parsedFileCacheMaxFiles = 2
+        try:
+            digests = []
+            for ant in range(3):
+                create_input("antenna='DV%02d&&*'" % ant, filename)
+                digests.append(fh._fileDigest(filename) + '.pkl')
+                fh.readAndParseFile(filename)
+                # Make sure that the modification times differ
+                time.sleep(1)
+                if ant == 1:
+                    # Use the first file again
+                    create_input("antenna='DV00&&*'", filename)
+                    fh.readAndParseFile(filename)
+                    time.sleep(1)
+            self.assertEqual(sorted(os.listdir(cachedir)), sorted([digests[0], digests[2]]))
+        finally:
+            (fh.parsedFileCacheDir, fh.parsedFileCacheMinLines, fh.parsedFileCacheMaxFiles) = \
+                (olddir, oldmin, oldmax)
+            shutil.rmtree(cachedir, True)
+
     def test_parseXML1(self):
         '''flaghelper: test parsing XML for online flags'''
         self.setUp_mockasdm()
@@ -533,10 +633,82 @@ class test_flaghelper(test_base):
         self.assertEqual(len(fdict.keys()), 12572)
         self.assertTrue(cmd0.has_key('spw'))
 
+    def test_parseXML2(self):
+        '''flaghelper: test parsing a synthetic Flag.xml for online flags'''
+        self.inpfile = 'flaghelper_mock.sdm'
+        create_mock_sdm(self.inpfile, 10)
+        fdict = fh.parseXML(self.inpfile, 0.5)
+        shutil.rmtree(self.inpfile)
+
+        self.assertEqual(len(fdict.keys()), 10)
+        self.assertEqual(fdict[3]['id'], 'Flag_3')
+        self.assertEqual(fdict[3]['antenna'], 'DV03,DV00')
+        self.assertEqual(fdict[3]['reason'], 'FOCUS_ERROR')
+        self.assertEqual(fdict[3]['spw'], '"WVR#NOMINAL","X1#ALMA_RB_03#BB_1#SW-01"')
+        self.assertEqual(fdict[3]['command']['correlation'], 'XX,XY,YX,YY')
+        self.assertAlmostEqual(fdict[3]['interval'], 1.5, 5)
+        self.assertEqual(fdict[3]['command'].keys(), ['antenna','timerange','spw','correlation'])
+
+
+class test_parseXML_benchmark(test_base):
+
+    def tearDown(self):
+        os.system('rm -rf flaghelper_bench.sdm')
+
+    def test_parseXML_500k(self):
+        '''flaghelper: benchmark parsing a synthetic Flag.xml with 500k rows'''
+        nflags = 500000
+        create_mock_sdm('flaghelper_bench.sdm', nflags)
+
+        start = time.time()
+        fdict = fh.parseXML('flaghelper_bench.sdm', 0.0)
+        elapsed = time.time() - start
+
+        print "parseXML of %s flags took %.1f s" % (nflags, elapsed)
+        self.assertEqual(len(fdict.keys()), nflags)
+        self.assertEqual(fdict[nflags-1]['id'], 'Flag_%s' % (nflags-1))
+
+
+class test_readAndParse_benchmark(test_base):
+
+    def tearDown(self):
+        os.system('rm -rf flaghelper_bench.txt flaghelper_bench_cache')
+
+    def test_readAndParse_200k(self):
+        '''flaghelper: benchmark reading and parsing a flag file with 200k lines'''
+        nlines = 200000
+        with open('flaghelper_bench.txt', 'w') as f:
+            for i in xrange(nlines):
+                f.write("antenna='DV%02d&&*' timerange='2013/11/15/10:%02d:%02d.516~2013/11/15/10:%02d:%02d.454' "
+                        "spw='%d' reason='FOCUS_ERROR' mode='manual' autocorr=false\n" % (i%50,i%60,i%60,(i+1)%60,i%60,i%4))
+
+        olddir = fh.parsedFileCacheDir
+        fh.parsedFileCacheDir = os.path.abspath('flaghelper_bench_cache')
+        try:
+            start = time.time()
+            flagcmd1 = fh.parseDictionary(fh.readAndParse(['flaghelper_bench.txt']))
+            parsed = time.time() - start
+
+            start = time.time()
+            flagcmd2 = fh.parseDictionary(fh.readAndParse(['flaghelper_bench.txt']))
+            cached = time.time() - start
+        finally:
+            fh.parsedFileCacheDir = olddir
+
+        print "read and parse of %s commands took %.1f s, %.1f s from the cache" % (nlines, parsed, cached)
+        self.assertEqual(len(flagcmd1), nlines)
+        self.assertEqual(flagcmd1, flagcmd2)
+
         
 def suite():
     return [test_flaghelper]
 
+def benchmark():
+    # Not in the default suite, run e.g. with
+    # python -m unittest test_flaghelper.test_parseXML_benchmark
+    return [test_parseXML_benchmark,
+            test_readAndParse_benchmark]
+
 
 
 
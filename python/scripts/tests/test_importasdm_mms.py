@@ -649,6 +649,40 @@ class asdm_import8(test_base):
             
                 
         self.assertTrue(retValue['success'],retValue['error_msgs'])
+
+    def test_mms8(self):
+        '''test_mms8: Import the scans of each sub-MS directly with separationaxis=scan and ignore_time=True'''
+        myasdmname = 'uid___A002_X72bc38_X000'
+        themsname = myasdmname + ".ms"
+
+        # The groups of scans of the sub-MSs cover the selected scans in order
+        asdmscans = [scan for (scan, size) in ph.getASDMScans(myasdmname)]
+        groups = ph.getASDMScanGroups(myasdmname, 2, '0:1~3')
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(sum([ph.selectASDMScans(asdmscans, group) for group in groups], []),
+                         [(0, 1), (0, 2), (0, 3)])
+
+        importasdm(myasdmname, vis=themsname, lazy=True, scans='0:1~3', ignore_time=True, createmms=True,
+                   separationaxis='scan', numsubms=2, process_flags=False, flagbackup=False)
+        self.assertTrue(ParallelDataHelper.isParallelMS(themsname), 'Output is not a Multi-MS')
+        self.assertEqual(ph.axisType(themsname), 'scan', 'Separation axis of MMS should be scan')
+        self.assertEqual(len(ParallelDataHelper.getReferencedMSs(themsname)), 2)
+        self.assertFalse(os.path.exists(myasdmname+'.data'))
+
+        importasdm(myasdmname, vis='reference.ms', lazy=True, scans='0:1~3', ignore_time=True,
+                   process_flags=False, flagbackup=False)
+        mytb = tbtool()
+        mytb.open('reference.ms')
+        nrows = mytb.nrows()
+        mytb.close()
+        mytb.open(themsname)
+        self.assertEqual(mytb.nrows(), nrows)
+        mytb.close()
+        self.assertEqual(th.checkwithtaql("select from [select from reference.ms orderby TIME, DATA_DESC_ID, ANTENNA1, ANTENNA2 ] t1, [select from "
+                                          +themsname+" orderby TIME, DATA_DESC_ID, ANTENNA1, ANTENNA2 ] t2 where (not all(near(t1.DATA,t2.DATA, 1.e-06)) or not all(t1.FLAG==t2.FLAG))"), 0)
+        for subtname in ["ANTENNA", "DATA_DESCRIPTION", "FIELD", "POINTING", "STATE"]:
+            self.assertTrue(th.compTables('reference.ms/'+subtname, themsname+'/'+subtname, [], 0.01),
+                            'Subtable %s differs from the reference'%subtname)
         
 
 class asdm_import9(test_base):
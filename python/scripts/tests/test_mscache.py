@@ -0,0 +1,94 @@
+import os
+import shutil
+import time
+import numpy as np
+from taskinit import mstool, msmdtool, tbtool
+import mscache
+import unittest
+
+'''
+Unit tests of the process-wide cache of MS metadata and resolved selections
+(mscache), used by update_spw, partitionhelper and ParallelDataHelper.
+'''
+
+datapath = os.environ.get('CASAPATH').split()[0] +\
+                            '/data/regression/unittest/split/'
+
+class test_base(unittest.TestCase):
+
+    def setUp(self):
+        self.vis = 'unordered_polspw.ms'
+        if os.path.exists(self.vis):
+            shutil.rmtree(self.vis)
+        fpath = os.path.join(datapath,self.vis)
+        if os.path.lexists(fpath):
+            shutil.copytree(fpath, self.vis)
+        else:
+            self.fail('Data does not exist -> '+fpath)
+        mscache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.vis, ignore_errors=True)
+        mscache.clear()
+
+
+class test_mscache(test_base):
+
+    def test_msseltoindex(self):
+        '''mscache: msseltoindex returns the same indices as the ms tool, once per selection'''
+        myms = mstool()
+        for spw in ['0:0', '1:1~3;5~9^2,8', '*']:
+            ref = myms.msseltoindex(vis=self.vis, spw=spw)
+            for i in range(2):
+                seldict = mscache.msseltoindex(self.vis, spw=spw)
+                self.assertTrue(np.all(seldict['spw'] == ref['spw']))
+                self.assertTrue(np.all(seldict['channel'] == ref['channel']))
+        self.assertEqual(len(mscache._cache), 3)
+        self.assertRaises(Exception, mscache.msseltoindex, self.vis, spw='99')
+
+    def test_copies(self):
+        '''mscache: Modifying a returned value does not modify the cache'''
+        seldict = mscache.msseltoindex(self.vis, spw='0')
+        seldict['channel'][0,2] += 1
+        self.assertEqual(mscache.msseltoindex(self.vis, spw='0')['channel'][0,2],
+                         seldict['channel'][0,2] - 1)
+
+    def test_scans(self):
+        '''mscache: getscansummary, scannumbers and msselectedindices'''
+        myms = mstool()
+        myms.open(self.vis)
+        ref = myms.getscansummary()
+        myms.close()
+        self.assertEqual(sorted(mscache.getscansummary(self.vis).keys()), sorted(ref.keys()))
+
+        mymsmd = msmdtool()
+        mymsmd.open(self.vis)
+        scans = mymsmd.scannumbers()
+        mymsmd.close()
+        self.assertTrue(np.all(mscache.scannumbers(self.vis) == scans))
+
+        scan = str(scans[0])
+        self.assertEqual(sorted(mscache.getscansummary(self.vis, {'scan':scan}).keys()), [scan])
+        self.assertEqual(list(mscache.msselectedindices(self.vis, {'scan':scan})['scan']),
+                         [scans[0]])
+
+    def test_modified(self):
+        '''mscache: A subtable is read again after the MS is modified'''
+        spwtable = mscache.getsubtable(self.vis, 'SPECTRAL_WINDOW')
+        self.assertTrue('NUM_CHAN' in spwtable)
+        names = mscache.getsubtable(self.vis, 'SPECTRAL_WINDOW', ['NAME'])['NAME']
+
+        # Make sure that the modification time changes
+        time.sleep(1)
+        mytb = tbtool()
+        mytb.open(os.path.join(self.vis, 'SPECTRAL_WINDOW'), nomodify=False)
+        mytb.putcell('NAME', 0, 'modified')
+        mytb.close()
+
+        newnames = mscache.getsubtable(self.vis, 'SPECTRAL_WINDOW', ['NAME'])['NAME']
+        self.assertEqual(newnames[0], 'modified')
+        self.assertEqual(list(newnames[1:]), list(names[1:]))
+
+
+def suite():
+    return [test_mscache]
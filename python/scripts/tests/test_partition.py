@@ -999,6 +999,77 @@ class test_partition_baseline_axis(test_base):
         self.assertEqual(len(thisdict.keys()), 3, 'There should be 3 subMSs in output MMS')
  
 
+def make_scan_summary(nscans, ntimestamps, nspws):
+    '''Scan summary and DDI info as returned by ms.getscansummary and ms.getspectralwindowinfo'''
+    scanSummary = {}
+    time = 4.8e9
+    for scan in range(1,nscans+1):
+        scanSummary[str(scan)] = {}
+        for timestamp in range(ntimestamps):
+            time += 1.152
+            # Every third scan does not observe the last spw
+            ddis = range(nspws - (scan % 3 == 0))
+            scanSummary[str(scan)]['%.3f' % time] = {'DDIds':ddis,'FieldId':scan%4,'nRow':1275*len(ddis)}
+
+    ddiInfo = {}
+    for ddi in range(nspws):
+        ddiInfo[str(ddi)] = {'NumChan':[128,3840,4][ddi%3],'NumCorr':[2,4][ddi%2],'isWVR':False}
+
+    return scanSummary, ddiInfo
+
+
+class test_partition_balanced_planner(unittest.TestCase):
+    '''Test the balanced partition map generated from a synthetic scan summary'''
+
+    def test_partition_map(self):
+        '''partition: Check that each scan/spw pair is assigned once and the subMSs are balanced'''
+        (scanSummary, ddiInfo) = make_scan_summary(20, 30, 8)
+        nsubms = 8
+
+        submsMap = ph.getPartitonMapFromSummary(scanSummary, ddiInfo, nsubms)
+        self.assertEqual(len(submsMap), nsubms)
+
+        pairs = []
+        nVisTotal = []
+        for subms in submsMap:
+            pairs += zip(submsMap[subms]['scanList'], submsMap[subms]['ddiList'])
+            nVisTotal.append(submsMap[subms]['nVisTotal'])
+            self.assertEqual(submsMap[subms]['nVisTotal'], sum(submsMap[subms]['nVisList']))
+        self.assertEqual(len(pairs), len(set(pairs)))
+        self.assertEqual(len(pairs), 20*8 - 6)
+
+        # Total number of visibilities
+        nVis = 0
+        for scan in scanSummary:
+            for timestamp in scanSummary[scan]:
+                for ddi in scanSummary[scan][timestamp]['DDIds']:
+                    nVis += 1275*ddiInfo[str(ddi)]['NumChan']*ddiInfo[str(ddi)]['NumCorr']
+        self.assertEqual(sum(nVisTotal), nVis)
+
+        # The subMSs should have a similar size
+        for subms in submsMap:
+            self.assertTrue(abs(submsMap[subms]['nVisTotal'] - nVis/nsubms) < 0.2*nVis/nsubms)
+
+    def test_partition_map_more_subms_than_pairs(self):
+        '''partition: Check that the number of subMSs is limited to the number of scan/spw pairs'''
+        (scanSummary, ddiInfo) = make_scan_summary(1, 10, 2)
+        submsMap = ph.getPartitonMapFromSummary(scanSummary, ddiInfo, 64)
+        self.assertEqual(len(submsMap), 2)
+
+
+class test_partition_balanced_planner_benchmark(unittest.TestCase):
+    '''Time the balanced partition map generation versus the number of timestamps'''
+
+    def test_partition_map(self):
+        '''partition: Benchmark the partition map generation versus the number of timestamps'''
+        for ntimestamps in [1000, 10000, 100000]:
+            (scanSummary, ddiInfo) = make_scan_summary(10, ntimestamps/10, 50)
+            start = time.time()
+            submsMap = ph.getPartitonMapFromSummary(scanSummary, ddiInfo, 32)
+            print "Partition map of %s timestamps and 50 spws took %.2f s" % (ntimestamps, time.time()-start)
+            self.assertEqual(len(submsMap), 32)
+
+
 # Cleanup class 
 class partition_cleanup(test_base):
     
@@ -1018,4 +1089,10 @@ def suite():
             test_partition_balanced,
             test_partition_balanced_multiple_scan,
             test_partition_baseline_axis,
+            test_partition_balanced_planner,
             partition_cleanup]
+
+def benchmark():
+    # Not in the default suite, run e.g. with
+    # python -m unittest test_partition.test_partition_balanced_planner_benchmark
+    return [test_partition_balanced_planner_benchmark]
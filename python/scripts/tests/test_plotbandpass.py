@@ -0,0 +1,80 @@
+import os
+import shutil
+import glob
+import pylab as pb
+import task_plotbandpass
+from task_plotbandpass import plotbandpass, pageRenderer
+import unittest
+
+'''
+Unit tests of the rendering of the plotbandpass pages in parallel processes
+(renderprocesses).
+'''
+
+datapath = os.environ.get('CASAPATH').split()[0] +\
+                            '/data/regression/unittest/bandpass/'
+
+class test_base(unittest.TestCase):
+
+    def setUp(self):
+        self.caltable = 'ngc5921.ref1a.bcal'
+        if os.path.exists(self.caltable):
+            shutil.rmtree(self.caltable)
+        fpath = os.path.join(datapath,self.caltable)
+        if os.path.lexists(fpath):
+            shutil.copytree(fpath, self.caltable)
+        else:
+            self.fail('Data does not exist -> '+fpath)
+        for plotdir in ['plotbandpass_serial', 'plotbandpass_parallel']:
+            shutil.rmtree(plotdir, ignore_errors=True)
+            os.mkdir(plotdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.caltable, ignore_errors=True)
+        for plotdir in ['plotbandpass_serial', 'plotbandpass_parallel']:
+            shutil.rmtree(plotdir, ignore_errors=True)
+
+    def plotfiles(self, plotdir):
+        return sorted([os.path.basename(name) for name in glob.glob(os.path.join(plotdir, '*.png'))])
+
+
+class test_renderprocesses(test_base):
+
+    def test_same_files(self):
+        '''plotbandpass: renderprocesses>1 writes the same files as serial rendering'''
+        for (plotdir, renderprocesses) in [('plotbandpass_serial', 0), ('plotbandpass_parallel', 3)]:
+            plotbandpass(caltable=self.caltable, yaxis='both', xaxis='chan', interactive=False,
+                         figfile=os.path.join(plotdir, 'bp'), renderprocesses=renderprocesses)
+            self.assertEqual(pageRenderer.children, [])
+
+        serial = self.plotfiles('plotbandpass_serial')
+        self.assertTrue(len(serial) > 1)
+        self.assertEqual(self.plotfiles('plotbandpass_parallel'), serial)
+        for name in serial:
+            self.assertTrue(os.path.getsize(os.path.join('plotbandpass_parallel', name)) > 0)
+
+    def test_early_return(self):
+        '''plotbandpass: The rendering processes are reaped when plotbandpass returns early'''
+        plotfile = os.path.join('plotbandpass_parallel', 'bp.png')
+
+        def plotbandpass_core(**kwargs):
+            # Return as soon as a page is being rendered, as the exits in the page loop
+            pageRenderer.reset(kwargs['renderprocesses'])
+            pb.figure()
+            pb.plot([0, 1], [0, 1])
+            pageRenderer.savefig(plotfile, kwargs['density'])
+            self.assertEqual(len(pageRenderer.children), 1)
+            return()
+
+        core = task_plotbandpass.plotbandpass_core
+        task_plotbandpass.plotbandpass_core = plotbandpass_core
+        try:
+            plotbandpass(caltable=self.caltable, interactive=False, figfile=plotfile, renderprocesses=2)
+        finally:
+            task_plotbandpass.plotbandpass_core = core
+        self.assertEqual(pageRenderer.children, [])
+        self.assertEqual(pageRenderer.failed, [])
+        self.assertTrue(os.path.getsize(plotfile) > 0)
+
+def suite():
+    return [test_renderprocesses]
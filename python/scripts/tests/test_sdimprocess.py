@@ -12,6 +12,7 @@ import re
 import string
 
 from sdimprocess import sdimprocess
+import task_sdimprocess
 
 _ia = iatool( )
 
@@ -657,5 +658,60 @@ class sdimprocess_test2(unittest.TestCase,sdimprocess_unittest_base):
         self._checkstats(self.outfile,refstats)
 
 
+class sdimprocess_test3(unittest.TestCase):
+    """
+    Test on the processing of blocks of planes.
+
+    The polynomial fit of a block of planes is compared with the fit of
+    each plane by numpy.ma.polyfit, and the planes of the images are
+    processed in blocks of a few planes.
+    """
+    def setUp(self):
+        self.max_block_bytes = task_sdimprocess.MAX_BLOCK_BYTES
+
+    def tearDown(self):
+        task_sdimprocess.MAX_BLOCK_BYTES = self.max_block_bytes
+
+    def test300(self):
+        """Test 300: Polynomial fit of a block of planes with masked pixels"""
+        nx, ny, nplane = (32, 16, 5)
+        x = numpy.arange(nx)
+        data = numpy.random.normal(size=(nx,ny,nplane))
+        data += (0.01 * x * x).reshape((nx,1,1))
+        mask = numpy.ones(data.shape, dtype=bool)
+        mask[3,2,1] = False
+        mask[7,0,3] = False
+        worker = task_sdimprocess.sdimprocess_worker
+        for axis in [0, 1]:
+            model = worker._get_polyfit_model_array.im_func(None, data, mask, axis, 2)
+            self.assertEqual(model.shape, data.shape)
+            for iplane in xrange(nplane):
+                plane = data[:,:,iplane]
+                pmask = mask[:,:,iplane]
+                if axis == 1:
+                    plane = plane.transpose()
+                    pmask = pmask.transpose()
+                mdata = numpy.ma.masked_array(plane, pmask ^ True)
+                coeffs = numpy.ma.polyfit(range(plane.shape[0]), mdata, 2).transpose()
+                ref = numpy.array([numpy.poly1d(c)(range(plane.shape[0])) for c in coeffs]).transpose()
+                if axis == 1:
+                    ref = ref.transpose()
+                self.assertTrue(numpy.allclose(model[:,:,iplane], ref),
+                                msg='Polynomial model differs for plane %s along axis %s' % (iplane,axis))
+
+    def test301(self):
+        """Test 301: Blocks of planes of a 4D image"""
+        imshape = [16, 8, 5, 2]
+        # three planes per block
+        task_sdimprocess.MAX_BLOCK_BYTES = 16 * 8 * 3
+        blocks = list(task_sdimprocess.iterate_plane_blocks(imshape, 1))
+        self.assertEqual(len(blocks), 4)
+        self.assertEqual(blocks[0], ([0,0,0,0], [15,7,2,0]))
+        self.assertEqual(blocks[1], ([0,0,3,0], [15,7,4,0]))
+        self.assertEqual(blocks[3], ([0,0,3,1], [15,7,4,1]))
+        # at least one plane per block
+        blocks = list(task_sdimprocess.iterate_plane_blocks(imshape[:2], 100))
+        self.assertEqual(blocks, [([0,0], [15,7])])
+
 def suite():
-    return [sdimprocess_test0,sdimprocess_test1,sdimprocess_test2]
+    return [sdimprocess_test0,sdimprocess_test1,sdimprocess_test2,sdimprocess_test3]
@@ -0,0 +1,127 @@
+import os
+import time
+import numpy as np
+from taskinit import casalog
+import solar_system_setjy as SSsetjy
+import unittest
+
+'''
+Unit tests of the solar system flux density models (solar_system_setjy),
+which are integrated over all the frequency ranges of a setjy call at once.
+'''
+
+modelpath = os.environ.get('CASAPATH').split()[0] +\
+                            '/data/alma/SolarSystemModels/'
+
+class test_base(unittest.TestCase):
+
+    def setUp(self):
+        self.ss_setjy = SSsetjy.solar_system_setjy()
+        fpath = os.path.join(modelpath, 'Jupiter_Tb.dat')
+        if not os.path.lexists(fpath):
+            self.fail('Data does not exist -> '+fpath)
+        [self.freqs, self.Tbs] = SSsetjy._read_model(fpath)
+
+    def integrate_Tb(self, frequency):
+        # The integral of one frequency range, one interpolation at a time
+        freqs = self.freqs
+        Tbs = self.Tbs
+        low_Tb = self.ss_setjy.interpolate_list(freqs, Tbs, frequency[0])[1]
+        hi_Tb = self.ss_setjy.interpolate_list(freqs, Tbs, frequency[1])[1]
+        low_index = self.ss_setjy.nearest_index(freqs, frequency[0])
+        if frequency[0] > freqs[low_index]:
+            low_index += 1
+        hi_index = self.ss_setjy.nearest_index(freqs, frequency[1])
+        if frequency[1] < freqs[hi_index]:
+            hi_index -= 1
+        if low_index > hi_index:
+            Tb = (frequency[1] - frequency[0]) * (low_Tb + hi_Tb) / 2
+        else:
+            Tb = (freqs[low_index] - frequency[0]) * (low_Tb + Tbs[low_index]) / 2 + \
+                 (frequency[1] - freqs[hi_index]) * (hi_Tb + Tbs[hi_index]) / 2
+            for ii in range(low_index, hi_index):
+                Tb += (freqs[ii+1] - freqs[ii]) * (Tbs[ii+1] + Tbs[ii]) / 2
+        return Tb / (frequency[1] - frequency[0])
+
+    def channels(self, nspw, nchan):
+        # Frequency ranges of the channels of nspw spws of 2 GHz from 84 GHz
+        frequencies = []
+        for spw in range(nspw):
+            edges = 84.0e9 + spw * 2.1e9 + np.arange(nchan + 1) * 2.0e9 / nchan
+            frequencies.append(np.transpose([edges[:-1], edges[1:]]).tolist())
+        return frequencies
+
+
+class test_models(test_base):
+
+    def test_interpolate_array(self):
+        '''solar_system_setjy: interpolate_array gives the same values as interpolate_list'''
+        frequencies = np.linspace(self.freqs[0], self.freqs[-1], 997)
+        brightnesses = self.ss_setjy.interpolate_array(self.freqs, self.Tbs, frequencies)
+        for (frequency, brightness) in zip(frequencies, brightnesses):
+            self.assertEqual(brightness,
+                             self.ss_setjy.interpolate_list(self.freqs, self.Tbs, frequency)[1])
+
+    def test_integrate_Tbs(self):
+        '''solar_system_setjy: integrate_Tbs integrates each frequency range as integrate_Tb'''
+        frequencies = [[self.freqs[0], self.freqs[-1]], [224.234567e9, 224.236567e9],
+                       [self.freqs[3], self.freqs[5]]] + self.channels(2, 128)[1]
+        Tbs = self.ss_setjy.integrate_Tbs(self.freqs, self.Tbs, frequencies)
+        self.assertEqual(len(Tbs), len(frequencies))
+        for (frequency, Tb) in zip(frequencies, Tbs):
+            ref = self.integrate_Tb(frequency)
+            self.assertTrue(abs(Tb - ref) <= 1.0e-10 * abs(ref))
+            self.assertEqual(self.ss_setjy.integrate_Tb(self.freqs, self.Tbs, frequency)[1], Tb)
+
+    def test_statuses(self):
+        '''solar_system_setjy: Unsupported frequencies and bodies get their status'''
+        [statuses, Tbs, dTbs] = self.ss_setjy.brightness_planet_ints('Jupiter',
+                                  [[1.0e6, 2.0e6], [224.234567e9, 224.236567e9]])
+        self.assertEqual(statuses, [2, 0])
+        self.assertEqual(Tbs[0], 0.0)
+        [statuses, fds, dfds, Rhats, directions] = \
+            self.ss_setjy.solar_system_fd('Pluto', [56018.232], [[1.0e11, 1.1e11]], 'ALMA', casalog)
+        self.assertEqual(statuses, [[1]])
+
+
+class test_solar_system_fd_benchmark(test_base):
+
+    def test_all_spws(self):
+        '''solar_system_setjy: 40 spws x 3840 channels in one call and per spw'''
+        MJDs = [56018.232]
+        frequencies = self.channels(40, 3840)
+
+        start = time.time()
+        [statuses, fds, dfds, Rhats, directions] = \
+            self.ss_setjy.solar_system_fd('Jupiter', MJDs, sum(frequencies, []), 'ALMA', casalog)
+        all_time = time.time() - start
+        self.assertEqual(len(fds[0]), 40 * 3840)
+        self.assertTrue(np.all(np.array(statuses) == 0))
+
+        start = time.time()
+        nf0 = 0
+        for spw_frequencies in frequencies:
+            spw_fds = self.ss_setjy.solar_system_fd('Jupiter', MJDs, spw_frequencies, 'ALMA', casalog)[1]
+            self.assertTrue(np.allclose(spw_fds[0], fds[0][nf0:nf0+len(spw_frequencies)],
+                                        rtol=1.0e-12, atol=0.0))
+            nf0 += len(spw_frequencies)
+        spw_time = time.time() - start
+
+        # One channel at a time, as the models were integrated before
+        start = time.time()
+        Tbs = self.ss_setjy.integrate_Tbs(self.freqs, self.Tbs, frequencies[0])
+        ref_Tbs = [self.integrate_Tb(frequency) for frequency in frequencies[0][:384]]
+        channel_time = (time.time() - start) * 10 * 40
+        self.assertTrue(np.allclose(Tbs[:384], ref_Tbs, rtol=1.0e-10, atol=0.0))
+
+        casalog.post("solar_system_fd time for 40 spws x 3840 channels: one call %.3f s, per spw %.3f s, per channel (estimated) %.3f s" %
+                     (all_time,spw_time,channel_time), "INFO", "test_all_spws")
+
+
+def suite():
+    return [test_models]
+
+def benchmark():
+    # Not in the default suite, run e.g. with
+    # python -m unittest test_solar_system_setjy.test_solar_system_fd_benchmark
+    return [test_solar_system_fd_benchmark]
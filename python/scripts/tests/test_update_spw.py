@@ -0,0 +1,148 @@
+import os
+import shutil
+import time
+import numpy as np
+from taskinit import casalog
+from update_spw import *
+import unittest
+
+'''
+Unit tests of the spw:chan selection functions of update_spw, which keep the
+selected channels as bitmaps.
+'''
+
+datapath = os.environ.get('CASAPATH').split()[0] +\
+                            '/data/regression/unittest/split/'
+
+class test_chanstr(unittest.TestCase):
+
+    def test_set_to_chanstr(self):
+        '''update_spw: set_to_chanstr of sets, lists and bitmaps'''
+        self.assertEqual(set_to_chanstr(set([0, 1, 2, 4, 5, 6, 7, 9, 11, 13])),
+                         '0~2;4~7;9;11;13')
+        self.assertEqual(set_to_chanstr(set([7, 9, 11, 13])), '7~13^2')
+        self.assertEqual(set_to_chanstr([0, 1, 2], 3), '*')
+        self.assertEqual(set_to_chanstr([0, 1, 2, 6], 3), '*')
+        self.assertEqual(set_to_chanstr([1, 2, 4, 5, 6, 7, 8, 9, 10, 11], 12), '1~2;4~11')
+        self.assertEqual(set_to_chanstr(set([])), '')
+        self.assertEqual(set_to_chanstr([5]), '5')
+        mask = np.zeros(14, dtype=bool)
+        mask[[0, 1, 2, 4, 5, 6, 7, 9, 11, 13]] = True
+        self.assertEqual(set_to_chanstr(mask), '0~2;4~7;9;11;13')
+
+    def test_sets_to_spwchan(self):
+        '''update_spw: sets_to_spwchan of sets and bitmaps'''
+        self.assertEqual(sets_to_spwchan({1: [0, 1, 2, 3]}, {1: 4}), '1')
+        self.assertEqual(sets_to_spwchan({1: set([1, 2, 3, 5, 7, 9]), 8: set([0])}),
+                         '1:1~3;5;7;9,8:0')
+        self.assertEqual(sets_to_spwchan({0: set([4, 5, 6]), 1: [4, 5, 6], 2: [4, 5, 6]}),
+                         '0~2:4~6')
+        mask = np.zeros(10, dtype=bool)
+        mask[[1, 2, 3, 5, 7, 9]] = True
+        self.assertEqual(sets_to_spwchan({1: mask, 8: set([0]), 9: np.zeros(3, dtype=bool)}),
+                         '1:1~3;5;7;9,8:0')
+
+    def test_spw_to_dict(self):
+        '''update_spw: spw_to_dict, join_spws, intersect_spws and subtract_spws'''
+        self.assertEqual(spw_to_dict('6~8:2~5', {})[8], set([2, 3, 4, 5]))
+        self.assertEqual(list(spw_to_masks('6~8:2~5', {})[8]),
+                         [False, False, True, True, True, True])
+        self.assertEqual(spw_to_dict('6~8:2~5', {6: '', 7: set([1, 7])})[7],
+                         set([1, 2, 3, 4, 5, 7]))
+        self.assertEqual(spw_to_dict('7:123~127;233~267', {6: '', 7: set([1, 7])})[7], '')
+        self.assertEqual(spw_to_dict('5:3~5,7:1~9^4', {}, False),
+                         {5: set([3, 4, 5]), 7: set([1, 5, 9])})
+        self.assertEqual(join_spws('0~2:3~5,3:9~13', '1~3:4~7'), '0:3~5,1~2:3~7,3')
+        self.assertEqual(join_spws('1~10:5~122,15~22:5~122', '0~21'), '0~21,22:5~122')
+        self.assertEqual(intersect_spws('0~2:3~5,3:9~13', '0~2:7~9,5'), set([0, 1, 2]))
+        self.assertEqual(subtract_spws('0~2:3~5,3:9~13', '0~2:7~9,5'), set([3]))
+        self.assertEqual(expand_tilde('3~7^2;9~11'), [3, 5, 7, 9, 10, 11])
+
+    def test_expand_tilde_bounds(self):
+        '''update_spw: expand_tilde of inverted and negative ranges'''
+        # Inverted ranges select nothing, as with range()
+        self.assertEqual(expand_tilde('0~-2'), [])
+        self.assertEqual(expand_tilde('5~3;1~2'), [1, 2])
+        self.assertEqual(list(spw_to_masks('1:0~-2', {}, False)[1]), [])
+        # Negative numbers are dropped rather than wrapped around
+        self.assertEqual(expand_tilde('-2~3'), [0, 1, 2, 3])
+        self.assertEqual(expand_tilde('-3~7^2'), [1, 3, 5, 7])
+        self.assertEqual(expand_tilde('-5~-2'), [])
+
+
+class test_spwchan(unittest.TestCase):
+
+    def setUp(self):
+        self.vis = 'unordered_polspw.ms'
+        if os.path.exists(self.vis):
+            shutil.rmtree(self.vis)
+        fpath = os.path.join(datapath,self.vis)
+        if os.path.lexists(fpath):
+            shutil.copytree(fpath, self.vis)
+        else:
+            self.fail('Data does not exist -> '+fpath)
+
+    def tearDown(self):
+        shutil.rmtree(self.vis, ignore_errors=True)
+
+    def test_spwchan_to_masks(self):
+        '''update_spw: spwchan_to_masks selects the same channels as spwchan_to_sets'''
+        for spw in ['0:0', '1:1~3;5~9^2', '1:1~3;5~9^2,8', '0~1:1~3,5;7:10~20^2']:
+            masks = spwchan_to_masks(self.vis, spw)
+            sets = spwchan_to_sets(self.vis, spw)
+            self.assertEqual(sorted(masks.keys()), sorted(sets.keys()))
+            for s in sets:
+                self.assertEqual(set(np.flatnonzero(masks[s])), sets[s])
+        self.assertEqual(spwchan_to_sets(self.vis, '1:1~3;5~9^2,8'),
+                         {1: set([1, 2, 3, 5, 7, 9]), 8: set([0])})
+
+    def test_update_spwchan(self):
+        '''update_spw: update_spwchan'''
+        self.assertEqual(update_spwchan(self.vis, '0~1:1~3,5;7:10~20^2', '0~1:2~3,5;7:12~18^2'),
+                         '0~1:1~2,2~3:1~4')
+        self.assertRaises(ValueError, update_spwchan, self.vis, '7:10~20^2', '7:12~18^3')
+        self.assertEqual(update_spwchan(self.vis, '7:10~20^2', '7:12~18^3', truncate=True),
+                         '0:1~4^3')
+        self.assertEqual(update_spwchan(self.vis, '7:10~20^2', '7:12~18^3', truncate=True,
+                                        widths={7: 2}),
+                         '0:0~2^2')
+
+
+class test_roundtrip_benchmark(unittest.TestCase):
+
+    def test_roundtrip(self):
+        '''update_spw: Round trip of a 32 spw x 64k channel selection through sets and bitmaps'''
+        nspw = 32
+        nchan = 65536
+        spw = ','.join(['%d:%d~%d;%d~%d' % (s, 2 * s, nchan / 2, nchan / 2 + 10, nchan - 1)
+                        for s in xrange(nspw)])
+
+        # The selection expanded into sets of ints, as done before bitmaps
+        start = time.time()
+        sets = {}
+        for s in xrange(nspw):
+            sets[s] = set(range(2 * s, nchan / 2 + 1)) | set(range(nchan / 2 + 10, nchan))
+        setstr = sets_to_spwchan(sets)
+        set_time = time.time() - start
+
+        start = time.time()
+        maskstr = sets_to_spwchan(spw_to_masks(spw, {}, False))
+        mask_time = time.time() - start
+
+        # sets_to_spwchan sorts the spws as strings
+        self.assertEqual(maskstr, setstr)
+        self.assertEqual(spw_to_dict(setstr, {}, False), sets)
+        self.assertEqual(spw_to_dict(maskstr, {}, False), sets)
+
+        casalog.post("spw:chan round trip time: sets %.3f s, bitmaps %.3f s" % (set_time,mask_time),
+                     "INFO", "test_roundtrip")
+
+
+def suite():
+    return [test_chanstr,
+            test_spwchan]
+
+def benchmark():
+    # Not in the default suite, run e.g. with
+    # python -m unittest test_update_spw.test_roundtrip_benchmark
+    return [test_roundtrip_benchmark]
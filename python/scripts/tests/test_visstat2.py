@@ -629,5 +629,99 @@ class visstat2_test(unittest.TestCase):
 
         self.assertTrue(retValue['success'],retValue['error_msgs'])
 
+    def test13(self):
+        '''Visstat2 13: Statistics of a Multi-MS merged from its sub-MSs, as for the MS'''
+        import task_visstat2
+        mmsfile = 'ngc5921_visstat2.mms'
+        partition(vis=self.msfile, outputvis=mmsfile, separationaxis='scan', numsubms=4,
+                  flagbackup=False)
+
+        # The Multi-MS is processed serially if the statistics of the sub-MSs cannot be merged
+        parallelStatistics = task_visstat2._parallelStatistics
+        mergeQuantiles = task_visstat2._mergeQuantiles
+        calls = {'merged': 0, 'quantiles': 0}
+        def parallel_statistics(*args):
+            s = parallelStatistics(*args)
+            if s is not None:
+                calls['merged'] += 1
+            return s
+        def merge_quantiles(*args):
+            mergeQuantiles(*args)
+            calls['quantiles'] += 1
+        task_visstat2._parallelStatistics = parallel_statistics
+        task_visstat2._mergeQuantiles = merge_quantiles
+        try:
+            for (axis, axes) in [('amp', 'ddid'), ('phase', 'field'), ('real', 'ddid,field')]:
+                ref = visstat2(vis=self.msfile, axis=axis, datacolumn='data', reportingaxes=axes)
+                calls['merged'] = calls['quantiles'] = 0
+                v2 = visstat2(vis=mmsfile, axis=axis, datacolumn='data', reportingaxes=axes)
+                self.assertEqual(calls['merged'], 1, "%s %s: statistics not merged from the sub-MSs" % (axis, axes))
+                self.assertEqual(calls['quantiles'], 1, "%s %s: quantiles not merged from the sub-MSs" % (axis, axes))
+                self.assertEqual(sorted(v2.keys()), sorted(ref.keys()))
+                for key in ref:
+                    for e in ['npts', 'min', 'max']:
+                        self.assertEqual(v2[key][e], ref[key][e], "%s %s %s" % (axis, key, e))
+                    for e in ['median', 'quartile', 'medabsdevmed']:
+                        self.assertTrue(np.allclose(v2[key][e], ref[key][e], rtol=1.0e-6, atol=0.0),
+                                        "%s %s %s: %s vs %s" % (axis, key, e, v2[key][e], ref[key][e]))
+                    for e in ['sum', 'sumsq', 'mean', 'variance', 'stddev', 'rms']:
+                        self.assertTrue(np.allclose(v2[key][e], ref[key][e], rtol=1.0e-8, atol=0.0),
+                                        "%s %s %s: %s vs %s" % (axis, key, e, v2[key][e], ref[key][e]))
+        finally:
+            task_visstat2._parallelStatistics = parallelStatistics
+            task_visstat2._mergeQuantiles = mergeQuantiles
+            shutil.rmtree(mmsfile, ignore_errors=True)
+
+    def test14(self):
+        '''Visstat2 14: Merge of the statistics of the sub-MSs of a Multi-MS'''
+        from task_visstat2 import StatisticsReducer
+
+        def stats(values):
+            values = np.array(values, dtype=float)
+            return {'npts': float(len(values)), 'sum': values.sum(), 'sumsq': (values**2).sum(),
+                    'min': values.min(), 'max': values.max(), 'minIndex': int(values.argmin()),
+                    'maxIndex': int(values.argmax()), 'mean': values.mean(), 'median': np.median(values),
+                    'variance': values.var(ddof=1), 'stddev': values.std(ddof=1),
+                    'rms': np.sqrt((values**2).mean())}
+
+        reducer = StatisticsReducer('visstat2')
+        reducer.reset()
+        reducer.add('sub0.ms', {'DATA_DESC_ID=0': stats([1.0, 4.0, 2.0]),
+                                'DATA_DESC_ID=1': stats([7.0, 8.0])})
+        reducer.add('sub1.ms', {'DATA_DESC_ID=0': stats([0.5, 3.0, 9.0, 2.5])})
+        reducer.add('sub2.ms', False)
+        s = reducer.getResult()
+
+        self.assertEqual(reducer.getMergedKeys(), ['DATA_DESC_ID=0'])
+        ref = stats([1.0, 4.0, 2.0, 0.5, 3.0, 9.0, 2.5])
+        for e in ['npts', 'min', 'max']:
+            self.assertEqual(s['DATA_DESC_ID=0'][e], ref[e])
+        self.assertEqual(s['DATA_DESC_ID=0']['minIndex'], 0)
+        self.assertEqual(s['DATA_DESC_ID=0']['maxIndex'], 2)
+        for e in ['sum', 'sumsq', 'mean', 'variance', 'stddev', 'rms']:
+            self.assertTrue(np.allclose(s['DATA_DESC_ID=0'][e], ref[e], rtol=1.0e-12, atol=0.0))
+        # Statistics found in a single sub-MS are kept as they are
+        self.assertEqual(s['DATA_DESC_ID=1'], stats([7.0, 8.0]))
+
+        # The variances are merged without the cancellation of sumsq - sum*mean
+        values = 1.0e8 + np.array([0.1, -0.2, 0.3, 0.05, -0.15])
+        reducer.reset()
+        reducer.add('sub0.ms', {'DATA_DESC_ID=0': stats(values[:2])})
+        reducer.add('sub1.ms', {'DATA_DESC_ID=0': stats(values[2:])})
+        s = reducer.getResult()
+        self.assertTrue(np.allclose(s['DATA_DESC_ID=0']['variance'], values.var(ddof=1),
+                                    rtol=1.0e-6, atol=0.0))
+
+    def test15(self):
+        '''Visstat2 15: Keys of the values in the quantile sketches of the sub-MSs'''
+        from task_visstat2 import _toKeys, _fromKeys
+
+        values = np.array([-np.inf, -1.0e300, -2.5, -1.0e-310, -0.0, 0.0, 1.0e-310, 1.0, 3.0e8, np.inf])
+        keys = _toKeys(values)
+        self.assertEqual(keys.dtype, np.uint64)
+        self.assertTrue(np.all(keys[1:] > keys[:-1]))
+        self.assertEqual(list(_fromKeys(keys)), list(values))
+        self.assertEqual(list(np.signbit(_fromKeys(keys))), list(np.signbit(values)))
+
 def suite():
     return [visstat2_test]
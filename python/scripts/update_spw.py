@@ -4,6 +4,11 @@
 """
 A set of functions for manipulating spw:chan selection strings.
 
+Internally the selected channels of each spw are kept as a boolean numpy
+array indexed by channel (a bitmap), so that selections of spws with tens of
+thousands of channels are not expanded into sets of Python ints.  The public
+functions still accept and return sets where they used to.
+
 If this is run from a shell (i.e. not in casapy), doctest will be used to run
 several unit tests from the doc strings, including the one below:
 
@@ -17,9 +22,9 @@ Example:
 
 import copy
 import os
+import numpy as np
 #from taskinit import mstool
-from casac import *
-from taskinit import ms
+import mscache
 
 def update_spw(spw, spwmap=None):
     """
@@ -157,7 +162,7 @@ def spwchan_to_ranges(vis, spw):
     >>> selranges
     {0: (1,  3,  1), 1: (1,  3,  1), 5: (10, 20,  2), 7: (10, 20,  2)}
     """
-    selarr = ms.msseltoindex(vis, spw=spw)['channel']
+    selarr = mscache.msseltoindex(vis, spw=spw)['channel']
     nspw = selarr.shape[0]
     selranges = {}
     for s in xrange(nspw):
@@ -169,7 +174,8 @@ def spwchan_to_ranges(vis, spw):
 def spwchan_to_sets(vis, spw):
     """
     Returns the spw:chan selection string spw as a dict of sets of selected
-    channels for vis, keyed by spectral window ID.
+    channels for vis, keyed by spectral window ID.  Use spwchan_to_masks()
+    to avoid expanding the selection into sets.
 
     Note that '' returns an empty set!  Use '*' to select everything!
 
@@ -186,6 +192,24 @@ def spwchan_to_sets(vis, spw):
     >>> spwchan_to_sets(vis, '')
     {}
     """
+    masks = spwchan_to_masks(vis, spw)
+    return dict([(s, set(np.flatnonzero(masks[s]).tolist())) for s in masks])
+
+def spwchan_to_masks(vis, spw):
+    """
+    Returns the spw:chan selection string spw as a dict of channel bitmaps
+    for vis, keyed by spectral window ID.  Each bitmap is a boolean numpy
+    array which is True for the selected channels, and may be shorter than
+    the spw (the channels past its end are not selected).
+
+    Note that '' returns an empty dict!  Use '*' to select everything!
+
+    Example:
+    >>> from update_spw import spwchan_to_masks
+    >>> vis = casa['dirs']['data'] + '/regression/unittest/split/unordered_polspw.ms'
+    >>> spwchan_to_masks(vis, '1:1~3;5~9^2')
+    {1: array([False,  True,  True,  True, False,  True, False,  True, False,  True], dtype=bool)}
+    """
     if not spw:        # ms.msseltoindex(vis, spw='')['channel'] returns a
         return {}      # different kind of empty array.  Skip it.
 
@@ -195,41 +219,98 @@ def spwchan_to_sets(vis, spw):
     if not os.path.isdir(vis):
         raise ValueError, str(vis) + ' is not a valid MS.'
         
-    sets = {}
+    masks = {}
     try:
-        scharr = ms.msseltoindex(vis, spw=spw)['channel']
+        scharr = mscache.msseltoindex(vis, spw=spw)['channel']
         for scr in scharr:
-            if not sets.has_key(scr[0]):
-                sets[scr[0]] = set([])
-
-            # scr[2] is the last selected channel.  Bump it up for range().
-            scr[2] += 1
-            sets[scr[0]].update(range(*scr[1:]))
+            # scr[2] is the last selected channel.
+            masks[scr[0]] = _addrange(masks.get(scr[0], _emptymask()),
+                                      scr[1], scr[2], scr[3])
     except:
         # spw includes channels that aren't in vis, so it needs to be trimmed
         # down to make ms.msseltoindex happy.
-        allrec = ms.msseltoindex(vis, spw='*')
+        allrec = mscache.msseltoindex(vis, spw='*')
         #print "Trimming", spw
-        spwd = spw_to_dict(spw, {}, False)
+        spwd = spw_to_masks(spw, {}, False)
         for s in spwd:
             if s in allrec['spw']:
                 endchan = allrec['channel'][s, 2]
-                if not sets.has_key(s):
-                    sets[s] = set([])
-                if spwd[s] == '':
+                if isinstance(spwd[s], str):
                     # We need to get the spw's # of channels without using
                     # ms.msseltoindex.
-                    mytb = casac.table()
-                    mytb.open(vis + '/SPECTRAL_WINDOW')
-                    spwd[s] = range(mytb.getcell('NUM_CHAN', s))
-                    mytb.close()
-                sets[s].update([c for c in spwd[s] if c <= endchan])
-    return sets
+                    nchan = mscache.getsubtable(vis, 'SPECTRAL_WINDOW', ['NUM_CHAN'])['NUM_CHAN'][s]
+                    spwd[s] = np.ones(nchan, dtype=bool)
+                masks[s] = _union(masks.get(s, _emptymask()), spwd[s][:endchan + 1])
+    return masks
+
+def _emptymask():
+    """
+    Returns a channel bitmap with no channels selected.
+    """
+    return np.zeros(0, dtype=bool)
+
+def _resize(mask, nchan):
+    """
+    Returns the channel bitmap mask padded with unselected channels (or
+    truncated) to nchan channels.
+    """
+    if len(mask) >= nchan:
+        return mask[:nchan]
+    return np.concatenate([mask, np.zeros(nchan - len(mask), dtype=bool)])
+
+def _addrange(mask, start, end, step=1):
+    """
+    Returns the channel bitmap mask with the channels start~end^step
+    (end inclusive) selected, grown if necessary.  mask may be modified.
+
+    Like range(start, end + 1, step), an inverted range selects nothing.
+    Negative numbers cannot be channels, so they are dropped instead of
+    wrapping around the end of the bitmap.
+    """
+    if start < 0:
+        start += -(start // step) * step  # First non-negative start + k*step.
+    if end < start:
+        return mask
+    if end >= len(mask):
+        mask = _resize(mask, end + 1)
+    mask[start:end + 1:step] = True
+    return mask
+
+def _union(mask1, mask2):
+    """
+    Returns a new channel bitmap with the channels selected in either mask1
+    or mask2.
+    """
+    nchan = max(len(mask1), len(mask2))
+    return _resize(mask1, nchan) | _resize(mask2, nchan)
+
+def _tomask(chanset):
+    """
+    Returns a set, list or array of channels, or a channel bitmap, as a
+    channel bitmap.
+    """
+    if isinstance(chanset, np.ndarray) and chanset.dtype == bool:
+        return chanset
+    chans = _chanarray(chanset)
+    mask = np.zeros(chans[-1] + 1 if len(chans) else 0, dtype=bool)
+    mask[chans] = True
+    return mask
+
+def _chanarray(chanset):
+    """
+    Returns a set, list or array of channels, or a channel bitmap, as a
+    sorted array of unique channels.
+    """
+    if isinstance(chanset, np.ndarray):
+        if chanset.dtype == bool:
+            return np.flatnonzero(chanset)
+        return np.unique(chanset.astype(int))
+    return np.unique(np.fromiter(chanset, dtype=int, count=len(chanset)))
 
 def set_to_chanstr(chanset, totnchan=None):
     """
-    Essentially the reverse of expand_tilde.  Given a set or list of integers
-    chanset, returns the corresponding string form.  It will not use non-unity
+    Essentially the reverse of expand_tilde.  Given a set, list or array of integers,
+    or a channel bitmap, chanset, returns the corresponding string form.  It will not use non-unity
     steps (^) if multiple ranges (;) are necessary, but it will use ^ if it
     helps to eliminate any ;s.
 
@@ -257,53 +338,38 @@ def set_to_chanstr(chanset, totnchan=None):
     >>> set_to_chanstr([1, 2, 4, 5, 6, 7, 8, 9, 10, 11], 12)
     '1~2;4~11'
     """
+    chans = _chanarray(chanset)
     if totnchan:
-        mylist = [c for c in chanset if c < totnchan]
-    else:
-        mylist = list(chanset)
+        chans = chans[chans < totnchan]
 
-    if totnchan == len(mylist):
+    if totnchan == len(chans):
         return '*'
 
-    mylist.sort()
-
-    retstr = ''
-    if len(mylist) > 1:
-        # Check whether the same step can be used throughout.
-        step = mylist[1] - mylist[0]
-        samestep = True
-        for i in xrange(2, len(mylist)):
-            if mylist[i] - mylist[i - 1] != step:
-                samestep = False
-                break
-        if samestep:
-            retstr = str(mylist[0]) + '~' + str(mylist[-1])
-            if step > 1:
-                retstr += '^' + str(step)
-        else:
-            sc = mylist[0]
-            oldc = sc
-            retstr = str(sc)
-            nc = len(mylist)
-            for i in xrange(1, nc):
-                cc = mylist[i]
-                if (cc > oldc + 1) or (i == nc - 1):
-                    if (i == nc - 1) and (cc == oldc + 1):
-                        retstr += '~' + str(cc)
-                    else:
-                        if oldc != sc:
-                            retstr += '~' + str(oldc)
-                        retstr += ';' + str(cc)
-                        sc = cc
-                oldc = cc
-    elif len(mylist) > 0:
-        retstr = str(mylist[0])
-    return retstr
+    nc = len(chans)
+    if nc == 0:
+        return ''
+    elif nc == 1:
+        return str(chans[0])
+
+    # Check whether the same step can be used throughout.
+    steps = np.diff(chans)
+    if (steps == steps[0]).all():
+        retstr = '%d~%d' % (chans[0], chans[-1])
+        if steps[0] > 1:
+            retstr += '^%d' % steps[0]
+        return retstr
+
+    # Otherwise list the runs of consecutive channels.
+    breaks = np.flatnonzero(steps > 1)
+    starts = chans[np.concatenate([[0], breaks + 1])]
+    ends = chans[np.concatenate([breaks, [nc - 1]])]
+    return ';'.join([str(sc) if sc == ec else '%d~%d' % (sc, ec)
+                     for sc, ec in zip(starts, ends)])
         
 def sets_to_spwchan(spwsets, nchans={}):
     """
     Returns a spw:chan selection string for a dict of sets of selected
-    channels keyed by spectral window ID.
+    channels (or channel bitmaps) keyed by spectral window ID.
 
     nchans is a dict of the total number of channels keyed by spw, used to
     abbreviate the return string.
@@ -324,8 +390,9 @@ def sets_to_spwchan(spwsets, nchans={}):
     csd = {}
     for s in spwsets:
         # Convert the set of channels to a string.
-        if spwsets[s]:
-            cstr = set_to_chanstr(spwsets[s], nchans.get(s))
+        chans = _chanarray(spwsets[s])
+        if len(chans):
+            cstr = set_to_chanstr(chans, nchans.get(s))
 
             if cstr:
                 if not csd.has_key(cstr):
@@ -409,41 +476,38 @@ def update_spwchan(vis, sch0, sch1, truncate=False, widths={}):
     elif sch1 in (sch0, '*'):
         return '*'
 
-    sch0sets = spwchan_to_sets(vis, sch0)
-    sch1sets = spwchan_to_sets(vis, sch1)
+    sch0masks = spwchan_to_masks(vis, sch0)
+    sch1masks = spwchan_to_masks(vis, sch1)
 
     outsets = {}
     outspw = 0
-    s0spws = sorted(sch0sets.keys())
-    s1spws = sorted(sch1sets.keys())
+    s0spws = sorted(sch0masks.keys())
+    s1spws = sorted(sch1masks.keys())
     ns0spw = len(s0spws)
     nchans = {}
     for s in s1spws:
         if s in s0spws:
-            s0 = sch0sets[s]
-            s1 = sch1sets[s]
+            nchan = max(len(sch0masks[s]), len(sch1masks[s]))
+            s0 = _resize(sch0masks[s], nchan)
+            s1 = _resize(sch1masks[s], nchan)
 
             # Check for and handle (throw or dispose) channels in sch1 that aren't in
             # sch0.
-            if s1.difference(s0):
+            if (s1 & ~s0).any():
                 if truncate:
-                    s1.intersection_update(s0)
-                    if not s1:
+                    s1 = s1 & s0
+                    if not s1.any():
                         raise ValueError, "'%s' does not overlap '%s'." % (sch1, sch0)
                 else:
                     raise ValueError, "'%s' is not a subset of '%s'." % (sch1, sch0)
 
-            # Adapt s1 for a post-s0 world.
-            s0list = sorted(list(s0))
-            s1list = sorted(list(s1))
-            outchan = 0
+            # Adapt s1 for a post-s0 world: each channel of s1 becomes its
+            # index in s0.
+            s0list = np.flatnonzero(s0)
             nc0 = len(s0list)
-            for s1ind in xrange(len(s1list)):
-                while (outchan < nc0) and (s0list[outchan] < s1list[s1ind]):
-                    outchan += 1
-                if outchan == nc0:  # Shouldn't happen
-                    outchan -= 1
-                s1list[s1ind] = outchan / widths.get(s, 1)
+            outchans = np.searchsorted(s0list, np.flatnonzero(s1))
+            outchans = np.minimum(outchans, nc0 - 1)  # Shouldn't happen
+            s1list = outchans // widths.get(s, 1)
 
             # Determine outspw.
             while (outspw < ns0spw) and (s0spws[outspw] < s):
@@ -451,10 +515,10 @@ def update_spwchan(vis, sch0, sch1, truncate=False, widths={}):
             if outspw == ns0spw:  # Shouldn't happen
                 outspw -= 1
 
-            outsets[outspw] = set(s1list)
+            outsets[outspw] = s1list
 
             # Get the number of channels per spw that are selected by s0.
-            nchans[outspw] = len(s0)
+            nchans[outspw] = nc0
         elif not truncate:
             raise ValueError, str(s) + ' is not a selected spw of ' + sch0
 
@@ -479,6 +543,16 @@ def expand_tilde(tstr, conv_multiranges=False):
     >>> expand_tilde('3~7^2;9~11', True)
     '*'
     """
+    mask = _tilde_to_mask(tstr, conv_multiranges)
+    if isinstance(mask, str):
+        return mask
+    return np.flatnonzero(mask).tolist()
+
+def _tilde_to_mask(tstr, conv_multiranges=False):
+    """
+    Like expand_tilde(), but returns the selection as a bitmap (a boolean
+    array indexed by number) instead of a list.
+    """
     tstr = str(tstr)  # Allows bare ints.
     if (not tstr) or (conv_multiranges and tstr.find(';') > -1):
         return '*'
@@ -486,7 +560,7 @@ def expand_tilde(tstr, conv_multiranges=False):
     tstr = tstr.replace("'", '')  # Dequote
     tstr = tstr.replace('"', '')
 
-    numset = set([])
+    mask = _emptymask()
 
     for numrang in tstr.split(';'):
         step = 1
@@ -499,10 +573,12 @@ def expand_tilde(tstr, conv_multiranges=False):
             else:
                 start = int(numrang)
                 end = start
+            if step < 1:
+                raise ValueError
         except:
             raise ValueError, 'numrang = ' + numrang + ', tstr = ' + tstr + ', conv_multiranges = ' + str(conv_multiranges)
-        numset.update(range(start, end + 1, step))
-    return sorted(list(numset))
+        mask = _addrange(mask, start, end, step)
+    return mask
 
 def spw_to_dict(spw, spwdict={}, conv_multiranges=True):
     """
@@ -544,7 +620,36 @@ def spw_to_dict(spw, spwdict={}, conv_multiranges=True):
     if not spw:
         return {}
 
-    myspwdict = copy.deepcopy(spwdict)
+    spwmasks = {}
+    for s in spwdict:
+        if isinstance(spwdict[s], str):
+            spwmasks[s] = spwdict[s]
+        else:
+            spwmasks[s] = _tomask(spwdict[s])
+
+    myspwdict = spw_to_masks(spw, spwmasks, conv_multiranges)
+    for s in myspwdict:
+        if not isinstance(myspwdict[s], str):
+            myspwdict[s] = set(np.flatnonzero(myspwdict[s]).tolist())
+    return myspwdict
+
+def spw_to_masks(spw, spwmasks={}, conv_multiranges=True):
+    """
+    Like spw_to_dict(), but with the selected channels of each spw as a
+    channel bitmap (a boolean numpy array indexed by channel) instead of a
+    set.  spwmasks is not modified.
+
+    Examples:
+    >>> from update_spw import spw_to_masks
+    >>> spw_to_masks('6~8:2~5', {})[6]
+    array([False, False,  True,  True,  True,  True], dtype=bool)
+    >>> spw_to_masks('6~8:2~5', {6: ''})[6]
+    ''
+    """
+    if not spw:
+        return {}
+
+    myspwdict = copy.copy(spwmasks)
 
     # Because ; means different things when it separates spws and channel
     # ranges, I can't think of a better way to construct myspwdict than an
@@ -558,15 +663,14 @@ def spw_to_dict(spw, spwdict={}, conv_multiranges=True):
         if spwrange == '*':  # This shouldn't happen.
             return {}
         else:
-            charange = expand_tilde(chag, conv_multiranges)
+            charange = _tilde_to_mask(chag, conv_multiranges)
         for s in spwrange:
-            if charange == '*':
+            if isinstance(charange, str):
                 myspwdict[s] = ''
-            else:
-                if not myspwdict.has_key(s):
-                    myspwdict[s] = set([])
-                if myspwdict[s] != '':
-                    myspwdict[s].update(charange)        
+            elif not myspwdict.has_key(s):
+                myspwdict[s] = charange.copy()
+            elif not isinstance(myspwdict[s], str):
+                myspwdict[s] = _union(myspwdict[s], charange)
 
     for c in spw:
         if c == ',' or (inspw and c == ';'):  # Start new [spw, chan] pair.
@@ -611,14 +715,14 @@ def join_spws(spw1, spw2, span_semicolon=True):
     if not spw1 or not spw2:
         return ''
         
-    spwdict = spw_to_dict(spw1, {})
-    spwdict = spw_to_dict(spw2, spwdict)
+    spwdict = spw_to_masks(spw1, {})
+    spwdict = spw_to_masks(spw2, spwdict)
 
     res = ''
-    # Convert channel sets to strings
+    # Convert channel bitmaps to strings
     for s in spwdict:
         cstr = ''
-        if isinstance(spwdict[s], set):
+        if not isinstance(spwdict[s], str):
             cstr = set_to_chanstr(spwdict[s])
             if span_semicolon and ';' in cstr:
                 cstr = ''
@@ -672,12 +776,12 @@ def intersect_spws(spw1, spw2):
         if spw2 == '':
             return ''     # intersection('', '') = ''
         else:             # intersection('', spw2) = spw2
-            return set(spw_to_dict(spw2, {}).keys()) # Just the spws, no chan ranges
+            return set(spw_to_masks(spw2, {}).keys()) # Just the spws, no chan ranges
     elif spw2 == '':      # intersection('', spw1) = spw1
-        return set(spw_to_dict(spw1, {}).keys())     # Just the spws, no chan ranges
+        return set(spw_to_masks(spw1, {}).keys())   # Just the spws, no chan ranges
     else:
-        spwset1 = set(spw_to_dict(spw1, {}).keys())  # spws are the keys, chan
-        spwset2 = set(spw_to_dict(spw2, {}).keys())  # ranges are the values.
+        spwset1 = set(spw_to_masks(spw1, {}).keys())  # spws are the keys, chan
+        spwset2 = set(spw_to_masks(spw2, {}).keys())  # ranges are the values.
         return spwset1.intersection(spwset2)
 
 def subtract_spws(spw1, spw2):
@@ -710,8 +814,8 @@ def subtract_spws(spw1, spw2):
     elif spw2 == '':
         return set([])
     else:
-        spwset1 = set(spw_to_dict(spw1, {}).keys())  # spws are the keys, chan
-        spwset2 = set(spw_to_dict(spw2, {}).keys())  # ranges are the values.
+        spwset1 = set(spw_to_masks(spw1, {}).keys())  # spws are the keys, chan
+        spwset2 = set(spw_to_masks(spw2, {}).keys())  # ranges are the values.
         return spwset1.difference(spwset2)
     
 if __name__ == '__main__':